@@ -10,6 +10,7 @@ from rich.prompt import Confirm
 
 from clude_code.config.config import CludeConfig
 from clude_code.llm.llama_cpp_http import ChatMessage, LlamaCppHttpClient
+from clude_code.llm.tokenizer import load_tokenizer
 from clude_code.orchestrator.agent_loop.tool_dispatch import iter_tool_specs
 from clude_code.cli.utils import select_model_interactively
 
@@ -83,7 +84,10 @@ def run_doctor(fix: bool, model: str, select_model: bool, logger: logging.Logger
         logger.error(f"workspace 写入失败: {e}", exc_info=True)
         raise typer.Exit(code=2)
 
-    # 3) 检查 LLM 服务连通性（支持 OpenAI / llama.cpp / Ollama 等）
+    # 3) 本地分词器加载（离线环境下不应卡在下载 BPE 文件）
+    _check_tokenizer(cfg, logger)
+
+    # 4) 检查 LLM 服务连通性（支持 OpenAI / llama.cpp / Ollama 等）
     try:
         client = LlamaCppHttpClient(
             base_url=cfg.llm.base_url,
@@ -104,6 +108,22 @@ def run_doctor(fix: bool, model: str, select_model: bool, logger: logging.Logger
         logger.error(f"llama.cpp 连通失败: {e}", exc_info=True)
         raise typer.Exit(code=3)
 
+def _check_tokenizer(cfg: CludeConfig, logger: logging.Logger) -> None:
+    """报告本地分词器的来源与加载耗时；不可用时给出离线放置文件的提示（不影响退出码）。"""
+    info = load_tokenizer(
+        cfg.llm.tokenizer_encoding,
+        path=cfg.llm.tokenizer_path,
+        allow_download=cfg.llm.tokenizer_allow_download,
+    )[1]
+    logger.info(f"\n[bold]分词器[/bold] (llm.tokenizer={cfg.llm.tokenizer})")
+    if info.ok:
+        logger.info(f"[green]本地分词器 {info.kind}:{info.name} 加载 OK[/green] 耗时={info.load_ms:.0f}ms {info.source}")
+    else:
+        logger.warning(f"本地分词器 {info.kind}:{info.name} 不可用（{info.load_ms:.0f}ms）: {info.error}，将回退为启发式估算")
+        for hint in info.hints:
+            logger.info(f"  提示: {hint}")
+
+
 def _try_fix_missing_tools(tools: list[str], logger: logging.Logger) -> None:
     os_name = platform.system()
     commands = []
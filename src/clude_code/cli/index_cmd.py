@@ -0,0 +1,85 @@
+"""
+Index CLI commands - 向量索引相关命令
+
+提供 ANN 索引构建与召回评估（recall@k vs 暴力检索）的 CLI 接口
+"""
+import json
+from typing import Optional
+
+import typer
+
+from clude_code.config.config import CludeConfig
+
+index_app = typer.Typer(help="向量索引相关命令（ANN 构建、统计、召回评估）")
+
+
+def _open_store(workspace: Optional[str]):
+    from clude_code.knowledge.vector_store import VectorStore
+
+    cfg = CludeConfig()
+    if workspace:
+        cfg.workspace_root = workspace
+    return cfg, VectorStore(cfg)
+
+
+@index_app.command("stats")
+def stats(
+    sample: int = typer.Option(50, "--sample", "-s", help="抽样查询数（0=只看索引状态）"),
+    k: int = typer.Option(10, "--k", "-k", help="recall@k 中的 k"),
+    nprobes: Optional[int] = typer.Option(None, "--nprobes", help="临时覆盖 rag.ann_nprobes"),
+    refine_factor: Optional[int] = typer.Option(None, "--refine-factor", help="临时覆盖 rag.ann_refine_factor"),
+    workspace: Optional[str] = typer.Option(None, "--workspace", help="指定工作区路径"),
+    format: str = typer.Option("text", "--format", help="输出格式 (text/json)"),
+) -> None:
+    """
+    显示向量索引统计，并在抽样向量上对比 ANN 与暴力检索的 recall@k 与耗时。
+    """
+    try:
+        cfg, store = _open_store(workspace)
+        if nprobes is not None:
+            cfg.rag.ann_nprobes = nprobes
+        if refine_factor is not None:
+            cfg.rag.ann_refine_factor = refine_factor
+        info = store.index_stats(sample=sample, k=k)
+    except Exception as e:
+        typer.echo(f"❌ 获取索引统计失败: {str(e)}", err=True)
+        raise typer.Exit(1) from e
+
+    if format == "json":
+        typer.echo(json.dumps(info, ensure_ascii=False, indent=2))
+        return
+
+    typer.echo("📦 向量索引统计")
+    typer.echo("=" * 30)
+    typer.echo(f"表: {info['table']}")
+    typer.echo(f"行数: {info['rows']}")
+    idx = info.get("index")
+    if idx:
+        typer.echo(f"ANN 索引: {idx['name']} ({idx['type']})")
+        typer.echo(f"  已索引行: {idx['indexed_rows']}  未索引行: {idx['unindexed_rows']}  训练时行数: {idx['trained_rows']}")
+    else:
+        typer.echo("ANN 索引: 无（暴力检索）")
+    typer.echo(f"nprobes: {info.get('nprobes')}  refine_factor: {info.get('refine_factor')}")
+    rec = info.get("recall")
+    if rec:
+        typer.echo()
+        key = f"recall@{rec['k']}"
+        typer.echo(f"{key}: {rec[key]}  (样本 {rec['samples']})")
+        typer.echo(f"平均耗时: ANN {rec['ann_avg_ms']} ms / 暴力 {rec['exact_avg_ms']} ms")
+
+
+@index_app.command("build")
+def build(
+    force: bool = typer.Option(False, "--force", help="忽略行数阈值，立即（重新）训练索引"),
+    workspace: Optional[str] = typer.Option(None, "--workspace", help="指定工作区路径"),
+) -> None:
+    """
+    按配置维护 ANN 索引（与后台索引每批写入后的逻辑一致）。
+    """
+    try:
+        _cfg, store = _open_store(workspace)
+        action = store.maintain_index(force=force)
+    except Exception as e:
+        typer.echo(f"❌ 构建索引失败: {str(e)}", err=True)
+        raise typer.Exit(1) from e
+    typer.echo(f"✅ ANN 索引: {action}")
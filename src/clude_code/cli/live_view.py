@@ -9,6 +9,8 @@ from rich.console import Console
 from rich.table import Table
 from rich.text import Text
 
+from clude_code.observability.message_store import resolve_messages
+
 
 class LiveDisplay:
     """
@@ -102,7 +104,7 @@ class LiveDisplay:
             stage = str(data.get("stage") or "").strip()
             self._set_row("llm", f"请求 LLM（消息数={msg_n}，阶段={stage}，model={model}）", style="cyan")
             # 将 messages 内容推送到思考窗口
-            messages = data.get("messages") or []
+            messages = resolve_messages(data)
             for i, msg in enumerate(messages):
                 role = str(msg.get("role") or "unknown")
                 content = str(msg.get("content") or "")
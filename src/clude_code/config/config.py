@@ -78,6 +78,66 @@ class LLMConfig(BaseModel):
         description="LLM 单次输出 token 上限（非上下文窗口大小）。常见推荐 512-4096；如后端支持可设更大。",
     )
     timeout_s: int = Field(default=120, ge=1)
+    context_window: int = Field(
+        default=32768,
+        ge=1024,
+        description="模型上下文窗口大小（tokens），用于 context_budget 的预算分配（历史裁剪、repo map）。",
+    )
+    context_window_auto: bool = Field(
+        default=True,
+        description="启动后向 llama.cpp 查询实际 n_ctx（/props 或 /v1/models）作为上下文窗口，失败时使用 context_window。",
+    )
+    # HTTP 连接池（keep-alive）：每个 agent step 复用连接，避免重复 TCP/TLS 握手
+    http_max_connections: int = Field(default=10, ge=1, le=1000, description="LLM HTTP 连接池最大连接数。")
+    http_max_keepalive_connections: int = Field(default=5, ge=0, le=1000, description="连接池中保持空闲的最大长连接数。")
+    http_keepalive_expiry_s: float = Field(default=30.0, ge=0.0, description="空闲长连接的保活时间（秒）。")
+    http2: bool = Field(default=False, description="是否启用 HTTP/2（需要 pip install 'httpx[http2]'；缺失时回退 HTTP/1.1）。")
+    cache_prompt: bool = Field(
+        default=True,
+        description="向 llama.cpp 发送 cache_prompt=true，复用与上次请求相同前缀的 KV 缓存（仅 provider=llama_cpp_http 时生效）。",
+    )
+    id_slot: int = Field(
+        default=-1,
+        ge=-1,
+        description="llama.cpp 槽位 ID：固定槽位可让同一会话稳定命中前缀缓存（-1=由服务端按相似度选择）。",
+    )
+    tokenizer: str = Field(
+        default="auto",
+        description=(
+            "token 计数来源：auto（服务端 /tokenize → 本地 tiktoken → 启发式依次降级）/ server / local / heuristic。"
+        ),
+    )
+    tokenizer_encoding: str = Field(
+        default="cl100k_base",
+        description="本地分词器名称：tiktoken 编码名，或 `hf:<名称>` 配合 tokenizer_path 指向模型的 tokenizer.json。",
+    )
+    tokenizer_path: str = Field(
+        default="",
+        description="本地分词器文件位置：tiktoken 缓存目录（离线预置的编码文件），或 tokenizer.json 文件/所在目录。",
+    )
+    tokenizer_allow_download: bool = Field(
+        default=False,
+        description="本地没有 tiktoken 编码文件时是否允许联网下载（默认否：离线环境立即降级为启发式估算）。",
+    )
+    token_cache_size: int = Field(
+        default=8192, ge=0, description="按内容哈希缓存的 token 计数条目上限（0=不缓存）。"
+    )
+    stream: bool = Field(
+        default=True,
+        description="是否以流式（SSE）请求 LLM：实时推送 llm_token 事件；服务端不支持时自动回退非流式。",
+    )
+    stream_stop_on_tool_call: bool = Field(
+        default=True,
+        description="流式输出中出现完整的工具调用 JSON 后立即停止生成（节省本地模型的无效解码时间）。",
+    )
+    stream_event_interval_ms: int = Field(
+        default=50, ge=0, le=5000, description="llm_token 事件的合并间隔（毫秒），0=每个增量都推送。"
+    )
+    model_id_ttl_s: float = Field(
+        default=300.0,
+        ge=0.0,
+        description="model 为空时自动解析的模型 ID 缓存时间（秒），避免每次请求前多一次 GET /v1/models。",
+    )
 
 """
 策略配置（Policy Configuration）
@@ -145,6 +205,21 @@ class LoggingConfig(BaseModel):
         default="%Y-%m-%d %H:%M:%S",
         description="日志时间格式。"
     )
+    event_log_max_bytes: int = Field(
+        default=16 * 1024 * 1024,
+        ge=1024,
+        description="trace.jsonl / audit.jsonl 活动文件超过该字节数时封存为编号段。"
+    )
+    event_log_max_age_hours: float = Field(
+        default=24.0,
+        gt=0,
+        description="活动文件中最早事件超过该小时数时封存为编号段。"
+    )
+    trace_max_segments: int = Field(
+        default=0,
+        ge=0,
+        description="trace.jsonl 保留的封存段数（0=不限，超出时删除最旧的段）。audit.jsonl 的封存段从不删除。"
+    )
 
 """
 LLM 详细日志配置（LLM Detail Logging）
@@ -187,6 +262,56 @@ class OrchestratorConfig(BaseModel):
     max_step_tool_calls: int = Field(default=100, ge=1, le=500, description="单个步骤内最大工具调用次数（防止死循环）。")
     max_replans: int = Field(default=2, ge=0, le=10, description="最大重规划次数（验证失败/卡住时）。")
     planning_retry: int = Field(default=1, ge=0, le=5, description="计划解析失败的重试次数。")
+    prefix_stable_layout: bool = Field(
+        default=False,
+        description=(
+            "前缀稳定的消息布局：系统提示词在会话内保持字节不变，历史只追加，超限时按大块裁剪，"
+            "让 llama.cpp 的提示词缓存尽量命中。开启后 repo_map.personalize（按轮重排 Repo Map）"
+            "与 ContextAssembler（按类别权重/新近度逐条选择历史）均不生效：两者都会改写已发送的前缀。"
+            "适合长会话、上下文窗口较小且重算提示词代价高的本地模型。"
+        ),
+    )
+    history_compaction: bool = Field(
+        default=True,
+        description="后台分段摘要较早的对话历史（按内容哈希缓存），超出预算时用摘要替换原文而不是直接截断。",
+    )
+    history_compaction_trigger: float = Field(
+        default=0.5,
+        ge=0.1,
+        le=1.0,
+        description="历史 token 占可用窗口的比例超过该值时开始后台摘要（超过 0.8 时替换）。",
+    )
+    history_compaction_keep_recent: int = Field(
+        default=8, ge=2, le=100, description="始终保留原文的最近消息条数（不参与摘要）。"
+    )
+    history_compaction_use_llm: bool = Field(
+        default=True,
+        description=(
+            "用本地模型生成摘要（仅 provider=llama_cpp_http；其他服务端不发额外的后台补全）；"
+            "关闭或调用失败时使用抽取式摘要（离线可用）。llama.cpp 服务端需至少 2 个槽位（--parallel）；"
+            "llm.id_slot 固定时摘要固定到另一个槽位，避免冲掉主对话的提示词缓存。"
+        ),
+    )
+    parallel_steps: int = Field(
+        default=0,
+        ge=0,
+        le=16,
+        description=(
+            "并发执行的只读计划步骤数上限（依赖已满足、只用只读工具、不涉及相同文件的步骤）。"
+            "0=自动（llama.cpp 服务端并行槽位数 total_slots，取不到时为 1）；1=关闭并发，逐步执行。"
+        ),
+    )
+    parallel_tool_calls: int = Field(
+        default=4,
+        ge=1,
+        le=16,
+        description="批量工具调用（{\"tool_calls\": [...]}）中连续只读调用的并发线程数上限（1=按顺序执行）。",
+    )
+    tool_cache_max_bytes: int = Field(
+        default=8_000_000,
+        ge=0,
+        description="只读工具（read_file/grep/list_dir/glob_file_search）结果缓存上限（字节，按 LRU 淘汰；0=关闭）。",
+    )
 
 """
 RAG 配置（Retrieval-Augmented Generation Configuration）
@@ -213,7 +338,7 @@ class RAGConfig(BaseModel):
         description="向量数据库存储路径。"
     )
     table_name: str = Field(
-        default="code_chunks_v2",
+        default="code_chunks_v3",
         description="向量表名（用于 schema/策略演进与迁移；变更后会触发重新索引）。",
     )
     chunk_size: int = Field(default=500, description="代码分块大小（字符数）。")
@@ -237,7 +362,46 @@ class RAGConfig(BaseModel):
     ts_leading_context_lines: int = Field(default=2, ge=0, le=30, description="tree-sitter chunk 向上附带的注释/空行上下文行数（用于可读性）。")
 
     # --- P2-1: 并发索引优化 ---
-    index_workers: int = Field(default=4, ge=1, le=16, description="并发索引线程数（1-16，推荐 4-8）。")
+    index_workers: int = Field(default=4, ge=1, le=16, description="并发索引线程数（1-16，推荐 4-8）；process 模式下为进程数。")
+    index_mode: str = Field(
+        default="thread",
+        description="索引并发模式：thread（线程池，共享一个模型）| process（进程池，每进程一个模型，绕开 GIL）。",
+    )
+    onnx_threads: int = Field(
+        default=0,
+        ge=0,
+        le=256,
+        description="每个 embedding 模型的 ONNX intra-op 线程数（0=自动：process 模式按 CPU 核数/进程数均分，thread 模式用 fastembed 默认）。",
+    )
+
+    # --- ANN 向量索引生命周期（LanceDB IVF_PQ / IVF_HNSW_SQ） ---
+    ann_index_type: str = Field(default="IVF_PQ", description="ANN 索引类型：IVF_PQ | IVF_HNSW_SQ | none（none=始终暴力检索）。")
+    ann_min_rows: int = Field(default=50_000, ge=256, description="行数达到该阈值后才构建 ANN 索引（小表暴力检索更快更准）。")
+    ann_reindex_after_writes: int = Field(default=20_000, ge=1, description="未入索引的新行数达到该值后做一次增量索引更新（optimize）。")
+    ann_retrain_growth: float = Field(default=2.0, ge=1.1, le=100.0, description="表行数增长到上次训练时的该倍数后，重新训练索引（分区中心随数据漂移）。")
+    ann_num_partitions: int = Field(default=0, ge=0, le=65536, description="IVF 分区数（0=自动：约 sqrt(行数)）。")
+    ann_num_sub_vectors: int = Field(default=0, ge=0, le=1024, description="PQ 子向量数（0=自动：维度/8，须整除维度）。")
+    ann_nprobes: int = Field(default=20, ge=0, le=65536, description="查询时探测的 IVF 分区数（越大越准越慢；0=LanceDB 默认）。")
+    ann_refine_factor: int = Field(default=10, ge=0, le=1000, description="PQ 召回后按原始向量重排的倍数（0=不重排）。")
+
+    # --- 写入缓冲与表维护（减少 Lance 小 fragment / 删除文件） ---
+    write_buffer_rows: int = Field(default=4096, ge=0, le=1_000_000, description="写后缓冲：待写入行数或待删除键数达到该值时合并落盘（0=每次调用直接写）。")
+    compact_interval_s: int = Field(default=300, ge=10, le=86400, description="后台索引循环中表维护（compaction + 旧版本清理）的最小间隔（秒）。")
+    compact_min_fragments: int = Field(default=16, ge=1, le=100_000, description="小 fragment 数达到该值才执行 compaction。")
+    version_retention_s: int = Field(default=600, ge=0, le=7 * 86400, description="清理早于该时长的旧表版本（秒）；保留窗口内的版本供并发读者使用。")
+
+    # --- 事件驱动增量索引（watcher 变更源） ---
+    watch_mode: str = Field(
+        default="auto",
+        description="变更监听方式：auto（Linux 优先 inotify，否则轮询）| inotify | poll。poll 模式按 scan_interval_s 轮询。",
+    )
+    change_queue_size: int = Field(default=10_000, ge=16, le=1_000_000, description="变更队列上限（不同路径数），溢出时回退为一次全量扫描。")
+    watch_debounce_ms: int = Field(default=200, ge=0, le=10_000, description="变更合并窗口（毫秒）：收到首个变更后再等待该时长批量处理。")
+    respect_gitignore: bool = Field(default=True, description="扫描/监听时是否遵循 .gitignore（及 .git/info/exclude）。")
+
+    # --- 内容寻址 Embedding 缓存（chunk 哈希 → 向量） ---
+    embed_cache_enabled: bool = Field(default=True, description="是否启用持久化 Embedding 缓存（.clude/embed_cache.sqlite）。")
+    embed_cache_max_mb: int = Field(default=512, ge=1, le=65536, description="Embedding 缓存容量上限（MB），超出后按 LRU 淘汰。")
 
 
 # 从工具配置模块导入（统一管理）
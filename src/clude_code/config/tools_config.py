@@ -185,6 +185,14 @@ class SearchToolConfig(BaseModel):
         le=100_000_000,
         description="当缺少 rg 时，Python 扫描单文件最大字节数（0=不限制）。默认 2,000,000（约 2MB）。"
     )
+    grep_engine: str = Field(
+        default="auto",
+        description="grep 引擎：auto（有 rg 用 rg，否则 Python 扫描）/ rg / python / index（.clude/grep_index 下的增量三元组索引，需要 numpy，需显式开启）。",
+    )
+    grep_index_watch_mode: str = Field(
+        default="auto",
+        description="三元组索引的变更监听：auto（Linux 优先 inotify，否则轮询）| inotify | poll | off（只在写文件/打补丁/执行命令后同步）。",
+    )
 
 
 class WebToolConfig(BaseModel):
@@ -285,6 +293,25 @@ class QuestionToolConfig(BaseModel):
 class RepoMapToolConfig(BaseModel):
     """仓库地图工具配置（repo_map）"""
     enabled: bool = Field(default=True, description="是否启用仓库地图工具。")
+    async_startup: bool = Field(
+        default=True,
+        description="会话启动时在后台生成仓库地图，生成完成后附加到系统提示词（首轮提示词无需等待）。"
+    )
+    max_tokens: int = Field(
+        default=0, ge=0,
+        description="仓库地图渲染的 token 预算（0=按 llm.context_window 与 context_budget 的 CONTEXT 份额自动分配）。"
+    )
+    auto_max_tokens: int = Field(
+        default=4096, ge=0,
+        description=(
+            "max_tokens=0 自动分配时的上限（0=不设上限）。默认值约等于旧版固定上限"
+            "（前 50 个文件 × 每文件 8 个符号）的渲染长度，避免大窗口模型下地图挤占对话历史。"
+        ),
+    )
+    personalize: bool = Field(
+        default=True,
+        description="每轮按用户输入中提到的文件/符号做个性化 PageRank 重排（种子变化时才重新渲染）。orchestrator.prefix_stable_layout 开启时不生效。"
+    )
     log_to_file: bool = Field(
         default=True,
         description="是否将仓库地图日志写入文件。默认 True，写入 .clude/logs/app.log。"
@@ -418,6 +445,8 @@ def set_tool_configs(cfg: Any) -> None:
             grep_ignore_dirs=getattr(cfg.search, "grep_ignore_dirs", [".git", ".clude", "node_modules", ".venv", "dist", "build"]),
             grep_language_extensions=getattr(cfg.search, "grep_language_extensions", SearchToolConfig().grep_language_extensions),
             grep_python_max_file_bytes=getattr(cfg.search, "grep_python_max_file_bytes", 2_000_000),
+            grep_engine=getattr(cfg.search, "grep_engine", "auto"),
+            grep_index_watch_mode=getattr(cfg.search, "grep_index_watch_mode", "auto"),
         ),
         # 网络工具配置
         web=WebToolConfig(
@@ -453,6 +482,10 @@ def set_tool_configs(cfg: Any) -> None:
         # 仓库地图工具配置
         repo_map=RepoMapToolConfig(
             enabled=getattr(cfg.repo_map, "enabled", True),
+            async_startup=getattr(cfg.repo_map, "async_startup", True),
+            max_tokens=getattr(cfg.repo_map, "max_tokens", 0),
+            auto_max_tokens=getattr(cfg.repo_map, "auto_max_tokens", 4096),
+            personalize=getattr(cfg.repo_map, "personalize", True),
             log_to_file=getattr(cfg.repo_map, "log_to_file", True),
         ),
         # 技能工具配置
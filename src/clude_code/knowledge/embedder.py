@@ -1,7 +1,13 @@
 from __future__ import annotations
 
 import logging
-from typing import List, Optional
+from pathlib import Path
+from typing import Any, List, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None  # type: ignore
 
 try:
     from fastembed import TextEmbedding
@@ -9,6 +15,7 @@ except ImportError:
     TextEmbedding = None  # type: ignore
 
 from clude_code.config.config import CludeConfig
+from clude_code.knowledge.embedding_cache import EmbeddingCache, chunk_hash
 
 class CodeEmbedder:
     """
@@ -18,46 +25,149 @@ class CodeEmbedder:
     def __init__(self, cfg: Optional[CludeConfig] = None):
         self._logger = logging.getLogger(__name__)
         self._device = "cpu"
+        self._threads: Optional[int] = None
+        self._vec_cache_path: Optional[Path] = None
+        self._vec_cache_max_bytes = 512 * 1024 * 1024
         if cfg:
             self.model_name = cfg.rag.embedding_model
             self.cache_dir = cfg.rag.model_cache_dir
             self._device = (cfg.rag.device or "cpu").lower()
+            self._threads = int(getattr(cfg.rag, "onnx_threads", 0) or 0) or None
+            # 内容寻址向量缓存：chunk 哈希 → 向量（跨文件/跨重建复用，命中即跳过模型推理）
+            if bool(getattr(cfg.rag, "embed_cache_enabled", True)):
+                root = Path(cfg.workspace_root)
+                self._vec_cache_path = root / ".clude" / "embed_cache.sqlite"
+                self._vec_cache_max_bytes = int(getattr(cfg.rag, "embed_cache_max_mb", 512) or 512) * 1024 * 1024
         else:
             self.model_name = "BAAI/bge-small-zh-v1.5"
             self.cache_dir = None
         self._model: Optional[TextEmbedding] = None
+        self._vec_cache: Optional[EmbeddingCache] = None
 
     def _load_model(self):
         if TextEmbedding is None:
             raise RuntimeError("fastembed is not installed. Please run `pip install fastembed`.")
         if self._model is None:
             # 使用配置中的缓存路径和模型名称；device 仅做 best-effort（不支持则自动回退）
+            # threads: ONNX intra-op 线程数（进程池模式下按 worker 数均分，避免超卖）
+            extra: dict[str, Any] = {"threads": self._threads} if self._threads else {}
             try:
                 if self._device in ("cuda", "mps"):
                     providers = ["CUDAExecutionProvider"] if self._device == "cuda" else ["CoreMLExecutionProvider"]
-                    self._model = TextEmbedding(model_name=self.model_name, cache_dir=self.cache_dir, providers=providers)  # type: ignore[call-arg]
+                    self._model = TextEmbedding(model_name=self.model_name, cache_dir=self.cache_dir, providers=providers, **extra)  # type: ignore[call-arg]
                 else:
-                    self._model = TextEmbedding(model_name=self.model_name, cache_dir=self.cache_dir)
+                    self._model = TextEmbedding(model_name=self.model_name, cache_dir=self.cache_dir, **extra)
             except TypeError:
-                # fastembed 版本差异：可能不支持 providers 参数
-                self._logger.warning("fastembed TextEmbedding 不支持 providers 参数，已回退到默认 provider。")
+                # fastembed 版本差异：可能不支持 providers/threads 参数
+                self._logger.warning("fastembed TextEmbedding 不支持 providers/threads 参数，已回退到默认参数。")
                 self._model = TextEmbedding(model_name=self.model_name, cache_dir=self.cache_dir)
 
-    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+    def _get_vec_cache(self) -> Optional[EmbeddingCache]:
+        if self._vec_cache is None and self._vec_cache_path is not None:
+            try:
+                self._vec_cache = EmbeddingCache(self._vec_cache_path, max_bytes=self._vec_cache_max_bytes)
+            except Exception as e:
+                # 缓存不可用（只读目录/损坏）时直接走模型，不影响索引
+                self._logger.warning(f"Embedding 缓存不可用，已禁用: {e}")
+                self._vec_cache_path = None
+        return self._vec_cache
+
+    def _embed_matrix(self, texts: List[str], batch_size: int) -> Any:
+        """运行模型，把 fastembed 逐行产出的 ndarray 直接写进预分配的 float32 矩阵。"""
+        self._load_model()
+        if self._model is None or not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        out = None
+        row = 0
+        bs = max(1, int(batch_size))
+        for i in range(0, len(texts), bs):
+            # fastembed returns a generator of numpy arrays
+            for e in self._model.embed(texts[i : i + bs], batch_size=bs):
+                if out is None:
+                    out = np.empty((len(texts), int(e.shape[-1])), dtype=np.float32)
+                out[row] = e
+                row += 1
+        if out is None or row != len(texts):
+            raise RuntimeError(f"embedding 数量不匹配: {row} != {len(texts)}")
+        return out
+
+    def embed_batch(self, texts: List[str], batch_size: int = 64, use_cache: bool = True) -> Any:
+        """
+        Generate embeddings as one C-contiguous float32 ndarray of shape (len(texts), dim).
+
+        This is the bulk/indexing path: no per-float Python objects are created, and the
+        result can be handed to `VectorStore.add_batch` without conversion.
+        Cached vectors (keyed by content hash) are reused; only misses hit the model,
+        and identical texts within one batch are embedded once.
+        """
+        if np is None:
+            raise RuntimeError("numpy is not installed. Please run `pip install numpy`.")
+        cache = self._get_vec_cache() if use_cache else None
+        if cache is None:
+            return self._embed_matrix(texts, batch_size)
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        keys = [chunk_hash(t, self.model_name) for t in texts]
+        try:
+            found = cache.get_many_raw(keys)
+        except Exception as e:
+            # 多进程并发访问时 sqlite 可能短暂加锁：当作未命中处理
+            self._logger.debug(f"Embedding 缓存读取失败: {e}")
+            found = {}
+        missing: dict[str, int] = {}
+        miss_texts: list[str] = []
+        for k, t in zip(keys, texts, strict=True):
+            if k not in found and k not in missing:
+                missing[k] = len(miss_texts)
+                miss_texts.append(t)
+
+        fresh = self._embed_matrix(miss_texts, batch_size) if miss_texts else None
+        if fresh is not None:
+            dim = fresh.shape[1]
+        else:
+            dim = len(next(iter(found.values()))) // 4
+
+        out = np.empty((len(texts), dim), dtype=np.float32)
+        for i, k in enumerate(keys):
+            j = missing.get(k)
+            if j is not None:
+                out[i] = fresh[j]
+            else:
+                blob = found[k]
+                if len(blob) != dim * 4:
+                    raise RuntimeError(f"embedding 维度不一致（缓存 {len(blob) // 4} vs {dim}），请清理 .clude/embed_cache.sqlite")
+                out[i] = np.frombuffer(blob, dtype=np.float32)
+        if fresh is not None:
+            try:
+                cache.put_many_raw((k, fresh[j].tobytes()) for k, j in missing.items())
+            except Exception as e:
+                self._logger.debug(f"Embedding 缓存写入失败: {e}")
+        return out
+
+    def embed_texts(self, texts: List[str], use_cache: bool = True) -> List[List[float]]:
         """
         Generate embeddings for a list of strings.
+
+        Convenience wrapper over `embed_batch` returning Python lists; prefer `embed_batch`
+        for bulk indexing.
         """
-        self._load_model()
-        if self._model is None:
+        if not texts:
             return []
-        
-        # fastembed returns a generator of numpy arrays
-        embeddings = list(self._model.embed(texts))
-        return [e.tolist() for e in embeddings]
+        return self.embed_batch(texts, batch_size=len(texts), use_cache=use_cache).tolist()
 
     def embed_query(self, query: str) -> List[float]:
         """
         Generate embedding for a single query string.
         """
-        return self.embed_texts([query])[0]
+        # 查询文本一次性居多，不写入缓存（避免挤占 chunk 向量）
+        return self.embed_texts([query], use_cache=False)[0]
+
+    def cache_stats(self) -> dict[str, int]:
+        """向量缓存统计（hits/misses/bytes），缓存未启用时返回空 dict。"""
+        cache = self._vec_cache
+        if cache is None:
+            return {}
+        return {"hits": cache.hits, "misses": cache.misses, "bytes": cache.total_bytes}
 
@@ -0,0 +1,155 @@
+"""
+内容寻址的 Embedding 缓存（Content-Addressed Embedding Cache）
+
+- key = sha1(model_name + "\\0" + chunk_text)：同一模型下，字节相同的 chunk（跨文件/跨重建/vendored 副本）只算一次；
+- 持久化：{workspace}/.clude/embed_cache.sqlite（标准库 sqlite3，无额外依赖），向量以 float32 原始字节存储；
+- 容量：按字节数上限做 LRU 淘汰（last_used 递增计数，命中时批量刷新）。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import sqlite3
+import threading
+from array import array
+from pathlib import Path
+from typing import Iterable, Sequence
+
+_logger = logging.getLogger(__name__)
+
+# 淘汰时一次清理到上限的 90%，避免每次写入都触发淘汰
+_EVICT_LOW_WATERMARK = 0.9
+
+
+def chunk_hash(text: str, model_name: str = "") -> str:
+    """计算 chunk 的内容哈希（模型名参与哈希：换模型后自然失效）。"""
+    h = hashlib.sha1()
+    h.update(model_name.encode("utf-8"))
+    h.update(b"\0")
+    h.update(text.encode("utf-8", errors="surrogatepass"))
+    return h.hexdigest()
+
+
+class EmbeddingCache:
+    """
+    sqlite 持久化的 chunk-hash → 向量缓存（线程安全，按字节数 LRU 淘汰）。
+    """
+
+    def __init__(self, path: Path, *, max_bytes: int = 512 * 1024 * 1024) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max(1, int(max_bytes))
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " vec BLOB NOT NULL,"
+            " nbytes INTEGER NOT NULL,"
+            " last_used INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        row = self._conn.execute("SELECT COALESCE(SUM(nbytes), 0), COALESCE(MAX(last_used), 0) FROM embeddings").fetchone()
+        self._total_bytes = int(row[0])
+        self._clock = int(row[1])
+        self.hits = 0
+        self.misses = 0
+
+    def _tick(self) -> int:
+        self._clock += 1
+        return self._clock
+
+    def get_many_raw(self, keys: Sequence[str]) -> dict[str, bytes]:
+        """批量查询原始 float32 字节（供 numpy 零拷贝 `frombuffer`）；命中项刷新 LRU 时间戳。"""
+        if not keys:
+            return {}
+        out: dict[str, bytes] = {}
+        uniq = list(dict.fromkeys(keys))
+        with self._lock:
+            # sqlite 默认变量上限 999：分批查询
+            for i in range(0, len(uniq), 500):
+                part = uniq[i : i + 500]
+                marks = ",".join("?" * len(part))
+                for key, blob in self._conn.execute(f"SELECT key, vec FROM embeddings WHERE key IN ({marks})", part):
+                    out[key] = bytes(blob)
+            if out:
+                ts = self._tick()
+                self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(ts, k) for k in out])
+            self.hits += len(out)
+            self.misses += len(uniq) - len(out)
+        return out
+
+    def get_many(self, keys: Sequence[str]) -> dict[str, list[float]]:
+        """批量查询；返回命中的 key → 向量（list[float]）。"""
+        out: dict[str, list[float]] = {}
+        for key, blob in self.get_many_raw(keys).items():
+            vec = array("f")
+            vec.frombytes(blob)
+            out[key] = vec.tolist()
+        return out
+
+    def put_many_raw(self, items: Iterable[tuple[str, bytes]]) -> None:
+        """写入原始 float32 字节（numpy 行的 `tobytes()`）。"""
+        rows = [(key, blob, len(blob)) for key, blob in items]
+        if not rows:
+            return
+        with self._lock:
+            ts = self._tick()
+            self._conn.execute("BEGIN")
+            try:
+                for key, blob, n in rows:
+                    prev = self._conn.execute("SELECT nbytes FROM embeddings WHERE key = ?", (key,)).fetchone()
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO embeddings(key, vec, nbytes, last_used) VALUES (?, ?, ?, ?)",
+                        (key, blob, n, ts),
+                    )
+                    self._total_bytes += n - (int(prev[0]) if prev else 0)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            if self._total_bytes > self.max_bytes:
+                self._evict_locked()
+
+    def put_many(self, items: Iterable[tuple[str, Sequence[float]]]) -> None:
+        self.put_many_raw((key, array("f", vec).tobytes()) for key, vec in items)
+
+    def _evict_locked(self) -> None:
+        target = int(self.max_bytes * _EVICT_LOW_WATERMARK)
+        freed = 0
+        victims: list[str] = []
+        for key, n in self._conn.execute("SELECT key, nbytes FROM embeddings ORDER BY last_used ASC"):
+            if self._total_bytes - freed <= target:
+                break
+            victims.append(key)
+            freed += int(n)
+        if not victims:
+            return
+        self._conn.execute("BEGIN")
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", [(k,) for k in victims])
+        self._conn.execute("COMMIT")
+        self._total_bytes -= freed
+        _logger.debug(f"EmbeddingCache 淘汰 {len(victims)} 条（释放 {freed} 字节）")
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def __len__(self) -> int:
+        with self._lock:
+            return int(self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._total_bytes = 0
+
+    def close(self) -> None:
+        with self._lock:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
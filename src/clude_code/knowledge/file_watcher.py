@@ -0,0 +1,601 @@
+"""
+工作区变更源（Workspace Change Feed）
+
+用于替代 IndexerService 每 scan_interval_s 一次的 `rglob("*")` 全量扫描：
+- 初始扫描：自顶向下遍历，进入子目录之前先剪枝（排除目录 + .gitignore），不再深入 node_modules 等；
+- 稳态：Linux 使用 inotify（ctypes 直调 libc，无额外依赖），其它平台/不可用时回退为轮询；
+- 变更路径推入有界队列（同一路径去重）；队列溢出时置位 overflow，由消费方触发一次全量扫描兜底。
+"""
+
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import queue
+import re
+import select
+import struct
+import sys
+import threading
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass
+from pathlib import Path
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_EXTS: frozenset[str] = frozenset({".py", ".js", ".ts", ".go", ".rs", ".c", ".cpp", ".java"})
+DEFAULT_EXCLUDE_DIRS: frozenset[str] = frozenset({".git", "node_modules", ".venv", "venv", "dist", "build", ".clude"})
+
+
+# ---------------------------------------------------------------------------
+# .gitignore 规则
+# ---------------------------------------------------------------------------
+@dataclass(frozen=True)
+class _IgnoreRule:
+    regex: re.Pattern[str]
+    negate: bool
+    dir_only: bool
+    anchored: bool
+
+    def matches(self, rel: str, is_dir: bool) -> bool:
+        if self.dir_only and not is_dir:
+            return False
+        if self.anchored:
+            return bool(self.regex.fullmatch(rel))
+        # 非锚定规则（不含 /）：匹配任意层级的 basename
+        return bool(self.regex.fullmatch(rel.rsplit("/", 1)[-1]))
+
+
+def _glob_to_regex(pat: str) -> str:
+    """把 gitignore glob 转成正则：`**` 跨目录，`*`/`?` 不跨目录。"""
+    out: list[str] = []
+    i, n = 0, len(pat)
+    while i < n:
+        c = pat[i]
+        if c == "*":
+            if i + 1 < n and pat[i + 1] == "*":
+                # `**/` -> 任意层级目录（含 0 层）；结尾 `**` -> 任意内容
+                if i + 2 < n and pat[i + 2] == "/":
+                    out.append("(?:.*/)?")
+                    i += 3
+                    continue
+                out.append(".*")
+                i += 2
+                continue
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            j = pat.find("]", i + 1)
+            if j == -1:
+                out.append(re.escape(c))
+            else:
+                body = pat[i + 1 : j].replace("\\", "\\\\")
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out.append(f"[{body}]")
+                i = j + 1
+                continue
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
+def parse_gitignore(text: str) -> list[_IgnoreRule]:
+    """解析 .gitignore 文本（支持 `!` 取反、尾部 `/` 仅目录、`/` 锚定与 `**`）。"""
+    rules: list[_IgnoreRule] = []
+    for raw in (text or "").splitlines():
+        line = raw.rstrip()
+        if not line or line.startswith("#"):
+            continue
+        negate = line.startswith("!")
+        if negate:
+            line = line[1:]
+        if line.startswith("\\"):
+            line = line[1:]
+        dir_only = line.endswith("/")
+        line = line.strip("/") if dir_only else line
+        anchored = "/" in line
+        line = line.lstrip("/")
+        if not line:
+            continue
+        try:
+            rules.append(_IgnoreRule(re.compile(_glob_to_regex(line)), negate, dir_only, anchored))
+        except re.error:
+            _logger.debug(f"忽略无法解析的 .gitignore 规则: {raw!r}")
+    return rules
+
+
+class GitIgnoreMatcher:
+    """
+    按目录懒加载并缓存 .gitignore（外加根目录 `.git/info/exclude`）。
+
+    语义与 git 一致：更深层目录的规则优先，同一文件内后出现的规则优先；
+    目录一旦被忽略，其下所有内容都被忽略（无法被子规则重新包含）。
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self._rules: dict[str, list[_IgnoreRule]] = {}
+        self._dir_ignored: dict[str, bool] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, rel_dir: str) -> list[_IgnoreRule]:
+        with self._lock:
+            cached = self._rules.get(rel_dir)
+        if cached is not None:
+            return cached
+        base = self.root / rel_dir if rel_dir else self.root
+        text = ""
+        try:
+            text = (base / ".gitignore").read_text(encoding="utf-8", errors="replace")
+        except OSError:
+            pass
+        if not rel_dir:
+            try:
+                text += "\n" + (self.root / ".git" / "info" / "exclude").read_text(encoding="utf-8", errors="replace")
+            except OSError:
+                pass
+        rules = parse_gitignore(text)
+        with self._lock:
+            self._rules[rel_dir] = rules
+        return rules
+
+    def invalidate(self, rel_dir: str) -> None:
+        """某目录的 .gitignore 变化时调用：清掉规则与目录判定缓存。"""
+        with self._lock:
+            self._rules.pop(rel_dir, None)
+            self._dir_ignored.clear()
+
+    def _match_self(self, rel: str, is_dir: bool) -> bool:
+        parts = rel.split("/")
+        ignored = False
+        # 从根到父目录逐层应用规则：深层覆盖浅层
+        for depth in range(len(parts)):
+            rel_dir = "/".join(parts[:depth])
+            sub = "/".join(parts[depth:])
+            for rule in self._load(rel_dir):
+                if rule.matches(sub, is_dir):
+                    ignored = not rule.negate
+        return ignored
+
+    def is_ignored(self, rel: str, is_dir: bool = False) -> bool:
+        rel = rel.replace("\\", "/").strip("/")
+        if not rel:
+            return False
+        parent = rel.rsplit("/", 1)[0] if "/" in rel else ""
+        if parent and self._is_dir_ignored(parent):
+            return True
+        return self._match_self(rel, is_dir)
+
+    def _is_dir_ignored(self, rel_dir: str) -> bool:
+        with self._lock:
+            hit = self._dir_ignored.get(rel_dir)
+        if hit is not None:
+            return hit
+        parent = rel_dir.rsplit("/", 1)[0] if "/" in rel_dir else ""
+        res = (bool(parent) and self._is_dir_ignored(parent)) or self._match_self(rel_dir, True)
+        with self._lock:
+            self._dir_ignored[rel_dir] = res
+        return res
+
+
+# ---------------------------------------------------------------------------
+# 剪枝扫描器
+# ---------------------------------------------------------------------------
+class WorkspaceScanner:
+    """
+    剪枝遍历工作区：排除目录与被 .gitignore 忽略的目录在进入之前就被跳过。
+
+    `iter_files()` 直接使用 `os.scandir` 的 DirEntry.stat()（大多数平台上无需额外系统调用）。
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        *,
+        exts: frozenset[str] | set[str] | None = DEFAULT_INDEX_EXTS,
+        exclude_dirs: frozenset[str] | set[str] = DEFAULT_EXCLUDE_DIRS,
+        respect_gitignore: bool = True,
+    ) -> None:
+        self.root = Path(root)
+        # exts=None 表示不按扩展名过滤（如 grep 索引需要覆盖所有文本文件）
+        self.exts = frozenset(exts) if exts is not None else None
+        self.exclude_dirs = frozenset(exclude_dirs)
+        self.gitignore: GitIgnoreMatcher | None = GitIgnoreMatcher(self.root) if respect_gitignore else None
+
+    def _is_excluded_dir(self, rel_dir: str, name: str) -> bool:
+        if name in self.exclude_dirs:
+            return True
+        return bool(self.gitignore and self.gitignore.is_ignored(rel_dir, is_dir=True))
+
+    def is_candidate(self, rel_path: str) -> bool:
+        """判断一个相对路径是否属于索引范围（供 watcher 事件过滤使用）。"""
+        rel = rel_path.replace("\\", "/")
+        if self.exts is not None and os.path.splitext(rel)[1] not in self.exts:
+            return False
+        if any(part in self.exclude_dirs for part in rel.split("/")[:-1]):
+            return False
+        return not (self.gitignore and self.gitignore.is_ignored(rel))
+
+    def is_watched_dir(self, rel_dir: str) -> bool:
+        rel = rel_dir.replace("\\", "/").strip("/")
+        if not rel:
+            return True
+        if any(part in self.exclude_dirs for part in rel.split("/")):
+            return False
+        return not (self.gitignore and self.gitignore.is_ignored(rel, is_dir=True))
+
+    def iter_dirs(self, start_rel: str = "") -> Iterator[str]:
+        """剪枝遍历目录（含起点），产出相对路径（`/` 分隔）。"""
+        for rel_dir, _files in self._walk(start_rel, want_files=False):
+            yield rel_dir
+
+    def iter_files(
+        self, start_rel: str = "", *, ignore_files: dict[str, float] | None = None
+    ) -> Iterator[tuple[str, float]]:
+        """
+        剪枝遍历可索引文件，产出 (rel_path, mtime)。
+
+        传入 ignore_files 时顺带记录遍历到的 .gitignore 的 mtime（同一次遍历，供轮询检测忽略规则变化）。
+        """
+        for _rel_dir, files in self._walk(start_rel, want_files=True, ignore_files=ignore_files):
+            yield from files
+
+    def _walk(
+        self, start_rel: str, *, want_files: bool, ignore_files: dict[str, float] | None = None
+    ) -> Iterator[tuple[str, list[tuple[str, float]]]]:
+        stack = [start_rel.strip("/")]
+        while stack:
+            rel_dir = stack.pop()
+            abs_dir = self.root / rel_dir if rel_dir else self.root
+            files: list[tuple[str, float]] = []
+            try:
+                with os.scandir(abs_dir) as it:
+                    for entry in it:
+                        rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if not self._is_excluded_dir(rel, entry.name):
+                                    stack.append(rel)
+                                continue
+                            if not want_files or not entry.is_file(follow_symlinks=False):
+                                continue
+                            if ignore_files is not None and entry.name == ".gitignore":
+                                ignore_files[rel] = entry.stat(follow_symlinks=False).st_mtime
+                            if self.exts is not None and os.path.splitext(entry.name)[1] not in self.exts:
+                                continue
+                            if self.gitignore and self.gitignore.is_ignored(rel):
+                                continue
+                            files.append((rel, entry.stat(follow_symlinks=False).st_mtime))
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+            yield rel_dir, files
+
+
+# ---------------------------------------------------------------------------
+# 变更源（Change Feed）
+# ---------------------------------------------------------------------------
+class ChangeFeed:
+    """
+    变更源基类：后台线程把变更的相对路径推入有界队列。
+
+    - 同一路径在被消费前只入队一次（去重），队列长度即“待处理的不同路径数”；
+    - 队列满时不阻塞生产者，而是置位 `overflowed`，消费方应回退为一次全量扫描。
+    """
+
+    kind = "base"
+
+    def __init__(self, scanner: WorkspaceScanner, *, queue_size: int = 10_000) -> None:
+        self.scanner = scanner
+        self.queue: queue.Queue[str] = queue.Queue(maxsize=max(1, int(queue_size)))
+        self.overflowed = threading.Event()
+        self._pending: set[str] = set()
+        self._pending_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=f"clude-watch-{self.kind}", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self._close()
+
+    def push(self, rel_path: str) -> None:
+        rel = rel_path.replace("\\", "/").strip("/")
+        if not rel:
+            return
+        with self._pending_lock:
+            if rel in self._pending:
+                return
+            self._pending.add(rel)
+        try:
+            self.queue.put_nowait(rel)
+        except queue.Full:
+            with self._pending_lock:
+                self._pending.discard(rel)
+            if not self.overflowed.is_set():
+                _logger.warning("变更队列已满，将回退为一次全量扫描")
+            self.overflowed.set()
+
+    def drain(self, timeout: float = 1.0, debounce_s: float = 0.2) -> tuple[list[str], bool]:
+        """
+        阻塞等待至多 timeout 秒拿到第一条变更，再额外收集 debounce_s 内的后续变更。
+
+        Returns:
+            (去重后的路径列表, 是否发生过溢出)
+        """
+        out: list[str] = []
+        try:
+            out.append(self.queue.get(timeout=max(0.0, timeout)))
+        except queue.Empty:
+            pass
+        if out and debounce_s > 0:
+            time.sleep(debounce_s)
+        while True:
+            try:
+                out.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        with self._pending_lock:
+            self._pending.difference_update(out)
+        overflow = self.overflowed.is_set()
+        if overflow:
+            self.overflowed.clear()
+        return out, overflow
+
+    def _run(self) -> None:  # pragma: no cover - 子类实现
+        raise NotImplementedError
+
+    def _close(self) -> None:
+        pass
+
+
+class PollingChangeFeed(ChangeFeed):
+    """
+    轮询回退：每 interval_s 做一次剪枝扫描并与上一次快照比较（仅推送差异）。
+
+    基准快照在 start() 中同步建立：调用方先 start 再做初始扫描，扫描期间的改动会出现在下一次差异里。
+    .gitignore（及 .git/info/exclude）的变化与 inotify 模式一致：清掉规则缓存并置位 overflowed。
+    """
+
+    kind = "poll"
+
+    def __init__(self, scanner: WorkspaceScanner, *, queue_size: int = 10_000, interval_s: float = 30.0) -> None:
+        super().__init__(scanner, queue_size=queue_size)
+        self.interval_s = max(0.1, float(interval_s))
+        self._snapshot: dict[str, float] | None = None
+        self._ignores: dict[str, float] = {}
+
+    def _take_snapshot(self) -> tuple[dict[str, float], dict[str, float]]:
+        ignores: dict[str, float] = {}
+        files = dict(self.scanner.iter_files(ignore_files=ignores))
+        try:
+            ignores[".git/info/exclude"] = (self.scanner.root / ".git" / "info" / "exclude").stat().st_mtime
+        except OSError:
+            pass
+        return files, ignores
+
+    def start(self) -> None:
+        if self._snapshot is None:
+            self._snapshot, self._ignores = self._take_snapshot()
+        super().start()
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval_s):
+            try:
+                cur, ignores = self._take_snapshot()
+                if ignores != self._ignores and self.scanner.gitignore is not None:
+                    for rel in ignores.keys() | self._ignores.keys():
+                        if ignores.get(rel) != self._ignores.get(rel):
+                            rel_dir = "" if rel == ".git/info/exclude" else os.path.dirname(rel)
+                            self.scanner.gitignore.invalidate(rel_dir)
+                    # 忽略规则变化可能让大量文件进出索引范围：交给一次全量扫描处理，快照按新规则重建
+                    self.overflowed.set()
+                    self._snapshot, self._ignores = self._take_snapshot()
+                    continue
+            except Exception as e:
+                _logger.warning(f"轮询扫描失败: {e}")
+                continue
+            prev = self._snapshot or {}
+            for rel, mtime in cur.items():
+                if prev.get(rel) != mtime:
+                    self.push(rel)
+            for rel in prev.keys() - cur.keys():
+                self.push(rel)
+            self._snapshot, self._ignores = cur, ignores
+
+
+# inotify 常量（linux/inotify.h）
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_ISDIR = 0x40000000
+_WATCH_MASK = (
+    _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF | _IN_ONLYDIR
+)
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class InotifyUnavailable(RuntimeError):
+    """当前平台/内核不支持 inotify，或 watch 数超过 fs.inotify.max_user_watches。"""
+
+
+class InotifyChangeFeed(ChangeFeed):
+    """
+    Linux inotify 变更源（ctypes 直调 libc）。
+
+    对每个未被剪枝的目录注册一个 watch；新建目录时递归补注册并推送其中已有文件
+    （避免 `mkdir -p a/b && touch a/b/x.py` 的竞态漏报）。
+    """
+
+    kind = "inotify"
+
+    def __init__(self, scanner: WorkspaceScanner, *, queue_size: int = 10_000) -> None:
+        super().__init__(scanner, queue_size=queue_size)
+        if not sys.platform.startswith("linux"):
+            raise InotifyUnavailable("inotify 仅在 Linux 上可用")
+        lib = ctypes.util.find_library("c") or "libc.so.6"
+        try:
+            self._libc = ctypes.CDLL(lib, use_errno=True)
+            self._libc.inotify_init1.argtypes = [ctypes.c_int]
+            self._libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+            self._libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        except (OSError, AttributeError) as e:
+            raise InotifyUnavailable(f"libc inotify 不可用: {e}") from e
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise InotifyUnavailable(f"inotify_init1 失败: {os.strerror(ctypes.get_errno())}")
+        self._wd_to_dir: dict[int, str] = {}
+        # 注册阶段在构造函数内同步完成：watch 上限不足时调用方可立即回退为轮询
+        try:
+            for rel_dir in scanner.iter_dirs():
+                self._add_watch(rel_dir)
+        except InotifyUnavailable:
+            self._close()
+            raise
+
+    def _add_watch(self, rel_dir: str) -> None:
+        abs_dir = self.scanner.root / rel_dir if rel_dir else self.scanner.root
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(str(abs_dir)), _WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                raise InotifyUnavailable("inotify watch 数已达上限（fs.inotify.max_user_watches）")
+            # 目录在注册前被删除等竞态：忽略
+            return
+        self._wd_to_dir[wd] = rel_dir
+
+    def _watch_tree(self, rel_dir: str) -> None:
+        try:
+            for d in self.scanner.iter_dirs(rel_dir):
+                self._add_watch(d)
+            for rel, _mtime in self.scanner.iter_files(rel_dir):
+                self.push(rel)
+        except InotifyUnavailable as e:
+            _logger.warning(f"{e}；新目录将依赖下一次全量扫描")
+            self.overflowed.set()
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                ready, _, _ = select.select([self._fd], [], [], 1.0)
+            except (OSError, ValueError):
+                break
+            if not ready:
+                continue
+            try:
+                buf = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            except OSError:
+                break
+            self._handle_events(buf)
+
+    def _handle_events(self, buf: bytes) -> None:
+        off = 0
+        size = _EVENT_HEADER.size
+        while off + size <= len(buf):
+            wd, mask, _cookie, name_len = _EVENT_HEADER.unpack_from(buf, off)
+            name = buf[off + size : off + size + name_len].rstrip(b"\0").decode("utf-8", errors="surrogateescape")
+            off += size + name_len
+
+            if mask & _IN_Q_OVERFLOW:
+                self.overflowed.set()
+                continue
+            if mask & _IN_IGNORED:
+                self._wd_to_dir.pop(wd, None)
+                continue
+            rel_dir = self._wd_to_dir.get(wd)
+            if rel_dir is None:
+                continue
+            if mask & _IN_DELETE_SELF:
+                self.push(rel_dir)
+                continue
+            if not name:
+                continue
+            rel = f"{rel_dir}/{name}" if rel_dir else name
+
+            if name == ".gitignore" and self.scanner.gitignore is not None:
+                self.scanner.gitignore.invalidate(rel_dir)
+                # 忽略规则变化可能让大量文件进出索引范围：交给一次全量扫描处理
+                self.overflowed.set()
+                continue
+
+            if mask & _IN_ISDIR:
+                if mask & (_IN_CREATE | _IN_MOVED_TO):
+                    if self.scanner.is_watched_dir(rel):
+                        self._watch_tree(rel)
+                elif mask & (_IN_DELETE | _IN_MOVED_FROM):
+                    # 目录被删除/移走：消费方按前缀清理
+                    self.push(rel)
+                continue
+
+            if mask & (_IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_MOVED_FROM | _IN_DELETE):
+                if self.scanner.is_candidate(rel):
+                    self.push(rel)
+
+    def _close(self) -> None:
+        fd = getattr(self, "_fd", -1)
+        if fd >= 0:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+            self._fd = -1
+
+
+def build_change_feed(
+    scanner: WorkspaceScanner,
+    *,
+    mode: str = "auto",
+    queue_size: int = 10_000,
+    poll_interval_s: float = 30.0,
+) -> ChangeFeed:
+    """
+    构建变更源：mode=auto 时优先 inotify，失败自动回退轮询；mode=poll 强制轮询。
+    """
+    m = (mode or "auto").strip().lower()
+    if m in ("auto", "inotify"):
+        try:
+            return InotifyChangeFeed(scanner, queue_size=queue_size)
+        except InotifyUnavailable as e:
+            if m == "inotify":
+                _logger.warning(f"inotify 不可用，回退为轮询: {e}")
+            else:
+                _logger.debug(f"inotify 不可用，使用轮询: {e}")
+    return PollingChangeFeed(scanner, queue_size=queue_size, interval_s=poll_interval_s)
+
+
+__all__ = [
+    "DEFAULT_INDEX_EXTS",
+    "DEFAULT_EXCLUDE_DIRS",
+    "GitIgnoreMatcher",
+    "parse_gitignore",
+    "WorkspaceScanner",
+    "ChangeFeed",
+    "PollingChangeFeed",
+    "InotifyChangeFeed",
+    "InotifyUnavailable",
+    "build_change_feed",
+]
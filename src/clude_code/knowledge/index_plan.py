@@ -0,0 +1,236 @@
+"""
+单文件索引计划（Per-file Index Plan）
+
+把“读文件 → 护栏 → 分块 → chunk 级 diff”抽成纯函数，与“嵌入 + 写向量库 + 更新 state”分离：
+- 线程模式：IndexerService 在工作线程内直接调用；
+- 进程模式：index_workers 在子进程内调用（分块是纯 Python，放进子进程才能绕开 GIL），
+  父进程只负责写 LanceDB 与更新 state（单写者）。
+"""
+
+from __future__ import annotations
+
+import hashlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from clude_code.config.config import CludeConfig
+from clude_code.knowledge.chunking import detect_language_from_path
+from clude_code.knowledge.embedding_cache import chunk_hash
+
+
+@dataclass
+class FileUpdate:
+    """
+    单文件的索引计划。
+
+    kind:
+    - skipped:   超大/二进制文件（state 标记 skipped）
+    - unchanged: 内容哈希未变（state 标记 skipped=False）
+    - empty:     读取失败或无可用 chunk（不改动 state）
+    - update:    需要写入向量库
+    """
+
+    rel_path: str
+    kind: str
+    file_hash: str = ""
+    mtime: float = 0.0
+    incremental: bool = False
+    stale_ids: List[str] = field(default_factory=list)
+    to_add: List[Dict[str, Any]] = field(default_factory=list)
+    # 内容未变、只是行号平移的 chunk：行号偏移量 -> chunk_id 列表（只改行号列，不重新嵌入）
+    moved: Dict[int, List[str]] = field(default_factory=dict)
+    # chunk_id -> [start_line, end_line]（写入 state，供下次 diff）
+    new_sig: Dict[str, List[int]] = field(default_factory=dict)
+
+    def columns(self) -> Dict[str, List[Any]]:
+        """把 to_add 行转成列式结构（供 VectorStore.add_batch）。"""
+        if not self.to_add:
+            return {}
+        return {name: [r[name] for r in self.to_add] for name in self.to_add[0].keys()}
+
+
+def is_probably_binary(path: Path) -> bool:
+    try:
+        with path.open("rb") as f:
+            head = f.read(4096)
+        return b"\x00" in head
+    except Exception:
+        return False
+
+
+def smart_chunking(cfg: CludeConfig, text: str) -> List[Dict[str, Any]]:
+    """
+    启发式分块：尝试在函数/类定义处切分，而不是固定行数。
+    """
+    lines = text.splitlines()
+    chunks = []
+    current_lines: List[str] = []
+    start_line = 1
+
+    # 配置参数
+    target_lines = int(getattr(cfg.rag, "chunk_target_lines", 40) or 40)
+    max_lines = int(getattr(cfg.rag, "chunk_max_lines", 60) or 60)
+    overlap_lines = int(getattr(cfg.rag, "chunk_overlap_lines", 5) or 5)
+
+    for i, line in enumerate(lines):
+        current_lines.append(line)
+
+        # 切分触发条件：
+        # 1. 达到目标行数且遇到空行
+        # 2. 达到硬性上限
+        # 3. 遇到新的顶层定义（简易识别）
+        is_new_def = line.startswith(("def ", "class ", "export ", "func ", "fn "))
+
+        should_split = False
+        if len(current_lines) >= target_lines and not line.strip():
+            should_split = True
+        elif len(current_lines) >= max_lines:
+            should_split = True
+        elif len(current_lines) > 10 and is_new_def:
+            should_split = True
+
+        if should_split:
+            chunks.append({
+                "text": "\n".join(current_lines),
+                "start": start_line,
+                "end": i + 1
+            })
+            # 业界做法：保留少量 overlap，提升跨块检索一致性
+            if overlap_lines > 0:
+                current_lines = current_lines[-overlap_lines:]
+                start_line = (i + 2) - len(current_lines)
+            else:
+                current_lines = []
+                start_line = i + 2
+
+    # 处理剩余行
+    if current_lines:
+        chunks.append({
+            "text": "\n".join(current_lines),
+            "start": start_line,
+            "end": len(lines)
+        })
+
+    return chunks
+
+
+def plan_file_update(
+    cfg: CludeConfig,
+    chunker: Any,
+    path: Path,
+    rel_path: str,
+    prev: Optional[Dict[str, Any]],
+) -> FileUpdate:
+    """语义化分块并与上次索引的 chunk 签名做 diff（不做嵌入、不写库）。"""
+    try:
+        # 护栏 1：超大文件跳过
+        max_bytes = int(getattr(cfg.rag, "max_file_bytes", 2_000_000) or 2_000_000)
+        if path.stat().st_size > max_bytes:
+            return FileUpdate(rel_path, "skipped")
+        # 护栏 2：二进制文件跳过（避免把乱码写入向量库）
+        if is_probably_binary(path):
+            return FileUpdate(rel_path, "skipped")
+        content = path.read_text(encoding="utf-8", errors="replace")
+        mtime = path.stat().st_mtime
+    except Exception:
+        return FileUpdate(rel_path, "empty")
+
+    file_hash = hashlib.md5(content.encode()).hexdigest()
+
+    # 如果内容 hash 没变，则跳过（解决某些平台 mtime 抖动/拷贝导致的重复索引）
+    if isinstance(prev, dict) and prev.get("hash") == file_hash:
+        return FileUpdate(rel_path, "unchanged", file_hash=file_hash, mtime=mtime)
+
+    # --- 深度调优：基于逻辑块的分块 ---
+    chunks: List[Any] = []
+    try:
+        # tree-sitter 模式缺依赖/解析失败时会返回空；自动降级到启发式（业界常见“可用优先”策略）
+        chunks = list(chunker.chunk(text=content, path=rel_path))
+    except Exception:
+        chunks = []
+    if not chunks:
+        chunks = smart_chunking(cfg, content)
+
+    if not chunks:
+        return FileUpdate(rel_path, "empty")
+
+    # 兼容两类结构：dict（历史）与 CodeChunk（新）
+    rows: List[Dict[str, Any]] = []
+    seen: Dict[str, int] = {}
+    for c in chunks:
+        if isinstance(c, dict):
+            c_text = str(c.get("text") or "")
+            c_start = int(c.get("start") or 1)
+            c_end = int(c.get("end") or c_start)
+            lang = detect_language_from_path(rel_path)
+            symbol = None
+            node_type = None
+            scope = None
+        else:
+            c_text = str(getattr(c, "text", "") or "")
+            c_start = int(getattr(c, "start_line", 1) or 1)
+            c_end = int(getattr(c, "end_line", c_start) or c_start)
+            lang = getattr(c, "language", None)
+            symbol = getattr(c, "symbol", None)
+            node_type = getattr(c, "node_type", None)
+            scope = getattr(c, "scope", None)
+        # chunk_id = 路径 + 符号 + 内容哈希（不含行号）：在文件前部插入一行不会改变后面 chunk 的 id；
+        # 同一文件内内容完全相同的 chunk 按出现顺序加序号区分
+        chunk_id = f"{rel_path}:{symbol or node_type or 'chunk'}:{chunk_hash(c_text)[:16]}"
+        seen[chunk_id] = seen.get(chunk_id, 0) + 1
+        if seen[chunk_id] > 1:
+            chunk_id = f"{chunk_id}#{seen[chunk_id]}"
+        rows.append({
+            "text": c_text,
+            "path": rel_path,
+            "start_line": c_start,
+            "end_line": c_end,
+            "file_hash": file_hash,
+            "language": lang,
+            "symbol": symbol,
+            "node_type": node_type,
+            "scope": scope,
+            "chunk_id": chunk_id,
+        })
+
+    # chunk 级 diff（chunk_id 已包含内容哈希）：
+    # - 上次有、这次没有的 id：删除；这次新出现的 id：嵌入并写入；
+    # - 两次都有但行号变了：只平移行号列（同一偏移量的 chunk 合并为一次更新）。
+    # 注意：保留行的 file_hash 列仍是旧值（该列仅用于溯源，不参与检索）。
+    new_sig: Dict[str, List[int]] = {r["chunk_id"]: [r["start_line"], r["end_line"]] for r in rows}
+    prev_sig = prev.get("chunks") if isinstance(prev, dict) else None
+    # 旧版 state（值为内容哈希字符串、id 含行号）无法增量对比：整文件重建一次
+    incremental = isinstance(prev_sig, dict) and all(isinstance(v, list) and len(v) == 2 for v in prev_sig.values())
+    stale_ids: List[str] = []
+    to_add: List[Dict[str, Any]] = []
+    moved: Dict[int, List[str]] = {}
+    if incremental:
+        assert isinstance(prev_sig, dict)
+        stale_ids = [cid for cid in prev_sig if cid not in new_sig]
+        for r in rows:
+            old = prev_sig.get(r["chunk_id"])
+            if old is None:
+                to_add.append(r)
+                continue
+            delta = r["start_line"] - int(old[0])
+            if delta != r["end_line"] - int(old[1]):
+                # 内容相同但行数不同（例如行尾空行被并入）：当作变化处理
+                stale_ids.append(r["chunk_id"])
+                to_add.append(r)
+            elif delta:
+                moved.setdefault(delta, []).append(r["chunk_id"])
+    else:
+        to_add = rows
+
+    return FileUpdate(
+        rel_path,
+        "update",
+        file_hash=file_hash,
+        mtime=mtime,
+        incremental=incremental,
+        stale_ids=stale_ids,
+        to_add=to_add,
+        moved=moved,
+        new_sig=new_sig,
+    )
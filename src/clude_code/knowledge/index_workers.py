@@ -0,0 +1,150 @@
+"""
+进程池索引（Process-Pool Indexing）
+
+线程模式下分块（heuristic / tree-sitter）是纯 Python、所有线程共享一个 ONNX 模型，吞吐被 GIL 卡在 ~1 核。
+进程模式把“读文件 + 分块 + diff + 嵌入”放到子进程：
+- 每个 worker 在 initializer 中各自加载一次 embedding 模型（ONNX intra-op 线程数可配置，避免 N×threads 超卖）；
+- 向量矩阵经 `multiprocessing.shared_memory` 回传父进程（小结果直接随 pickle 返回，省去 shm 系统调用）；
+- 父进程保持 LanceDB/state 的唯一写者。
+
+子进程使用 spawn 启动：父进程内已有 LanceDB/tokio 等线程，fork 不安全。
+"""
+
+from __future__ import annotations
+
+import logging
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from clude_code.config.config import CludeConfig
+from clude_code.knowledge.index_plan import FileUpdate, plan_file_update
+
+_logger = logging.getLogger(__name__)
+
+# 小于该字节数的向量矩阵直接随结果 pickle 返回
+_INLINE_MAX_BYTES = 64 * 1024
+
+# 子进程内的单例（由 _init_worker 初始化）
+_W_CFG: Optional[CludeConfig] = None
+_W_CHUNKER: Any = None
+_W_EMBEDDER: Any = None
+
+
+@dataclass
+class WorkerResult:
+    """子进程返回：索引计划 + 向量（shm 名称或内联字节）。"""
+
+    update: FileUpdate
+    shape: tuple[int, int] = (0, 0)
+    shm_name: Optional[str] = None
+    inline: Optional[bytes] = None
+
+
+def resolve_onnx_threads(cfg: CludeConfig, workers: int) -> int:
+    """每个 worker 的 ONNX intra-op 线程数：显式配置优先，否则按 CPU 核数均分。"""
+    n = int(getattr(cfg.rag, "onnx_threads", 0) or 0)
+    if n > 0:
+        return n
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def _init_worker(cfg_data: Dict[str, Any], onnx_threads: int) -> None:
+    global _W_CFG, _W_CHUNKER, _W_EMBEDDER
+    # 在 onnxruntime/numpy 导入前限制底层线程池，避免与 intra-op 线程叠加超卖
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = str(onnx_threads)
+
+    from clude_code.knowledge.chunking import build_chunker
+    from clude_code.knowledge.embedder import CodeEmbedder
+
+    cfg = CludeConfig(**cfg_data)
+    cfg.rag.onnx_threads = onnx_threads
+    _W_CFG = cfg
+    _W_CHUNKER = build_chunker(cfg)
+    _W_EMBEDDER = CodeEmbedder(cfg)
+
+
+def _index_in_worker(abs_path: str, rel_path: str, prev: Dict[str, Any]) -> WorkerResult:
+    assert _W_CFG is not None and _W_EMBEDDER is not None
+    update = plan_file_update(_W_CFG, _W_CHUNKER, Path(abs_path), rel_path, prev)
+    if update.kind != "update" or not update.to_add:
+        return WorkerResult(update)
+
+    batch_size = int(getattr(_W_CFG.rag, "embed_batch_size", 64) or 64)
+    vectors = _W_EMBEDDER.embed_batch([r["text"] for r in update.to_add], batch_size=batch_size)
+    shape = (int(vectors.shape[0]), int(vectors.shape[1]))
+    if vectors.nbytes <= _INLINE_MAX_BYTES:
+        return WorkerResult(update, shape=shape, inline=vectors.tobytes())
+
+    from multiprocessing import resource_tracker, shared_memory
+
+    import numpy as np
+
+    shm = shared_memory.SharedMemory(create=True, size=vectors.nbytes)
+    try:
+        np.ndarray(shape, dtype=np.float32, buffer=shm.buf)[:] = vectors
+        name = shm.name
+    finally:
+        shm.close()
+    # 所有权转交父进程（由父进程 unlink）：子进程的 resource_tracker 不再跟踪，避免退出时误删/告警
+    try:
+        resource_tracker.unregister(shm._name, "shared_memory")  # type: ignore[attr-defined]
+    except Exception:
+        pass
+    return WorkerResult(update, shape=shape, shm_name=name)
+
+
+class ProcessIndexPool:
+    """
+    常驻进程池：跨批次复用（模型只在 worker 启动时加载一次）。
+    """
+
+    def __init__(self, cfg: CludeConfig, workers: int) -> None:
+        self.workers = max(1, int(workers))
+        self.onnx_threads = resolve_onnx_threads(cfg, self.workers)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=mp.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(cfg.model_dump(mode="json"), self.onnx_threads),
+        )
+        _logger.info(f"进程池索引已启动: workers={self.workers}, onnx_threads/worker={self.onnx_threads}")
+
+    def submit(self, abs_path: Path, rel_path: str, prev: Dict[str, Any]):
+        return self._executor.submit(_index_in_worker, str(abs_path), rel_path, prev)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def load_vectors(result: WorkerResult, consume: Any) -> None:
+    """
+    在父进程中把 worker 的向量映射为 ndarray 并交给 consume(vectors)；
+    shm 在 consume 返回后释放（consume 内可零拷贝使用该缓冲区）。
+    """
+    import numpy as np
+
+    if result.inline is not None:
+        consume(np.frombuffer(result.inline, dtype=np.float32).reshape(result.shape))
+        return
+    if result.shm_name is None:
+        consume(None)
+        return
+
+    from multiprocessing import shared_memory
+
+    shm = shared_memory.SharedMemory(name=result.shm_name)
+    try:
+        view = np.ndarray(result.shape, dtype=np.float32, buffer=shm.buf)
+        consume(view)
+        del view
+    finally:
+        shm.close()
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
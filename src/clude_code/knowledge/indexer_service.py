@@ -1,23 +1,26 @@
 from __future__ import annotations
 
 import json
-import hashlib
 import logging
 import threading
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 from pathlib import Path
 from typing import Any, List, Optional, Dict
 
 from clude_code.config.config import CludeConfig
 from clude_code.knowledge.vector_store import VectorStore
 from clude_code.knowledge.embedder import CodeEmbedder
-from clude_code.knowledge.chunking import build_chunker, detect_language_from_path
+from clude_code.knowledge.index_plan import FileUpdate, is_probably_binary, plan_file_update, smart_chunking
+from clude_code.knowledge.chunking import build_chunker
+from clude_code.knowledge.file_watcher import ChangeFeed, WorkspaceScanner, build_change_feed
+from clude_code.knowledge.index_workers import ProcessIndexPool, load_vectors
 
 
 class IndexerService:
     """
     后台索引服务：支持增量扫描与深度调优。
+    事件驱动：初始剪枝扫描一次，之后只处理变更源（inotify / 轮询回退）推送的路径。
     大文件治理说明：引入 mtime 校验与语义化分块。
     """
     def __init__(self, cfg: CludeConfig):
@@ -29,6 +32,14 @@ class IndexerService:
         self.chunker = build_chunker(cfg)
         self._stop_event = threading.Event()
         self._thread: Optional[threading.Thread] = None
+        # 事件驱动增量索引：剪枝扫描器 + 变更源（inotify / 轮询回退），在后台线程内创建
+        self._scanner = WorkspaceScanner(
+            self.workspace_root,
+            respect_gitignore=bool(getattr(cfg.rag, "respect_gitignore", True)),
+        )
+        self._feed: Optional[ChangeFeed] = None
+        # rag.index_mode=process 时懒加载的常驻进程池（每个 worker 各自加载一次模型）
+        self._process_pool: Optional[ProcessIndexPool] = None
         self._logger = get_logger(
             __name__,
             workspace_root=cfg.workspace_root,
@@ -53,6 +64,10 @@ class IndexerService:
         self.indexed_files = 0
         self.total_files = 0
 
+        # 表维护调度（compaction + 旧版本清理）
+        self._last_compact = time.monotonic()
+        self._dirty_since_compact = False
+
         # 索引状态持久化（业界标配：可恢复的增量索引）
         # 版本隔离：table_name/chunker 变化时触发重新索引（避免“state 认为已索引，但表为空/策略不同”）
         table_name = str(getattr(cfg.rag, "table_name", "") or "code_chunks")
@@ -88,55 +103,172 @@ class IndexerService:
         # P2-1: 并发索引配置（线程池控制）
         max_workers = int(getattr(self.cfg.rag, "index_workers", 4) or 4)
         max_workers = max(1, min(max_workers, 16))  # 限制在 1-16 之间
+        debounce_s = max(0, int(getattr(self.cfg.rag, "watch_debounce_ms", 200) or 0)) / 1000.0
 
+        # 1. 初始全量扫描（剪枝遍历 + mtime 比对），之后只处理变更源推送的路径
+        need_full_scan = True
         while not self._stop_event.is_set():
             try:
-                self.status = "scanning"
-                # 1. 扫描出真正变化的文件
-                files_to_index = self._scan_modified_files()
-                self.total_files = len(files_to_index)
-
-                if files_to_index:
-                    self.status = f"indexing ({max_workers} workers)"
-                    self.indexed_files = 0
-                    self._index_errors: list[str] = []
-
-                    # P2-1: 使用 ThreadPoolExecutor 并发索引
-                    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                        # 提交所有任务
-                        future_to_path = {
-                            executor.submit(self._index_file_safe, fp): fp
-                            for fp in files_to_index
-                        }
-
-                        # 收集结果（带进度更新）
-                        for future in as_completed(future_to_path):
-                            if self._stop_event.is_set():
-                                executor.shutdown(wait=False, cancel_futures=True)
-                                break
-                            path = future_to_path[future]
-                            try:
-                                future.result()
-                            except Exception as e:
-                                self._index_errors.append(f"{path}: {e}")
-                            self.indexed_files += 1
-
-                    self._save_state()
-
-                    if self._index_errors:
-                        self._logger.warning(f"索引完成，{len(self._index_errors)} 个文件失败")
-
+                if self._feed is None:
+                    # 先建立监听再做初始扫描：扫描期间发生的变更不会丢失（重复的由 mtime/hash 去重）
+                    self._feed = self._build_feed()
+                    self._feed.start()
+
+                self._maybe_compact()
+                if need_full_scan:
+                    self.status = "scanning"
+                    files_to_index = self._scan_modified_files()
+                    need_full_scan = False
+                else:
+                    self.status = f"watching ({self._feed.kind})"
+                    changed, overflow = self._feed.drain(timeout=1.0, debounce_s=debounce_s)
+                    if overflow:
+                        self._logger.info("变更源溢出/忽略规则变化，执行一次全量扫描")
+                        need_full_scan = True
+                        continue
+                    if not changed:
+                        continue
+                    files_to_index = self._resolve_changes(changed)
+
+                self._index_batch(files_to_index, max_workers)
                 self.status = "idle"
-                # 休眠间隔（可配置）
-                sleep_s = int(getattr(self.cfg.rag, "scan_interval_s", 30) or 30)
-                for _ in range(sleep_s):
-                    if self._stop_event.is_set():
-                        break
-                    time.sleep(1)
             except Exception as e:
                 self.status = f"error: {str(e)}"
                 self._logger.exception("IndexerService 后台索引异常", exc_info=True)
-                time.sleep(10)
+                need_full_scan = True
+                self._stop_event.wait(10)
+
+        if self._feed is not None:
+            self._feed.stop()
+            self._feed = None
+        if self._process_pool is not None:
+            self._process_pool.shutdown()
+            self._process_pool = None
+
+    def _build_feed(self) -> ChangeFeed:
+        mode = str(getattr(self.cfg.rag, "watch_mode", "auto") or "auto")
+        queue_size = int(getattr(self.cfg.rag, "change_queue_size", 10_000) or 10_000)
+        poll_interval_s = int(getattr(self.cfg.rag, "scan_interval_s", 30) or 30)
+        feed = build_change_feed(self._scanner, mode=mode, queue_size=queue_size, poll_interval_s=poll_interval_s)
+        self._logger.info(f"后台索引变更源: {feed.kind}")
+        return feed
+
+    def _index_batch(self, files_to_index: List[Path], max_workers: int) -> None:
+        self.total_files = len(files_to_index)
+        if not files_to_index:
+            return
+
+        self.indexed_files = 0
+        self._index_errors: list[str] = []
+
+        mode = str(getattr(self.cfg.rag, "index_mode", "thread") or "thread").lower()
+        if mode == "process":
+            self.status = f"indexing ({max_workers} processes)"
+            self._index_batch_process(files_to_index, max_workers)
+            self._save_state()
+            if self._index_errors:
+                self._logger.warning(f"索引完成，{len(self._index_errors)} 个文件失败")
+            self._maintain_ann_index()
+            return
+
+        self.status = f"indexing ({max_workers} workers)"
+        # P2-1: 使用 ThreadPoolExecutor 并发索引
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # 提交所有任务
+            future_to_path = {
+                executor.submit(self._index_file_safe, fp): fp
+                for fp in files_to_index
+            }
+
+            # 收集结果（带进度更新）
+            for future in as_completed(future_to_path):
+                if self._stop_event.is_set():
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    break
+                path = future_to_path[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    self._index_errors.append(f"{path}: {e}")
+                self.indexed_files += 1
+
+        self._save_state()
+
+        if self._index_errors:
+            self._logger.warning(f"索引完成，{len(self._index_errors)} 个文件失败")
+        self._maintain_ann_index()
+
+    def _maybe_compact(self) -> None:
+        """按 rag.compact_interval_s 定期做表维护（仅在有写入后）；失败不影响索引流程。"""
+        interval = int(getattr(self.cfg.rag, "compact_interval_s", 300) or 300)
+        now = time.monotonic()
+        if not self._dirty_since_compact or now - self._last_compact < interval:
+            return
+        self._last_compact = now
+        self._dirty_since_compact = False
+        try:
+            self.status = "compacting"
+            self.store.compact()
+        except Exception as e:
+            self._logger.warning(f"向量表维护失败: {e}")
+
+    def _maintain_ann_index(self) -> None:
+        """每批写入后维护 ANN 索引（过阈值构建 / 增量更新 / 重训）；失败不影响索引流程。"""
+        if self._stop_event.is_set():
+            return
+        try:
+            action = self.store.maintain_index()
+            if action in ("built", "retrained", "updated"):
+                self._logger.info(f"ANN 索引维护: {action}")
+        except Exception as e:
+            self._logger.warning(f"ANN 索引维护失败: {e}")
+
+    def _index_batch_process(self, files_to_index: List[Path], max_workers: int) -> None:
+        """
+        进程池模式：子进程完成读文件/分块/diff/嵌入，父进程按完成顺序写库与更新 state。
+
+        在途任务数限制为 workers×4，避免大批量时 shm 段与结果在父进程堆积。
+        """
+        if self._process_pool is None:
+            self._process_pool = ProcessIndexPool(self.cfg, max_workers)
+        pool = self._process_pool
+        window = pool.workers * 4
+        in_flight: dict[Any, Path] = {}
+
+        def _consume(fut: Any, path: Path) -> None:
+            try:
+                res = fut.result()
+                load_vectors(res, lambda vectors: self._apply_update(res.update, vectors))
+            except Exception as e:
+                self._logger.warning(f"索引文件失败 [{path}]: {e}")
+                self._index_errors.append(f"{path}: {e}")
+            self.indexed_files += 1
+
+        pending = iter(files_to_index)
+        exhausted = False
+        while not self._stop_event.is_set():
+            while not exhausted and len(in_flight) < window:
+                fp = next(pending, None)
+                if fp is None:
+                    exhausted = True
+                    break
+                rel_path = str(fp.relative_to(self.workspace_root))
+                with self._state_lock:
+                    prev = dict(self._state.get(rel_path) or {})
+                in_flight[pool.submit(fp, rel_path, prev)] = fp
+            if not in_flight:
+                break
+            done, _ = wait(list(in_flight), timeout=1.0, return_when=FIRST_COMPLETED)
+            for fut in done:
+                _consume(fut, in_flight.pop(fut))
+
+        # 被中断：取消未开始的任务，已完成的结果仍需释放其 shm
+        for fut in in_flight:
+            if not fut.cancel():
+                try:
+                    load_vectors(fut.result(timeout=30), lambda _v: None)
+                except Exception:
+                    pass
 
     def _index_file_safe(self, path: Path) -> None:
         """
@@ -151,139 +283,112 @@ class IndexerService:
             raise
 
     def _scan_modified_files(self) -> List[Path]:
-        """增量扫描：仅返回自上次扫描以来修改过或新增加的文件。"""
-        valid_exts = {".py", ".js", ".ts", ".go", ".rs", ".c", ".cpp", ".java"}
-        exclude_dirs = {".git", "node_modules", ".venv", "venv", "dist", "build", ".clude"}
+        """全量增量扫描：剪枝遍历工作区，仅返回自上次索引以来修改过或新增加的文件。"""
+        # 一次性取 state 快照，避免遍历时每个文件都抢一次锁
+        with self._state_lock:
+            known_mtimes = {
+                k: float(v.get("mtime", 0.0)) if isinstance(v, dict) else 0.0
+                for k, v in self._state.items()
+            }
 
-        modified = []
+        modified: List[Path] = []
         current_paths: set[str] = set()
+        for rel_path, mtime in self._scanner.iter_files():
+            current_paths.add(rel_path)
+            # 如果是新文件，或者 mtime 变了（注意：这里只"发现"，不提前写入 state，避免索引失败后被错误跳过）
+            if known_mtimes.get(rel_path, 0.0) < mtime:
+                modified.append(self.workspace_root / rel_path)
 
-        for p in self.workspace_root.rglob("*"):
-            if not p.is_file() or p.suffix not in valid_exts:
-                continue
-            if any(part in p.parts for part in exclude_dirs):
-                continue
+        # 清理已删除（或新被 .gitignore 忽略）的文件，同步删除向量库中的记录
+        self._forget_paths(set(known_mtimes) - current_paths)
+        return modified
 
-            rel_path = str(p.relative_to(self.workspace_root))
-            current_paths.add(rel_path)
+    def _resolve_changes(self, rel_paths: List[str]) -> List[Path]:
+        """
+        处理变更源推送的路径：存在且在索引范围内 -> 待索引；不存在 -> 从 state/向量库删除。
 
-            mtime = p.stat().st_mtime
-            # 如果是新文件，或者 mtime 变了（注意：这里只"发现"，不提前写入 state，避免索引失败后被错误跳过）
-            # P2-1: 并发安全的状态读取
-            with self._state_lock:
-                st = self._state.get(rel_path)
-            prev_mtime = float(st.get("mtime", 0.0)) if isinstance(st, dict) else 0.0
-            if prev_mtime < mtime:
-                modified.append(p)
+        目录删除/移走时 watcher 推送的是目录路径，这里按前缀清理其下所有记录。
+        """
+        modified: List[Path] = []
+        gone: set[str] = set()
+        with self._state_lock:
+            known = set(self._state.keys())
+        for rel in rel_paths:
+            abs_path = self.workspace_root / rel
+            try:
+                st = abs_path.stat()
+            except OSError:
+                st = None
+            if st is not None and abs_path.is_file():
+                if self._scanner.is_candidate(rel):
+                    modified.append(abs_path)
+                elif rel in known:
+                    gone.add(rel)
+                continue
+            if st is not None and abs_path.is_dir():
+                # 目录被移入：补扫其中文件（inotify 模式通常已逐个推送，这里兜底）
+                modified.extend(self.workspace_root / r for r, _m in self._scanner.iter_files(rel))
+                continue
+            if rel in known:
+                gone.add(rel)
+            prefix = rel.rstrip("/") + "/"
+            gone.update(k for k in known if k.startswith(prefix))
+        self._forget_paths(gone)
+        return modified
 
-        # 清理已删除的文件（可选：同步删除向量库中的记录）
+    def _forget_paths(self, deleted_paths: set[str]) -> None:
+        if not deleted_paths:
+            return
         # P2-1: 并发安全的状态修改
         with self._state_lock:
-            deleted_paths = set(self._state.keys()) - current_paths
             for dp in deleted_paths:
                 self.store.delete_by_path(dp)
-                del self._state[dp]
-
-        # 扫描阶段仅在发生删除时持久化（删除需要落盘；mtime 更新应在索引成功后落盘）
-        if deleted_paths:
-            self._save_state()
-
-        return modified
+                self._state.pop(dp, None)
+        # 删除需要落盘；mtime 更新应在索引成功后落盘
+        self._save_state()
 
     def _index_file(self, path: Path):
         """语义化分块并写入向量库。"""
         rel_path = str(path.relative_to(self.workspace_root))
-        try:
-            # 护栏 1：超大文件跳过
-            max_bytes = int(getattr(self.cfg.rag, "max_file_bytes", 2_000_000) or 2_000_000)
-            if path.stat().st_size > max_bytes:
-                with self._state_lock:
-                    self._state.setdefault(rel_path, {})["skipped"] = True
-                return
-            # 护栏 2：二进制文件跳过（避免把乱码写入向量库）
-            if self._is_probably_binary(path):
-                with self._state_lock:
-                    self._state.setdefault(rel_path, {})["skipped"] = True
-                return
-            content = path.read_text(encoding="utf-8", errors="replace")
-        except Exception:
-            return
-
-        mtime = path.stat().st_mtime
-        file_hash = hashlib.md5(content.encode()).hexdigest()
-
-        # 如果内容 hash 没变，则跳过（解决某些平台 mtime 抖动/拷贝导致的重复索引）
         # P2-1: 并发安全的状态读取
         with self._state_lock:
-            prev = self._state.get(rel_path, {})
-            if isinstance(prev, dict) and prev.get("hash") == file_hash:
-                self._state.setdefault(rel_path, {})["skipped"] = False
-                return
-        
-        # --- 深度调优：基于逻辑块的分块 ---
-        chunks = []
-        try:
-            # tree-sitter 模式缺依赖/解析失败时会返回空；自动降级到启发式（业界常见“可用优先”策略）
-            chunks = list(self.chunker.chunk(text=content, path=rel_path))  # type: ignore[attr-defined]
-        except Exception:
-            chunks = []
-        if not chunks:
-            chunks = self._smart_chunking(content)
-        
-        final_chunks = []
-        if not chunks:
+            prev = dict(self._state.get(rel_path) or {})
+        update = plan_file_update(self.cfg, self.chunker, path, rel_path, prev)
+
+        # 批量获取向量：一次返回连续的 float32 矩阵（不逐个创建 Python float），直接写入 Arrow；
+        # 重复内容由 CodeEmbedder 的内容寻址缓存命中
+        vectors = None
+        if update.kind == "update" and update.to_add:
+            batch_size = int(getattr(self.cfg.rag, "embed_batch_size", 64) or 64)
+            vectors = self.embedder.embed_batch([r["text"] for r in update.to_add], batch_size=batch_size)
+        self._apply_update(update, vectors)
+
+    def _apply_update(self, update: FileUpdate, vectors: Any) -> None:
+        """把索引计划落到向量库与 state（线程/进程两种模式共用；仅在本进程写库）。"""
+        rel_path = update.rel_path
+        if update.kind in ("skipped", "unchanged"):
+            with self._state_lock:
+                self._state.setdefault(rel_path, {})["skipped"] = update.kind == "skipped"
+            return
+        if update.kind != "update":
             return
+        if vectors is not None and vectors.shape[0] != len(update.to_add):
+            raise RuntimeError(f"embedding 数量不匹配: {vectors.shape[0]} != {len(update.to_add)}")
 
-        # 批量获取向量（更高效 + 节流）
-        # 兼容两类结构：dict（历史）与 CodeChunk（新）
-        texts: list[str] = []
-        for c in chunks:
-            if isinstance(c, dict):
-                texts.append(str(c.get("text") or ""))
-            else:
-                texts.append(str(getattr(c, "text", "") or ""))
-        vectors: list[list[float]] = []
-        batch_size = int(getattr(self.cfg.rag, "embed_batch_size", 64) or 64)
-        for i in range(0, len(texts), max(1, batch_size)):
-            vectors.extend(self.embedder.embed_texts(texts[i : i + batch_size]))
-        
-        for i, vec in enumerate(vectors):
-            c = chunks[i]
-            if isinstance(c, dict):
-                c_text = str(c.get("text") or "")
-                c_start = int(c.get("start") or 1)
-                c_end = int(c.get("end") or c_start)
-                lang = detect_language_from_path(rel_path)
-                symbol = None
-                node_type = None
-                scope = None
-            else:
-                c_text = str(getattr(c, "text", "") or "")
-                c_start = int(getattr(c, "start_line", 1) or 1)
-                c_end = int(getattr(c, "end_line", c_start) or c_start)
-                lang = getattr(c, "language", None)
-                symbol = getattr(c, "symbol", None)
-                node_type = getattr(c, "node_type", None)
-                scope = getattr(c, "scope", None)
-            chunk_id = f"{rel_path}:{c_start}-{c_end}:{symbol or node_type or 'chunk'}"
-            final_chunks.append({
-                "vector": vec,
-                "text": c_text,
-                "path": rel_path,
-                "start_line": c_start,
-                "end_line": c_end,
-                "file_hash": file_hash,
-                "language": lang,
-                "symbol": symbol,
-                "node_type": node_type,
-                "scope": scope,
-                "chunk_id": chunk_id,
-            })
-        
         # 向量库依赖缺失时，索引应“降级停用”而不是持续报错占用资源
         try:
-            self.store.delete_by_path(rel_path)
-            self.store.add_chunks(final_chunks)
+            if update.incremental:
+                # 连同待写入的 chunk_id 一起删：上次落库后、保存 state 前崩溃时，这些行已在库中，
+                # 而 state 仍是旧签名，重放会再次写入；先删后加保证写入幂等
+                self.store.delete_chunks(
+                    rel_path, list(dict.fromkeys([*update.stale_ids, *(r["chunk_id"] for r in update.to_add)]))
+                )
+                for delta, ids in update.moved.items():
+                    self.store.shift_lines(rel_path, ids, delta)
+            else:
+                self.store.delete_by_path(rel_path)
+            if vectors is not None:
+                self.store.add_batch(vectors, update.columns())
         except Exception as e:
             self.status = f"disabled: vector_store_unavailable ({e})"
             self._logger.error("VectorStore 不可用，已降级停用后台索引。", exc_info=True)
@@ -294,72 +399,22 @@ class IndexerService:
         # P2-1: 并发安全的状态更新
         with self._state_lock:
             st = self._state.setdefault(rel_path, {})
-            st["hash"] = file_hash
-            st["mtime"] = mtime
+            st["hash"] = update.file_hash
+            st["mtime"] = update.mtime
             st["skipped"] = False
+            if update.new_sig:
+                st["chunks"] = update.new_sig
+            else:
+                st.pop("chunks", None)
 
     def _smart_chunking(self, text: str) -> List[Dict[str, Any]]:
         """
         启发式分块：尝试在函数/类定义处切分，而不是固定行数。
         """
-        lines = text.splitlines()
-        chunks = []
-        current_lines = []
-        start_line = 1
-        
-        # 配置参数
-        target_lines = int(getattr(self.cfg.rag, "chunk_target_lines", 40) or 40)
-        max_lines = int(getattr(self.cfg.rag, "chunk_max_lines", 60) or 60)
-        overlap_lines = int(getattr(self.cfg.rag, "chunk_overlap_lines", 5) or 5)
-        
-        for i, line in enumerate(lines):
-            current_lines.append(line)
-            
-            # 切分触发条件：
-            # 1. 达到目标行数且遇到空行
-            # 2. 达到硬性上限
-            # 3. 遇到新的顶层定义（简易识别）
-            is_new_def = line.startswith(("def ", "class ", "export ", "func ", "fn "))
-            
-            should_split = False
-            if len(current_lines) >= target_lines and not line.strip():
-                should_split = True
-            elif len(current_lines) >= max_lines:
-                should_split = True
-            elif len(current_lines) > 10 and is_new_def:
-                should_split = True
-                
-            if should_split:
-                chunks.append({
-                    "text": "\n".join(current_lines),
-                    "start": start_line,
-                    "end": i + 1
-                })
-                # 业界做法：保留少量 overlap，提升跨块检索一致性
-                if overlap_lines > 0:
-                    current_lines = current_lines[-overlap_lines:]
-                    start_line = (i + 2) - len(current_lines)
-                else:
-                    current_lines = []
-                    start_line = i + 2
-        
-        # 处理剩余行
-        if current_lines:
-            chunks.append({
-                "text": "\n".join(current_lines),
-                "start": start_line,
-                "end": len(lines)
-            })
-            
-        return chunks
+        return smart_chunking(self.cfg, text)
 
     def _is_probably_binary(self, path: Path) -> bool:
-        try:
-            with path.open("rb") as f:
-                head = f.read(4096)
-            return b"\x00" in head
-        except Exception:
-            return False
+        return is_probably_binary(path)
 
     def _load_state(self) -> None:
         # P2-1: 并发安全的状态加载（通常在启动时单线程调用，但为安全起见加锁）
@@ -373,6 +428,13 @@ class IndexerService:
                 self._state = {}
 
     def _save_state(self) -> None:
+        # 先把向量库写后缓冲落盘：state 只记录已持久化的结果（失败则不保存，下次扫描会重新索引）
+        try:
+            self.store.flush()
+        except Exception as e:
+            self._logger.warning(f"向量库缓冲落盘失败，跳过保存索引状态: {e}")
+            return
+        self._dirty_since_compact = True
         # P2-1: 并发安全的状态保存
         with self._state_lock:
             try:
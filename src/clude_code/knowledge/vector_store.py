@@ -1,7 +1,13 @@
 from __future__ import annotations
 
+import json
 import logging
+import math
 import os
+import random
+import threading
+import time
+from datetime import timedelta
 from pathlib import Path
 from typing import Any, List, Optional
 
@@ -12,12 +18,34 @@ except ImportError:
     lancedb = None  # type: ignore
     pa = None  # type: ignore
 
+try:
+    import numpy as np
+except ImportError:
+    np = None  # type: ignore
+
 from clude_code.config.config import CludeConfig
 
 # P1-1: 模块级 logger，用于调试 RAG 向量存储问题
 _logger = logging.getLogger(__name__)
 
 
+# 单条删除谓词中 IN 列表的最大元素数（避免超长 SQL）
+_DELETE_IN_MAX = 2000
+
+
+def _sql_str(value: str) -> str:
+    """SQL 字符串字面量（单引号转义），用于 LanceDB 过滤谓词。"""
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _in_predicates(column: str, values: List[str]) -> List[str]:
+    """把 values 拆成若干 `column IN (...)` 谓词。"""
+    out = []
+    for i in range(0, len(values), _DELETE_IN_MAX):
+        out.append(f"{column} IN ({', '.join(_sql_str(v) for v in values[i:i + _DELETE_IN_MAX])})")
+    return out
+
+
 class VectorStore:
     """
     围绕 LanceDB 和 fastembed 的包装器，用于存储和搜索代码嵌入向量。
@@ -34,46 +62,244 @@ class VectorStore:
         self._db: Optional[Any] = None
         self._table: Optional[Any] = None
 
-    def _connect(self):
+        # 写后缓冲（write-behind）：删除合并为 `IN (...)` 谓词、追加合并为大批次，
+        # 避免逐文件 delete+add 产生大量小 fragment 与删除文件。读路径（search 等）会先 flush。
+        self._buffer_rows = int(getattr(cfg.rag, "write_buffer_rows", 4096) or 0)
+        self._buf_lock = threading.RLock()
+        self._pending_adds: List[tuple[Any, dict[str, List[Any]]]] = []
+        self._pending_add_rows = 0
+        self._pending_add_paths: set[str] = set()
+        self._pending_path_deletes: set[str] = set()
+        self._pending_chunk_deletes: dict[str, str] = {}  # chunk_id -> path
+        self._pending_line_shifts: List[tuple[int, List[str]]] = []  # (行号偏移量, chunk_id 列表)
+
+    @staticmethod
+    def _schema(dim: Optional[int]) -> Any:
+        # 新表使用 FixedSizeList(dim)：可零拷贝写入 numpy 矩阵，也是 ANN 索引的前提；
+        # dim 未知时（兼容旧调用）退回变长 list。
+        vec_type = pa.list_(pa.float32(), dim) if dim else pa.list_(pa.float32())
+        return pa.schema([
+            pa.field("vector", vec_type),
+            pa.field("text", pa.string()),
+            pa.field("path", pa.string()),
+            pa.field("start_line", pa.int32()),
+            pa.field("end_line", pa.int32()),
+            pa.field("file_hash", pa.string()),
+            # AST-aware 元数据（可选）：用于更可解释的召回与后续 rerank
+            pa.field("language", pa.string()),
+            pa.field("symbol", pa.string()),
+            pa.field("node_type", pa.string()),
+            pa.field("scope", pa.string()),
+            pa.field("chunk_id", pa.string()),
+        ])
+
+    def _connect(self, create_dim: Optional[int] = None):
+        """
+        连接数据库并打开表；表不存在时仅在写入路径（已知向量维度）下创建，
+        读/删路径下保持 `_table=None`（空库直接返回空结果）。
+        """
         if lancedb is None or pa is None:
             raise RuntimeError("lancedb/pyarrow is not installed. Please run `pip install lancedb pyarrow`.")
-        
+
         if self._db is None:
             self._db = lancedb.connect(str(self.db_dir))
-        
-        if self.table_name not in self._db.table_names():
-            # 业界做法：向量维度可能随 embedding_model 变化，避免固定尺寸以提升兼容性。
-            schema = pa.schema([
-                pa.field("vector", pa.list_(pa.float32())),
-                pa.field("text", pa.string()),
-                pa.field("path", pa.string()),
-                pa.field("start_line", pa.int32()),
-                pa.field("end_line", pa.int32()),
-                pa.field("file_hash", pa.string()),
-                # AST-aware 元数据（可选）：用于更可解释的召回与后续 rerank
-                pa.field("language", pa.string()),
-                pa.field("symbol", pa.string()),
-                pa.field("node_type", pa.string()),
-                pa.field("scope", pa.string()),
-                pa.field("chunk_id", pa.string()),
-            ])
-            self._table = self._db.create_table(self.table_name, schema=schema)
-        else:
+        if self._table is not None:
+            return
+
+        if self.table_name in self._db.table_names():
             self._table = self._db.open_table(self.table_name)
+        elif create_dim is not None:
+            self._table = self._db.create_table(self.table_name, schema=self._schema(create_dim))
 
     def add_chunks(self, chunks: List[dict[str, Any]]):
-        """添加分块到向量数据库。"""
-        self._connect()
+        """添加分块到向量数据库（逐行 dict，向量为 list[float]）。"""
+        if not chunks:
+            return
+        self.flush()
+        self._connect(create_dim=len(chunks[0].get("vector") or []) or None)
         if self._table:
             self._table.add(chunks)
 
-    def search(self, query_vector: List[float], limit: int = 5) -> List[dict[str, Any]]:
-        """根据向量进行语义搜索。"""
+    def add_batch(self, vectors: Any, columns: dict[str, List[Any]]) -> None:
+        """
+        批量写入：vectors 为 (n, dim) float32 ndarray，columns 为其余列（列名 -> 长度 n 的列表）。
+
+        向量列直接由 ndarray 的底层缓冲区构造 Arrow 数组（FixedSizeList / List），
+        不经过 Python float 对象；缺失的元数据列以 null 填充。
+        启用写后缓冲时先入缓冲区，累计到 write_buffer_rows 行再合并写入。
+        """
+        if np is None:
+            raise RuntimeError("numpy is not installed. Please run `pip install numpy`.")
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[0] == 0:
+            return
+        if self._buffer_rows <= 0:
+            self._write_batch(vectors, columns)
+            return
+
+        # 调用方的缓冲区（如进程模式的共享内存）在返回后可能被释放：视图需复制一份
+        if vectors.base is not None:
+            vectors = vectors.copy()
+        with self._buf_lock:
+            if self._pending_adds and self._pending_adds[0][0].shape[1] != vectors.shape[1]:
+                self._flush_locked()
+            self._pending_adds.append((vectors, columns))
+            self._pending_add_rows += int(vectors.shape[0])
+            self._pending_add_paths.update(str(p) for p in columns.get("path") or [])
+            if self._pending_add_rows >= self._buffer_rows:
+                self._flush_locked()
+
+    def _write_batch(self, vectors: Any, columns: dict[str, List[Any]]) -> None:
+        n, dim = vectors.shape
+        self._connect(create_dim=dim)
+        if self._table is None:
+            return
+
+        schema = self._table.schema
+        values = pa.array(vectors.reshape(-1))
+        vec_type = schema.field("vector").type
+        if pa.types.is_fixed_size_list(vec_type):
+            if vec_type.list_size != dim:
+                raise ValueError(
+                    f"向量维度不匹配：表 {self.table_name} 为 {vec_type.list_size}，写入为 {dim}（更换 embedding_model 后请更换 table_name）"
+                )
+            vec_arr = pa.FixedSizeListArray.from_arrays(values, dim)
+        else:
+            # 旧表（变长 list）：用等距 offsets 包装同一缓冲区
+            offsets = pa.array(np.arange(0, (n + 1) * dim, dim, dtype=np.int32))
+            vec_arr = pa.ListArray.from_arrays(offsets, values)
+        if vec_arr.type != vec_type:
+            vec_arr = vec_arr.cast(vec_type)
+
+        arrays = [vec_arr]
+        for field in schema:
+            if field.name == "vector":
+                continue
+            col = columns.get(field.name)
+            arrays.append(pa.array(col if col is not None else [None] * n, type=field.type))
+        self._table.add(pa.Table.from_batches([pa.RecordBatch.from_arrays(arrays, schema=schema)]))
+
+    # ------------------------------------------------------------------
+    # 写后缓冲
+    # ------------------------------------------------------------------
+    @property
+    def pending_writes(self) -> int:
+        """缓冲区中待写入行数 + 待删除键数。"""
+        with self._buf_lock:
+            return (
+                self._pending_add_rows
+                + len(self._pending_path_deletes)
+                + len(self._pending_chunk_deletes)
+                + sum(len(ids) for _, ids in self._pending_line_shifts)
+            )
+
+    def _drop_pending_adds(self, column: str, keys: set[str]) -> None:
+        """删除先于落盘到达时，把缓冲区中命中的待写入行一并丢弃（否则 flush 时先删后加会留下陈旧行）。"""
+        kept: List[tuple[Any, dict[str, List[Any]]]] = []
+        for vectors, columns in self._pending_adds:
+            values = columns.get(column) or []
+            mask = [str(v) not in keys for v in values]
+            if all(mask):
+                kept.append((vectors, columns))
+                continue
+            idx = [i for i, keep in enumerate(mask) if keep]
+            if not idx:
+                continue
+            kept.append((vectors[idx], {k: [v[i] for i in idx] for k, v in columns.items()}))
+        self._pending_adds = kept
+        self._pending_add_rows = sum(int(v.shape[0]) for v, _ in kept)
+        self._pending_add_paths = {str(p) for _, c in kept for p in c.get("path") or []}
+
+    def flush(self) -> None:
+        """把缓冲区中的删除、行号平移与追加落盘：先删除，再平移已落盘行的行号，最后一次性追加。"""
+        with self._buf_lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        if not (self._pending_adds or self._pending_path_deletes or self._pending_chunk_deletes or self._pending_line_shifts):
+            return
+        path_deletes = sorted(self._pending_path_deletes)
+        # 整文件删除已覆盖的 chunk 无需再单独删除（chunk_id 含路径，单列 IN 即可定位）
+        chunk_deletes = sorted(
+            c for c, p in self._pending_chunk_deletes.items() if p not in self._pending_path_deletes
+        )
+        adds = self._pending_adds
+        self._pending_adds = []
+        self._pending_add_rows = 0
+        self._pending_add_paths = set()
+        self._pending_path_deletes = set()
+        self._pending_chunk_deletes = {}
+        shifts = self._pending_line_shifts
+        self._pending_line_shifts = []
+
+        self._connect()
+        if self._table is not None:
+            for pred in _in_predicates("path", path_deletes) + _in_predicates("chunk_id", chunk_deletes):
+                self._table.delete(pred)
+            for delta, ids in shifts:
+                self._apply_shift(ids, delta)
+        if adds:
+            vectors = adds[0][0] if len(adds) == 1 else np.concatenate([v for v, _ in adds])
+            names = {k for _, c in adds for k in c}
+            columns = {
+                k: [x for v, c in adds for x in (c.get(k) or [None] * int(v.shape[0]))] for k in names
+            }
+            self._write_batch(vectors, columns)
+
+    # ------------------------------------------------------------------
+    # 表维护：compaction + 旧版本清理
+    # ------------------------------------------------------------------
+    def compact(self, force: bool = False) -> dict[str, Any]:
+        """
+        合并小 fragment 并清理旧版本。
+
+        小 fragment 数达到 rag.compact_min_fragments（或 force）才做 compaction（optimize 同时会把新行并入 ANN 索引）；
+        否则只清理早于 rag.version_retention_s 的旧版本（每次写入都会产生一个版本）。
+        """
+        self.flush()
+        self._connect()
+        if self._table is None:
+            return {"action": "empty"}
+        retention = timedelta(seconds=int(getattr(self.cfg.rag, "version_retention_s", 600) or 0))
+        frag = (self._table.stats() or {}).get("fragment_stats") or {}
+        small = int(frag.get("num_small_fragments") or 0)
+        min_fragments = int(getattr(self.cfg.rag, "compact_min_fragments", 16) or 16)
+        t0 = time.perf_counter()
+        if force or small >= min_fragments:
+            self._table.optimize(cleanup_older_than=retention)
+            action = "compacted"
+        else:
+            self._table.cleanup_old_versions(retention)
+            action = "cleaned"
+        cost = time.perf_counter() - t0
+        if action == "compacted":
+            _logger.info(
+                f"向量表已压缩: table={self.table_name} fragments={frag.get('num_fragments')} small={small} cost={cost:.1f}s"
+            )
+        return {"action": action, "fragments": frag.get("num_fragments"), "small_fragments": small, "seconds": round(cost, 3)}
+
+    def search(self, query_vector: List[float], limit: int = 5, brute_force: bool = False) -> List[dict[str, Any]]:
+        """
+        根据向量进行语义搜索。
+
+        有 ANN 索引时带上 nprobes/refine_factor；brute_force=True 绕过索引做精确检索（用于召回评估）。
+        """
+        self.flush()
         self._connect()
         if self._table is None:
             return []
 
-        results = self._table.search(query_vector).limit(limit).to_list()
+        query = self._table.search(query_vector, vector_column_name="vector").limit(limit)
+        if brute_force:
+            query = query.bypass_vector_index()
+        else:
+            nprobes = int(getattr(self.cfg.rag, "ann_nprobes", 0) or 0)
+            refine = int(getattr(self.cfg.rag, "ann_refine_factor", 0) or 0)
+            if nprobes > 0:
+                query = query.nprobes(nprobes)
+            if refine > 0:
+                query = query.refine_factor(refine)
+        results = query.to_list()
         # LanceDB 通常会附带 `_distance`；这里统一补一个可用的 `score`（越大越相似）
         out: list[dict[str, Any]] = []
         for r in results or []:
@@ -91,14 +317,252 @@ class VectorStore:
             out.append(r)
         return out
 
-    def delete_by_path(self, path: str):
-        """删除特定路径的所有分块。"""
+    # ------------------------------------------------------------------
+    # ANN 索引生命周期
+    # ------------------------------------------------------------------
+    @property
+    def _ann_meta_path(self) -> Path:
+        return self.db_dir / f"{self.table_name}.ann.json"
+
+    def _load_ann_meta(self) -> dict[str, Any]:
+        try:
+            obj = json.loads(self._ann_meta_path.read_text(encoding="utf-8"))
+            return obj if isinstance(obj, dict) else {}
+        except Exception:
+            return {}
+
+    def _save_ann_meta(self, meta: dict[str, Any]) -> None:
+        try:
+            self._ann_meta_path.write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+        except Exception as e:
+            _logger.debug(f"ANN 元数据写入失败: {e}")
+
+    def _vector_index(self) -> Optional[Any]:
+        """返回 vector 列上的索引配置（无则 None）。"""
+        for idx in self._table.list_indices() or []:
+            cols = list(getattr(idx, "columns", None) or [])
+            if "vector" in cols or getattr(idx, "vector_column", None) == "vector":
+                return idx
+        return None
+
+    def _index_stats(self, idx: Any) -> tuple[int, int]:
+        """(已索引行数, 未索引行数)；旧版 LanceDB 不支持时返回 (0, 0)。"""
+        try:
+            st = self._table.index_stats(idx.name)
+            return int(st.num_indexed_rows), int(st.num_unindexed_rows)
+        except Exception:
+            return 0, 0
+
+    def _build_index(self, rows: int) -> None:
+        index_type = str(getattr(self.cfg.rag, "ann_index_type", "IVF_PQ") or "IVF_PQ").upper()
+        dim = int(self._table.schema.field("vector").type.list_size)
+        num_partitions = int(getattr(self.cfg.rag, "ann_num_partitions", 0) or 0)
+        if num_partitions <= 0:
+            num_partitions = max(16, min(4096, int(math.sqrt(rows))))
+        num_sub_vectors = int(getattr(self.cfg.rag, "ann_num_sub_vectors", 0) or 0)
+        if num_sub_vectors <= 0 or dim % num_sub_vectors:
+            num_sub_vectors = next((n for n in (dim // 8, dim // 16, dim // 4, 1) if n and dim % n == 0), 1)
+        t0 = time.perf_counter()
+        self._table.create_index(
+            metric="L2",
+            num_partitions=num_partitions,
+            num_sub_vectors=num_sub_vectors,
+            vector_column_name="vector",
+            replace=True,
+            index_type=index_type,
+        )
+        self._save_ann_meta({"trained_rows": rows, "index_type": index_type, "built_at": int(time.time())})
+        _logger.info(
+            f"ANN 索引已构建: table={self.table_name} type={index_type} rows={rows} "
+            f"partitions={num_partitions} sub_vectors={num_sub_vectors} cost={time.perf_counter() - t0:.1f}s"
+        )
+
+    def maintain_index(self, force: bool = False) -> str:
+        """
+        ANN 索引维护（由 IndexerService 每批写入后调用）：
+
+        - 行数 < ann_min_rows：不建索引（暴力检索）；
+        - 无索引：构建；
+        - 行数增长到上次训练的 ann_retrain_growth 倍：重新训练（replace）；
+        - 未入索引行数 ≥ ann_reindex_after_writes：增量更新（optimize，把新行并入已有分区）。
+
+        Returns:
+            本次动作：disabled | empty | below_threshold | unsupported_schema | built | retrained | updated | ok
+        """
+        index_type = str(getattr(self.cfg.rag, "ann_index_type", "IVF_PQ") or "IVF_PQ").lower()
+        if index_type == "none":
+            return "disabled"
+        self.flush()
         self._connect()
-        if self._table:
-            self._table.delete(f'path = "{path}"')
+        if self._table is None:
+            return "empty"
+        rows = int(self._table.count_rows())
+        min_rows = int(getattr(self.cfg.rag, "ann_min_rows", 50_000) or 50_000)
+        if rows < min_rows and not force:
+            return "below_threshold"
+        if not pa.types.is_fixed_size_list(self._table.schema.field("vector").type):
+            # 旧表（变长 list 向量列）无法建 ANN 索引：需更换 table_name 重建
+            _logger.warning(f"表 {self.table_name} 的向量列不是定长类型，无法构建 ANN 索引；请更换 rag.table_name 以重建")
+            return "unsupported_schema"
+
+        idx = self._vector_index()
+        if idx is None or force:
+            self._build_index(rows)
+            return "built"
+
+        trained_rows = int(self._load_ann_meta().get("trained_rows") or 0)
+        growth = float(getattr(self.cfg.rag, "ann_retrain_growth", 2.0) or 2.0)
+        if trained_rows and rows >= trained_rows * growth:
+            self._build_index(rows)
+            return "retrained"
+
+        _indexed, unindexed = self._index_stats(idx)
+        threshold = int(getattr(self.cfg.rag, "ann_reindex_after_writes", 20_000) or 20_000)
+        if unindexed >= threshold:
+            t0 = time.perf_counter()
+            self._table.optimize()
+            _logger.info(f"ANN 索引增量更新: table={self.table_name} new_rows={unindexed} cost={time.perf_counter() - t0:.1f}s")
+            return "updated"
+        return "ok"
+
+    def index_stats(self, sample: int = 50, k: int = 10, seed: Optional[int] = None) -> dict[str, Any]:
+        """
+        索引统计 + 召回评估：随机抽样表内向量作为查询，对比 ANN 与暴力检索的 top-k，报告 recall@k 与平均耗时。
+        """
+        self.flush()
+        self._connect()
+        if self._table is None:
+            return {"table": self.table_name, "rows": 0, "index": None}
+        rows = int(self._table.count_rows())
+        idx = self._vector_index()
+        info: dict[str, Any] = {
+            "table": self.table_name,
+            "rows": rows,
+            "vector_type": str(self._table.schema.field("vector").type),
+            "index": None,
+            "nprobes": int(getattr(self.cfg.rag, "ann_nprobes", 0) or 0),
+            "refine_factor": int(getattr(self.cfg.rag, "ann_refine_factor", 0) or 0),
+        }
+        if idx is not None:
+            indexed, unindexed = self._index_stats(idx)
+            info["index"] = {
+                "name": getattr(idx, "name", ""),
+                "type": str(getattr(idx, "index_type", "")),
+                "indexed_rows": indexed,
+                "unindexed_rows": unindexed,
+                "trained_rows": self._load_ann_meta().get("trained_rows"),
+            }
+        if rows == 0 or sample <= 0:
+            return info
+
+        # 抽样：从随机偏移处取一个窗口，再在窗口内随机挑选（避免全表读入内存）
+        rng = random.Random(seed)
+        window = min(rows, max(sample * 20, sample))
+        offset = rng.randrange(0, rows - window + 1)
+        pool = (
+            self._table.search().select(["vector"]).offset(offset).limit(window).to_arrow().column("vector").to_pylist()
+        )
+        queries = rng.sample(pool, min(sample, len(pool)))
+
+        def _ids(hits: List[dict[str, Any]]) -> list[tuple[Any, Any, Any]]:
+            return [(h.get("path"), h.get("chunk_id"), h.get("start_line")) for h in hits]
+
+        recalls: list[float] = []
+        ann_ms = 0.0
+        exact_ms = 0.0
+        for q in queries:
+            t0 = time.perf_counter()
+            approx = _ids(self.search(q, limit=k))
+            t1 = time.perf_counter()
+            exact = _ids(self.search(q, limit=k, brute_force=True))
+            t2 = time.perf_counter()
+            ann_ms += (t1 - t0) * 1000
+            exact_ms += (t2 - t1) * 1000
+            if exact:
+                recalls.append(len(set(approx) & set(exact)) / len(exact))
+        n = max(1, len(queries))
+        info["recall"] = {
+            "k": k,
+            "samples": len(queries),
+            f"recall@{k}": round(sum(recalls) / len(recalls), 4) if recalls else None,
+            "ann_avg_ms": round(ann_ms / n, 2),
+            "exact_avg_ms": round(exact_ms / n, 2),
+        }
+        return info
+
+    def delete_by_path(self, path: str):
+        """删除特定路径的所有分块（启用写后缓冲时合并为 `path IN (...)`）。"""
+        if self._buffer_rows <= 0:
+            self._connect()
+            if self._table:
+                self._table.delete(f"path = {_sql_str(path)}")
+            return
+        with self._buf_lock:
+            if path in self._pending_add_paths:
+                self._drop_pending_adds("path", {path})
+            self._pending_path_deletes.add(path)
+            if len(self._pending_path_deletes) >= self._buffer_rows:
+                self._flush_locked()
+
+    def delete_chunks(self, path: str, chunk_ids: List[str]):
+        """删除某路径下指定 chunk_id 的分块（chunk 级增量更新；缓冲时合并为 `chunk_id IN (...)`）。"""
+        if not chunk_ids:
+            return
+        if self._buffer_rows <= 0:
+            self._connect()
+            if self._table:
+                ids = ", ".join(_sql_str(c) for c in chunk_ids)
+                self._table.delete(f"path = {_sql_str(path)} AND chunk_id IN ({ids})")
+            return
+        with self._buf_lock:
+            if path in self._pending_add_paths:
+                self._drop_pending_adds("chunk_id", set(chunk_ids))
+            self._pending_chunk_deletes.update((c, path) for c in chunk_ids)
+            if len(self._pending_chunk_deletes) >= self._buffer_rows:
+                self._flush_locked()
+
+    def shift_lines(self, path: str, chunk_ids: List[str], delta: int) -> None:
+        """
+        内容未变、只是在文件中平移的 chunk：start_line/end_line 加 delta（不重新嵌入）。
+
+        一次 `UPDATE ... WHERE chunk_id IN (...)` 覆盖同一偏移量的全部 chunk；缓冲时尚未落盘的行
+        直接改缓冲区，已落盘的行在 flush 时（删除之后、追加之前）平移。
+        """
+        if not chunk_ids or not delta:
+            return
+        if self._buffer_rows <= 0:
+            self._connect()
+            if self._table:
+                self._apply_shift(chunk_ids, delta)
+            return
+        with self._buf_lock:
+            remaining = set(chunk_ids)
+            if path in self._pending_add_paths:
+                for _vectors, columns in self._pending_adds:
+                    for i, cid in enumerate(columns.get("chunk_id") or []):
+                        if cid in remaining:
+                            columns["start_line"][i] += delta
+                            columns["end_line"][i] += delta
+                            remaining.discard(cid)
+            if remaining:
+                self._pending_line_shifts.append((delta, sorted(remaining)))
+            if self.pending_writes >= self._buffer_rows:
+                self._flush_locked()
+
+    def _apply_shift(self, chunk_ids: List[str], delta: int) -> None:
+        values_sql = {"start_line": f"start_line + ({int(delta)})", "end_line": f"end_line + ({int(delta)})"}
+        for pred in _in_predicates("chunk_id", sorted(chunk_ids)):
+            self._table.update(where=pred, values_sql=values_sql)
 
     def clear_all(self):
-        """清空索引。"""
+        """清空索引（丢弃未落盘的缓冲）。"""
+        with self._buf_lock:
+            self._pending_adds = []
+            self._pending_add_rows = 0
+            self._pending_add_paths = set()
+            self._pending_path_deletes = set()
+            self._pending_chunk_deletes = {}
+            self._pending_line_shifts = []
         self._connect()
         if self._db and self.table_name in self._db.table_names():
             self._db.drop_table(self.table_name)
@@ -1,11 +1,16 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Any, Literal
+from typing import Any, Callable, Literal
 
+import copy
 import httpx
+import importlib.util
+import json
 import logging
 import os
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -53,6 +58,13 @@ class LlamaCppHttpClient:
         max_tokens: int = 1024,
         timeout_s: int = 120,
         api_key: str = "",
+        max_connections: int = 10,
+        max_keepalive_connections: int = 5,
+        keepalive_expiry_s: float = 30.0,
+        http2: bool = False,
+        model_id_ttl_s: float = 300.0,
+        cache_prompt: bool = False,
+        id_slot: int = -1,
     ) -> None:
         self.base_url = base_url.rstrip("/")
         self.api_mode = api_mode
@@ -63,11 +75,311 @@ class LlamaCppHttpClient:
         # API Key 优先级：参数 > 环境变量 OPENAI_API_KEY > 空
         self.api_key = api_key or os.environ.get("OPENAI_API_KEY", "")
 
+        # 长连接池（keep-alive）：每个 agent step 复用 TCP/TLS 连接，避免每次请求重新握手
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry_s,
+        )
+        # HTTP/2 需要可选依赖 h2（pip install "httpx[http2]"）；缺失时回退 HTTP/1.1
+        self.http2 = bool(http2) and importlib.util.find_spec("h2") is not None
+        if http2 and not self.http2:
+            logger.warning("已配置 http2，但未安装 h2（pip install 'httpx[http2]'），回退到 HTTP/1.1")
+        self._client: httpx.Client | None = None
+        self._client_lock = threading.Lock()
+
+        # model 为空时自动解析的模型 ID（带 TTL，避免每次 chat 前多一次 GET /v1/models）
+        self.model_id_ttl_s = model_id_ttl_s
+        self._resolved_model: str | None = None
+        self._resolved_at = 0.0
+
+        # 最近一次请求的耗时拆分（connect/ttfb/total，毫秒）
+        self.last_timing: dict[str, Any] = {}
+
+        # llama.cpp 提示词 KV 缓存复用：cache_prompt 让服务端复用与上次请求相同的前缀，
+        # id_slot 固定槽位（-1=由服务端按相似度选择）。仅 llama.cpp 识别这些字段，其他服务端不要开启。
+        self.cache_prompt = cache_prompt
+        self.id_slot = id_slot
+        # 最近一次请求服务端报告的 prompt 用量：prompt_tokens / cached_tokens（未报告时为空）
+        self.last_server_usage: dict[str, int] = {}
+
+    # ------------------------------------------------------------------
+    # 连接池
+    # ------------------------------------------------------------------
+    def _http(self) -> httpx.Client:
+        """惰性创建共享 httpx.Client（线程安全）。"""
+        client = self._client
+        if client is None or client.is_closed:
+            with self._client_lock:
+                client = self._client
+                if client is None or client.is_closed:
+                    client = httpx.Client(timeout=self.timeout_s, limits=self.limits, http2=self.http2)
+                    self._client = client
+        return client
+
+    def close(self) -> None:
+        """关闭连接池（进程退出时调用；之后再请求会自动重建）。"""
+        with self._client_lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+    def _request(self, method: str, url: str, *, timeout: float | None = None, **kwargs: Any) -> httpx.Response:
+        """
+        通过连接池发送请求，并记录耗时拆分到 last_timing：
+        - connect_ms: TCP 连接 + TLS 握手（复用连接时为 0）
+        - ttfb_ms: 发出请求到收到响应头（Time To First Byte）
+        - total_ms: 含读取完整响应体
+        """
+        marks: dict[str, float] = {}
+
+        def _trace(event: str, info: dict[str, Any]) -> None:
+            marks[event] = time.perf_counter()
+
+        t0 = time.perf_counter()
+        extensions = {"trace": _trace}
+        r = self._http().request(
+            method,
+            url,
+            timeout=timeout if timeout is not None else self.timeout_s,
+            extensions=extensions,
+            **kwargs,
+        )
+        t_end = time.perf_counter()
+        self.last_timing = self._timing(url, marks, t0, t_end, r.http_version)
+        logger.debug(f"LLM HTTP 耗时: {self.last_timing}")
+        return r
+
+    @staticmethod
+    def _timing(url: str, marks: dict[str, float], t0: float, t_end: float, http_version: str, **extra: Any) -> dict[str, Any]:
+        """由 httpx trace 事件时间点计算耗时拆分。"""
+        connect = 0.0
+        for phase in ("connection.connect_tcp", "connection.start_tls"):
+            if f"{phase}.started" in marks and f"{phase}.complete" in marks:
+                connect += marks[f"{phase}.complete"] - marks[f"{phase}.started"]
+        headers_done = next(
+            (v for k, v in marks.items() if k.endswith("receive_response_headers.complete")),
+            t_end,
+        )
+        return {
+            "url": url,
+            "reused": "connection.connect_tcp.started" not in marks,
+            "http_version": http_version,
+            "connect_ms": round(connect * 1000, 1),
+            "ttfb_ms": round((headers_done - t0) * 1000, 1),
+            "total_ms": round((t_end - t0) * 1000, 1),
+            **extra,
+        }
+
+    def resolve_model(self) -> str:
+        """配置的 model 优先；为空时自动取服务端第一个模型（按 model_id_ttl_s 缓存）。"""
+        if self.model:
+            return self.model
+        now = time.monotonic()
+        if self._resolved_model and now - self._resolved_at < self.model_id_ttl_s:
+            return self._resolved_model
+        mid = self.try_get_first_model_id()
+        if mid:
+            self._resolved_model, self._resolved_at = mid, now
+        return mid or "llama.cpp"
+
+    def get_context_window(self, *, timeout: float = 3.0) -> int | None:
+        """
+        查询服务端实际的上下文窗口（每个槽位的 n_ctx）：
+        - llama.cpp: GET /props → default_generation_settings.n_ctx（或顶层 n_ctx）
+        - 退化：GET /v1/models → data[0].meta.n_ctx（llama.cpp 只报告 n_ctx_train 时取它）
+        都拿不到时返回 None（由调用方回退到配置的 llm.context_window）。
+        """
+        headers = self._build_headers()
+        try:
+            r = self._http().get(f"{self.base_url}/props", headers=headers, timeout=timeout)
+            if r.status_code == 200:
+                data = r.json()
+                settings = data.get("default_generation_settings") or {}
+                for v in (settings.get("n_ctx"), data.get("n_ctx")):
+                    if isinstance(v, int) and v > 0:
+                        return v
+        except Exception as e:
+            logger.debug(f"GET /props 失败: {e}")
+        try:
+            r = self._http().get(f"{self.base_url}/v1/models", headers=headers, timeout=timeout)
+            if r.status_code == 200:
+                for m in r.json().get("data") or []:
+                    meta = m.get("meta") if isinstance(m, dict) else None
+                    if isinstance(meta, dict):
+                        for k in ("n_ctx", "n_ctx_train"):
+                            if isinstance(meta.get(k), int) and meta[k] > 0:
+                                return meta[k]
+        except Exception as e:
+            logger.debug(f"GET /v1/models 失败: {e}")
+        return None
+
+    def get_total_slots(self, *, timeout: float = 3.0) -> int | None:
+        """
+        查询服务端并行槽位数（llama.cpp --parallel）：GET /props → total_slots。
+        拿不到时返回 None（非 llama.cpp 服务端或旧版本）。
+        """
+        try:
+            r = self._http().get(f"{self.base_url}/props", headers=self._build_headers(), timeout=timeout)
+            if r.status_code == 200:
+                v = r.json().get("total_slots")
+                if isinstance(v, int) and v > 0:
+                    return v
+        except Exception as e:
+            logger.debug(f"GET /props 失败: {e}")
+        return None
+
+    def fork(self, *, id_slot: int = -1) -> "LlamaCppHttpClient":
+        """
+        并发请求用的副本：共享连接池与模型 ID 解析结果，但 last_timing / last_server_usage / id_slot 各自独立，
+        多个线程同时请求时互不覆盖。副本不要调用 close()（会关闭共享连接池）。
+        """
+        self._http()
+        other = copy.copy(self)
+        other.id_slot = id_slot
+        other.last_timing = {}
+        other.last_server_usage = {}
+        return other
+
+    def tokenize(self, content: str, *, timeout: float = 5.0) -> list[int]:
+        """
+        llama.cpp 原生分词：POST {base_url}/tokenize，返回 token id 列表（与服务端模型的词表一致）。
+
+        不经过 _request：分词请求不应覆盖 chat 请求的 last_timing。服务端不支持时抛出异常。
+        """
+        r = self._http().post(
+            f"{self.base_url}/tokenize",
+            json={"content": content, "add_special": False},
+            headers=self._build_headers(),
+            timeout=timeout,
+        )
+        r.raise_for_status()
+        tokens = r.json().get("tokens")
+        if not isinstance(tokens, list):
+            raise RuntimeError(f"unexpected /tokenize response: {r.text[:200]}")
+        return tokens
+
     def chat(self, messages: list[ChatMessage]) -> str:
+        self.last_server_usage = {}
         if self.api_mode == "openai_compat":
             return self._chat_openai_compat(messages)
         return self._chat_completion(messages)
 
+    def chat_stream(self, messages: list[ChatMessage], on_delta: Callable[[str], bool | None]) -> str:
+        """
+        流式对话（SSE，`"stream": true`），逐段回调 on_delta(text)。
+
+        on_delta 返回 True 时提前结束：关闭响应（连接随之断开，llama.cpp 会停止继续解码），
+        返回已收到的文本。last_timing 额外包含 first_token_ms 与 early_stop。
+        """
+        if self.api_mode == "openai_compat":
+            url = f"{self.base_url}/v1/chat/completions"
+            payload: dict[str, Any] = {
+                "model": self.resolve_model(),
+                "messages": [{"role": m.role, "content": m.content} for m in messages],
+                "temperature": self.temperature,
+                "max_tokens": self.max_tokens,
+                "stream": True,
+                **self._cache_fields(),
+            }
+            headers = self._build_headers()
+        else:
+            url = f"{self.base_url}/completion"
+            payload = {
+                "prompt": self._completion_prompt(messages),
+                "temperature": self.temperature,
+                "n_predict": self.max_tokens,
+                "stream": True,
+                **self._cache_fields(),
+            }
+            headers = {}
+
+        marks: dict[str, float] = {}
+
+        def _trace(event: str, info: dict[str, Any]) -> None:
+            marks[event] = time.perf_counter()
+
+        parts: list[str] = []
+        self.last_server_usage = {}
+        first_token: float | None = None
+        early_stop = False
+        http_version = ""
+        t0 = time.perf_counter()
+        try:
+            with self._http().stream(
+                "POST", url, json=payload, headers=headers, timeout=self.timeout_s, extensions={"trace": _trace}
+            ) as r:
+                http_version = r.http_version
+                if r.status_code >= 400:
+                    body = r.read().decode("utf-8", errors="replace")
+                    logger.warning(f"llama.cpp stream request failed: status={r.status_code} url={url} body={body}")
+                    raise RuntimeError(
+                        "llama.cpp stream request failed: "
+                        f"status={r.status_code} url={url} body={body}"
+                    )
+                for line in r.iter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data_str = line[5:].strip()
+                    if data_str == "[DONE]":
+                        break
+                    try:
+                        data = json.loads(data_str)
+                    except json.JSONDecodeError:
+                        logger.debug(f"无法解析 SSE 数据行: {data_str[:200]}")
+                        continue
+                    usage = self._server_usage(data)
+                    if usage:
+                        self.last_server_usage = usage
+                    delta = self._stream_delta(data)
+                    if not delta:
+                        continue
+                    if first_token is None:
+                        first_token = time.perf_counter()
+                    parts.append(delta)
+                    if on_delta(delta):
+                        early_stop = True
+                        break
+        except httpx.TimeoutException as e:
+            logger.warning(f"llama.cpp stream url={url}, timeout_s={self.timeout_s}, request timed out: {e}")
+            raise RuntimeError(
+                "llama.cpp stream request failed: "
+                f"timeout url={url} (timeout_s={self.timeout_s})"
+            ) from e
+        except httpx.RequestError as e:
+            logger.warning(f"llama.cpp stream url={url}, timeout_s={self.timeout_s}, request error: {e}")
+            raise RuntimeError(
+                "llama.cpp stream request failed: "
+                f"request_error url={url} err={type(e).__name__}: {e}"
+            ) from e
+
+        t_end = time.perf_counter()
+        self.last_timing = self._timing(
+            url,
+            marks,
+            t0,
+            t_end,
+            http_version,
+            first_token_ms=round(((first_token or t_end) - t0) * 1000, 1),
+            early_stop=early_stop,
+        )
+        logger.debug(f"LLM HTTP 耗时（流式）: {self.last_timing}")
+        return "".join(parts)
+
+    @staticmethod
+    def _stream_delta(data: Any) -> str:
+        """从一条 SSE JSON 中取增量文本（OpenAI: choices[].delta.content；llama.cpp /completion: content）。"""
+        if not isinstance(data, dict):
+            return ""
+        choices = data.get("choices")
+        if isinstance(choices, list) and choices and isinstance(choices[0], dict):
+            delta = choices[0].get("delta") or {}
+            text = delta.get("content") if isinstance(delta, dict) else None
+            if text is None:
+                text = choices[0].get("text")
+            return text or ""
+        return str(data.get("content") or "")
+
     def try_get_first_model_id(self) -> str | None:
         """
         Best-effort helper for OpenAI-compatible servers.
@@ -78,10 +390,9 @@ class LlamaCppHttpClient:
         url = f"{self.base_url}/v1/models"
         headers = self._build_headers()
         try:
-            with httpx.Client(timeout=min(self.timeout_s, 10)) as client:
-                r = client.get(url, headers=headers)
-                r.raise_for_status()
-                data = r.json()
+            r = self._request("GET", url, headers=headers, timeout=min(self.timeout_s, 10))
+            r.raise_for_status()
+            data = r.json()
         except Exception as e:
             logger.warning(f"获取模型 ID 失败 (try_get_first_model_id): {e}")
             return None
@@ -107,10 +418,9 @@ class LlamaCppHttpClient:
         url = f"{self.base_url}/v1/models"
         headers = self._build_headers()
         try:
-            with httpx.Client(timeout=min(self.timeout_s, 10)) as client:
-                r = client.get(url, headers=headers)
-                r.raise_for_status()
-                data = r.json()
+            r = self._request("GET", url, headers=headers, timeout=min(self.timeout_s, 10))
+            r.raise_for_status()
+            data = r.json()
         except Exception as e:
             logger.error(f"无法从 {url} 获取模型列表: {e}", exc_info=True)
             return []
@@ -138,29 +448,27 @@ class LlamaCppHttpClient:
 
     def _chat_openai_compat(self, messages: list[ChatMessage]) -> str:
         url = f"{self.base_url}/v1/chat/completions"
-        model = self.model
-        if not model:
-            model = self.try_get_first_model_id() or "llama.cpp"
+        model = self.resolve_model()
         payload: dict[str, Any] = {
             "model": model,
             "messages": [{"role": m.role, "content": m.content} for m in messages],
             "temperature": self.temperature,
             "max_tokens": self.max_tokens,
             "stream": False,
+            **self._cache_fields(),
         }
         headers = self._build_headers()
         try:
-            with httpx.Client(timeout=self.timeout_s) as client:
-                r = client.post(url, json=payload, headers=headers)
-                if r.status_code >= 400:
-                    logger.warning(f"llama.cpp OpenAI-compatible request failed: status={r.status_code} url={url} payload={payload} body={r.text}");
-                    # Surface response body — llama.cpp often explains which field is invalid.
-                    body = r.text
-                    raise RuntimeError(
-                        "llama.cpp OpenAI-compatible request failed: "
-                        f"status={r.status_code} url={url} body={body}"
-                    )
-                data = r.json()
+            r = self._request("POST", url, json=payload, headers=headers)
+            if r.status_code >= 400:
+                logger.warning(f"llama.cpp OpenAI-compatible request failed: status={r.status_code} url={url} payload={payload} body={r.text}");
+                # Surface response body — llama.cpp often explains which field is invalid.
+                body = r.text
+                raise RuntimeError(
+                    "llama.cpp OpenAI-compatible request failed: "
+                    f"status={r.status_code} url={url} body={body}"
+                )
+            data = r.json()
         except httpx.TimeoutException as e:
             logger.warning(f"llama.cpp OpenAI-compatible url={url}, timeout_s={self.timeout_s}, payload={payload},  request timed out: {e}");
             raise RuntimeError(
@@ -175,6 +483,7 @@ class LlamaCppHttpClient:
                 f"request_error url={url} err={type(e).__name__}: {e}"
             ) from e
 
+        self.last_server_usage = self._server_usage(data)
         # OpenAI style
         try:
             return data["choices"][0]["message"]["content"]
@@ -186,27 +495,67 @@ class LlamaCppHttpClient:
                 logger.warning(f"无法解析 llama.cpp OpenAI-compatible 响应: {e} 数据: {data}", exc_info=True);
                 raise RuntimeError(f"unexpected response format: {data}") from e
 
-    def _chat_completion(self, messages: list[ChatMessage]) -> str:
+    def _cache_fields(self) -> dict[str, Any]:
+        fields: dict[str, Any] = {}
+        if self.cache_prompt:
+            fields["cache_prompt"] = True
+        if self.id_slot >= 0:
+            fields["id_slot"] = self.id_slot
+        return fields
+
+    @staticmethod
+    def _server_usage(data: Any) -> dict[str, int]:
+        """
+        解析服务端报告的 prompt 用量：
+        - llama.cpp: timings.cache_n（复用的缓存 token）/ timings.prompt_n（实际 prefill 的 token）
+        - OpenAI: usage.prompt_tokens / usage.prompt_tokens_details.cached_tokens
+        """
+        if not isinstance(data, dict):
+            return {}
+        out: dict[str, int] = {}
+        usage = data.get("usage") if isinstance(data.get("usage"), dict) else {}
+        timings = data.get("timings") if isinstance(data.get("timings"), dict) else {}
+        if isinstance(usage.get("prompt_tokens"), int):
+            out["prompt_tokens"] = usage["prompt_tokens"]
+        details = usage.get("prompt_tokens_details")
+        if isinstance(details, dict) and isinstance(details.get("cached_tokens"), int):
+            out["cached_tokens"] = details["cached_tokens"]
+        if isinstance(timings.get("prompt_n"), int):
+            cache_n = timings.get("cache_n")
+            if isinstance(cache_n, int):
+                out["cached_tokens"] = cache_n
+                out.setdefault("prompt_tokens", cache_n + timings["prompt_n"])
+            elif "prompt_tokens" in out:
+                out["cached_tokens"] = max(0, out["prompt_tokens"] - timings["prompt_n"])
+        if isinstance(data.get("tokens_cached"), int):  # /completion（旧版 llama.cpp）
+            out.setdefault("cached_tokens", data["tokens_cached"])
+        return out
+
+    @staticmethod
+    def _completion_prompt(messages: list[ChatMessage]) -> str:
         # Fallback mode: build a plain prompt. This is intentionally simple for MVP.
         prompt = ""
         for m in messages:
             prompt += f"{m.role.upper()}: {m.content}\n"
         prompt += "ASSISTANT: "
+        return prompt
 
+    def _chat_completion(self, messages: list[ChatMessage]) -> str:
         url = f"{self.base_url}/completion"
         payload: dict[str, Any] = {
-            "prompt": prompt,
+            "prompt": self._completion_prompt(messages),
             "temperature": self.temperature,
             "n_predict": self.max_tokens,
+            **self._cache_fields(),
         }
-        with httpx.Client(timeout=self.timeout_s) as client:
-            r = client.post(url, json=payload)
-            if r.status_code >= 400:
-                raise RuntimeError(
-                    "llama.cpp completion request failed: "
-                    f"status={r.status_code} url={url} body={r.text[:2000]}"
-                )
-            data = r.json()
+        r = self._request("POST", url, json=payload)
+        if r.status_code >= 400:
+            raise RuntimeError(
+                "llama.cpp completion request failed: "
+                f"status={r.status_code} url={url} body={r.text[:2000]}"
+            )
+        data = r.json()
+        self.last_server_usage = self._server_usage(data)
         # llama.cpp typically returns {"content": "..."} for /completion
         return data.get("content") or data.get("completion") or ""
 
@@ -0,0 +1,324 @@
+"""
+统一分词计数服务（Token Counter）。
+
+此前 token 数有三套算法（usage.estimate_tokens 的 chars/4、ContextItem 的 tiktoken、
+ContextCompressor 的中英文估算），且每次裁剪历史都要把全部消息重新分词一遍。这里收敛为一个服务：
+- server   : 调用服务端模型自己的 /tokenize（llama.cpp），与真实 prefill 一致；
+- local    : 本地分词器（tiktoken 编码仅作近似；配置模型自带的 tokenizer.json 时与服务端一致）；
+- heuristic: usage.estimate_tokens（chars/4，无依赖、确定性）；
+- auto     : server → local → heuristic 依次降级，服务端失败后冷却一段时间再重试。
+
+计数按内容哈希做 LRU 记忆化：历史消息只在第一次出现时分词，一轮的计数开销与新增消息数成正比。
+
+本地分词器注册表（惰性加载、离线安全）：
+- 按名称注册加载器（内置 tiktoken 与 HuggingFace tokenizer.json），首次使用时才 import；
+- tiktoken 只从本地文件加载：配置的 tokenizer_path、TIKTOKEN_CACHE_DIR 或默认缓存目录中已存在
+  编码文件才加载，否则立即降级（除非 allow_download=True），不会在离线环境卡在下载 BPE 文件；
+- 加载结果（含失败）在进程内缓存，同一编码只加载一次。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Iterable, Optional
+
+from clude_code.observability.usage import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+SOURCES: tuple[str, ...] = ("auto", "server", "local", "heuristic")
+
+# tiktoken 官方编码文件地址：本地缓存文件名为其 sha1（与 tiktoken.load.read_file_cached 一致）
+_TIKTOKEN_URLS: dict[str, str] = {
+    name: f"https://openaipublic.blob.core.windows.net/encodings/{name}.tiktoken"
+    for name in ("cl100k_base", "o200k_base", "p50k_base", "r50k_base")
+}
+
+
+class LocalTokenizer:
+    """本地分词器的统一接口：encode/decode，屏蔽 tiktoken 与 tokenizers 的 API 差异。"""
+
+    def __init__(self, name: str, encode: Callable[[str], list[int]], decode: Callable[[list[int]], str]) -> None:
+        self.name = name
+        self._encode = encode
+        self._decode = decode
+
+    def encode(self, text: str) -> list[int]:
+        return self._encode(text)
+
+    def decode(self, tokens: list[int]) -> str:
+        return self._decode(tokens)
+
+
+@dataclass
+class TokenizerLoadInfo:
+    name: str
+    kind: str
+    ok: bool
+    load_ms: float
+    source: str = ""  # 实际加载的文件/目录
+    error: str = ""
+    hints: list[str] = field(default_factory=list)  # 离线放置文件的提示（供 clude doctor 展示）
+
+
+def _tiktoken_cache_dirs(path: str) -> list[Path]:
+    dirs: list[Path] = []
+    if path:
+        dirs.append(Path(path).expanduser())
+    for env in ("TIKTOKEN_CACHE_DIR", "DATA_GYM_CACHE_DIR"):
+        if os.environ.get(env):
+            dirs.append(Path(os.environ[env]).expanduser())
+    dirs.append(Path(tempfile.gettempdir()) / "data-gym-cache")
+    return dirs
+
+
+def _load_tiktoken(name: str, path: str, allow_download: bool) -> tuple[LocalTokenizer, str]:
+    url = _TIKTOKEN_URLS.get(name)
+    source = ""
+    if url is not None:
+        key = hashlib.sha1(url.encode()).hexdigest()
+        dirs = _tiktoken_cache_dirs(path)
+        found = next((d for d in dirs if (d / key).is_file()), None)
+        if found is None and not allow_download:
+            raise FileNotFoundError(f"本地未找到 tiktoken 编码文件 {name}（未启用下载）")
+        if found is not None:
+            source = str(found / key)
+    elif not allow_download:
+        raise FileNotFoundError(f"未知的 tiktoken 编码 {name}，无法确认本地文件（未启用下载）")
+
+    import tiktoken
+
+    if not source:
+        enc = tiktoken.get_encoding(name)
+    else:
+        # tiktoken 只通过该环境变量定位缓存；仅在构造编码期间指向命中目录，随后恢复原值
+        # （get_encoding 会缓存编码对象，之后不再读取该变量）
+        prev = os.environ.get("TIKTOKEN_CACHE_DIR")
+        os.environ["TIKTOKEN_CACHE_DIR"] = str(Path(source).parent)
+        try:
+            enc = tiktoken.get_encoding(name)
+        finally:
+            if prev is None:
+                os.environ.pop("TIKTOKEN_CACHE_DIR", None)
+            else:
+                os.environ["TIKTOKEN_CACHE_DIR"] = prev
+    tok = LocalTokenizer(name, lambda t: enc.encode(t, disallowed_special=()), enc.decode)
+    return tok, source
+
+
+def _load_hf(name: str, path: str, allow_download: bool) -> tuple[LocalTokenizer, str]:
+    p = Path(path or name).expanduser()
+    if p.is_dir():
+        p = p / "tokenizer.json"
+    if not p.is_file():
+        raise FileNotFoundError(f"tokenizer.json 不存在: {p}")
+    from tokenizers import Tokenizer
+
+    tk = Tokenizer.from_file(str(p))
+    tok = LocalTokenizer(
+        name,
+        lambda t: tk.encode(t, add_special_tokens=False).ids,
+        lambda ids: tk.decode(ids),
+    )
+    return tok, str(p)
+
+
+# 加载器注册表：kind -> loader(name, path, allow_download) -> (tokenizer, 实际加载的文件)；失败时抛异常
+_LOADERS: dict[str, Callable[[str, str, bool], tuple[LocalTokenizer, str]]] = {
+    "tiktoken": _load_tiktoken,
+    "hf": _load_hf,
+}
+_LOADED: dict[tuple[str, str, str, bool], tuple[Optional[LocalTokenizer], TokenizerLoadInfo]] = {}
+_LOADED_LOCK = threading.Lock()
+
+
+def register_tokenizer_loader(kind: str, loader: Callable[[str, str, bool], tuple[LocalTokenizer, str]]) -> None:
+    """注册自定义本地分词器加载器（如 sentencepiece）；按 kind 选择。"""
+    _LOADERS[kind] = loader
+
+
+def tokenizer_kind(name: str, path: str = "") -> str:
+    """推断加载器：显式 `kind:name` 优先；path 指向 tokenizer.json（或其所在目录）时为 hf，否则 tiktoken。"""
+    if ":" in name and name.split(":", 1)[0] in _LOADERS:
+        return name.split(":", 1)[0]
+    if path:
+        p = Path(path).expanduser()
+        if p.suffix == ".json" or (p / "tokenizer.json").is_file():
+            return "hf"
+    return "tiktoken"
+
+
+def load_tokenizer(
+    name: str = "cl100k_base", *, path: str = "", allow_download: bool = False
+) -> tuple[Optional[LocalTokenizer], TokenizerLoadInfo]:
+    """按 (名称, 路径) 惰性加载本地分词器，结果（含失败）进程内缓存。"""
+    kind = tokenizer_kind(name, path)
+    bare = name.split(":", 1)[1] if name.startswith(f"{kind}:") else name
+    key = (kind, bare, path, allow_download)
+    with _LOADED_LOCK:
+        cached = _LOADED.get(key)
+        if cached is not None:
+            return cached
+        t0 = time.perf_counter()
+        tok: Optional[LocalTokenizer] = None
+        source, error, hints = "", "", []
+        try:
+            tok, source = _LOADERS[kind](bare, path, allow_download)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if kind == "tiktoken":
+                hints = _tiktoken_hints(bare, path)
+        info = TokenizerLoadInfo(
+            name=bare, kind=kind, ok=tok is not None, load_ms=round((time.perf_counter() - t0) * 1000, 1),
+            source=source, error=error, hints=hints,
+        )
+        if tok is None:
+            logger.debug(f"本地分词器 {kind}:{bare} 不可用，改用启发式估算: {error}")
+        _LOADED[key] = (tok, info)
+        return tok, info
+
+
+def _tiktoken_hints(name: str, path: str) -> list[str]:
+    url = _TIKTOKEN_URLS.get(name)
+    if url is None:
+        return []
+    key = hashlib.sha1(url.encode()).hexdigest()
+    return [f"离线使用：下载 {url} 并保存为 {_tiktoken_cache_dirs(path)[0] / key}（或设置 llm.tokenizer_path 指向该目录）"]
+
+
+class TokenCounter:
+    """带内容哈希缓存的分词计数器（线程安全）。"""
+
+    def __init__(
+        self,
+        *,
+        source: str = "auto",
+        llm: Any = None,
+        encoding_name: str = "cl100k_base",
+        tokenizer_path: str = "",
+        allow_download: bool = False,
+        cache_size: int = 8192,
+        server_retry_s: float = 60.0,
+    ) -> None:
+        self.source = source if source in SOURCES else "auto"
+        self.llm = llm  # 需提供 tokenize(text) -> list[int]（LlamaCppHttpClient）
+        self.encoding_name = encoding_name
+        self.tokenizer_path = tokenizer_path
+        self.allow_download = allow_download
+        self.cache_size = max(0, int(cache_size))
+        self.server_retry_s = server_retry_s
+        self.hits = 0
+        self.misses = 0
+        self._cache: OrderedDict[bytes, int] = OrderedDict()
+        self._lock = threading.Lock()
+        self._server_down_until = 0.0
+
+    # ------------------------------------------------------------------
+    # 计数
+    # ------------------------------------------------------------------
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        key = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+        n = self._count_uncached(text)
+        if self.cache_size:
+            with self._lock:
+                self._cache[key] = n
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return n
+
+    def count_messages(self, messages: Iterable[Any]) -> int:
+        """消息列表的 token 总数（只计 content；已出现过的消息直接命中缓存）。"""
+        return sum(self.count(getattr(m, "content", None) or "") for m in messages)
+
+    @property
+    def active_source(self) -> str:
+        """当前实际使用的来源（auto 降级后的结果）。"""
+        if self.source == "heuristic":
+            return "heuristic"
+        if self.source in ("auto", "server") and self._server_ready():
+            return "server"
+        if self.source != "server" and self.local_tokenizer() is not None:
+            return "local"
+        return "heuristic"
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "source": self.source,
+            "active_source": self.active_source,
+            "cache_entries": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    # ------------------------------------------------------------------
+    # 各来源
+    # ------------------------------------------------------------------
+    def _count_uncached(self, text: str) -> int:
+        if self.source == "heuristic":
+            return estimate_tokens(text)
+        if self.source in ("auto", "server") and self._server_ready():
+            try:
+                return len(self.llm.tokenize(text))
+            except Exception as e:
+                self._server_down_until = time.monotonic() + self.server_retry_s
+                level = logging.WARNING if self.source == "server" else logging.DEBUG
+                logger.log(level, f"服务端 /tokenize 不可用，{self.server_retry_s:.0f}s 内改用本地计数: {e}")
+        if self.source != "server":
+            tok = self.local_tokenizer()
+            if tok is not None:
+                try:
+                    return len(tok.encode(text))
+                except Exception:
+                    pass
+        return estimate_tokens(text)
+
+    def _server_ready(self) -> bool:
+        return self.llm is not None and hasattr(self.llm, "tokenize") and time.monotonic() >= self._server_down_until
+
+    def local_tokenizer(self) -> Optional[LocalTokenizer]:
+        """本地分词器（注册表惰性加载、进程内缓存；不可用时为 None）。"""
+        if self.source in ("server", "heuristic"):
+            return None
+        tok, _ = load_tokenizer(self.encoding_name, path=self.tokenizer_path, allow_download=self.allow_download)
+        return tok
+
+
+_COUNTER: Optional[TokenCounter] = None
+_COUNTER_LOCK = threading.Lock()
+
+
+def get_token_counter() -> TokenCounter:
+    """进程内共享的计数器（未配置时为 auto 且不接服务端，即 local → heuristic）。"""
+    global _COUNTER
+    with _COUNTER_LOCK:
+        if _COUNTER is None:
+            _COUNTER = TokenCounter()
+        return _COUNTER
+
+
+def set_token_counter(counter: TokenCounter) -> None:
+    """由 AgentLoop 按配置注入（绑定当前 LLM 客户端以使用 /tokenize）。"""
+    global _COUNTER
+    with _COUNTER_LOCK:
+        _COUNTER = counter
@@ -6,6 +6,9 @@ from dataclasses import dataclass
 from pathlib import Path
 from typing import Any
 
+from clude_code.observability.log_sink import get_log_sink
+from clude_code.observability.log_store import get_jsonl_log
+
 
 @dataclass(frozen=True)
 class AuditEvent:
@@ -21,13 +24,23 @@ class AuditLogger:
     Minimal JSONL audit logger.
 
     Writes to: {workspace_root}/.clude/logs/audit.jsonl
+    Lines are handed to the shared async log sink (batched, fsynced on turn boundaries).
     """
 
-    def __init__(self, workspace_root: str, session_id: str) -> None:
+    def __init__(
+        self,
+        workspace_root: str,
+        session_id: str,
+        *,
+        max_bytes: int | None = None,
+        max_age_seconds: float | None = None,
+    ) -> None:
         self.workspace_root = Path(workspace_root)
         self.session_id = session_id
         self._path = self.workspace_root / ".clude" / "logs" / "audit.jsonl"
         self._path.parent.mkdir(parents=True, exist_ok=True)
+        # 轮转 + 会话/trace_id 偏移索引；写入经共享 LogSink 交给它。审计段只轮转、从不删除
+        self._log = get_jsonl_log(self._path, max_bytes=max_bytes, max_age_seconds=max_age_seconds)
 
     def write(self, *, trace_id: str, event: str, data: dict[str, Any]) -> None:
         ev = AuditEvent(
@@ -47,7 +60,9 @@ class AuditLogger:
             },
             ensure_ascii=False,
         )
-        with self._path.open("a", encoding="utf-8") as f:
-            f.write(line + "\n")
-
+        get_log_sink().submit(self._path, line)
 
+    def tail(self, limit: int = 100, *, trace_id: str | None = None, session_id: str | None = None) -> list[dict[str, Any]]:
+        """最新的 limit 条审计事件（最新的在前面），可按 trace_id / session_id 过滤。"""
+        get_log_sink().flush()
+        return self._log.tail(limit, trace_id=trace_id, session_id=session_id)
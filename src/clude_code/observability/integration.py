@@ -10,6 +10,7 @@ from typing import Any, Dict, List, Optional, Union
 
 from clude_code.config.config import CludeConfig
 from clude_code.observability.logger import get_logger
+from clude_code.observability.log_sink import get_log_sink
 from clude_code.observability.metrics import get_metrics_collector, MetricType
 from clude_code.observability.metrics_storage import get_metrics_manager, StorageBackend, MetricsQuery
 from clude_code.observability.tracing import get_tracer, SpanKind, trace_span, trace_method
@@ -28,14 +29,15 @@ class ObservabilityManager:
         self.metrics_collector = get_metrics_collector(cfg.workspace_root)
         self.metrics_manager = get_metrics_manager(
             workspace_root=cfg.workspace_root,
-            storage_backend=StorageBackend.FILE,
-            storage_options={"max_file_size_mb": 50}
+            storage_backend=StorageBackend.SEGMENT,
         )
         self.tracer = get_tracer("clude_code", cfg.workspace_root)
         self.profile_manager = get_profile_manager(cfg.workspace_root)
         
         # 创建业务指标
         self._setup_business_metrics()
+        # 审计/追踪日志写入器的队列深度与背压指标
+        self.metrics_collector.register_collector(get_log_sink().collect_metrics)
         
         # 启动后台任务
         self._background_tasks: List[threading.Thread] = []
@@ -70,27 +72,29 @@ class ObservabilityManager:
         )
         
         # 工具调用指标
-        self.tool_call_counter = self.metrics_collector.counter(
+        # 按工具名分序列（指标族：同一标签组合复用同一子序列，随 collect_all 一起导出）
+        self.tool_call_counter = self.metrics_collector.counter_family(
             "tool_calls_total",
-            "Total number of tool calls",
-            labels={"tool": "unknown"}
+            ["tool"],
+            "Total number of tool calls"
         )
-        self.tool_call_duration = self.metrics_collector.histogram(
+        self.tool_call_duration = self.metrics_collector.histogram_family(
             "tool_call_duration_seconds",
+            ["tool"],
             buckets=[0.1, 0.5, 1.0, 2.0, 5.0, 10.0],
             help_text="Tool call duration in seconds"
         )
-        self.tool_call_errors = self.metrics_collector.counter(
+        self.tool_call_errors = self.metrics_collector.counter_family(
             "tool_call_errors_total",
-            "Total number of tool call errors",
-            labels={"tool": "unknown"}
+            ["tool"],
+            "Total number of tool call errors"
         )
         
         # 文件操作指标
-        self.file_operation_counter = self.metrics_collector.counter(
+        self.file_operation_counter = self.metrics_collector.counter_family(
             "file_operations_total",
-            "Total number of file operations",
-            labels={"operation": "unknown", "file_type": "unknown"}
+            ["operation", "file_type"],
+            "Total number of file operations"
         )
         self.file_operation_bytes = self.metrics_collector.histogram(
             "file_operation_bytes",
@@ -99,10 +103,10 @@ class ObservabilityManager:
         )
         
         # 任务执行指标
-        self.task_execution_counter = self.metrics_collector.counter(
+        self.task_execution_counter = self.metrics_collector.counter_family(
             "task_executions_total",
-            "Total number of task executions",
-            labels={"task_type": "unknown", "status": "unknown"}
+            ["task_type", "status"],
+            "Total number of task executions"
         )
         self.task_execution_duration = self.metrics_collector.histogram(
             "task_execution_duration_seconds",
@@ -173,7 +177,7 @@ class ObservabilityManager:
         """记录工具调用"""
         # 记录指标
         self.tool_call_counter.with_labels(tool=tool_name).inc()
-        self.tool_call_duration.observe(duration)
+        self.tool_call_duration.with_labels(tool=tool_name).observe(duration)
         
         if not success:
             self.tool_call_errors.with_labels(tool=tool_name).inc()
@@ -353,6 +357,9 @@ class ObservabilityManager:
         # 保存性能分析记录
         self.profile_manager.save_records()
         
+        # 停止清理定时器并落盘指标段索引
+        self.metrics_manager.shutdown()
+        
         self.logger.info("Observability manager shutdown")
 
 
@@ -0,0 +1,339 @@
+"""
+共享的异步 JSONL 日志写入器（Async Log Sink）
+
+AuditLogger / TraceLogger 过去每个事件都 open → 写一行 → close；run_tool_lifecycle 与 _ev 每步会发出
+多个事件，在慢盘/网络盘上 Agent 主循环会卡在 open()/close() 上。这里改为：
+- 调用方只把已序列化的行放进有界内存队列（submit），不碰文件；
+- 后台写线程按批取出（凑满 batch_size 或等满 flush_interval），按文件分组追加写入，文件句柄常驻；
+- 只在轮次边界（sync）与进程退出（close，atexit 注册）时 fsync；flush 只保证写入 OS 缓冲区，供读取方读到自己的写入；
+- 队列满时调用方阻塞等待（不丢审计事件），等待次数与累计时长作为背压指标（stats / collect_metrics）；
+- 写线程不可用（已关闭或异常退出）时退化为调用方同步追加写入；单个文件写入失败（含无法编码的字符）
+  只计入 write_errors，不影响同批其他文件，也不会让写线程退出；
+- 需要自行管理文件（轮转、维护偏移索引）的日志可通过 attach 注册 LogWriter，写线程把该路径的行交给它。
+"""
+
+from __future__ import annotations
+
+import atexit
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+_STOP = object()
+
+
+class LogWriter:
+    """单个日志文件的写入端（默认实现：常驻的追加句柄）。只在持有 LogSink 的 I/O 锁时被调用。"""
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path = Path(path)
+        self._fh: Any = None
+
+    def write_lines(self, lines: List[str]) -> None:
+        if self._fh is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # 工具输出中的孤立代理字符（ensure_ascii=False 序列化）无法编码为 UTF-8：转义而不是整批失败
+            self._fh = open(self.path, "a", encoding="utf-8", errors="backslashreplace")
+        self._fh.write("\n".join(lines) + "\n")
+        self._fh.flush()
+
+    def flush(self) -> None:
+        if self._fh is not None:
+            self._fh.flush()
+
+    def fsync(self) -> bool:
+        if self._fh is None:
+            return False
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        return True
+
+    def close(self) -> None:
+        if self._fh is not None:
+            fh, self._fh = self._fh, None
+            fh.close()
+
+
+def _key(path: Union[str, Path]) -> str:
+    # 同一文件可能以相对/绝对路径提交（CLI 与 Agent 的 workspace_root 写法不同）
+    return os.path.abspath(str(path))
+
+
+class LogSink:
+    """按文件分组批量追加写入的后台写线程（线程安全，多个 logger 共享一个实例）。"""
+
+    def __init__(self, max_queue: int = 10_000, batch_size: int = 256, flush_interval: float = 0.2) -> None:
+        self.max_queue = max(1, int(max_queue))
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = max(0.0, float(flush_interval))
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=self.max_queue)
+        self._writers: Dict[str, LogWriter] = {}
+        # 通过 attach 注册的写入端：关闭后保留（下次写入时自行重新打开）
+        self._attached: set[str] = set()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        # 同步回退写入与写线程互斥，避免同一文件的行交错
+        self._io_lock = threading.Lock()
+        self._closed = False
+        self._stats_lock = threading.Lock()
+        self._stats: Dict[str, float] = {
+            "enqueued": 0,
+            "written": 0,
+            "batches": 0,
+            "fsyncs": 0,
+            "write_errors": 0,
+            "sync_writes": 0,
+            "max_queue_depth": 0,
+            "backpressure_waits": 0,
+            "backpressure_wait_seconds": 0.0,
+        }
+
+    # ---- 生产者 ----
+
+    def submit(self, path: Union[str, Path], line: str) -> None:
+        """追加一行（line 不含换行符）到 path。"""
+        item = (_key(path), line)
+        if not self._ensure_started():
+            self._write_sync(item)
+            return
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            t0 = time.perf_counter()
+            while True:
+                try:
+                    self._queue.put(item, timeout=0.5)
+                    break
+                except queue.Full:
+                    if not self._alive():
+                        self._write_sync(item)
+                        break
+            self._bump(backpressure_waits=1, backpressure_wait_seconds=time.perf_counter() - t0)
+        depth = self._queue.qsize()
+        with self._stats_lock:
+            self._stats["enqueued"] += 1
+            if depth > self._stats["max_queue_depth"]:
+                self._stats["max_queue_depth"] = depth
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """等待已提交的行写入 OS 缓冲区（读取方在读文件前调用）。"""
+        return self._barrier(fsync=False, timeout=timeout)
+
+    def sync(self, timeout: float = 10.0) -> bool:
+        """等待已提交的行写入并 fsync（轮次边界调用）。"""
+        return self._barrier(fsync=True, timeout=timeout)
+
+    def close(self, timeout: float = 10.0) -> None:
+        """写完队列中剩余的行、fsync 并关闭文件；之后的 submit 退化为同步写入。"""
+        with self._start_lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put(_STOP)
+            thread.join(timeout)
+        # 写线程退出后仍可能残留（例如 join 超时前后的竞争）：就地写完
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, tuple):
+                self._write_sync(item)
+            elif isinstance(item, threading.Event):
+                item.set()
+        with self._io_lock:
+            self._sync_files()
+            for key, w in list(self._writers.items()):
+                try:
+                    w.close()
+                except OSError:
+                    pass
+                if key not in self._attached:
+                    del self._writers[key]
+
+    def attach(self, path: Union[str, Path], writer: LogWriter) -> None:
+        """让写线程把 path 的行交给 writer（替换默认的追加句柄）。"""
+        key = _key(path)
+        with self._io_lock:
+            old = self._writers.get(key)
+            if old is not None and old is not writer:
+                try:
+                    old.close()
+                except OSError:
+                    pass
+            self._writers[key] = writer
+            self._attached.add(key)
+
+    # ---- 指标 ----
+
+    def stats(self) -> Dict[str, float]:
+        with self._stats_lock:
+            out = dict(self._stats)
+        out["queue_depth"] = self._queue.qsize()
+        out["queue_capacity"] = self.max_queue
+        return out
+
+    def collect_metrics(self) -> List[Any]:
+        """以 MetricPoint 形式导出背压/吞吐指标（可注册为 MetricsCollector 的收集器）。"""
+        from clude_code.observability.metrics import MetricPoint, MetricType
+
+        now = time.time()
+        gauges = {"queue_depth", "queue_capacity", "max_queue_depth"}
+        return [
+            MetricPoint(
+                name=f"log_sink_{k}" if k in gauges else f"log_sink_{k}_total",
+                metric_type=MetricType.GAUGE if k in gauges else MetricType.COUNTER,
+                value=float(v),
+                timestamp=now,
+                help_text="Async audit/trace log sink",
+            )
+            for k, v in self.stats().items()
+        ]
+
+    # ---- 写线程 ----
+
+    def _alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _ensure_started(self) -> bool:
+        if self._closed:
+            return False
+        if self._alive():
+            return True
+        with self._start_lock:
+            if self._closed:
+                return False
+            if self._alive():
+                return True
+            if self._thread is not None:
+                # 写线程异常退出：不再重启，后续同步写入
+                return False
+            self._thread = threading.Thread(target=self._run, name="clude-log-sink", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+            return True
+
+    def _barrier(self, *, fsync: bool, timeout: float) -> bool:
+        if not self._alive():
+            with self._io_lock:
+                self._flush_files(fsync=fsync)
+            return True
+        done = threading.Event()
+        done.fsync = fsync  # type: ignore[attr-defined]
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def _run(self) -> None:
+        while True:
+            try:
+                if self._run_once():
+                    return
+            except Exception:
+                # 单批异常不能结束写线程（否则之后所有 submit 都退化为同步写入）
+                self._bump(write_errors=1)
+
+    def _run_once(self) -> bool:
+        """取出并写入一批；收到停止信号时返回 True。"""
+        item = self._queue.get()
+        batch: List[Tuple[str, str]] = []
+        barrier: Optional[threading.Event] = None
+        stop = False
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            if item is _STOP:
+                stop = True
+                break
+            if isinstance(item, threading.Event):
+                barrier = item
+                break
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                break
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+        try:
+            with self._io_lock:
+                if batch:
+                    self._write_batch(batch)
+                if barrier is not None or stop:
+                    self._flush_files(fsync=stop or bool(getattr(barrier, "fsync", False)))
+        except Exception:
+            self._bump(write_errors=1)
+        finally:
+            if barrier is not None:
+                barrier.set()
+        return stop
+
+    def _writer(self, path: str) -> LogWriter:
+        w = self._writers.get(path)
+        if w is None:
+            w = self._writers[path] = LogWriter(path)
+        return w
+
+    def _write_batch(self, batch: List[Tuple[str, str]]) -> None:
+        grouped: Dict[str, List[str]] = {}
+        for path, line in batch:
+            grouped.setdefault(path, []).append(line)
+        written = errors = 0
+        for path, lines in grouped.items():
+            w = self._writer(path)
+            try:
+                w.write_lines(lines)
+                written += len(lines)
+            except Exception:
+                errors += 1
+                # 关闭出错的句柄，下一批重新打开
+                try:
+                    w.close()
+                except OSError:
+                    pass
+        self._bump(written=written, batches=1, write_errors=errors)
+
+    def _write_sync(self, item: Tuple[str, str]) -> None:
+        with self._io_lock:
+            self._write_batch([item])
+        self._bump(sync_writes=1)
+
+    def _flush_files(self, *, fsync: bool) -> None:
+        for w in list(self._writers.values()):
+            try:
+                w.flush()
+            except OSError:
+                self._bump(write_errors=1)
+        if fsync:
+            self._sync_files()
+
+    def _sync_files(self) -> None:
+        for w in list(self._writers.values()):
+            try:
+                if w.fsync():
+                    self._bump(fsyncs=1)
+            except (OSError, ValueError):
+                self._bump(write_errors=1)
+
+    def _bump(self, **deltas: float) -> None:
+        with self._stats_lock:
+            for k, v in deltas.items():
+                self._stats[k] += v
+
+
+_SINK: Optional[LogSink] = None
+_SINK_LOCK = threading.Lock()
+
+
+def get_log_sink() -> LogSink:
+    """进程内共享的日志写入器（审计与追踪日志共用一个写线程）。"""
+    global _SINK
+    with _SINK_LOCK:
+        if _SINK is None:
+            _SINK = LogSink()
+        return _SINK
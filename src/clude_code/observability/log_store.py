@@ -0,0 +1,518 @@
+"""
+按大小/时间轮转、带旁路索引的 JSONL 日志存储（Rotating Indexed JSONL Log）
+
+trace.jsonl / audit.jsonl 过去只有一个不断增长的文件：read_traces / list_sessions 每次都从头扫描，
+几个月的历史会让 `clude observability` 花几十秒列会话，read_traces(limit=N) 还返回的是最旧的 N 条。这里改为：
+- 活动文件仍是 <name>.jsonl；超过 max_bytes 或最早事件超过 max_age_seconds 时整体改名为
+  <name>.<seq>.jsonl 封存；默认保留全部封存段（审计与离线消息重建依赖完整历史），
+  显式设置 max_segments 时只保留最新的 max_segments 个（更旧的整段删除）；
+- 写入端（LogSink 写线程）写入时记录每行的字节偏移：session_id -> 偏移、trace_id -> 偏移；
+  封存时把偏移索引写到 <name>.<seq>.idx.json，并在清单 <name>.index.json 中记录段的时间范围、
+  会话摘要（首/末时间戳、事件数）与 trace_id 列表（时间 -> 段、会话/trace -> 段）；
+- 读取（tail）从最新的段向前：按会话/trace 过滤时只打开清单中包含该键的段，并按偏移直接 seek；
+  不过滤时从文件末尾按块反向读取。取最新 N 条的代价与文件总大小无关。
+
+同一工作区的多个会话会同时写 audit/trace：写入端每批持有 <name>.lock 的排他 flock，在锁内补齐
+其他进程追加的行、按需轮转并追加，偏移与清单因此不会被并发写入打乱（无 fcntl 的平台退化为单写进程假设）。
+只读进程（例如 CLI）不加锁：读取前按文件大小增量补齐活动文件的索引，检测到活动文件被轮转（变小）时
+重新加载清单。清单/段索引丢失时读取方只在内存中重建，只有写入端（write_lines）才把重建结果写回磁盘。
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+from clude_code.observability.log_sink import LogWriter, get_log_sink
+
+try:
+    import fcntl
+except ImportError:  # Windows：无 flock，退化为单写进程假设
+    fcntl = None  # type: ignore[assignment]
+
+_REVERSE_BLOCK = 64 * 1024
+
+
+@dataclass
+class _SegmentIndex:
+    """一个段内的偏移索引与摘要"""
+
+    sessions: Dict[str, List[int]] = field(default_factory=dict)
+    traces: Dict[str, List[int]] = field(default_factory=dict)
+    # session_id -> [首个时间戳, 最后时间戳, 事件数]
+    session_stats: Dict[str, List[float]] = field(default_factory=dict)
+    min_ts: Optional[float] = None
+    max_ts: Optional[float] = None
+    count: int = 0
+
+    def add(self, offset: int, raw: bytes) -> None:
+        self.count += 1
+        try:
+            obj = json.loads(raw)
+        except (ValueError, UnicodeDecodeError):
+            return
+        if not isinstance(obj, dict):
+            return
+        ts = obj.get("timestamp")
+        if isinstance(ts, (int, float)):
+            self.min_ts = ts if self.min_ts is None else min(self.min_ts, ts)
+            self.max_ts = ts if self.max_ts is None else max(self.max_ts, ts)
+        sid = obj.get("session_id")
+        if isinstance(sid, str):
+            self.sessions.setdefault(sid, []).append(offset)
+            st = self.session_stats.get(sid)
+            t = ts if isinstance(ts, (int, float)) else 0
+            if st is None:
+                self.session_stats[sid] = [t, t, 1]
+            else:
+                st[0], st[1], st[2] = min(st[0], t), max(st[1], t), st[2] + 1
+        tid = obj.get("trace_id")
+        if isinstance(tid, str):
+            self.traces.setdefault(tid, []).append(offset)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "min_ts": self.min_ts,
+            "max_ts": self.max_ts,
+            "count": self.count,
+            "sessions": self.session_stats,
+            "traces": list(self.traces),
+        }
+
+
+def _scan(path: Path, index: _SegmentIndex, start: int) -> int:
+    """从 start 开始把完整的行加入索引，返回已索引到的字节位置（不含末尾未写完的行）。"""
+    pos = start
+    with open(path, "rb") as f:
+        f.seek(start)
+        for raw in f:
+            if not raw.endswith(b"\n"):
+                break
+            if raw.strip():
+                index.add(pos, raw)
+            pos += len(raw)
+    return pos
+
+
+def _iter_reverse(f: Any, end: int) -> Iterator[bytes]:
+    """从 end 向前按块读取，倒序产出非空行。"""
+    pos = end
+    tail = b""
+    while pos > 0:
+        step = min(_REVERSE_BLOCK, pos)
+        pos -= step
+        f.seek(pos)
+        buf = f.read(step) + tail
+        lines = buf.split(b"\n")
+        tail = lines[0]
+        for line in reversed(lines[1:]):
+            if line.strip():
+                yield line
+    if tail.strip():
+        yield tail
+
+
+class RotatingJsonlLog(LogWriter):
+    """轮转 + 偏移索引的 JSONL 日志（同时是 LogSink 的写入端与读取入口，线程安全）。"""
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        *,
+        max_bytes: int = 16 * 1024 * 1024,
+        max_age_seconds: float = 24 * 3600,
+        max_segments: Optional[int] = None,
+    ) -> None:
+        super().__init__(path)
+        self.max_segments: Optional[int] = None
+        self.configure(max_bytes=max_bytes, max_age_seconds=max_age_seconds, max_segments=max_segments)
+        self.manifest_path = self.path.with_name(f"{self.path.stem}.index.json")
+        # 跨进程写锁：活动文件会被改名封存，不能锁它本身
+        self.lock_path = self.path.with_name(f"{self.path.stem}.lock")
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._active = _SegmentIndex()
+        self._active_size = 0
+        self._active_ino: Optional[int] = None
+        # 清单文件的 (mtime_ns, size)：其他进程轮转后清单会变（inode 可能被复用，不能只看 inode）
+        self._manifest_sig: Optional[tuple] = None
+        self._segments: List[Dict[str, Any]] = []
+        # trace_id -> 包含它的段号（清单中每段的 traces 是列表，按段逐个 in 是线性扫描）
+        self._trace_segs: Dict[str, List[int]] = {}
+        self._idx_cache: Dict[str, Dict[str, Any]] = {}
+        # 读取时在内存中重建、尚未写回磁盘的清单与段索引（只由写入端落盘）
+        self._manifest_dirty = False
+        self._pending_idx: Dict[int, _SegmentIndex] = {}
+
+    def configure(
+        self,
+        *,
+        max_bytes: Optional[int] = None,
+        max_age_seconds: Optional[float] = None,
+        max_segments: Optional[int] = None,
+    ) -> None:
+        """调整轮转与保留策略（None 表示不修改；max_segments<=0 表示不限）。"""
+        if max_bytes is not None:
+            self.max_bytes = max(1024, int(max_bytes))
+        if max_age_seconds is not None:
+            self.max_age_seconds = float(max_age_seconds)
+        if max_segments is not None:
+            self.max_segments = int(max_segments) if max_segments > 0 else None
+
+    # ---- 段与清单 ----
+
+    def _seg_path(self, seq: int) -> Path:
+        return self.path.with_name(f"{self.path.stem}.{seq:06d}{self.path.suffix}")
+
+    def _idx_path(self, seq: int) -> Path:
+        return self.path.with_name(f"{self.path.stem}.{seq:06d}.idx.json")
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        self._load_manifest()
+        self._active = _SegmentIndex()
+        self._active_size = 0
+        self._active_ino = None
+        self._loaded = True
+        self._catch_up()
+
+    def _stat_manifest(self) -> Optional[tuple]:
+        try:
+            st = self.manifest_path.stat()
+            return (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return None
+
+    def _load_manifest(self) -> None:
+        self._manifest_sig = self._stat_manifest()
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                segments = json.load(f)["segments"]
+        except (OSError, ValueError, KeyError, TypeError):
+            segments = self._rebuild_manifest()
+        self._segments = [s for s in segments if self._seg_path(s["seq"]).exists()]
+        self._trace_segs = {}
+        for seg in self._segments:
+            self._index_traces(seg)
+        self._idx_cache.clear()
+
+    def _index_traces(self, seg: Dict[str, Any]) -> None:
+        for tid in seg["traces"]:
+            self._trace_segs.setdefault(tid, []).append(seg["seq"])
+
+    def _rebuild_manifest(self) -> List[Dict[str, Any]]:
+        """清单丢失/损坏：从封存段（及其 .idx.json，缺失时扫描段文件）重建。"""
+        segments = []
+        prefix = f"{self.path.stem}."
+        for p in sorted(self.path.parent.glob(f"{self.path.stem}.*{self.path.suffix}")):
+            seq_s = p.name[len(prefix):-len(self.path.suffix)]
+            if not seq_s.isdigit():
+                continue
+            index = _SegmentIndex()
+            _scan(p, index, 0)
+            segments.append({"seq": int(seq_s), **index.summary()})
+            self._pending_idx[int(seq_s)] = index
+        self._manifest_dirty = bool(segments)
+        return segments
+
+    def _persist_rebuilt(self) -> None:
+        """写入端：把读取时在内存中重建的清单与段索引写回磁盘。"""
+        if not self._manifest_dirty:
+            return
+        for seq, index in self._pending_idx.items():
+            if self._seg_path(seq).exists():
+                self._write_idx(seq, index)
+        self._pending_idx.clear()
+        self._save_manifest(self._segments)
+        self._manifest_dirty = False
+
+    def _write_idx(self, seq: int, index: _SegmentIndex) -> None:
+        tmp = self._idx_path(seq).with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"sessions": index.sessions, "traces": index.traces}, f)
+        os.replace(tmp, self._idx_path(seq))
+
+    def _save_manifest(self, segments: List[Dict[str, Any]]) -> None:
+        tmp = self.manifest_path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "segments": segments}, f, ensure_ascii=False)
+        os.replace(tmp, self.manifest_path)
+        self._manifest_sig = self._stat_manifest()
+
+    def _load_idx(self, seq: int) -> Dict[str, Any]:
+        key = str(seq)
+        idx = self._idx_cache.get(key)
+        if idx is None:
+            try:
+                with open(self._idx_path(seq), encoding="utf-8") as f:
+                    idx = json.load(f)
+            except (OSError, ValueError):
+                index = self._pending_idx.get(seq)
+                if index is None:
+                    index = _SegmentIndex()
+                    _scan(self._seg_path(seq), index, 0)
+                idx = {"sessions": index.sessions, "traces": index.traces}
+            self._idx_cache[key] = idx
+        return idx
+
+    def _catch_up(self) -> None:
+        """活动文件被其他进程追加或轮转时同步内存索引。"""
+        try:
+            st = self.path.stat()
+            size, ino = st.st_size, st.st_ino
+        except FileNotFoundError:
+            size, ino = 0, None
+        rotated = (self._active_ino is not None and ino is not None and ino != self._active_ino) or (
+            self._stat_manifest() != self._manifest_sig
+        )
+        if size < self._active_size or rotated:
+            self._manifest_dirty = False
+            self._pending_idx.clear()
+            self._load_manifest()
+            self._active = _SegmentIndex()
+            self._active_size = 0
+        self._active_ino = ino
+        if size > self._active_size:
+            self._active_size = _scan(self.path, self._active, self._active_size)
+
+    # ---- 写入端（LogSink 写线程调用） ----
+
+    @contextmanager
+    def _write_lock(self) -> Iterator[None]:
+        """跨进程排他写锁（补齐、轮转与追加必须在同一把锁内完成）。"""
+        if fcntl is None:
+            yield
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_path, "a+b") as lf:
+            fcntl.flock(lf.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lf.fileno(), fcntl.LOCK_UN)
+
+    def write_lines(self, lines: List[str]) -> None:
+        with self._lock, self._write_lock():
+            self._ensure_loaded()
+            if self._fh is not None and self._rotated_elsewhere():
+                self.close()
+            if self._fh is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._fh = open(self.path, "ab")
+            self._catch_up()
+            self._persist_rebuilt()
+            if self._should_rotate():
+                self._rotate()
+                self._fh = open(self.path, "ab")
+                self._active_ino = os.fstat(self._fh.fileno()).st_ino
+            chunks = []
+            size = os.fstat(self._fh.fileno()).st_size
+            if size > self._active_size:
+                # 持锁时仍有未写完的行：来自崩溃的写入者，补一个换行让它自成一行（解析失败会被跳过）
+                chunks.append(b"\n")
+                self._active_size = size + 1
+            for line in lines:
+                raw = line.encode("utf-8", errors="backslashreplace") + b"\n"
+                self._active.add(self._active_size, raw)
+                self._active_size += len(raw)
+                chunks.append(raw)
+            self._fh.write(b"".join(chunks))
+            self._fh.flush()
+
+    def _rotated_elsewhere(self) -> bool:
+        try:
+            return os.stat(self.path).st_ino != os.fstat(self._fh.fileno()).st_ino
+        except OSError:
+            return True
+
+    def _should_rotate(self) -> bool:
+        if self._active.count == 0:
+            return False
+        if self._active_size >= self.max_bytes:
+            return True
+        return self._active.min_ts is not None and time.time() - self._active.min_ts >= self.max_age_seconds
+
+    def _rotate(self) -> None:
+        self.close()
+        seq = max((s["seq"] for s in self._segments), default=0) + 1
+        os.replace(self.path, self._seg_path(seq))
+        self._write_idx(seq, self._active)
+        self._segments.append({"seq": seq, **self._active.summary()})
+        self._index_traces(self._segments[-1])
+        pruned = False
+        while self.max_segments is not None and len(self._segments) > self.max_segments:
+            old = self._segments.pop(0)
+            pruned = True
+            for p in (self._seg_path(old["seq"]), self._idx_path(old["seq"])):
+                try:
+                    p.unlink()
+                except FileNotFoundError:
+                    pass
+            self._idx_cache.pop(str(old["seq"]), None)
+        if pruned:
+            live = {seg["seq"] for seg in self._segments}
+            self._trace_segs = {
+                tid: kept for tid, seqs in self._trace_segs.items() if (kept := [q for q in seqs if q in live])
+            }
+        self._save_manifest(self._segments)
+        self._active = _SegmentIndex()
+        self._active_size = 0
+
+    # ---- 读取 ----
+
+    def tail(
+        self,
+        limit: int = 100,
+        *,
+        session_id: Optional[str] = None,
+        trace_id: Optional[str] = None,
+        since: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        """最新的 limit 条事件（新 -> 旧），可按 session_id / trace_id / 起始时间过滤。"""
+        if limit <= 0:
+            return []
+        with self._lock:
+            self._ensure_loaded()
+            self._catch_up()
+            # 活动文件在锁内打开：锁外打开可能拿到轮转后的新文件，与 _active_size/偏移对不上
+            try:
+                active_fh: Any = open(self.path, "rb")
+            except FileNotFoundError:
+                active_fh = None
+            # (段文件或已打开的活动文件, 可读到的字节数, 偏移列表 | None 表示反向扫描, 段内最大时间戳)
+            sources = [(active_fh, self._active_size, self._offsets(self._active, session_id, trace_id), self._active.max_ts)]
+            trace_segs = set(self._trace_segs.get(trace_id, ())) if trace_id is not None else None
+            for seg in reversed(self._segments):
+                if session_id is not None and session_id not in seg["sessions"]:
+                    continue
+                if trace_segs is not None and seg["seq"] not in trace_segs:
+                    continue
+                offsets = None
+                if session_id is not None or trace_id is not None:
+                    try:
+                        idx = self._load_idx(seg["seq"])
+                    except FileNotFoundError:
+                        continue
+                    offsets = list(idx["sessions" if session_id is not None else "traces"].get(session_id or trace_id, []))
+                    if session_id is not None and trace_id is not None:
+                        offsets = sorted(set(offsets) & set(idx["traces"].get(trace_id, [])))
+                sources.append((self._seg_path(seg["seq"]), None, offsets, seg["max_ts"]))
+
+        try:
+            return self._read_sources(sources, limit, session_id, trace_id, since)
+        finally:
+            if active_fh is not None:
+                active_fh.close()
+
+    def _read_sources(
+        self,
+        sources: List[Any],
+        limit: int,
+        session_id: Optional[str],
+        trace_id: Optional[str],
+        since: Optional[float],
+    ) -> List[Dict[str, Any]]:
+        out: List[Dict[str, Any]] = []
+        for src, end, offsets, max_ts in sources:
+            # 来源按新 -> 旧排列：某个段整体早于 since 时，其后的段只会更早
+            if since is not None and max_ts is not None and max_ts < since:
+                break
+            if src is None:
+                continue
+            try:
+                if isinstance(src, Path):
+                    # 封存段不再变化；在锁内打开，避免与本进程的轮转/清理交错
+                    with self._lock:
+                        fh: Any = open(src, "rb")
+                else:
+                    fh = nullcontext(src)
+                with fh as f:
+                    if offsets is None:
+                        lines = _iter_reverse(f, end if end is not None else os.fstat(f.fileno()).st_size)
+                    else:
+                        lines = self._read_at(f, reversed(offsets))
+                    for raw in lines:
+                        try:
+                            obj = json.loads(raw)
+                        except (ValueError, UnicodeDecodeError):
+                            continue
+                        if not isinstance(obj, dict):
+                            continue
+                        ts = obj.get("timestamp")
+                        if since is not None and isinstance(ts, (int, float)) and ts < since:
+                            return out
+                        if offsets is None and (
+                            (session_id is not None and obj.get("session_id") != session_id)
+                            or (trace_id is not None and obj.get("trace_id") != trace_id)
+                        ):
+                            continue
+                        out.append(obj)
+                        if len(out) >= limit:
+                            return out
+            except FileNotFoundError:
+                continue
+        return out
+
+    @staticmethod
+    def _offsets(index: _SegmentIndex, session_id: Optional[str], trace_id: Optional[str]) -> Optional[List[int]]:
+        if session_id is None and trace_id is None:
+            return None
+        if session_id is not None and trace_id is not None:
+            return sorted(set(index.sessions.get(session_id, [])) & set(index.traces.get(trace_id, [])))
+        if session_id is not None:
+            return list(index.sessions.get(session_id, []))
+        return list(index.traces.get(trace_id, []))
+
+    @staticmethod
+    def _read_at(f: Any, offsets: Any) -> Iterator[bytes]:
+        for off in offsets:
+            f.seek(off)
+            yield f.readline()
+
+    def trace_events(self, trace_id: str) -> List[Dict[str, Any]]:
+        """某个 trace_id 的全部事件（按写入顺序）。"""
+        return list(reversed(self.tail(1 << 62, trace_id=trace_id)))
+
+    def sessions(self) -> Dict[str, List[float]]:
+        """session_id -> [首个时间戳, 最后时间戳, 事件数]（只读清单与活动段索引）。"""
+        with self._lock:
+            self._ensure_loaded()
+            self._catch_up()
+            out: Dict[str, List[float]] = {}
+            for seg in self._segments + [{"sessions": self._active.session_stats}]:
+                for sid, (first, last, count) in seg["sessions"].items():
+                    cur = out.get(sid)
+                    out[sid] = [first, last, count] if cur is None else [min(cur[0], first), max(cur[1], last), cur[2] + count]
+            return out
+
+    def segment_files(self) -> List[Path]:
+        """封存段（旧 -> 新）与活动文件。"""
+        with self._lock:
+            self._ensure_loaded()
+            return [self._seg_path(s["seq"]) for s in self._segments] + [self.path]
+
+
+_LOGS: Dict[str, RotatingJsonlLog] = {}
+_LOGS_LOCK = threading.Lock()
+
+
+def get_jsonl_log(path: Union[str, Path], **options: Any) -> RotatingJsonlLog:
+    """进程内每个日志文件一个实例，并注册为共享 LogSink 的写入端（传入的轮转/保留选项会应用到已有实例）。"""
+    key = os.path.abspath(str(path))
+    options = {k: v for k, v in options.items() if v is not None}
+    with _LOGS_LOCK:
+        log = _LOGS.get(key)
+        if log is None:
+            log = _LOGS[key] = RotatingJsonlLog(key, **options)
+            get_log_sink().attach(key, log)
+        elif options:
+            with log._lock:
+                log.configure(**options)
+        return log
@@ -0,0 +1,117 @@
+"""
+内容寻址的消息存储（Content-Addressed Message Store）
+
+llm_request_params 事件过去每次都携带完整 messages（含数 KB 的系统提示词与 Repo Map），
+一轮 30 步就把相同内容复制 30 次进 UI 队列与 trace.jsonl。这里改为：
+- 消息正文按内容哈希存入进程内存储（按字节数 LRU 淘汰）；
+- 事件只带消息引用 {id, role, length}，外加本会话首次出现的消息正文（delta），
+  因此 trace.jsonl 仍可离线还原每次请求的完整 messages；
+- UI 需要展示正文时再按 id 取（resolve_messages），取不到时回退到事件里的 delta。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+
+def message_id(role: str, content: str) -> str:
+    h = hashlib.blake2b(digest_size=10)
+    h.update(role.encode("utf-8"))
+    h.update(b"\x00")
+    h.update((content or "").encode("utf-8", "surrogatepass"))
+    return h.hexdigest()
+
+
+class MessageStore:
+    """id -> {role, content}，按正文字节数限界的 LRU（线程安全）。"""
+
+    def __init__(self, max_bytes: int = 64_000_000) -> None:
+        self.max_bytes = max(0, int(max_bytes))
+        self._items: OrderedDict[str, Dict[str, str]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def put(self, role: str, content: str) -> str:
+        mid = message_id(role, content)
+        with self._lock:
+            if mid in self._items:
+                self._items.move_to_end(mid)
+                return mid
+            self._items[mid] = {"role": role, "content": content or ""}
+            self._bytes += len(content or "")
+            while self._bytes > self.max_bytes and len(self._items) > 1:
+                _, old = self._items.popitem(last=False)
+                self._bytes -= len(old["content"])
+        return mid
+
+    def get(self, mid: str) -> Optional[Dict[str, str]]:
+        with self._lock:
+            item = self._items.get(mid)
+            if item is not None:
+                self._items.move_to_end(mid)
+            return item
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class MessageRefEncoder:
+    """
+    把消息列表编码为引用 + delta（每个会话一个实例）：已发送过正文的消息只发引用。
+    """
+
+    def __init__(self, store: Optional[MessageStore] = None) -> None:
+        self.store = store or get_message_store()
+        self._sent: set[str] = set()
+
+    def encode(self, messages: Iterable[Any]) -> tuple[List[Dict[str, Any]], List[Dict[str, str]]]:
+        refs: List[Dict[str, Any]] = []
+        delta: List[Dict[str, str]] = []
+        for m in messages:
+            role = str(getattr(m, "role", "") or "")
+            content = str(getattr(m, "content", "") or "")
+            mid = self.store.put(role, content)
+            refs.append({"id": mid, "role": role, "length": len(content)})
+            if mid not in self._sent:
+                self._sent.add(mid)
+                delta.append({"id": mid, "role": role, "content": content})
+        return refs, delta
+
+
+def resolve_messages(data: Dict[str, Any], store: Optional[MessageStore] = None) -> List[Dict[str, str]]:
+    """
+    从 llm_request_params 事件还原完整 messages（UI 按需调用）。
+
+    兼容旧格式：messages 元素本身带 content 时原样返回。
+    """
+    store = store or get_message_store()
+    delta = {d.get("id"): d for d in (data.get("messages_delta") or []) if isinstance(d, dict)}
+    out: List[Dict[str, str]] = []
+    for ref in data.get("messages") or []:
+        if not isinstance(ref, dict):
+            continue
+        if "content" in ref:
+            out.append({"role": str(ref.get("role") or ""), "content": str(ref.get("content") or "")})
+            continue
+        mid = str(ref.get("id") or "")
+        item = store.get(mid) or delta.get(mid)
+        if item is None:
+            item = {"role": str(ref.get("role") or ""), "content": f"（消息 {mid} 已从存储淘汰，长度 {ref.get('length')}）"}
+        out.append({"role": str(item.get("role") or ""), "content": str(item.get("content") or "")})
+    return out
+
+
+_STORE: Optional[MessageStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_message_store() -> MessageStore:
+    """进程内共享的消息存储（Agent 与 UI 在同一进程）。"""
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = MessageStore()
+        return _STORE
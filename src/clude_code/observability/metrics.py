@@ -4,10 +4,13 @@
 """
 from __future__ import annotations
 
+import bisect
+import math
 import time
 import threading
 import json
 import os
+from collections import deque
 from abc import ABC, abstractmethod
 from contextlib import contextmanager
 from dataclasses import dataclass, field
@@ -77,7 +80,7 @@ class Metric(ABC):
         pass
     
     def with_labels(self, **labels) -> 'Metric':
-        """返回带新标签的指标实例"""
+        """返回带新标签的指标实例（未注册，不会被 collect_all 收集；按标签统计请使用 MetricsCollector.*_family）"""
         new_labels = self.labels.copy()
         new_labels.update(labels)
         return self.__class__(self.name, self.help_text, new_labels)
@@ -153,8 +156,98 @@ class Gauge(Metric):
             )]
 
 
+class DDSketch:
+    """
+    可合并的分位数草图（DDSketch，相对误差保证）。
+
+    值 v 落入下标 ceil(log_gamma(|v|)) 的桶，gamma = (1 + alpha) / (1 - alpha)，
+    因此任意分位数估计的相对误差不超过 alpha；observe O(1)，内存只与值域跨度的对数成正比。
+    桶数超过 max_bins 时合并最小的几个桶（只影响最低分位的精度）。同参数的草图可直接 merge。
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, max_bins: int = 2048, min_value: float = 1e-9):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be in (0, 1)")
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.min_value = min_value
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._inv_log_gamma = 1.0 / math.log(self._gamma)
+        self._pos: Dict[int, int] = {}
+        self._neg: Dict[int, int] = {}
+        self._zero = 0
+        self.count = 0
+
+    def _key(self, v: float) -> int:
+        return math.ceil(math.log(v) * self._inv_log_gamma)
+
+    def _value(self, key: int) -> float:
+        return 2.0 * self._gamma ** key / (self._gamma + 1)
+
+    def add(self, value: float) -> None:
+        if value > self.min_value:
+            k = self._key(value)
+            self._pos[k] = self._pos.get(k, 0) + 1
+            if len(self._pos) > self.max_bins:
+                self._collapse(self._pos)
+        elif value < -self.min_value:
+            k = self._key(-value)
+            self._neg[k] = self._neg.get(k, 0) + 1
+            if len(self._neg) > self.max_bins:
+                self._collapse(self._neg)
+        else:
+            self._zero += 1
+        self.count += 1
+
+    def _collapse(self, store: Dict[int, int]) -> None:
+        keys = sorted(store)
+        extra = len(keys) - self.max_bins + 1
+        merged = sum(store.pop(k) for k in keys[:extra])
+        store[keys[extra]] = store.get(keys[extra], 0) + merged
+
+    def merge(self, other: "DDSketch") -> None:
+        if other._gamma != self._gamma:
+            raise ValueError("cannot merge DDSketch with different relative_accuracy")
+        for src, dst in ((other._pos, self._pos), (other._neg, self._neg)):
+            for k, c in src.items():
+                dst[k] = dst.get(k, 0) + c
+            if len(dst) > self.max_bins:
+                self._collapse(dst)
+        self._zero += other._zero
+        self.count += other.count
+
+    def quantile(self, q: float) -> Optional[float]:
+        """q ∈ [0, 1]；空草图返回 None。复杂度 O(桶数)。"""
+        if self.count == 0:
+            return None
+        rank = min(max(q, 0.0), 1.0) * (self.count - 1)
+        seen = 0
+        # 负值：|v| 越大越小，按下标降序
+        for k in sorted(self._neg, reverse=True):
+            seen += self._neg[k]
+            if seen > rank:
+                return -self._value(k)
+        seen += self._zero
+        if seen > rank:
+            return 0.0
+        for k in sorted(self._pos):
+            seen += self._pos[k]
+            if seen > rank:
+                return self._value(k)
+        return self._value(max(self._pos)) if self._pos else 0.0
+
+    @property
+    def bins(self) -> int:
+        return len(self._pos) + len(self._neg) + (1 if self._zero else 0)
+
+
 class Histogram(Metric):
-    """直方图指标"""
+    """
+    直方图指标：固定桶边界的计数器数组（常量内存）。
+
+    observe 只做一次二分定位 + 计数（O(log 桶数)），收集时累加为 Prometheus 语义的累计桶（O(桶数)），
+    不再保存原始观察值。
+    """
     
     def __init__(
         self, 
@@ -165,80 +258,92 @@ class Histogram(Metric):
     ):
         super().__init__(name, help_text, labels)
         # 默认桶边界
-        self.buckets = buckets or [0.1, 0.5, 1.0, 2.5, 5.0, 10.0]
-        self._observations = []
+        self.buckets = sorted(buckets or [0.1, 0.5, 1.0, 2.5, 5.0, 10.0])
+        # 非累计计数：_counts[i] 为落在 (buckets[i-1], buckets[i]] 的个数，最后一格为 +Inf
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._count = 0
+        self._sum = 0.0
         self._lock = threading.Lock()
     
     def observe(self, value: float) -> None:
         """记录一个观察值"""
+        i = bisect.bisect_left(self.buckets, value)
         with self._lock:
-            self._observations.append(value)
+            self._counts[i] += 1
+            self._count += 1
+            self._sum += value
     
     def get_bucket_counts(self) -> List[HistogramBucket]:
-        """获取桶计数"""
+        """获取累计桶计数（le 递增，最后一个为 +Inf）"""
         with self._lock:
-            if not self._observations:
-                return [HistogramBucket(le=le, count=0) for le in self.buckets] + [
-                    HistogramBucket(le=float('inf'), count=0)
-                ]
-            
-            sorted_obs = sorted(self._observations)
-            total = len(sorted_obs)
-            
-            buckets = []
-            for le in self.buckets:
-                # 计算小于等于 le 的观察值数量
-                count = sum(1 for v in sorted_obs if v <= le)
-                buckets.append(HistogramBucket(le=le, count=count))
-            
-            # 添加最后一个桶（+inf）
-            buckets.append(HistogramBucket(le=float('inf'), count=total))
-            
-            return buckets
+            counts = list(self._counts)
+        buckets = []
+        cumulative = 0
+        for le, c in zip(self.buckets + [float('inf')], counts, strict=True):
+            cumulative += c
+            buckets.append(HistogramBucket(le=le, count=cumulative))
+        return buckets
     
     def collect(self) -> List[MetricPoint]:
         with self._lock:
-            points = []
-            
-            # 添加桶计数
-            for bucket in self.get_bucket_counts():
-                bucket_name = f"{self.name}_bucket"
-                bucket_labels = self.labels.copy()
-                bucket_labels["le"] = str(bucket.le)
-                points.append(MetricPoint(
-                    name=bucket_name,
-                    metric_type=MetricType.COUNTER,
-                    value=bucket.count,
-                    timestamp=time.time(),
-                    labels=bucket_labels,
-                    help_text=f"{self.help_text} (bucket le={bucket.le})"
-                ))
-            
-            # 添加观察值总数
-            points.append(MetricPoint(
-                name=f"{self.name}_count",
-                metric_type=MetricType.COUNTER,
-                value=len(self._observations),
-                timestamp=time.time(),
-                labels=self.labels,
-                help_text=f"{self.help_text} (total count)"
-            ))
-            
-            # 添加观察值总和
+            total, total_sum = self._count, self._sum
+        now = time.time()
+        points = []
+
+        # 添加桶计数
+        for bucket in self.get_bucket_counts():
+            bucket_labels = self.labels.copy()
+            bucket_labels["le"] = str(bucket.le)
             points.append(MetricPoint(
-                name=f"{self.name}_sum",
+                name=f"{self.name}_bucket",
                 metric_type=MetricType.COUNTER,
-                value=sum(self._observations),
-                timestamp=time.time(),
-                labels=self.labels,
-                help_text=f"{self.help_text} (sum)"
+                value=bucket.count,
+                timestamp=now,
+                labels=bucket_labels,
+                help_text=f"{self.help_text} (bucket le={bucket.le})"
             ))
-            
-            return points
+
+        # 添加观察值总数
+        points.append(MetricPoint(
+            name=f"{self.name}_count",
+            metric_type=MetricType.COUNTER,
+            value=total,
+            timestamp=now,
+            labels=self.labels,
+            help_text=f"{self.help_text} (total count)"
+        ))
+
+        # 添加观察值总和
+        points.append(MetricPoint(
+            name=f"{self.name}_sum",
+            metric_type=MetricType.COUNTER,
+            value=total_sum,
+            timestamp=now,
+            labels=self.labels,
+            help_text=f"{self.help_text} (sum)"
+        ))
+
+        return points
+
+
+@dataclass
+class _AgeBucket:
+    """Summary 滑动窗口中的一个时间片：计数/总和/极值 + 分位数草图。"""
+    timestamp: float
+    sketch: DDSketch
+    count: int = 0
+    sum: float = 0.0
+    min: float = float('inf')
+    max: float = float('-inf')
 
 
 class Summary(Metric):
-    """摘要指标"""
+    """
+    摘要指标：滑动窗口（max_age 秒，分为 age_buckets 个时间片）内的统计与分位数。
+
+    每个时间片只保存 DDSketch 与计数/总和/极值，observe O(1)；统计时合并窗口内的时间片，
+    复杂度 O(时间片数 × 草图桶数)，与观察值数量无关。
+    """
     
     def __init__(
         self, 
@@ -247,13 +352,15 @@ class Summary(Metric):
         help_text: str = "", 
         labels: Dict[str, str] = None,
         max_age: float = 600,  # 10分钟
-        age_buckets: int = 5  # 5个时间桶
+        age_buckets: int = 5,  # 5个时间桶
+        relative_accuracy: float = 0.01,
     ):
         super().__init__(name, help_text, labels)
         self.quantiles = quantiles or [0.5, 0.9, 0.95, 0.99]
         self.max_age = max_age
         self.age_buckets = age_buckets
-        self._time_buckets = deque(maxlen=age_buckets)
+        self.relative_accuracy = relative_accuracy
+        self._time_buckets: deque[_AgeBucket] = deque(maxlen=age_buckets)
         self._lock = threading.Lock()
     
     def observe(self, value: float) -> None:
@@ -261,108 +368,177 @@ class Summary(Metric):
         with self._lock:
             now = time.time()
             # 创建或获取当前时间桶
-            if not self._time_buckets or now - self._time_buckets[-1]["timestamp"] > self.max_age / self.age_buckets:
-                self._time_buckets.append({"timestamp": now, "values": []})
-            
-            # 添加值到当前桶
-            self._time_buckets[-1]["values"].append(value)
+            if not self._time_buckets or now - self._time_buckets[-1].timestamp > self.max_age / self.age_buckets:
+                self._time_buckets.append(_AgeBucket(timestamp=now, sketch=DDSketch(self.relative_accuracy)))
+            b = self._time_buckets[-1]
+            b.sketch.add(value)
+            b.count += 1
+            b.sum += value
+            if value < b.min:
+                b.min = value
+            if value > b.max:
+                b.max = value
     
     def get_stats(self) -> SummaryStats:
         """获取统计信息"""
         with self._lock:
-            # 收集所有有效时间桶的值
             now = time.time()
-            all_values = []
-            
-            for bucket in self._time_buckets:
-                if now - bucket["timestamp"] <= self.max_age:
-                    all_values.extend(bucket["values"])
-            
-            if not all_values:
-                return SummaryStats(
-                    count=0,
-                    sum=0.0,
-                    min=0.0,
-                    max=0.0,
-                    avg=0.0,
-                    quantiles={}
-                )
-            
-            # 计算统计信息
-            count = len(all_values)
-            total = sum(all_values)
-            minimum = min(all_values)
-            maximum = max(all_values)
-            average = total / count
-            
-            # 计算分位数
-            sorted_values = sorted(all_values)
-            quantiles = {}
-            for q in self.quantiles:
-                index = int(q * len(sorted_values))
-                if index >= len(sorted_values):
-                    index = len(sorted_values) - 1
-                quantiles[q] = sorted_values[index]
-            
-            return SummaryStats(
-                count=count,
-                sum=total,
-                min=minimum,
-                max=maximum,
-                avg=average,
-                quantiles=quantiles
-            )
+            live = [b for b in self._time_buckets if now - b.timestamp <= self.max_age]
+            merged = DDSketch(self.relative_accuracy)
+            count, total = 0, 0.0
+            minimum, maximum = float('inf'), float('-inf')
+            for b in live:
+                merged.merge(b.sketch)
+                count += b.count
+                total += b.sum
+                minimum = min(minimum, b.min)
+                maximum = max(maximum, b.max)
+
+        if count == 0:
+            return SummaryStats(count=0, sum=0.0, min=0.0, max=0.0, avg=0.0, quantiles={})
+
+        # 草图的估计值限制在真实极值范围内
+        quantiles = {q: min(max(merged.quantile(q), minimum), maximum) for q in self.quantiles}
+        return SummaryStats(
+            count=count,
+            sum=total,
+            min=minimum,
+            max=maximum,
+            avg=total / count,
+            quantiles=quantiles
+        )
     
     def collect(self) -> List[MetricPoint]:
-        with self._lock:
-            stats = self.get_stats()
-            points = []
-            
-            # 添加计数
+        stats = self.get_stats()
+        now = time.time()
+        points = []
+
+        # 添加计数
+        points.append(MetricPoint(
+            name=f"{self.name}_count",
+            metric_type=MetricType.GAUGE,
+            value=stats.count,
+            timestamp=now,
+            labels=self.labels,
+            help_text=f"{self.help_text} (count)"
+        ))
+
+        # 添加总和
+        points.append(MetricPoint(
+            name=f"{self.name}_sum",
+            metric_type=MetricType.GAUGE,
+            value=stats.sum,
+            timestamp=now,
+            labels=self.labels,
+            help_text=f"{self.help_text} (sum)"
+        ))
+
+        # 添加基本统计
+        for stat_name, value in [
+            ("min", stats.min), ("max", stats.max), ("avg", stats.avg)
+        ]:
             points.append(MetricPoint(
-                name=f"{self.name}_count",
+                name=f"{self.name}_{stat_name}",
                 metric_type=MetricType.GAUGE,
-                value=stats.count,
-                timestamp=time.time(),
+                value=value,
+                timestamp=now,
                 labels=self.labels,
-                help_text=f"{self.help_text} (count)"
+                help_text=f"{self.help_text} ({stat_name})"
             ))
-            
-            # 添加总和
+
+        # 添加分位数
+        for quantile, value in stats.quantiles.items():
             points.append(MetricPoint(
-                name=f"{self.name}_sum",
+                name=f"{self.name}",
                 metric_type=MetricType.GAUGE,
-                value=stats.sum,
-                timestamp=time.time(),
-                labels=self.labels,
-                help_text=f"{self.help_text} (sum)"
+                value=value,
+                timestamp=now,
+                labels={**self.labels, "quantile": str(quantile)},
+                help_text=f"{self.help_text} (quantile {quantile})"
             ))
-            
-            # 添加基本统计
-            for stat_name, value in [
-                ("min", stats.min), ("max", stats.max), ("avg", stats.avg)
-            ]:
-                points.append(MetricPoint(
-                    name=f"{self.name}_{stat_name}",
-                    metric_type=MetricType.GAUGE,
-                    value=value,
-                    timestamp=time.time(),
-                    labels=self.labels,
-                    help_text=f"{self.help_text} ({stat_name})"
-                ))
-            
-            # 添加分位数
-            for quantile, value in stats.quantiles.items():
-                points.append(MetricPoint(
-                    name=f"{self.name}",
-                    metric_type=MetricType.GAUGE,
-                    value=value,
-                    timestamp=time.time(),
-                    labels={**self.labels, "quantile": str(quantile)},
-                    help_text=f"{self.help_text} (quantile {quantile})"
-                ))
-            
-            return points
+
+        return points
+
+
+class MetricFamily(Metric):
+    """
+    带标签维度的指标族（labeled metric family / vector）。
+
+    子序列按标签值元组缓存在字典里：同一组标签值始终返回同一个子指标（计数不会丢失，也不会每次新建对象），
+    随指标族一起被 MetricsCollector.collect_all 收集。子序列数量达到 max_series 后，新的标签组合统一
+    归入标签值为 OVERFLOW_LABEL 的溢出序列，避免异常标签（路径、ID 等）撑爆内存。
+    """
+
+    OVERFLOW_LABEL = "__overflow__"
+    DEFAULT_MAX_SERIES = 1000
+
+    def __init__(
+        self,
+        name: str,
+        label_names: List[str],
+        factory: Callable[[Dict[str, str]], Metric],
+        help_text: str = "",
+        labels: Dict[str, str] = None,
+        max_series: Optional[int] = None,
+        kind: Optional[type] = None,
+    ):
+        super().__init__(name, help_text, labels)
+        if not label_names:
+            raise ValueError(f"Metric family {name} requires at least one label name")
+        self.label_names = tuple(label_names)
+        self.max_series = self.DEFAULT_MAX_SERIES if max_series is None else max(1, int(max_series))
+        self._factory = factory
+        # 子指标类型（Counter/Gauge/Histogram/Summary），用于同名注册时的类型校验
+        self.kind = kind
+        self._children: Dict[tuple, Metric] = {}
+        self._lock = threading.Lock()
+        self.dropped_series = 0
+
+    def child(self, *values: str, **kv: str) -> Metric:
+        """按标签值（位置参数按 label_names 顺序，或关键字参数）返回缓存的子指标。"""
+        if values and kv:
+            raise ValueError("child() accepts either positional or keyword label values, not both")
+        if kv:
+            missing = set(self.label_names) - set(kv)
+            extra = set(kv) - set(self.label_names)
+            if missing or extra:
+                raise ValueError(f"Metric family {self.name} expects labels {list(self.label_names)}, got {sorted(kv)}")
+            values = tuple(str(kv[n]) for n in self.label_names)
+        else:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"Metric family {self.name} expects {len(self.label_names)} label values")
+            values = tuple(str(v) for v in values)
+
+        child = self._children.get(values)
+        if child is not None:
+            return child
+        with self._lock:
+            child = self._children.get(values)
+            if child is not None:
+                return child
+            if len(self._children) >= self.max_series:
+                self.dropped_series += 1
+                values = (self.OVERFLOW_LABEL,) * len(self.label_names)
+                child = self._children.get(values)
+                if child is not None:
+                    return child
+            child = self._factory({**self.labels, **dict(zip(self.label_names, values, strict=True))})
+            self._children[values] = child
+            return child
+
+    def with_labels(self, **labels) -> Metric:
+        """与 Metric.with_labels 相同的调用方式，但返回缓存的子指标（而不是新建未注册的实例）。"""
+        return self.child(**labels)
+
+    def children(self) -> Dict[tuple, Metric]:
+        with self._lock:
+            return dict(self._children)
+
+    def collect(self) -> List[MetricPoint]:
+        points: List[MetricPoint] = []
+        for child in self.children().values():
+            points.extend(child.collect())
+        return points
 
 
 class MetricsCollector:
@@ -453,6 +629,45 @@ class MetricsCollector:
             raise ValueError(f"Metric {name} already exists with different type")
         return metric
 
+    def _family(self, name: str, kind: type, factory: Callable[[Dict[str, str]], Metric], label_names: List[str],
+                help_text: str, max_series: Optional[int]) -> MetricFamily:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = MetricFamily(name, label_names, factory, help_text, max_series=max_series, kind=kind)
+                self._metrics[name] = metric
+                self.logger.debug(f"Registered metric family: {name} {list(label_names)}")
+                return metric
+        if not isinstance(metric, MetricFamily) or metric.kind is not kind:
+            raise ValueError(f"Metric {name} already exists with different type")
+        if metric.label_names != tuple(label_names):
+            raise ValueError(f"Metric family {name} already exists with labels {list(metric.label_names)}")
+        return metric
+
+    def counter_family(self, name: str, label_names: List[str], help_text: str = "",
+                       max_series: Optional[int] = None) -> MetricFamily:
+        """创建或获取带标签的计数器族（.with_labels(...) / .child(...) 返回子计数器）"""
+        return self._family(name, Counter, lambda lb: Counter(name, help_text, lb), label_names, help_text, max_series)
+
+    def gauge_family(self, name: str, label_names: List[str], help_text: str = "",
+                     max_series: Optional[int] = None) -> MetricFamily:
+        """创建或获取带标签的仪表盘族"""
+        return self._family(name, Gauge, lambda lb: Gauge(name, help_text, lb), label_names, help_text, max_series)
+
+    def histogram_family(self, name: str, label_names: List[str], buckets: List[float] = None, help_text: str = "",
+                         max_series: Optional[int] = None) -> MetricFamily:
+        """创建或获取带标签的直方图族（各子序列共享桶边界）"""
+        return self._family(
+            name, Histogram, lambda lb: Histogram(name, buckets, help_text, lb), label_names, help_text, max_series
+        )
+
+    def summary_family(self, name: str, label_names: List[str], quantiles: List[float] = None, help_text: str = "",
+                       max_series: Optional[int] = None) -> MetricFamily:
+        """创建或获取带标签的摘要族"""
+        return self._family(
+            name, Summary, lambda lb: Summary(name, quantiles, help_text, lb), label_names, help_text, max_series
+        )
+
 
 # 全局指标收集器实例
 _global_collector: Optional[MetricsCollector] = None
@@ -5,8 +5,12 @@
 from __future__ import annotations
 
 import json
+import os
+import struct
+import sys
 import time
 import threading
+from array import array
 from abc import ABC, abstractmethod
 from collections import defaultdict, deque
 from dataclasses import dataclass, field
@@ -17,11 +21,17 @@ from typing import Any, Dict, List, Optional, Union
 from clude_code.observability.metrics import MetricPoint, MetricType
 from clude_code.observability.logger import get_logger
 
+try:
+    import fcntl
+except ImportError:  # Windows：无 flock，退化为单写入进程假设
+    fcntl = None  # type: ignore[assignment]
+
 """存储后端类型"""
 class StorageBackend(Enum):
     
     MEMORY = "memory"
     FILE = "file"
+    SEGMENT = "segment"  # 按小时分段的二进制列式存储（默认）
     REMOTE = "remote"  # 预留，未来实现
 
 """指标查询"""
@@ -347,6 +357,437 @@ class FileMetricsStorage(MetricsStorage):
             return 0
 
 
+# 段文件块头：magic, 点数, 新序列定义 JSON 长度, 块内最小/最大时间戳（小端）
+_BLOCK_HEADER = struct.Struct("<4sIIdd")
+_BLOCK_MAGIC = b"CMS1"
+
+
+@dataclass
+class _SegmentMeta:
+    """单个段文件的元数据（段文件本身可重建，.idx 只是缓存）"""
+
+    key: str
+    min_ts: float = float("inf")
+    max_ts: float = float("-inf")
+    count: int = 0
+    size: int = 0  # 元数据覆盖到的段文件字节数
+    # series_id -> (name, metric_type, labels, help_text)
+    series: List[list] = field(default_factory=list)
+    # 指标名 -> 包含该指标的块偏移量
+    names: Dict[str, List[int]] = field(default_factory=dict)
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "key": self.key, "min_ts": self.min_ts, "max_ts": self.max_ts, "count": self.count,
+            "size": self.size, "series": self.series, "names": self.names,
+        }
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "_SegmentMeta":
+        return cls(
+            key=data["key"], min_ts=data["min_ts"], max_ts=data["max_ts"], count=data["count"],
+            size=data["size"], series=data["series"], names=data["names"],
+        )
+
+
+def _le_bytes(arr: array) -> bytes:
+    if sys.byteorder == "big":
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _le_array(typecode: str, raw: bytes) -> array:
+    arr = array(typecode)
+    arr.frombytes(raw)
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr
+
+
+"""
+分段指标存储
+"""
+class SegmentedMetricsStorage(MetricsStorage):
+    """
+    按时间分段（默认每小时一个段）的二进制列式指标存储，替代 data.jsonl 的全量扫描。
+
+    - 段文件 segments/<YYYYMMDDHH>.seg：每次 store 追加一个块；块内按列存放
+      series_id(uint32) / timestamp(float64) / value(float64)，块头记录块内最小/最大时间戳；
+      首次出现的序列（名称+类型+标签）定义以 JSON 随块写入，因此段文件自描述。
+    - 旁路索引 <key>.idx：段的 min/max 时间戳、点数、序列表、指标名 -> 块偏移；
+      只在内存缓存失效或进程重启时读取，丢失或落后于段文件时从段文件增量重建；
+      尾部不完整的块加载时忽略。
+    - 多个进程（同一工作区的多个会话）可同时写同一段：追加时持有段文件的排他 flock，
+      先从本进程已知的末尾补读其他进程追加的块，再分配 series_id 并写入；
+      持锁时尾部仍不完整的块只可能来自崩溃的写入者，此时才截断；查询前同样补读各段新增的块。
+    - 查询只打开时间范围重叠且包含目标指标名的段，且只读取包含该指标的块，代价与涉及的段数成正比。
+    - 过期清理整段删除（段内早于截止时间的点仍由查询的时间过滤排除）。
+    """
+
+    def __init__(self, workspace_root: str, segment_seconds: int = 3600):
+        self.workspace_root = workspace_root
+        self.segment_seconds = max(60, int(segment_seconds))
+        self.logger = get_logger(__name__, workspace_root=workspace_root)
+
+        base_dir = Path(workspace_root) / ".clude" / "metrics"
+        self.storage_dir = base_dir / "segments"
+        self.storage_dir.mkdir(parents=True, exist_ok=True)
+
+        self._segments: Dict[str, _SegmentMeta] = {}
+        # 段 -> {序列键: series_id}，用于写入时复用序列号
+        self._series_ids: Dict[str, Dict[tuple, int]] = {}
+        # 索引落盘节流：段文件自描述，索引落后时加载阶段会增量补齐，因此不必每批都重写
+        self._dirty: set[str] = set()
+        self._last_index_save = 0.0
+        self._lock = threading.RLock()
+        self._load_segments()
+        self._migrate_legacy(base_dir / "data.jsonl")
+
+    # ---- 段定位 ----
+
+    def _segment_key(self, timestamp: float) -> str:
+        start = int(timestamp // self.segment_seconds) * self.segment_seconds
+        fmt = "%Y%m%d%H" if self.segment_seconds >= 3600 else "%Y%m%d%H%M"
+        return time.strftime(fmt, time.gmtime(start))
+
+    def _seg_path(self, key: str) -> Path:
+        return self.storage_dir / f"{key}.seg"
+
+    def _idx_path(self, key: str) -> Path:
+        return self.storage_dir / f"{key}.idx"
+
+    # ---- 加载 / 重建 ----
+
+    def _load_segments(self) -> None:
+        """加载段元数据；已加载的段只补读其他进程追加的块（查询前也会调用）。"""
+        for seg_file in sorted(self.storage_dir.glob("*.seg")):
+            key = seg_file.stem
+            meta: Optional[_SegmentMeta] = self._segments.get(key)
+            known = meta is not None
+            if meta is None:
+                try:
+                    with open(self._idx_path(key), "r", encoding="utf-8") as f:
+                        meta = _SegmentMeta.from_json(json.load(f))
+                except (OSError, json.JSONDecodeError, KeyError, TypeError):
+                    meta = _SegmentMeta(key=key)
+            try:
+                if meta.size == seg_file.stat().st_size:
+                    if known:
+                        continue
+                else:
+                    self._rebuild(meta)
+            except Exception as e:
+                self.logger.error(f"Error loading metrics segment {key}: {e}")
+                continue
+            self._register(meta)
+
+    @staticmethod
+    def _series_key(name: str, metric_type: str, labels: Dict[str, str], help_text: str) -> tuple:
+        return (name, metric_type, tuple(sorted(labels.items())), help_text)
+
+    def _register(self, meta: _SegmentMeta) -> None:
+        self._segments[meta.key] = meta
+        self._series_ids[meta.key] = {self._series_key(*s): i for i, s in enumerate(meta.series)}
+
+    def _rebuild(self, meta: _SegmentMeta) -> None:
+        """
+        从 meta.size 开始扫描段文件补齐元数据；尾部不完整的块（写入中途崩溃，或其他进程正在写）只是忽略，
+        meta.size 停在最后一个完整块之后。只读加载不修改段文件，截断留给持锁的写入端（见 store）。
+        """
+        with open(self._seg_path(meta.key), "rb") as f:
+            self._scan(meta, f)
+
+    def _scan(self, meta: _SegmentMeta, f) -> int:
+        """从 meta.size 读到最后一个完整块，补齐元数据并返回文件实际大小。"""
+        size = os.fstat(f.fileno()).st_size
+        if meta.size > size:
+            # 段文件被替换或截短：元数据作废，从头重建
+            meta.__dict__.update(_SegmentMeta(key=meta.key).__dict__)
+        if size == meta.size:
+            return size
+        f.seek(meta.size)
+        offset = meta.size
+        while True:
+            block = self._read_block(f)
+            if block is None:
+                break
+            defs, ids, _ts, _vals, bmin, bmax = block
+            self._apply_block_meta(meta, offset, defs, ids, bmin, bmax)
+            offset = f.tell()
+        meta.size = offset
+        self._dirty.add(meta.key)
+        return size
+
+    @staticmethod
+    def _apply_block_meta(meta: _SegmentMeta, offset: int, defs: List[list], ids: array, bmin: float, bmax: float) -> None:
+        meta.series.extend(defs)
+        for name in {meta.series[i][0] for i in set(ids)}:
+            meta.names.setdefault(name, []).append(offset)
+        meta.count += len(ids)
+        meta.min_ts = min(meta.min_ts, bmin)
+        meta.max_ts = max(meta.max_ts, bmax)
+
+    def _save_meta(self, meta: _SegmentMeta) -> None:
+        tmp = self._idx_path(meta.key).with_suffix(".idx.tmp")
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(meta.to_json(), f, ensure_ascii=False)
+            os.replace(tmp, self._idx_path(meta.key))
+        except OSError as e:
+            # 索引只是缓存：写失败时下次加载会从段文件重建
+            self.logger.error(f"Error saving metrics segment index: {e}")
+
+    # ---- 块编解码 ----
+
+    @staticmethod
+    def _read_block(f) -> Optional[tuple]:
+        header = f.read(_BLOCK_HEADER.size)
+        if len(header) < _BLOCK_HEADER.size:
+            return None
+        magic, n, defs_len, bmin, bmax = _BLOCK_HEADER.unpack(header)
+        if magic != _BLOCK_MAGIC:
+            return None
+        body = f.read(defs_len + n * 20)
+        if len(body) < defs_len + n * 20:
+            return None
+        try:
+            defs = json.loads(body[:defs_len].decode("utf-8")) if defs_len else []
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            return None
+        pos = defs_len
+        ids = _le_array("I", body[pos:pos + n * 4])
+        pos += n * 4
+        ts = _le_array("d", body[pos:pos + n * 8])
+        pos += n * 8
+        vals = _le_array("d", body[pos:pos + n * 8])
+        return defs, ids, ts, vals, bmin, bmax
+
+    # ---- MetricsStorage 接口 ----
+
+    def store(self, points: List[MetricPoint]) -> None:
+        """存储指标数据点（按段分组，每个段追加一个块）"""
+        if not points:
+            return
+        by_key: Dict[str, List[MetricPoint]] = defaultdict(list)
+        for point in points:
+            by_key[self._segment_key(point.timestamp)].append(point)
+
+        with self._lock:
+            for key, seg_points in by_key.items():
+                meta = self._segments.get(key)
+                if meta is None:
+                    meta = _SegmentMeta(key=key)
+                    self._register(meta)
+                with open(self._seg_path(key), "a+b") as f:
+                    if fcntl is not None:
+                        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                    try:
+                        self._append_block(meta, f, seg_points)
+                    finally:
+                        if fcntl is not None:
+                            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+            # 写入了新的段（通常是跨过整点）或距上次落盘超过 30 秒时保存索引
+            if self._dirty - set(by_key) or time.time() - self._last_index_save >= 30:
+                self.flush()
+
+    def _append_block(self, meta: _SegmentMeta, f, points: List[MetricPoint]) -> None:
+        """持有段文件排他锁时调用：补读其他写入者追加的块后，再分配 series_id 并追加一个块。"""
+        known = len(meta.series)
+        size = self._scan(meta, f)
+        if len(meta.series) != known:
+            self._series_ids[meta.key] = {self._series_key(*s): i for i, s in enumerate(meta.series)}
+        if size > meta.size:
+            # 持锁时尾部仍不完整：写入者中途崩溃留下的残块，截掉后新块才能被读到
+            self.logger.warning(f"Truncating incomplete metrics segment tail: {meta.key}.seg @ {meta.size}")
+            f.truncate(meta.size)
+        series_ids = self._series_ids[meta.key]
+
+        defs: List[list] = []
+        ids, ts, vals = array("I"), array("d"), array("d")
+        new_keys: List[tuple] = []
+        for point in points:
+            skey = self._series_key(point.name, point.metric_type.value, point.labels, point.help_text)
+            sid = series_ids.get(skey)
+            if sid is None:
+                sid = len(meta.series) + len(defs)
+                series_ids[skey] = sid
+                new_keys.append(skey)
+                defs.append([point.name, point.metric_type.value, dict(point.labels), point.help_text])
+            ids.append(sid)
+            ts.append(float(point.timestamp))
+            vals.append(float(point.value))
+
+        defs_raw = json.dumps(defs, ensure_ascii=False).encode("utf-8") if defs else b""
+        bmin, bmax = min(ts), max(ts)
+        block = b"".join((
+            _BLOCK_HEADER.pack(_BLOCK_MAGIC, len(ids), len(defs_raw), bmin, bmax),
+            defs_raw, _le_bytes(ids), _le_bytes(ts), _le_bytes(vals),
+        ))
+        try:
+            f.seek(meta.size)
+            f.write(block)
+            f.flush()
+        except OSError:
+            # 块未写入：撤销本块新分配的序列号
+            for skey in new_keys:
+                series_ids.pop(skey, None)
+            raise
+        self._apply_block_meta(meta, meta.size, defs, ids, bmin, bmax)
+        meta.size += len(block)
+        self._dirty.add(meta.key)
+
+    def flush(self) -> None:
+        """把内存中的段索引写回 .idx 文件"""
+        with self._lock:
+            for key in sorted(self._dirty):
+                meta = self._segments.get(key)
+                if meta is not None:
+                    self._save_meta(meta)
+            self._dirty.clear()
+            self._last_index_save = time.time()
+
+    def _segments_for(self, query: MetricsQuery) -> List[_SegmentMeta]:
+        """与查询时间范围重叠、且包含目标指标名的段（新 -> 旧）"""
+        out = []
+        for meta in self._segments.values():
+            if meta.count == 0:
+                continue
+            if query.start_time and meta.max_ts < query.start_time:
+                continue
+            if query.end_time and meta.min_ts > query.end_time:
+                continue
+            if query.name and query.name not in meta.names:
+                continue
+            out.append(meta)
+        out.sort(key=lambda m: m.key, reverse=True)
+        return out
+
+    def query(self, query: MetricsQuery) -> List[MetricPoint]:
+        """查询指标数据点"""
+        with self._lock:
+            self._load_segments()
+            segments = [
+                (meta, sorted(meta.names[query.name]) if query.name else None, list(meta.series))
+                for meta in self._segments_for(query)
+            ]
+
+        points: List[MetricPoint] = []
+        metric_type = query.metric_type.value if query.metric_type else None
+        for meta, offsets, series in segments:
+            # 序列级过滤只做一次，块内只比较整数 series_id
+            wanted = {
+                i for i, (name, mtype, labels, _help) in enumerate(series)
+                if (not query.name or name == query.name)
+                and (not metric_type or mtype == metric_type)
+                and all(labels.get(k) == v for k, v in query.labels.items())
+            }
+            if not wanted:
+                continue
+            try:
+                with open(self._seg_path(meta.key), "rb") as f:
+                    for block in self._iter_blocks(f, offsets):
+                        _defs, ids, ts, vals, bmin, bmax = block
+                        if query.start_time and bmax < query.start_time:
+                            continue
+                        if query.end_time and bmin > query.end_time:
+                            continue
+                        for sid, t, v in zip(ids, ts, vals, strict=True):
+                            if sid not in wanted:
+                                continue
+                            if query.start_time and t < query.start_time:
+                                continue
+                            if query.end_time and t > query.end_time:
+                                continue
+                            name, mtype, labels, help_text = series[sid]
+                            points.append(MetricPoint(
+                                name=name, metric_type=MetricType(mtype), value=v,
+                                timestamp=t, labels=dict(labels), help_text=help_text,
+                            ))
+            except FileNotFoundError:
+                continue
+            # 段按时间不相交：已凑够 limit 后更旧的段不可能进入结果
+            if query.limit and len(points) >= query.limit:
+                break
+
+        points.sort(key=lambda p: p.timestamp, reverse=True)
+        if query.limit:
+            points = points[:query.limit]
+        return points
+
+    def _iter_blocks(self, f, offsets: Optional[List[int]]):
+        if offsets is None:
+            while True:
+                block = self._read_block(f)
+                if block is None:
+                    return
+                yield block
+        for offset in offsets:
+            f.seek(offset)
+            block = self._read_block(f)
+            if block is not None:
+                yield block
+
+    def get_metric_names(self) -> List[str]:
+        """获取所有指标名称"""
+        with self._lock:
+            self._load_segments()
+            names: Dict[str, None] = {}
+            for key in sorted(self._segments):
+                names.update(dict.fromkeys(self._segments[key].names))
+            return list(names)
+
+    def cleanup(self, retention_hours: int = 24) -> int:
+        """删除最新数据点早于保留期的整个段"""
+        cutoff_time = time.time() - retention_hours * 3600
+        removed_count = 0
+        with self._lock:
+            for key, meta in list(self._segments.items()):
+                if meta.max_ts >= cutoff_time:
+                    continue
+                try:
+                    self._seg_path(key).unlink(missing_ok=True)
+                    self._idx_path(key).unlink(missing_ok=True)
+                except OSError as e:
+                    self.logger.error(f"Error removing metrics segment {key}: {e}")
+                    continue
+                removed_count += meta.count
+                del self._segments[key]
+                self._series_ids.pop(key, None)
+                self._dirty.discard(key)
+        if removed_count:
+            self.logger.info(f"Cleaned up {removed_count} expired metric points")
+        return removed_count
+
+    def _migrate_legacy(self, data_file: Path) -> None:
+        """一次性导入旧的 data.jsonl（FileMetricsStorage），导入后重命名为 data.jsonl.migrated"""
+        if not data_file.exists():
+            return
+        batch: List[MetricPoint] = []
+        try:
+            with open(data_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        data = json.loads(line)
+                        batch.append(MetricPoint(
+                            name=data["name"], metric_type=MetricType(data["metric_type"]),
+                            value=data["value"], timestamp=data["timestamp"],
+                            labels=data.get("labels") or {}, help_text=data.get("help_text", ""),
+                        ))
+                    except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+                        continue
+                    if len(batch) >= 10000:
+                        self.store(batch)
+                        batch = []
+            self.store(batch)
+            self.flush()
+            data_file.replace(data_file.with_name(data_file.name + ".migrated"))
+            self.logger.info(f"Migrated legacy metrics file {data_file} into segments")
+        except OSError as e:
+            self.logger.error(f"Error migrating legacy metrics file: {e}")
+
+
 class MetricsExporter(ABC):
     """指标导出器接口"""
     
@@ -419,7 +860,7 @@ class MetricsManager:
     def __init__(
         self, 
         workspace_root: str,
-        storage_backend: StorageBackend = StorageBackend.FILE,
+        storage_backend: StorageBackend = StorageBackend.SEGMENT,
         storage_options: Dict[str, Any] = None
     ):
         self.workspace_root = workspace_root
@@ -431,6 +872,8 @@ class MetricsManager:
             self.storage = MemoryMetricsStorage(**storage_options)
         elif storage_backend == StorageBackend.FILE:
             self.storage = FileMetricsStorage(workspace_root, **storage_options)
+        elif storage_backend == StorageBackend.SEGMENT:
+            self.storage = SegmentedMetricsStorage(workspace_root, **storage_options)
         else:
             raise ValueError(f"Unsupported storage backend: {storage_backend}")
         
@@ -513,6 +956,12 @@ class MetricsManager:
         if self._cleanup_task:
             self._cleanup_task.cancel()
             self._cleanup_task = None
+        flush = getattr(self.storage, "flush", None)
+        if flush is not None:
+            try:
+                flush()
+            except Exception as e:
+                self.logger.error(f"Error flushing metrics storage: {e}")
 
 
 # 全局指标管理器实例
@@ -523,7 +972,7 @@ _global_manager: Optional[MetricsManager] = None
 """
 def get_metrics_manager(
     workspace_root: str = ".",
-    storage_backend: StorageBackend = StorageBackend.FILE,
+    storage_backend: StorageBackend = StorageBackend.SEGMENT,
     storage_options: Dict[str, Any] = None
 ) -> MetricsManager:
     
@@ -6,6 +6,9 @@ from dataclasses import dataclass
 from pathlib import Path
 from typing import Any
 
+from clude_code.observability.log_sink import get_log_sink
+from clude_code.observability.log_store import get_jsonl_log
+
 
 @dataclass(frozen=True)
 class TraceEvent:
@@ -24,13 +27,26 @@ class TraceLogger:
     Writes to: {workspace_root}/.clude/logs/trace.jsonl
     Intended for debugging "agent thinking flow" as observable steps:
     LLM output -> parsed tool call -> confirmation/policy -> tool result -> feedback.
+    Lines are handed to the shared async log sink (batched, fsynced on turn boundaries).
     """
 
-    def __init__(self, workspace_root: str, session_id: str) -> None:
+    def __init__(
+        self,
+        workspace_root: str,
+        session_id: str,
+        *,
+        max_bytes: int | None = None,
+        max_age_seconds: float | None = None,
+        max_segments: int | None = None,
+    ) -> None:
         self.workspace_root = Path(workspace_root)
         self.session_id = session_id
         self._path = self.workspace_root / ".clude" / "logs" / "trace.jsonl"
         self._path.parent.mkdir(parents=True, exist_ok=True)
+        # 轮转 + 会话/trace_id 偏移索引；写入经共享 LogSink 交给它
+        self._log = get_jsonl_log(
+            self._path, max_bytes=max_bytes, max_age_seconds=max_age_seconds, max_segments=max_segments
+        )
 
     def write(self, *, trace_id: str, step: int, event: str, data: dict[str, Any]) -> None:
         ev = TraceEvent(
@@ -52,61 +68,37 @@ class TraceLogger:
             },
             ensure_ascii=False,
         )
-        with self._path.open("a", encoding="utf-8") as f:
-            f.write(line + "\n")
+        get_log_sink().submit(self._path, line)
 
     def read_traces(self, limit: int = 100, session_id: str | None = None) -> list[TraceEvent]:
         """
-        读取追踪记录
+        读取追踪记录（最新的 limit 条）
 
         Args:
             limit: 最大记录数量
             session_id: 过滤特定会话ID
 
         Returns:
-            追踪事件列表
+            追踪事件列表（最新的在前面）
         """
-        if not self._path.exists():
+        # 先让异步写入器把已提交的事件写到文件
+        get_log_sink().flush()
+        try:
+            rows = self._log.tail(limit, session_id=session_id)
+        except OSError:
             return []
+        return [ev for ev in (_to_event(r) for r in rows) if ev is not None]
 
-        traces = []
+    def read_trace(self, trace_id: str) -> list[TraceEvent]:
+        """
+        读取某一轮（trace_id）的全部追踪事件，按写入顺序排列。
+        """
+        get_log_sink().flush()
         try:
-            with self._path.open("r", encoding="utf-8") as f:
-                for line in f:
-                    if not line.strip():
-                        continue
-
-                    try:
-                        data = json.loads(line.strip())
-                        trace_event = TraceEvent(
-                            timestamp=data["timestamp"],
-                            trace_id=data["trace_id"],
-                            session_id=data["session_id"],
-                            step=data["step"],
-                            event=data["event"],
-                            data=data["data"]
-                        )
-
-                        # 应用会话过滤
-                        if session_id and trace_event.session_id != session_id:
-                            continue
-
-                        traces.append(trace_event)
-
-                        # 检查是否达到限制
-                        if len(traces) >= limit:
-                            break
-
-                    except json.JSONDecodeError:
-                        continue  # 跳过损坏的行
-
-        except IOError:
+            rows = self._log.trace_events(trace_id)
+        except OSError:
             return []
-
-        # 按时间戳降序排序（最新的在前面）
-        traces.sort(key=lambda t: t.timestamp, reverse=True)
-
-        return traces
+        return [ev for ev in (_to_event(r) for r in rows) if ev is not None]
 
     @classmethod
     def list_sessions(cls, workspace_root: str) -> list[str]:
@@ -119,26 +111,26 @@ class TraceLogger:
         Returns:
             会话ID列表
         """
+        get_log_sink().flush()
         trace_path = Path(workspace_root) / ".clude" / "logs" / "trace.jsonl"
-        if not trace_path.exists():
+        if not trace_path.parent.exists():
             return []
-
-        sessions = set()
         try:
-            with trace_path.open("r", encoding="utf-8") as f:
-                for line in f:
-                    if not line.strip():
-                        continue
-
-                    try:
-                        data = json.loads(line.strip())
-                        sessions.add(data["session_id"])
-                    except json.JSONDecodeError:
-                        continue
-        except IOError:
-            pass
-
-        return sorted(list(sessions))
-
+            # 只读轮转清单中的会话摘要与活动段索引，不扫描历史文件
+            return sorted(get_jsonl_log(trace_path).sessions())
+        except OSError:
+            return []
 
 
+def _to_event(data: dict[str, Any]) -> TraceEvent | None:
+    try:
+        return TraceEvent(
+            timestamp=data["timestamp"],
+            trace_id=data["trace_id"],
+            session_id=data["session_id"],
+            step=data["step"],
+            event=data["event"],
+            data=data["data"],
+        )
+    except KeyError:
+        return None
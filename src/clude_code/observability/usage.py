@@ -8,6 +8,7 @@ from __future__ import annotations
 - 估算方法默认：tokens ≈ chars / 4（英文略偏乐观，中文略偏保守，但足够做趋势/回归监控）。
 """
 
+import threading
 from dataclasses import dataclass, field
 from typing import Any
 
@@ -22,6 +23,8 @@ def estimate_tokens(text: str) -> int:
 class SessionUsage:
     llm_requests: int = 0
     llm_total_ms: int = 0
+    llm_connect_ms: int = 0  # TCP/TLS 建连耗时累计（连接复用时为 0）
+    llm_ttfb_ms: int = 0  # 首字节耗时累计（含服务端 prefill）
     prompt_tokens_est: int = 0
     completion_tokens_est: int = 0
 
@@ -30,33 +33,88 @@ class SessionUsage:
 
     by_tool: dict[str, dict[str, Any]] = field(default_factory=dict)  # name -> {calls, failures}
 
-    def record_llm(self, *, prompt_tokens_est: int, completion_tokens_est: int, elapsed_ms: int) -> None:
-        self.llm_requests += 1
-        self.llm_total_ms += max(0, int(elapsed_ms))
-        self.prompt_tokens_est += max(0, int(prompt_tokens_est))
-        self.completion_tokens_est += max(0, int(completion_tokens_est))
+    tool_cache_hits: int = 0
+    tool_cache_misses: int = 0
+
+    # 提示词前缀 KV 缓存复用（llama.cpp cache_prompt）：服务端报告优先，否则按与上次请求的公共前缀估算
+    prefill_tokens_total: int = 0
+    prefill_tokens_saved: int = 0
+    turn_prefill_tokens_total: int = 0
+    turn_prefill_tokens_saved: int = 0
+
+    # 并发步骤/批量工具调用会在多个线程里记录用量
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def record_llm(
+        self,
+        *,
+        prompt_tokens_est: int,
+        completion_tokens_est: int,
+        elapsed_ms: int,
+        connect_ms: float = 0.0,
+        ttfb_ms: float = 0.0,
+    ) -> None:
+        with self._lock:
+            self.llm_requests += 1
+            self.llm_total_ms += max(0, int(elapsed_ms))
+            self.llm_connect_ms += max(0, int(connect_ms))
+            self.llm_ttfb_ms += max(0, int(ttfb_ms))
+            self.prompt_tokens_est += max(0, int(prompt_tokens_est))
+            self.completion_tokens_est += max(0, int(completion_tokens_est))
 
     def record_tool(self, *, name: str, ok: bool) -> None:
-        self.tool_calls += 1
-        if not ok:
-            self.tool_failures += 1
-        d = self.by_tool.get(name)
-        if d is None:
-            d = {"calls": 0, "failures": 0}
-            self.by_tool[name] = d
-        d["calls"] += 1
-        if not ok:
-            d["failures"] += 1
+        with self._lock:
+            self.tool_calls += 1
+            if not ok:
+                self.tool_failures += 1
+            d = self.by_tool.get(name)
+            if d is None:
+                d = {"calls": 0, "failures": 0}
+                self.by_tool[name] = d
+            d["calls"] += 1
+            if not ok:
+                d["failures"] += 1
+
+    def begin_turn(self) -> None:
+        self.turn_prefill_tokens_total = 0
+        self.turn_prefill_tokens_saved = 0
+
+    def record_prefill(self, *, prompt_tokens: int, saved_tokens: int) -> None:
+        with self._lock:
+            prompt_tokens = max(0, int(prompt_tokens))
+            saved_tokens = min(prompt_tokens, max(0, int(saved_tokens)))
+            self.prefill_tokens_total += prompt_tokens
+            self.prefill_tokens_saved += saved_tokens
+            self.turn_prefill_tokens_total += prompt_tokens
+            self.turn_prefill_tokens_saved += saved_tokens
+
+    def record_tool_cache(self, *, name: str, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.tool_cache_hits += 1
+            else:
+                self.tool_cache_misses += 1
+            d = self.by_tool.setdefault(name, {"calls": 0, "failures": 0})
+            key = "cache_hits" if hit else "cache_misses"
+            d[key] = d.get(key, 0) + 1
 
     def summary(self) -> dict[str, Any]:
         return {
             "llm_requests": self.llm_requests,
             "llm_total_ms": self.llm_total_ms,
+            "llm_connect_ms": self.llm_connect_ms,
+            "llm_ttfb_ms": self.llm_ttfb_ms,
             "prompt_tokens_est": self.prompt_tokens_est,
             "completion_tokens_est": self.completion_tokens_est,
             "total_tokens_est": self.prompt_tokens_est + self.completion_tokens_est,
             "tool_calls": self.tool_calls,
             "tool_failures": self.tool_failures,
+            "prefill_tokens_total": self.prefill_tokens_total,
+            "prefill_tokens_saved": self.prefill_tokens_saved,
+            "turn_prefill_tokens_total": self.turn_prefill_tokens_total,
+            "turn_prefill_tokens_saved": self.turn_prefill_tokens_saved,
+            "tool_cache_hits": self.tool_cache_hits,
+            "tool_cache_misses": self.tool_cache_misses,
             "by_tool": self.by_tool,
         }
 
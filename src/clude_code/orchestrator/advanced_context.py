@@ -2,12 +2,12 @@
 高级上下文管理器
 参考Claude Code，实现智能的token预算管理和上下文优化
 """
-import tiktoken
 from typing import List, Dict, Any, Optional, Tuple
 from dataclasses import dataclass, field
 from enum import Enum
 
 from clude_code.llm.llama_cpp_http import ChatMessage
+from clude_code.llm.tokenizer import get_token_counter
 
 
 class ContextPriority(Enum):
@@ -34,13 +34,8 @@ class ContextItem:
         if self.token_count > 0:
             return self.token_count
 
-        try:
-            encoding = tiktoken.get_encoding(encoding_name)
-            self.token_count = len(encoding.encode(self.content))
-        except Exception:
-            # 简单估算：1个中文字符≈1.5个token，英文单词≈1个token
-            self.token_count = len(self.content) // 2  # 粗略估算
-
+        # 统一走分词服务（服务端 /tokenize → tiktoken → 启发式），按内容哈希缓存
+        self.token_count = get_token_counter().count(self.content)
         return self.token_count
 
 
@@ -218,7 +213,10 @@ class AdvancedContextManager:
     def _truncate_content(self, content: str, max_tokens: int) -> str:
         """智能截断内容"""
         try:
-            encoding = tiktoken.get_encoding(self.encoding_name)
+            # 本地分词器按需惰性加载（离线且无本地编码文件时为 None，直接走字符截断）
+            encoding = get_token_counter().local_tokenizer()
+            if encoding is None:
+                raise RuntimeError("本地分词器不可用")
             tokens = encoding.encode(content)
 
             if len(tokens) <= max_tokens:
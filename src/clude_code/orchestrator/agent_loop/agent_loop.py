@@ -1,5 +1,6 @@
 import json
 import re
+import threading
 import uuid
 from pathlib import Path
 from typing import Any, Callable, List, Dict, Optional
@@ -7,7 +8,11 @@ from typing import Any, Callable, List, Dict, Optional
 from clude_code.config.config import CludeConfig
 from clude_code.llm.llama_cpp_http import ChatMessage, LlamaCppHttpClient
 from clude_code.observability.audit import AuditLogger
+from clude_code.observability.log_sink import get_log_sink
 from clude_code.observability.trace import TraceLogger
+from clude_code.llm.tokenizer import TokenCounter, set_token_counter
+from clude_code.orchestrator.context_assembler import ContextAssembler
+from clude_code.orchestrator.history_compactor import HistoryCompactor
 from clude_code.observability.usage import SessionUsage
 from clude_code.observability.logger import get_logger
 from clude_code.policy.command_policy import evaluate_command
@@ -22,9 +27,11 @@ from clude_code.orchestrator.state_m import AgentState
 from clude_code.orchestrator.classifier import IntentClassifier, IntentCategory
 
 from .models import AgentTurn
+from .control_protocol import try_parse_tool_call_batch
 from .parsing import try_parse_tool_call
 from .prompts import SYSTEM_PROMPT, load_project_memory
 from clude_code.prompts import read_prompt, render_prompt
+from .tool_cache import ToolResultCache
 from .tool_lifecycle import run_tool_lifecycle
 from .planning import execute_planning_phase
 from .execution import (
@@ -45,6 +52,9 @@ from .react import execute_react_fallback_loop as _react_execute_react_fallback_
 from .semantic_search import semantic_search as _semantic_search_fn
 from .tool_dispatch import dispatch_tool as _dispatch_tool_fn, iter_tool_specs as _iter_tool_specs
 
+# Repo Map 后台生成期间系统提示词中的占位内容
+_REPO_MAP_PENDING = "（仓库符号概览正在后台生成，可先使用 internal_repo_map / list_dir / grep 等工具了解结构。）"
+
 
 def _try_parse_tool_call(text: str) -> dict[str, Any] | None:
     """
@@ -61,6 +71,12 @@ def _try_parse_tool_call(text: str) -> dict[str, Any] | None:
     obj = try_parse_tool_call(text)
     if obj is None:
         return None
+    if "tool_calls" in obj:
+        # 批量信封：规范化为 {"tool_calls": [...]}；只有一个调用时退化为普通调用
+        calls = try_parse_tool_call_batch(obj)
+        if not calls:
+            return None
+        return calls[0] if len(calls) == 1 else {"tool_calls": calls}
     if "tool" not in obj or "args" not in obj:
         return None
     if not isinstance(obj["tool"], str) or not isinstance(obj["args"], dict):
@@ -152,7 +168,44 @@ class AgentLoop:
             max_tokens=cfg.llm.max_tokens,
             timeout_s=cfg.llm.timeout_s,
             api_key=cfg.llm.api_key,  # 支持 OpenAI/Azure 等需要认证的 API
+            max_connections=cfg.llm.http_max_connections,
+            max_keepalive_connections=cfg.llm.http_max_keepalive_connections,
+            keepalive_expiry_s=cfg.llm.http_keepalive_expiry_s,
+            http2=cfg.llm.http2,
+            model_id_ttl_s=cfg.llm.model_id_ttl_s,
+            # cache_prompt/id_slot 是 llama.cpp 扩展字段，其他 OpenAI 兼容服务端可能拒绝未知字段
+            cache_prompt=cfg.llm.cache_prompt and cfg.llm.provider == "llama_cpp_http",
+            id_slot=cfg.llm.id_slot if cfg.llm.provider == "llama_cpp_http" else -1,
+        )
+        # 统一 token 计数：llama.cpp 使用服务端 /tokenize，计数按内容哈希缓存（全进程共享）
+        self.token_counter = TokenCounter(
+            source=cfg.llm.tokenizer,
+            llm=self.llm if cfg.llm.provider == "llama_cpp_http" else None,
+            encoding_name=cfg.llm.tokenizer_encoding,
+            tokenizer_path=cfg.llm.tokenizer_path,
+            allow_download=cfg.llm.tokenizer_allow_download,
+            cache_size=cfg.llm.token_cache_size,
         )
+        set_token_counter(self.token_counter)
+        # 上下文窗口：首次使用时向服务端查询 n_ctx（见 context_window 属性）
+        self._context_window: int | None = None
+        self._parallel_steps: int | None = None
+        self._context_assembler: ContextAssembler | None = None
+        # 历史压缩：后台分段摘要，超预算时替换最旧的历史段（见 _compact_history）
+        self._summary_llm: LlamaCppHttpClient | None = None
+        self.history_compactor: HistoryCompactor | None = None
+        if cfg.orchestrator.history_compaction:
+            self.history_compactor = HistoryCompactor(
+                # 模型摘要只发给本地 llama.cpp：OpenAI 兼容/付费服务端上后台补全会产生额外费用
+                summarize=(
+                    self._summarize_history
+                    if cfg.orchestrator.history_compaction_use_llm and cfg.llm.provider == "llama_cpp_http"
+                    else None
+                ),
+                counter=self.token_counter,
+                keep_recent=cfg.orchestrator.history_compaction_keep_recent,
+                logger=self.file_only_logger,
+            )
         self.tools = LocalTools(
             cfg.workspace_root,
             max_file_read_bytes=cfg.limits.max_file_read_bytes,
@@ -169,9 +222,16 @@ class AgentLoop:
         except ImportError:
             pass  # 工具模块可选
         
-        self.audit = AuditLogger(cfg.workspace_root, self.session_id)
-        self.trace = TraceLogger(cfg.workspace_root, self.session_id)
+        log_cfg = cfg.logging
+        rotation = {"max_bytes": log_cfg.event_log_max_bytes, "max_age_seconds": log_cfg.event_log_max_age_hours * 3600}
+        self.audit = AuditLogger(cfg.workspace_root, self.session_id, **rotation)
+        self.trace = TraceLogger(
+            cfg.workspace_root, self.session_id, max_segments=log_cfg.trace_max_segments, **rotation
+        )
         self.usage = SessionUsage()
+        self.tool_cache = ToolResultCache(
+            cfg.workspace_root, max_bytes=cfg.orchestrator.tool_cache_max_bytes
+        )
         
         # Knowledge / RAG systems
         self.indexer = IndexerService(cfg)
@@ -194,7 +254,6 @@ class AgentLoop:
 
         # Initialize with Repo Map for better global context (Aider-style)
         import platform
-        repo_map = self.tools.generate_repo_map()
         env_info = f"操作系统: {platform.system()} ({platform.release()})\n当前绝对路径: {self.cfg.workspace_root}"
 
         # Claude Code 对标：自动加载 CLUDE.md 作为项目记忆（只读、失败不阻塞）
@@ -202,12 +261,26 @@ class AgentLoop:
         self._project_memory_meta: dict[str, object] = project_memory_meta
         self._project_memory_emitted: bool = False
 
-        combined_system_prompt = (
+        self._system_prompt_prefix = (
             f"{SYSTEM_PROMPT}"
             f"{project_memory_text}"
-            f"\n\n=== 环境信息 ===\n{env_info}\n\n=== 代码仓库符号概览 ===\n{repo_map}"
+            f"\n\n=== 环境信息 ===\n{env_info}\n\n=== 代码仓库符号概览 ===\n"
         )
-        
+        # Repo Map 异步生成：首轮提示词立即可用，生成完成后在下一轮开始时附加到系统提示词
+        self._repo_map: str | None = None
+        self._repo_map_attached = False
+        self._repo_map_focus: tuple[str, ...] = ()
+        self._repo_map_thread: threading.Thread | None = None
+        from clude_code.config.tools_config import get_repo_map_config
+        if get_repo_map_config().async_startup:
+            self._repo_map_thread = threading.Thread(target=self._build_repo_map, name="repo-map", daemon=True)
+            self._repo_map_thread.start()
+        else:
+            self._build_repo_map()
+        initial_repo_map = self._repo_map
+        combined_system_prompt = self._system_prompt_prefix + (initial_repo_map or _REPO_MAP_PENDING)
+        self._repo_map_attached = initial_repo_map is not None
+
         self.messages: list[ChatMessage] = [
             ChatMessage(role="system", content=combined_system_prompt),
         ]
@@ -217,6 +290,93 @@ class AgentLoop:
             self.logger.info("[dim]未加载 CLUDE.md（未找到或为空）[/dim]")
         self.logger.info("[dim]初始化系统提示词（包含 Repo Map/环境信息/可选项目记忆）[/dim]")
 
+    @property
+    def context_window(self) -> int:
+        """
+        模型实际的上下文窗口（tokens）：llm.context_window_auto 时优先取服务端 n_ctx（/props 或 /v1/models，
+        只查询一次），查询失败或未开启时使用配置的 llm.context_window。
+        """
+        if self._context_window is None:
+            n_ctx = None
+            if self.cfg.llm.context_window_auto and self.cfg.llm.provider == "llama_cpp_http":
+                n_ctx = self.llm.get_context_window()
+            self._context_window = int(n_ctx or self.cfg.llm.context_window)
+            self.logger.info(
+                f"[dim]上下文窗口: {self._context_window} tokens（来源: {'服务端 n_ctx' if n_ctx else '配置'}）[/dim]"
+            )
+        return self._context_window
+
+    @property
+    def parallel_steps(self) -> int:
+        """
+        可并发执行的只读计划步骤数：orchestrator.parallel_steps 为 0 时取服务端并行槽位数（只查询一次），
+        取不到时为 1（逐步执行）。
+        """
+        if self._parallel_steps is None:
+            n = int(self.cfg.orchestrator.parallel_steps)
+            if n == 0:
+                slots = self.llm.get_total_slots() if self.cfg.llm.provider == "llama_cpp_http" else None
+                n = int(slots or 1)
+            self._parallel_steps = max(1, n)
+        return self._parallel_steps
+
+    @property
+    def context_assembler(self) -> ContextAssembler:
+        if self._context_assembler is None:
+            self._context_assembler = ContextAssembler(
+                context_window=self.context_window,
+                max_output_tokens=self.llm.max_tokens,
+                counter=self.token_counter,
+            )
+        return self._context_assembler
+
+    def _repo_map_budget(self) -> int:
+        from clude_code.tooling.tools.repo_map import resolve_repo_map_budget
+        return resolve_repo_map_budget(self.context_window)
+
+    def _build_repo_map(self) -> None:
+        try:
+            self._repo_map = self.tools.generate_repo_map(max_tokens=self._repo_map_budget())
+        except Exception as e:
+            self.file_only_logger.warning(f"Repo Map 生成失败: {e}", exc_info=True)
+            self._repo_map = f"Repo Map Error: {e}"
+
+    def _attach_repo_map(self) -> None:
+        """后台生成的 Repo Map 就绪后替换系统提示词中的占位符（只做一次）。"""
+        if self._repo_map_attached or self._repo_map is None:
+            return
+        if self.messages and self.messages[0].role == "system":
+            self.messages[0] = ChatMessage(role="system", content=self._system_prompt_prefix + self._repo_map)
+        self._repo_map_attached = True
+        self.logger.info("[dim]Repo Map 已生成并附加到系统提示词[/dim]")
+
+    def _personalize_repo_map(self, user_text: str) -> None:
+        """按本轮提到的文件/符号重排 Repo Map（个性化 PageRank）；种子集合变化时才替换系统提示词。"""
+        from clude_code.config.tools_config import get_repo_map_config
+        from clude_code.tooling.tools.repo_graph import get_repo_graph
+
+        if not self._repo_map_attached or not get_repo_map_config().personalize:
+            return
+        # 前缀稳定布局：系统提示词必须保持字节不变，否则每轮都会让 llama.cpp 的提示词缓存失效
+        if self.cfg.orchestrator.prefix_stable_layout:
+            return
+        try:
+            seeds = get_repo_graph(Path(self.cfg.workspace_root)).mentioned(user_text)
+            focus = tuple(sorted(seeds))
+            if not seeds or focus == self._repo_map_focus:
+                return
+            repo_map = self.tools.generate_repo_map(
+                max_tokens=self._repo_map_budget(), focus_text=user_text, refresh=False
+            )
+        except Exception as e:
+            self.file_only_logger.warning(f"Repo Map 个性化重排失败: {e}", exc_info=True)
+            return
+        self._repo_map_focus = focus
+        self._repo_map = repo_map
+        if self.messages and self.messages[0].role == "system":
+            self.messages[0] = ChatMessage(role="system", content=self._system_prompt_prefix + repo_map)
+        self.logger.info(f"[dim]Repo Map 已按本轮提及的 {len(seeds)} 个文件重排[/dim]")
+
     def run_turn(
         self,
         user_text: str,
@@ -224,6 +384,21 @@ class AgentLoop:
         confirm: Callable[[str], bool],
         debug: bool = False,
         on_event: Callable[[dict[str, Any]], None] | None = None,
+    ) -> AgentTurn:
+        """执行一轮对话（见 _run_turn）；轮次边界把本轮的审计/追踪日志写盘并 fsync。"""
+        try:
+            return self._run_turn(user_text, confirm=confirm, debug=debug, on_event=on_event)
+        finally:
+            if not get_log_sink().sync():
+                self.file_only_logger.warning("审计/追踪日志 fsync 超时（日志写入器积压）")
+
+    def _run_turn(
+        self,
+        user_text: str,
+        *,
+        confirm: Callable[[str], bool],
+        debug: bool = False,
+        on_event: Callable[[dict[str, Any]], None] | None = None,
     ) -> AgentTurn:
         """
         执行一轮完整的 Agent 对话循环（ReAct 模式）。
@@ -257,8 +432,14 @@ class AgentLoop:
         self.logger.info(f"[bold cyan]开始新的一轮对话[/bold cyan] trace_id={trace_id}")
         self.logger.info(f"[dim]用户输入: {user_text[:100]}{'...' if len(user_text) > 100 else ''}[/dim]")
 
+        self._attach_repo_map()
+        self._personalize_repo_map(user_text)
+
         # 阶段 C: 清空本轮修改追踪
         self._turn_modified_paths.clear()
+        # 目录树类（grep/glob）缓存条目只在本轮内有效
+        self.tool_cache.begin_turn()
+        self.usage.begin_turn()
         # LLM 请求/返回日志：本轮只打印"本轮新增 user + 本次返回"，不输出历史轮次
         # 说明：llm_io.py 会用这个 cursor 计算"本次请求新增消息"的切片范围
         self._llm_log_cursor = len(self.messages)
@@ -656,82 +837,122 @@ class AgentLoop:
             _set_state,
         )
 
+    def _summary_slot(self) -> int | None:
+        """
+        历史摘要使用的 llama.cpp 槽位：摘要请求与主对话不同前缀，落在主对话的槽位上会冲掉它的提示词缓存。
+        主对话固定了槽位（llm.id_slot）时摘要固定到另一个槽位；未固定时摘要也不固定（-1，由服务端挑选），
+        不改动主客户端的设置。服务端只有 1 个槽位时返回 None：不发模型请求（由压缩器改用抽取式摘要）。
+        """
+        n = self.llm.get_total_slots() or 1
+        if n < 2:
+            return None
+        main = self.llm.id_slot
+        if main < 0:
+            return -1
+        return n - 1 if main != n - 1 else 0
+
+    def _summarize_history(self, transcript: str) -> str:
+        """后台线程调用：使用独立客户端（不覆盖主请求的 last_timing/last_server_usage）生成历史摘要。"""
+        if self._summary_llm is None:
+            slot = self._summary_slot()
+            if slot is None:
+                # 单槽位服务端：摘要请求必然驱逐主对话的 KV 缓存，改用抽取式摘要
+                raise RuntimeError("llama.cpp 服务端只有一个槽位，跳过模型摘要")
+            self._summary_llm = LlamaCppHttpClient(
+                base_url=self.cfg.llm.base_url,
+                api_mode=self.cfg.llm.api_mode,  # type: ignore[arg-type]
+                model=self.cfg.llm.model,
+                temperature=0.1,
+                max_tokens=512,
+                timeout_s=min(self.cfg.llm.timeout_s, 60),
+                api_key=self.cfg.llm.api_key,
+                id_slot=slot,
+            )
+        max_chars = self.history_compactor.max_summary_chars if self.history_compactor else 800
+        system = read_prompt("agent_loop/history_summary.md").replace("{max_chars}", str(max_chars))
+        return self._summary_llm.chat([
+            ChatMessage(role="system", content=system),
+            ChatMessage(role="user", content=transcript),
+        ])
+
+    def _compact_history(self, *, max_messages: int) -> None:
+        """
+        历史压缩：超过 history_compaction_trigger 时为较早的段提交后台摘要；
+        超过 80% 预算或消息数上限时，用已就绪的摘要原子替换最旧的段（之后的裁剪通常就不再需要丢弃原文）。
+        """
+        compactor = self.history_compactor
+        if compactor is None:
+            return
+        available = self.context_assembler.available_tokens
+        total = self.token_counter.count_messages(self.messages)
+        count = len(self.messages) - 1
+        trigger = self.cfg.orchestrator.history_compaction_trigger
+        if total > available * trigger or count > max_messages * trigger:
+            compactor.schedule(self.messages)
+        if total > available * 0.8 or count > max_messages:
+            new_messages = compactor.apply(self.messages)
+            if new_messages is not None:
+                self.logger.debug(
+                    f"[dim]历史摘要替换: {len(self.messages)} → {len(new_messages)} 条消息, "
+                    f"{total} → {self.token_counter.count_messages(new_messages)} tokens[/dim]"
+                )
+                self.messages = new_messages
+
+    def _trim_history_coarse(self, *, max_messages: int) -> None:
+        """
+        前缀稳定布局下的裁剪：未超限时不改动任何已有消息（只追加）；超过消息数或 token 预算时
+        一次性丢弃最旧的一大块（保留约一半），之后又能连续多步命中 llama.cpp 的提示词前缀缓存。
+        """
+        has_system = self.messages[0].role == "system"
+        head = self.messages[:1] if has_system else []
+        body = self.messages[1:] if has_system else list(self.messages)
+        budget = int(self.context_assembler.available_tokens * 0.8)
+        head_tokens = self.token_counter.count_messages(head)
+        body_tokens = self.token_counter.count_messages(body)
+        if len(body) <= max_messages and head_tokens + body_tokens <= budget:
+            return
+
+        keep = body[-max(2, max_messages // 2):]
+        while len(keep) > 2 and head_tokens + self.token_counter.count_messages(keep) > budget // 2:
+            keep = keep[2:]
+        # 保持角色交替：裁剪后的第一条非 system 消息应为 user
+        while len(keep) > 1 and keep[0].role != "user":
+            keep = keep[1:]
+        old_len = len(self.messages)
+        self.messages = head + keep
+        self.logger.debug(f"[dim]前缀稳定裁剪: {old_len} → {len(self.messages)} 条消息[/dim]")
+
     def _trim_history(self, *, max_messages: int) -> None:
         """
-        高级对话历史裁剪，使用智能上下文管理和token预算。
+        按 token 预算裁剪对话历史（预算来自模型真实上下文窗口，而非单次输出上限 llm.max_tokens）。
 
-        裁剪策略：
-        1. 使用高级上下文管理器进行token-aware裁剪
-        2. 优先保留高优先级内容（系统消息、当前任务相关）
-        3. 智能压缩长内容以适应token预算
-        4. 保持对话的连贯性和角色交替
+        裁剪策略（见 HistoryCompactor / ContextAssembler）：
+        0. 先用后台生成的历史摘要替换最旧的段（不丢信息地缩短历史）
+        1. system 消息与最近几条消息必选，放不下时截断
+        2. 其余历史与工具结果按“类别权重 × 新近度”做背包选择，保持原有顺序
+        3. 未超预算且未超过 max_messages 时不做任何改动（计数按内容哈希缓存，只有新消息需要分词）
 
         参数:
-            max_messages: 最大保留消息数（兼容性参数，现主要使用token预算）
+            max_messages: 最大保留消息数（兼容性参数，主要使用token预算）
 
         流程图: 见 `agent_loop_trim_history_flow.svg`
         """
-        from clude_code.orchestrator.advanced_context import get_advanced_context_manager, ContextPriority
-
+        if len(self.messages) <= 1:  # 至少保留system消息
+            return
+        self._compact_history(max_messages=max_messages)
         old_len = len(self.messages)
-        if old_len <= 1:  # 至少保留system消息
+        if self.cfg.orchestrator.prefix_stable_layout:
+            self._trim_history_coarse(max_messages=max_messages)
             return
 
-        # 初始化上下文管理器
-        context_manager = get_advanced_context_manager(max_tokens=self.llm.max_tokens)
-
-        # 清空旧上下文
-        context_manager.clear_context(keep_system=True)
-
-        # 添加system消息（最高优先级）
-        if self.messages and self.messages[0].role == "system":
-            system_content = self.messages[0].content or ""
-            context_manager.add_system_context(system_content, ContextPriority.CRITICAL)
-
-        # 添加对话历史（按优先级分类）
-        for i, message in enumerate(self.messages[1:], 1):  # 跳过system消息
-            # 根据位置和内容确定优先级
-            if i >= len(self.messages) - 5:  # 最近5条消息
-                priority = ContextPriority.HIGH
-            elif i >= len(self.messages) - 15:  # 最近15条消息
-                priority = ContextPriority.MEDIUM
-            else:
-                priority = ContextPriority.LOW
-
-            context_manager.add_message(message, priority)
-
-        # 获取优化后的上下文
-        optimized_items = context_manager.optimize_context()
-
-        # 重建消息列表
-        new_messages = []
-
-        # 添加system消息
-        if self.messages and self.messages[0].role == "system":
-            new_messages.append(self.messages[0])
-
-        # 从优化后的上下文项重建消息
-        for item in optimized_items:
-            if item.category == "system":
-                continue  # system消息已添加
-
-            # 从metadata恢复原始消息
-            original_role = item.metadata.get("original_role", item.category)
-            message = ChatMessage(role=original_role, content=item.content)
-            new_messages.append(message)
-
-        # 如果优化后消息太少，至少保留最近的几条
-        if len(new_messages) < 3 and len(self.messages) > 3:
-            # 保留system + 最后两条对话
-            new_messages = [self.messages[0]] + self.messages[-4:] if len(self.messages) > 4 else self.messages
-
-        self.messages = new_messages
-
-        # 记录裁剪统计
-        stats = context_manager.get_context_stats()
+        assembler = self.context_assembler
+        if old_len - 1 <= max_messages and assembler.fits(self.messages):
+            return
+        self.messages, stats = assembler.assemble(self.messages, max_messages=max_messages)
         self.logger.debug(
             f"[dim]智能上下文裁剪: {old_len} → {len(self.messages)} 条消息, "
-            f"{stats.get('total_tokens', 0)} tokens ({stats.get('utilization_rate', 0):.1%})[/dim]"
+            f"{stats.system_tokens + stats.history_tokens}/{stats.available_tokens} tokens, "
+            f"截断 {stats.truncated} 条[/dim]"
         )
 
     def _format_args_summary(self, tool_name: str, args: dict[str, Any]) -> str:
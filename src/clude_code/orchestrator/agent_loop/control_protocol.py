@@ -118,3 +118,43 @@ def try_parse_control_envelope(text: str) -> ControlEnvelope | None:
         return None
 
 
+
+
+class ToolCall(BaseModel):
+    """单个工具调用：{"tool": "<工具名>", "args": {...}}。"""
+
+    tool: str = Field(min_length=1, description="工具名称")
+    args: dict[str, Any] = Field(default_factory=dict, description="工具参数")
+
+
+class ToolCallBatch(BaseModel):
+    """
+    批量工具调用信封（Tool-Call Batch Envelope / 批量工具调用信封）。
+
+    模型在一次响应中给出多个互不依赖的工具调用，减少 LLM 往返次数；
+    只读调用由执行层并发执行，结果合并为一条消息回喂。
+
+    JSON 示例：
+        {"tool_calls": [{"tool": "read_file", "args": {"path": "a.py"}},
+                        {"tool": "grep", "args": {"pattern": "foo"}}]}
+    """
+
+    tool_calls: list[ToolCall] = Field(min_length=1, description="按顺序排列的工具调用列表")
+
+
+def try_parse_tool_call_batch(obj: Any) -> list[dict[str, Any]] | None:
+    """
+    从已解析的 JSON 对象中提取批量工具调用（ToolCallBatch）。
+
+    Returns:
+        list[dict]: 规范化后的调用列表（每项含 tool/args）
+        None: 不是合法的批量信封
+    """
+    if not isinstance(obj, dict) or "tool_calls" not in obj:
+        return None
+    try:
+        batch = ToolCallBatch.model_validate(obj)
+    except ValidationError as e:
+        _logger.debug(f"ToolCallBatch Pydantic 校验失败: {e}")
+        return None
+    return [c.model_dump() for c in batch.tool_calls]
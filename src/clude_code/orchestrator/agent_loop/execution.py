@@ -9,6 +9,8 @@ from clude_code.tooling.local_tools import ToolResult
 from clude_code.orchestrator.state_m import AgentState
 from clude_code.orchestrator.planner import Plan
 from .control_protocol import try_parse_control_envelope
+from .step_scheduler import run_parallel_batch, select_parallel_batch
+from .tool_lifecycle import run_tool_batch
 from clude_code.prompts import read_prompt, render_prompt
 
 
@@ -68,6 +70,46 @@ def handle_tool_call_in_step(
     return result, did_modify_code
 
 
+def handle_tool_batch(
+    loop: "AgentLoop",
+    calls: list[dict[str, Any]],
+    trace_id: str,
+    keywords: set[str],
+    confirm: Callable[[str], bool],
+    _ev: Callable[[str, dict[str, Any]], None],
+    _tool_result_to_message: Callable[[str, ToolResult, set[str] | None], str],
+    *,
+    step_id: str | None = None,
+) -> tuple[list[ToolResult], bool]:
+    """
+    处理批量工具调用（{"tool_calls": [...]}）：记录调用 → 执行（连续只读调用并发）→ 合并为一条消息回喂。
+    返回: (results, did_modify_code)
+    """
+    tag = {"step_id": step_id} if step_id else {}
+    names = [c["tool"] for c in calls]
+    loop.logger.info(f"[bold blue]🔧 解析到批量工具调用: {len(calls)} 个[/bold blue] [工具] {', '.join(names)}")
+    loop.file_only_logger.info(f"批量工具调用详情 [step_id={step_id}] [calls={json.dumps(calls, ensure_ascii=False)}]")
+    for c in calls:
+        _ev("tool_call_parsed", {"tool": c["tool"], "args": c["args"], "batch": len(calls), **tag})
+    loop.messages.append(ChatMessage(role="assistant", content=json.dumps({"tool_calls": calls}, ensure_ascii=False)))
+    loop._trim_history(max_messages=30)
+
+    workers = loop.cfg.orchestrator.parallel_tool_calls
+    results = run_tool_batch(loop, calls, trace_id, confirm, _ev, max_workers=workers)
+
+    did_modify_code = False
+    parts: list[str] = []
+    for c, result in zip(calls, results, strict=True):
+        _ev("tool_result", {"tool": c["tool"], "ok": result.ok, "error": result.error, "payload": result.payload, **tag})
+        did_modify_code = did_modify_code or (c["tool"] in {"write_file", "apply_patch", "undo_patch"} and result.ok)
+        parts.append(_tool_result_to_message(c["tool"], result, keywords=keywords))
+    # 每个结果一行 JSON（与单次调用的回喂格式一致），整体作为一条消息回喂
+    loop.messages.append(ChatMessage(role="user", content="\n".join(parts)))
+    _ev("tool_result_fed_back", {"tools": names, **tag})
+    loop._trim_history(max_messages=30)
+    return results, did_modify_code
+
+
 def execute_single_step_iteration(
     loop: "AgentLoop",
     step,
@@ -177,6 +219,12 @@ def execute_single_step_iteration(
         loop._trim_history(max_messages=30)
         return None, False, False
 
+    if "tool_calls" in tool_call:
+        _, did_modify_code = handle_tool_batch(
+            loop, tool_call["tool_calls"], trace_id, keywords, confirm, _ev, _tool_result_to_message, step_id=step.id
+        )
+        return None, did_modify_code, True
+
     name = tool_call["tool"]
     args = tool_call["args"]
     _ev("tool_call_parsed", {"tool": name, "args": args, "step_id": step.id})
@@ -390,6 +438,27 @@ def execute_plan_steps(
     did_modify_code = False
 
     while True:
+        # DAG 调度：依赖已满足的只读步骤（互不涉及相同文件）成批并发执行，其余步骤仍按顺序逐个执行
+        batch = select_parallel_batch(plan, loop.parallel_steps)
+        if batch:
+            tool_used = run_parallel_batch(
+                loop, plan, batch, trace_id, keywords, confirm, _ev, _try_parse_tool_call, _tool_result_to_message
+            ) or tool_used
+            unfinished = [s for s in batch if s.status != "done"]
+            if unfinished:
+                # 只对计划顺序中第一个未完成的步骤重规划；其余未完成的步骤退回 pending，之后重新调度
+                failed = unfinished[0]
+                for s in unfinished[1:]:
+                    if s.status == "in_progress":
+                        s.status = "pending"
+                failed.status = "failed"
+                new_plan, replans_used = handle_replanning(loop, failed, plan, replans_used, trace_id, tool_used, _ev, _llm_chat, _set_state)
+                if new_plan is None:
+                    return None, tool_used, did_modify_code
+                plan = new_plan
+            step_cursor = 0
+            continue
+
         if step_cursor >= len(plan.steps):
             break
 
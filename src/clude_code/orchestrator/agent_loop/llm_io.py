@@ -2,11 +2,14 @@ from __future__ import annotations
 
 import json
 import inspect
+import os
 import time
 from typing import Any, Callable, TYPE_CHECKING
 
 from clude_code.llm.llama_cpp_http import ChatMessage
-from clude_code.observability.usage import estimate_tokens
+from clude_code.llm.tokenizer import TokenCounter, get_token_counter
+from clude_code.observability.message_store import MessageRefEncoder
+from .parsing import ToolCallDetector
 
 if TYPE_CHECKING:
     from .agent_loop import AgentLoop
@@ -82,6 +85,38 @@ def normalize_messages_for_llama(
             )
 
 
+def _prompt_signature(messages: list[ChatMessage]) -> str:
+    # 近似 chat template 展开后的前缀：角色与内容按顺序拼接，分隔符不会出现在正常文本里
+    return "".join(f"\x00{m.role}\x01{m.content}" for m in messages)
+
+
+def _token_counter(loop: "AgentLoop") -> TokenCounter:
+    return getattr(loop, "token_counter", None) or get_token_counter()
+
+
+def prefill_stats(loop: "AgentLoop", prompt_sig: str, prompt_tokens_est: int) -> dict[str, Any]:
+    """
+    本次请求的 prefill 复用情况：
+    - 服务端返回了 cached_tokens / timings.cache_n 时以服务端为准（source=server）；
+    - 否则按与上一次请求的公共前缀估算（source=estimate），近似 llama.cpp cache_prompt 可复用的部分。
+    """
+    prev = getattr(loop, "_last_prompt_sig", "") or ""
+    loop._last_prompt_sig = prompt_sig
+    server = dict(getattr(loop.llm, "last_server_usage", None) or {})
+    if server.get("prompt_tokens"):
+        prompt_tokens = int(server["prompt_tokens"])
+        saved = int(server.get("cached_tokens") or 0)
+        source = "server"
+    else:
+        prompt_tokens = prompt_tokens_est
+        # 按公共前缀字符占比折算，与 prompt_tokens 同一计数口径
+        common = len(os.path.commonprefix([prev, prompt_sig])) if prev else 0
+        saved = int(prompt_tokens * common / len(prompt_sig)) if prompt_sig else 0
+        source = "estimate"
+    saved = min(saved, prompt_tokens)
+    return {"prompt_tokens": prompt_tokens, "saved_tokens": saved, "source": source}
+
+
 def llm_chat(
     loop: "AgentLoop",
     stage: str,
@@ -107,7 +142,7 @@ def llm_chat(
     # 0) 估算 prompt tokens（轻量，不依赖服务端 usage）
     prompt_tokens_est = 0
     try:
-        prompt_tokens_est = sum(estimate_tokens(m.content) for m in (loop.messages or []))
+        prompt_tokens_est = _token_counter(loop).count_messages(loop.messages or [])
     except Exception as ex:
         # P1-1: 异常写入 file-only 日志，便于排查
         loop.file_only_logger.warning(f"估算 prompt tokens 失败: {ex}", exc_info=True)
@@ -115,11 +150,13 @@ def llm_chat(
 
     # 1) 记录/打印请求参数（model 等）与请求数据摘要
     try:
-        # 构建完整的 messages 列表（用于 TUI 显示系统/用户提示词）
-        messages_full = [
-            {"role": msg.role, "content": msg.content}
-            for msg in loop.messages
-        ]
+        # messages 只发引用（内容寻址存储），正文只在本会话首次出现时随事件发送（delta）
+        encoder = getattr(loop, "_message_ref_encoder", None)
+        if encoder is None:
+            encoder = MessageRefEncoder()
+            loop._message_ref_encoder = encoder
+        message_refs, message_delta = encoder.encode(loop.messages)
+        last_content = loop.messages[-1].content if loop.messages else None
         req_obj = {
             "stage": stage,
             "step_id": step_id,
@@ -132,9 +169,10 @@ def llm_chat(
             "prompt_tokens_est": prompt_tokens_est,
             "messages_count": len(loop.messages),
             "last_role": loop.messages[-1].role if loop.messages else None,
-            "last_content_preview": (loop.messages[-1].content) if (loop.messages and len(loop.messages[-1].content) > 200) else (loop.messages[-1].content if loop.messages else None),
-            # 完整 messages 列表（供 TUI 显示系统/用户提示词）
-            "messages": messages_full,
+            "last_content_preview": (last_content[:200] + "...") if (last_content and len(last_content) > 200) else last_content,
+            # 消息引用 [{id, role, length}]；UI 通过 message_store.resolve_messages(data) 还原正文
+            "messages": message_refs,
+            "messages_delta": message_delta,
         }
         # 写入文件（详细）：只打印本次请求新增的 user，不打印历史轮次 messages
         log_llm_request_params_to_file(loop)
@@ -146,9 +184,14 @@ def llm_chat(
         # P1-1: 打印失败不影响主流程，但写入 file-only 日志便于排查
         loop.file_only_logger.warning(f"LLM 请求参数记录失败: {ex}", exc_info=True)
 
+    prompt_sig = _prompt_signature(loop.messages or [])
+
     # 2) 发起请求
     t0 = time.time()
-    assistant_text = loop.llm.chat(loop.messages)
+    if loop.cfg.llm.stream and hasattr(loop.llm, "chat_stream"):
+        assistant_text = llm_chat_stream(loop, stage, step_id=step_id, _ev=_ev)
+    else:
+        assistant_text = loop.llm.chat(loop.messages)
     elapsed_ms = int((time.time() - t0) * 1000)
 
     # 3) 记录/打印返回数据摘要（不依赖 tool_call，tool_call 在上层解析后另行落盘）
@@ -169,12 +212,17 @@ def llm_chat(
 
     # 4) 记录用量（会话级）
     try:
-        completion_tokens_est = estimate_tokens(assistant_text)
+        completion_tokens_est = _token_counter(loop).count(assistant_text)
+        timing = dict(getattr(loop.llm, "last_timing", None) or {})
+        prefill = prefill_stats(loop, prompt_sig, prompt_tokens_est)
         if hasattr(loop, "usage"):
+            loop.usage.record_prefill(prompt_tokens=prefill["prompt_tokens"], saved_tokens=prefill["saved_tokens"])
             loop.usage.record_llm(
                 prompt_tokens_est=prompt_tokens_est,
                 completion_tokens_est=completion_tokens_est,
                 elapsed_ms=elapsed_ms,
+                connect_ms=float(timing.get("connect_ms") or 0.0),
+                ttfb_ms=float(timing.get("ttfb_ms") or 0.0),
             )
         if _ev:
             _ev(
@@ -183,6 +231,10 @@ def llm_chat(
                     "stage": stage,
                     "step_id": step_id,
                     "elapsed_ms": elapsed_ms,
+                    # HTTP 耗时拆分：connect（建连）/ ttfb（首字节，含 prefill）/ total
+                    "timing": timing,
+                    # prompt 前缀 KV 缓存复用（saved_tokens 为免于重新 prefill 的 token 数）
+                    "prefill": prefill,
                     "prompt_tokens_est": prompt_tokens_est,
                     "completion_tokens_est": completion_tokens_est,
                     "total_tokens_est": prompt_tokens_est + completion_tokens_est,
@@ -196,6 +248,57 @@ def llm_chat(
     return assistant_text
 
 
+def llm_chat_stream(
+    loop: "AgentLoop",
+    stage: str,
+    *,
+    step_id: str | None = None,
+    _ev: Callable[[str, dict[str, Any]], None] | None = None,
+) -> str:
+    """
+    流式请求（SSE）：
+    - 增量文本按 llm.stream_event_interval_ms 合并后以 `llm_token` 事件推给 UI（避免逐 token 刷屏/写 trace）；
+    - ToolCallDetector 增量检测顶层工具调用 JSON，完整出现即提前结束生成（llm.stream_stop_on_tool_call）；
+    - 尚未收到任何 token 就失败时（如服务端不支持 stream）回退到非流式 chat。
+    """
+    cfg = loop.cfg.llm
+    stop_on_tool_call = bool(getattr(cfg, "stream_stop_on_tool_call", True))
+    interval_s = max(0, int(getattr(cfg, "stream_event_interval_ms", 50))) / 1000.0
+    detector = ToolCallDetector()
+    pending: list[str] = []
+    state = {"chunks": 0, "chars": 0, "last_emit": time.monotonic()}
+
+    def _flush() -> None:
+        if pending and _ev:
+            _ev("llm_token", {"stage": stage, "step_id": step_id, "delta": "".join(pending), "chars": state["chars"]})
+        pending.clear()
+        state["last_emit"] = time.monotonic()
+
+    def _on_delta(delta: str) -> bool:
+        state["chunks"] += 1
+        state["chars"] += len(delta)
+        pending.append(delta)
+        if time.monotonic() - state["last_emit"] >= interval_s:
+            _flush()
+        return stop_on_tool_call and detector.feed(delta) is not None
+
+    try:
+        text = loop.llm.chat_stream(loop.messages, _on_delta)
+    except Exception as ex:
+        if state["chunks"]:
+            raise
+        loop.file_only_logger.warning(f"流式请求失败，回退到非流式: {ex}", exc_info=True)
+        return loop.llm.chat(loop.messages)
+    _flush()
+
+    if detector.tool_call is not None and _ev:
+        _ev(
+            "llm_stream_early_stop",
+            {"stage": stage, "step_id": step_id, "tool": detector.tool_call.get("tool") or "tool_calls", "chars": state["chars"]},
+        )
+    return text
+
+
 def log_llm_request_params_to_file(loop: "AgentLoop") -> None:
     """纯文本：只打印“本次请求新增的 user 文本”，不打印历史轮次 messages。"""
     llm_cfg = getattr(getattr(loop, "cfg", None), "llm_detail_logging", None)
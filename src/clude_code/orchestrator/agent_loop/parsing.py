@@ -52,3 +52,58 @@ def try_parse_tool_call(text: str) -> dict[str, Any] | None:
     return None
 
 
+
+
+class ToolCallDetector:
+    """
+    流式输出上的增量工具调用检测器（Incremental Tool-Call Detector）。
+
+    逐段 feed 模型输出，按字符串/转义感知的括号配对跟踪顶层 `{...}`；每闭合一个顶层对象就尝试
+    json.loads，得到含 "tool"（或批量信封 "tool_calls"）键的 dict 即视为完整工具调用（只检测顶层对象，
+    计划 JSON 中嵌套的 "tool" 字段不会误触发）。总开销 O(输出长度)。
+    """
+
+    def __init__(self) -> None:
+        self._text = ""
+        self._pos = 0
+        self._depth = 0
+        self._start = -1
+        self._in_str = False
+        self._esc = False
+        self.tool_call: dict[str, Any] | None = None
+
+    def feed(self, chunk: str) -> dict[str, Any] | None:
+        """追加一段输出；检测到完整工具调用时返回该 dict（之后保持返回它）。"""
+        if self.tool_call is not None or not chunk:
+            return self.tool_call
+        self._text += chunk
+        text = self._text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+                continue
+            if ch == '"' and self._depth > 0:
+                self._in_str = True
+            elif ch == "{":
+                if self._depth == 0:
+                    self._start = i
+                self._depth += 1
+            elif ch == "}" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        obj = json.loads(text[self._start : i + 1])
+                    except json.JSONDecodeError:
+                        obj = None
+                    if isinstance(obj, dict) and ("tool" in obj or "tool_calls" in obj):
+                        self._pos = i + 1
+                        self.tool_call = obj
+                        return obj
+        self._pos = len(text)
+        return None
@@ -7,6 +7,8 @@ from clude_code.llm.llama_cpp_http import ChatMessage
 from clude_code.orchestrator.state_m import AgentState
 from clude_code.tooling.local_tools import ToolResult
 
+from .execution import handle_tool_batch
+
 if TYPE_CHECKING:
     from .agent_loop import AgentLoop
     from .models import AgentTurn
@@ -77,6 +79,12 @@ def execute_react_fallback_loop(
 
             return AgentTurn(assistant_text=assistant, tool_used=tool_used, trace_id=trace_id, events=events)
 
+        if "tool_calls" in tool_call:
+            # 批量调用：一次 LLM 往返执行多个工具，结果合并为一条消息回喂
+            handle_tool_batch(loop, tool_call["tool_calls"], trace_id, keywords, confirm, _ev, _tool_result_to_message)
+            tool_used = True
+            continue
+
         name = tool_call["tool"]
         args = tool_call["args"]
         if name == "none" or name.lower() == "no_tool":
@@ -0,0 +1,208 @@
+"""
+计划步骤的 DAG 并发调度（Step Scheduler）
+
+execute_plan_steps 原先按 step_cursor 逐个执行步骤；多路调查类任务（分别搜索/阅读几个模块）的步骤之间
+往往没有依赖，串行执行的墙钟时间约等于步骤数 × 单步耗时。这里按依赖 DAG 把它们并发起来：
+- 就绪：Plan.get_ready_steps(已完成步骤集合)；
+- 只读：tools_expected 非空且全部是只读工具（tool_dispatch.is_read_only_tool），只有只读步骤参与并发；
+- 文件冲突：步骤描述中提到的文件路径有交集的步骤不放进同一批（留到下一批串行执行）；
+- 隔离：每个并发步骤在 StepBranch 上执行——消息列表从当前历史复制，LLM 客户端是共享连接池的副本
+  （各占服务端一个并行槽位），工具调用限制为只读；
+- 合并：整批结束后按计划顺序把各步骤新增的消息追加回主历史，结果与各步骤完成的先后无关。
+"""
+
+from __future__ import annotations
+
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Callable, List
+
+from clude_code.llm.llama_cpp_http import ChatMessage, LlamaCppHttpClient
+from clude_code.orchestrator.planner import Plan, PlanStep
+from clude_code.tooling.local_tools import ToolResult
+
+from .tool_dispatch import is_read_only_tool
+
+if TYPE_CHECKING:
+    from .agent_loop import AgentLoop
+
+# 步骤描述中的文件路径（ASCII 匹配，避免把相邻的中文并入路径）：含目录分隔符或带扩展名
+_PATH_RE = re.compile(r"(?:[\w.\-]+[/\\])+[\w.\-]+|\b[\w\-]{2,}\.[A-Za-z][A-Za-z0-9]{0,7}\b", re.ASCII)
+
+
+def step_paths(step: PlanStep) -> set[str]:
+    """步骤描述里提到的文件/目录路径（归一化为小写、正斜杠，去掉开头的 ./）。"""
+    out: set[str] = set()
+    for m in _PATH_RE.findall(step.description or ""):
+        p = m.replace("\\", "/").strip("./").lower()
+        if p:
+            out.add(p)
+    return out
+
+
+def is_parallel_step(step: PlanStep) -> bool:
+    """只读步骤：预计使用的工具全部是只读工具（未声明工具的步骤无法判断，按可能写入处理）。"""
+    return bool(step.tools_expected) and all(is_read_only_tool(t) for t in step.tools_expected)
+
+
+def select_parallel_batch(plan: Plan, limit: int) -> List[PlanStep]:
+    """
+    从就绪步骤中按计划顺序挑选一批可并发的只读步骤（至多 limit 个，路径互不相交）。
+    计划顺序中第一个未完成的非只读步骤是屏障：它之后的步骤一律不提前（规划器常把 dependencies
+    留空，此时"先改后读"只由计划顺序表达）。不足 2 个时返回空列表（交给串行路径执行）。
+    """
+    if limit < 2:
+        return []
+    completed = {s.id for s in plan.steps if s.status == "done"}
+    ready = {id(s) for s in plan.get_ready_steps(completed)}
+    batch: List[PlanStep] = []
+    claimed: set[str] = set()
+    for step in plan.steps:
+        if len(batch) >= limit:
+            break
+        if step.status in ("done", "failed"):
+            continue
+        if not is_parallel_step(step):
+            break
+        if id(step) not in ready:
+            continue
+        paths = step_paths(step)
+        if paths & claimed:
+            continue
+        batch.append(step)
+        claimed |= paths
+    return batch if len(batch) >= 2 else []
+
+
+class StepBranch:
+    """
+    AgentLoop 的分支视图：messages / llm / 请求记录等写入只落在分支上，其余属性读取委托给主循环。
+    execution 与 llm_io 的函数只通过属性访问 loop，因此可以直接在分支上运行。
+    """
+
+    def __init__(self, loop: "AgentLoop", llm: LlamaCppHttpClient) -> None:
+        self._loop = loop
+        self.llm = llm
+        self.base: List[ChatMessage] = list(loop.messages)
+        self.messages: List[ChatMessage] = list(self.base)
+        self._last_prompt_sig = getattr(loop, "_last_prompt_sig", "")
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "_loop":
+            raise AttributeError(name)
+        return getattr(self._loop, name)
+
+    def _trim_history(self, *, max_messages: int) -> None:
+        # 分支只存活一个步骤：使用前缀稳定的大块裁剪，不触发历史摘要（摘要只作用于主历史）
+        from .agent_loop import AgentLoop
+
+        AgentLoop._trim_history_coarse(self, max_messages=max_messages)  # type: ignore[arg-type]
+
+    def _run_tool_lifecycle(
+        self,
+        name: str,
+        args: dict[str, Any],
+        trace_id: str,
+        confirm: Callable[[str], bool],
+        _ev: Callable[[str, dict[str, Any]], None],
+    ) -> ToolResult:
+        if not is_read_only_tool(name):
+            return ToolResult(
+                ok=False,
+                error={
+                    "code": "E_READ_ONLY_STEP",
+                    "message": f"该步骤与其他只读步骤并发执行，不允许调用有副作用的工具: {name}；如确需修改请请求重规划",
+                },
+            )
+        return self._loop._run_tool_lifecycle(name, args, trace_id, confirm, _ev)
+
+    def transcript(self) -> List[ChatMessage]:
+        """分支新增的消息（按出现顺序），用于合并回主历史。"""
+        base_ids = {id(m) for m in self.base}
+        out = [m for m in self.messages if id(m) not in base_ids]
+        # 规范化会把步骤提示词与历史中最后一条同角色消息合并：去掉属于历史的那部分前缀
+        if out and self.base:
+            last = self.base[-1]
+            prefix = (last.content or "") + "\n\n"
+            if out[0].role == last.role and (out[0].content or "").startswith(prefix):
+                out[0] = ChatMessage(role=out[0].role, content=out[0].content[len(prefix):])
+        return out
+
+
+def run_parallel_batch(
+    loop: "AgentLoop",
+    plan: Plan,
+    batch: List[PlanStep],
+    trace_id: str,
+    keywords: set[str],
+    confirm: Callable[[str], bool],
+    _ev: Callable[[str, dict[str, Any]], None],
+    _try_parse_tool_call: Callable[[str], dict[str, Any] | None],
+    _tool_result_to_message: Callable[[str, ToolResult, set[str] | None], str],
+) -> bool:
+    """
+    并发执行一批只读步骤，完成后按计划顺序合并各步骤的消息。
+    返回: tool_used（只读步骤不会修改代码）。步骤状态直接写回 PlanStep（done / failed / in_progress）。
+    """
+    from . import llm_io
+    from .execution import execute_single_step_iteration
+
+    ev_lock = threading.Lock()
+
+    def ev(event: str, data: dict[str, Any]) -> None:
+        # 事件序号与 UI 回调不是线程安全的：串行化上报
+        with ev_lock:
+            _ev(event, data)
+
+    branches: List[StepBranch] = []
+    for step in batch:
+        step.status = "in_progress"
+        loop.audit.write(trace_id=trace_id, event="plan_step_start", data={"step_id": step.id, "description": step.description, "parallel": True})
+        branches.append(StepBranch(loop, loop.llm.fork()))
+    ev("plan_steps_parallel", {"step_ids": [s.id for s in batch], "width": len(batch)})
+    loop.logger.info(f"[bold magenta]⇉ 并发执行 {len(batch)} 个只读步骤: {', '.join(s.id for s in batch)}[/bold magenta]")
+
+    def _run(branch: StepBranch, step: PlanStep) -> bool:
+        def _llm_chat(stage: str, step_id: str | None = None) -> str:
+            return llm_io.llm_chat(branch, stage, step_id=step_id, _ev=ev)  # type: ignore[arg-type]
+
+        used_tool = False
+        idx = plan.steps.index(step)
+        for iteration in range(loop.cfg.orchestrator.max_step_tool_calls):
+            control_signal, _, iter_did_use_tool = execute_single_step_iteration(
+                branch,  # type: ignore[arg-type]
+                step,
+                idx,
+                plan,
+                iteration,
+                trace_id,
+                keywords,
+                confirm,
+                ev,
+                _llm_chat,
+                _try_parse_tool_call,
+                _tool_result_to_message,
+            )
+            used_tool = used_tool or iter_did_use_tool
+            if control_signal in ("STEP_DONE", "REPLAN"):
+                break
+        return used_tool
+
+    tool_used = False
+    with ThreadPoolExecutor(max_workers=len(batch), thread_name_prefix="plan-step") as pool:
+        futures = [pool.submit(_run, b, s) for b, s in zip(branches, batch, strict=True)]
+        for step, fut in zip(batch, futures, strict=True):
+            try:
+                tool_used = fut.result() or tool_used
+            except Exception as e:
+                loop.logger.error(f"[red]✗ 并发步骤异常[/red] [步骤] {step.id} {e}", exc_info=True)
+                step.status = "failed"
+
+    # 按计划顺序合并（与完成先后无关）
+    for branch in branches:
+        loop.messages.extend(branch.transcript())
+    loop._last_prompt_sig = branches[-1]._last_prompt_sig
+    loop._trim_history(max_messages=30)
+    ev("plan_steps_parallel_done", {"steps": {s.id: s.status for s in batch}})
+    return tool_used
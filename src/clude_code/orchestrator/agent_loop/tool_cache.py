@@ -0,0 +1,175 @@
+"""
+只读工具结果缓存（Tool Result Cache）。
+
+同一轮对话中模型经常以相同参数重复调用 read_file / grep / list_dir / glob_file_search，
+这里在 dispatch 层按“规范化参数 + 涉及路径的 (mtime, size) 指纹”缓存结果：
+- 精确条目（read_file）：指纹不变即有效，可跨轮复用；
+- 目录树条目（grep / glob_file_search）：根目录指纹无法反映深层文件变化，只在本轮内有效；
+- list_dir 结果带子项的 size_bytes，子文件内容变化不会改变目录自身的指纹，同样只在本轮内有效；
+- 写文件（apply_patch / write_file / undo_patch）按路径失效，执行命令（run_cmd）清空全部；
+- 按结果序列化字节数做 LRU 淘汰。
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from clude_code.tooling.local_tools import ToolResult
+
+# 递归搜索整棵目录树的工具：参数名 -> 搜索根目录
+_TREE_TOOLS: dict[str, str] = {"grep": "path", "glob_file_search": "target_directory"}
+# 只涉及单个路径的工具
+_PATH_TOOLS: dict[str, str] = {"read_file": "path", "list_dir": "path"}
+# 结果包含子项元数据、而指纹只覆盖目录本身的工具：按轮次失效
+_TURN_SCOPED: frozenset[str] = frozenset({"list_dir"})
+
+
+@dataclass
+class _Entry:
+    result: ToolResult
+    paths: tuple[str, ...]
+    fingerprint: tuple[Any, ...]
+    tree: bool
+    epoch: int
+    nbytes: int
+
+
+class ToolResultCache:
+    """按字节数限界的 LRU 缓存（线程安全）。"""
+
+    def __init__(self, workspace_root: str | Path, *, max_bytes: int = 8_000_000) -> None:
+        self.workspace_root = Path(workspace_root).resolve()
+        self.max_bytes = max(0, int(max_bytes))
+        self._entries: OrderedDict[tuple[str, str], _Entry] = OrderedDict()
+        self._bytes = 0
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # ------------------------------------------------------------------
+    # 键与指纹
+    # ------------------------------------------------------------------
+    def _abs(self, rel: Any) -> str:
+        return os.path.normpath(os.path.join(str(self.workspace_root), str(rel or ".")))
+
+    def _touched(self, name: str, args: dict[str, Any]) -> tuple[tuple[str, ...], bool]:
+        if name in _PATH_TOOLS:
+            return (self._abs(args.get(_PATH_TOOLS[name])),), name in _TURN_SCOPED
+        if name in _TREE_TOOLS:
+            return (self._abs(args.get(_TREE_TOOLS[name])),), True
+        return (str(self.workspace_root),), True
+
+    @staticmethod
+    def _fingerprint(paths: tuple[str, ...]) -> tuple[Any, ...]:
+        out: list[Any] = []
+        for p in paths:
+            try:
+                st = os.stat(p)
+                out.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                out.append(None)
+        return tuple(out)
+
+    @staticmethod
+    def _key(name: str, args: dict[str, Any]) -> tuple[str, str]:
+        norm = {k: v for k, v in args.items() if v is not None}
+        return name, json.dumps(norm, sort_keys=True, ensure_ascii=False, default=str)
+
+    # ------------------------------------------------------------------
+    # 读写
+    # ------------------------------------------------------------------
+    def get(self, name: str, args: dict[str, Any]) -> ToolResult | None:
+        if not self.enabled:
+            return None
+        key = self._key(name, args)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if (entry.tree and entry.epoch != self._epoch) or entry.fingerprint != self._fingerprint(entry.paths):
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            res = entry.result
+        return ToolResult(res.ok, payload=dict(res.payload) if res.payload is not None else None, error=res.error)
+
+    def snapshot(self, name: str, args: dict[str, Any]) -> tuple[tuple[str, ...], bool, tuple[Any, ...]]:
+        """执行工具前取指纹：执行期间文件被改动时，下次查询会因指纹不一致而失效。"""
+        paths, tree = self._touched(name, args)
+        return paths, tree, self._fingerprint(paths)
+
+    def put(
+        self,
+        name: str,
+        args: dict[str, Any],
+        result: ToolResult,
+        snapshot: tuple[tuple[str, ...], bool, tuple[Any, ...]] | None = None,
+    ) -> None:
+        # 只缓存成功结果：失败可能是瞬时的（权限、竞争写入等）
+        if not self.enabled or not result.ok:
+            return
+        try:
+            nbytes = len(json.dumps(result.payload, ensure_ascii=False, default=str).encode("utf-8"))
+        except Exception:
+            return
+        if nbytes > self.max_bytes:
+            return
+        paths, tree, fingerprint = snapshot or self.snapshot(name, args)
+        key = self._key(name, args)
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = _Entry(result, paths, fingerprint, tree, self._epoch, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes and self._entries:
+                self._pop(next(iter(self._entries)))
+
+    def _pop(self, key: tuple[str, str]) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.nbytes
+
+    # ------------------------------------------------------------------
+    # 失效
+    # ------------------------------------------------------------------
+    def begin_turn(self) -> None:
+        """新一轮对话开始：目录树条目（grep/glob）与 list_dir 条目全部过期。"""
+        with self._lock:
+            self._epoch += 1
+
+    def invalidate(self, path: Any = None) -> None:
+        """
+        使缓存失效。
+
+        path 为 None 时清空全部（执行命令等无法确定影响范围的操作）；否则删除与该路径
+        相同、为其祖先目录或位于其下的条目。
+        """
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                self._bytes = 0
+                return
+            target = self._abs(path)
+            for key in [k for k, e in self._entries.items() if any(_overlaps(p, target) for p in e.paths)]:
+                self._pop(key)
+
+
+def _overlaps(a: str, b: str) -> bool:
+    if a == b:
+        return True
+    return b.startswith(a.rstrip(os.sep) + os.sep) or a.startswith(b.rstrip(os.sep) + os.sep)
@@ -272,7 +272,7 @@ def _h_display(loop: "AgentLoop", args: dict[str, Any]) -> ToolResult:
 
 
 def _h_internal_repo_map(loop: "AgentLoop", args: dict[str, Any]) -> ToolResult:
-    repo_map = loop.tools.generate_repo_map()
+    repo_map = loop.tools.generate_repo_map(max_tokens=loop._repo_map_budget())
     return ToolResult(ok=True, payload={"repo_map": repo_map})
 
 
@@ -303,6 +303,7 @@ def _spec_list_dir() -> ToolSpec:
         callable_by_model=True,
         exec_command_key=None,
         handler=_h_list_dir,
+        cacheable=True,
     )
 
 
@@ -332,6 +333,7 @@ def _spec_read_file() -> ToolSpec:
         callable_by_model=True,
         exec_command_key=None,
         handler=_h_read_file,
+        cacheable=True,
     )
 
 
@@ -360,6 +362,7 @@ def _spec_glob_file_search() -> ToolSpec:
         callable_by_model=True,
         exec_command_key=None,
         handler=_h_glob_file_search,
+        cacheable=True,
     )
 
 
@@ -407,6 +410,7 @@ def _spec_grep() -> ToolSpec:
         callable_by_model=True,
         exec_command_key=None,
         handler=_h_grep,
+        cacheable=True,
     )
 
 
@@ -610,8 +614,8 @@ def _spec_internal_repo_map() -> ToolSpec:
         args_schema=_obj_schema(properties={}, required=[]),
         example_args={},
         side_effects={"read"},
-        external_bins_required={"ctags"},
-        external_bins_optional=set(),
+        external_bins_required=set(),
+        external_bins_optional={"ctags"},
         visible_in_prompt=False,
         callable_by_model=False,
         exec_command_key=None,
@@ -1248,6 +1252,17 @@ def iter_tool_specs() -> Iterable[ToolSpec]:
 # 注册表驱动（业界版）：同一份注册表 = tool dispatch + tool prompt/help 的来源
 TOOL_REGISTRY: dict[str, ToolSpec] = {s.name: s for s in iter_tool_specs()}
 
+# 虽然只读，但需要与用户交互的工具（不能并发执行，否则多个提问会互相抢占终端）
+_INTERACTIVE_TOOLS = {"question"}
+
+
+def is_read_only_tool(name: str) -> bool:
+    """无副作用（side_effects ⊆ {"read"}）且无需用户交互的已注册工具：可以安全地并发执行。"""
+    spec = TOOL_REGISTRY.get(name)
+    if spec is None or name in _INTERACTIVE_TOOLS or spec.requires_confirmation:
+        return False
+    return spec.side_effects <= {"read"}
+
 # 新增：集成工具注册表管理器
 def get_tool_registry():
     """获取工具注册表管理器"""
@@ -1303,7 +1318,10 @@ def dispatch_tool(loop: "AgentLoop", name: str, args: dict[str, Any]) -> ToolRes
             return ToolResult(ok=False, error={"code": "E_INVALID_ARGS", "message": f"参数校验失败: {validated_or_msg}"})
         
         # 校验通过，执行处理器（使用校验/转换后的参数，例如 "1" -> 1）
-        return spec.handler(loop, validated_or_msg)  # type: ignore
+        cache = getattr(loop, "tool_cache", None)
+        if cache is None or not cache.enabled:
+            return spec.handler(loop, validated_or_msg)  # type: ignore
+        return _dispatch_with_cache(loop, cache, spec, validated_or_msg)  # type: ignore
 
     except KeyError as e:
         logger.error(f"[red]✗ 参数缺失: {e}[/red]", exc_info=True)
@@ -1313,6 +1331,29 @@ def dispatch_tool(loop: "AgentLoop", name: str, args: dict[str, Any]) -> ToolRes
         return ToolResult(ok=False, error={"code": "E_TOOL", "message": str(e)})
 
 
+def _dispatch_with_cache(loop: "AgentLoop", cache: Any, spec: ToolSpec, args: dict[str, Any]) -> ToolResult:
+    """
+    带结果缓存的分发：
+    - cacheable 且无副作用（仅 read）的工具先查缓存；
+    - 写文件类工具按 path 失效，执行命令等无法确定影响范围的工具清空缓存。
+    """
+    usage = getattr(loop, "usage", None)
+    if spec.cacheable and spec.side_effects <= {"read"}:
+        hit = cache.get(spec.name, args)
+        if usage is not None:
+            usage.record_tool_cache(name=spec.name, hit=hit is not None)
+        if hit is not None:
+            logger.debug(f"工具结果缓存命中: {spec.name}")
+            return hit
+        snap = cache.snapshot(spec.name, args)
+        result = spec.handler(loop, args)
+        cache.put(spec.name, args, result, snap)
+        return result
 
-
-
+    try:
+        return spec.handler(loop, args)
+    finally:
+        if "exec" in spec.side_effects:
+            cache.invalidate()
+        elif "write" in spec.side_effects:
+            cache.invalidate(args.get("path"))
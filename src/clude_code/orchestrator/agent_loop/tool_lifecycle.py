@@ -1,10 +1,12 @@
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Any, Callable, TYPE_CHECKING
 
 from clude_code.policy.command_policy import evaluate_command
 from clude_code.tooling.local_tools import ToolResult
-from .tool_dispatch import TOOL_REGISTRY
+from .tool_dispatch import TOOL_REGISTRY, is_read_only_tool
 
 if TYPE_CHECKING:
     from .agent_loop import AgentLoop
@@ -143,3 +145,41 @@ def run_tool_lifecycle(
     return result
 
 
+def run_tool_batch(
+    loop: "AgentLoop",
+    calls: list[dict[str, Any]],
+    trace_id: str,
+    confirm: Callable[[str], bool],
+    _ev: Callable[[str, dict[str, Any]], None],
+    *,
+    max_workers: int = 4,
+) -> list[ToolResult]:
+    """
+    批量工具调用的执行：按原顺序切段——连续的只读调用在有界线程池中并发执行，
+    有副作用的调用单独串行执行（作为屏障，写/执行与前后调用的相对顺序不变）。
+    每个调用仍走完整生命周期（loop._run_tool_lifecycle），结果按调用顺序返回。
+    """
+    ev_lock = threading.Lock()
+
+    def ev(event: str, data: dict[str, Any]) -> None:
+        with ev_lock:
+            _ev(event, data)
+
+    def _run(call: dict[str, Any]) -> ToolResult:
+        return loop._run_tool_lifecycle(call["tool"], call["args"], trace_id, confirm, ev)
+
+    results: list[ToolResult] = []
+    i = 0
+    while i < len(calls):
+        j = i
+        while j < len(calls) and is_read_only_tool(calls[j]["tool"]):
+            j += 1
+        if j - i >= 2 and max_workers > 1:
+            with ThreadPoolExecutor(max_workers=min(max_workers, j - i), thread_name_prefix="tool-batch") as pool:
+                results.extend(pool.map(_run, calls[i:j]))
+            i = j
+        else:
+            results.append(_run(calls[i]))
+            i += 1
+    return results
+
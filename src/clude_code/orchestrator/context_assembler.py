@@ -0,0 +1,237 @@
+"""
+按 token 预算组装上下文（Context Assembler）
+
+以模型真实的上下文窗口（服务端 n_ctx 或 llm.context_window）为总预算，只用 context_budget.TokenBudget
+预留输出空间（不按 SYSTEM/TOOLS/CONTEXT 等类别比例切分），再把消息装进剩余容量：
+- system 消息（系统提示词 + 工具说明 + Repo Map）必选，按实际大小扣除，历史只用剩下的容量；
+- 历史先切成不可拆分的单元：工具调用与其结果回喂、用户提问与不含工具调用的回答各为一个单元，
+  其余消息单独成元；选择只以单元为粒度，不会留下没有结果的调用或没有调用的结果；
+- 覆盖最近 min_recent 条消息的单元（当前请求与最新一次工具往返）必选，放不下时按比例截断；
+- 其余单元做 0/1 背包选择：价值 = Σ 类别权重 × 新近度，重量 = token 数；
+  容量按固定粒度量化，复杂度 O(单元数 × 粒度数)，与窗口大小无关。
+选中的单元保持原有顺序；相邻单元角色重复时丢弃较旧的可选单元，保证 user/assistant 交替、
+prefill 大小可预测、不再超出上下文。
+"""
+
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass, field
+from typing import Any, List, Optional
+
+from clude_code.llm.llama_cpp_http import ChatMessage
+from clude_code.llm.tokenizer import TokenCounter, get_token_counter
+
+from .context_budget import TokenBudget
+
+# 类别权重：对话 > 工具结果（旧工具结果通常已被后续推理消化）
+_KIND_VALUE = {"user": 1.0, "assistant": 0.8, "tool_result": 0.5}
+# 新近度衰减：每往前 1 条消息价值乘以该系数
+_RECENCY_DECAY = 0.9
+# 背包容量量化粒度
+_KNAPSACK_BUCKETS = 512
+# 输出预留占窗口的上限（llm.max_tokens 常被配置得远大于窗口）
+_MAX_OUTPUT_SHARE = 0.25
+
+
+def message_kind(msg: ChatMessage) -> str:
+    """区分对话消息与工具结果回喂（format_feedback_message 产生的 JSON，以 user 角色回喂）。"""
+    if msg.role == "user" and (msg.content or "").startswith('{"tool":'):
+        return "tool_result"
+    return msg.role
+
+
+@dataclass
+class AssemblyStats:
+    context_window: int
+    available_tokens: int
+    system_tokens: int = 0
+    history_tokens: int = 0
+    kept: int = 0
+    dropped: int = 0
+    truncated: int = 0
+    by_kind: dict[str, int] = field(default_factory=dict)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "context_window": self.context_window,
+            "available_tokens": self.available_tokens,
+            "system_tokens": self.system_tokens,
+            "history_tokens": self.history_tokens,
+            "kept": self.kept,
+            "dropped": self.dropped,
+            "truncated": self.truncated,
+            "by_kind": dict(self.by_kind),
+        }
+
+
+class ContextAssembler:
+    """按窗口预算选择并截断消息。"""
+
+    def __init__(
+        self,
+        *,
+        context_window: int,
+        max_output_tokens: int,
+        counter: Optional[TokenCounter] = None,
+        min_recent: int = 4,
+    ) -> None:
+        reserved = min(int(max_output_tokens), int(context_window * _MAX_OUTPUT_SHARE))
+        self.budget = TokenBudget(total_tokens=int(context_window), reserved_output=max(0, reserved))
+        self.counter = counter or get_token_counter()
+        self.min_recent = max(1, int(min_recent))
+
+    @property
+    def available_tokens(self) -> int:
+        return self.budget.available_tokens
+
+    def fits(self, messages: List[ChatMessage]) -> bool:
+        return self.counter.count_messages(messages) <= self.available_tokens
+
+    def assemble(
+        self, messages: List[ChatMessage], *, max_messages: Optional[int] = None
+    ) -> tuple[List[ChatMessage], AssemblyStats]:
+        stats = AssemblyStats(context_window=self.budget.total_tokens, available_tokens=self.available_tokens)
+        if not messages:
+            return [], stats
+        head = [messages[0]] if messages[0].role == "system" else []
+        body = messages[len(head):]
+        stats.system_tokens = self.counter.count_messages(head)
+
+        # 历史容量：窗口扣除实际 system 占用，不能超过真实窗口（system 异常膨胀时历史只剩最近消息的截断版）
+        capacity = max(0, self.available_tokens - stats.system_tokens)
+        weights = [self.counter.count(m.content or "") for m in body]
+        kinds = [message_kind(m) for m in body]
+        units = _split_units(body, kinds)
+
+        # 覆盖最近 min_recent 条消息的单元必选
+        n_recent = 0
+        covered = 0
+        while n_recent < len(units) and covered < self.min_recent:
+            n_recent += 1
+            covered += len(units[-n_recent])
+        recent = units[len(units) - n_recent:]
+        out_body: dict[int, ChatMessage] = {}
+
+        # 1) 最近单元必选；超过容量时按比例截断（最新一条优先保留完整）
+        used = 0
+        for i in reversed([i for unit in recent for i in unit]):
+            room = capacity - used
+            if weights[i] <= room:
+                out_body[i] = body[i]
+                used += weights[i]
+            elif room > 32:
+                out_body[i] = ChatMessage(role=body[i].role, content=_truncate(body[i].content or "", weights[i], room))
+                used += room
+                stats.truncated += 1
+
+        # 2) 其余单元：0/1 背包（max_messages 只作为条数上限）
+        candidates = units[:len(units) - n_recent]
+        slots = None if max_messages is None else max(0, max_messages - len(out_body))
+        picked = self._knapsack(candidates, weights, kinds, capacity - used, slots)
+
+        # 3) 按原顺序拼接；相邻单元角色重复（如 user/user）时丢弃较旧的可选单元
+        chosen: list[tuple[list[int], bool]] = []
+        # 被挤掉部分消息的必选单元整体放弃（最新单元除外），不留下半个调用/结果对
+        tail = [u for u in recent[:-1] if all(i in out_body for i in u)]
+        tail += [[i for i in recent[-1] if i in out_body]] if recent else []
+        for unit, mandatory in [*((u, False) for u in picked), *((u, True) for u in tail if u)]:
+            while chosen and not chosen[-1][1] and body[chosen[-1][0][-1]].role == body[unit[0]].role:
+                chosen.pop()
+            chosen.append((unit, mandatory))
+        # 裁剪后的第一条非 system 消息应为 user（保持角色交替）
+        while len(chosen) > 1 and body[chosen[0][0][0]].role != "user":
+            chosen.pop(0)
+        kept = [out_body.get(i, body[i]) for unit, _mandatory in chosen for i in unit]
+        stats.kept = len(kept)
+        stats.dropped = len(body) - len(kept)
+        stats.history_tokens = self.counter.count_messages(kept)
+        for m in kept:
+            k = message_kind(m)
+            stats.by_kind[k] = stats.by_kind.get(k, 0) + 1
+        return head + kept, stats
+
+    @staticmethod
+    def _value(kind: str, age: int) -> float:
+        return _KIND_VALUE.get(kind, 0.5) * (_RECENCY_DECAY ** age)
+
+    def _knapsack(
+        self, candidates: List[List[int]], weights: List[int], kinds: List[str], capacity: int, slots: Optional[int]
+    ) -> List[List[int]]:
+        """在候选单元中选择总价值最大、总 token 不超过 capacity 的子集（按原顺序返回）。"""
+        if capacity <= 0 or not candidates or slots == 0:
+            return []
+        sizes_tok = [sum(weights[i] for i in unit) for unit in candidates]
+        if sum(sizes_tok) <= capacity and (slots is None or sum(map(len, candidates)) <= slots):
+            return list(candidates)
+        unit_tokens = max(1, math.ceil(capacity / _KNAPSACK_BUCKETS))
+        cap = capacity // unit_tokens
+        total = len(weights)
+        values = [sum(self._value(kinds[i], total - 1 - i) for i in unit) for unit in candidates]
+
+        # 0/1 背包：dp[c] 为容量 c 下的最大价值，take[k][c] 记录第 k 个候选是否选中（用于回溯）
+        dp = [0.0] * (cap + 1)
+        take: list[bytearray] = []
+        sizes: list[int] = []
+        for k in range(len(candidates)):
+            w = math.ceil(sizes_tok[k] / unit_tokens)
+            row = bytearray(cap + 1)
+            v = values[k]
+            for c in range(cap, w - 1, -1):
+                cand = dp[c - w] + v
+                if cand > dp[c]:
+                    dp[c] = cand
+                    row[c] = 1
+            take.append(row)
+            sizes.append(w)
+        picked: list[int] = []
+        c = cap
+        for k in range(len(candidates) - 1, -1, -1):
+            if take[k][c]:
+                picked.append(k)
+                c -= sizes[k]
+        if slots is not None and sum(len(candidates[k]) for k in picked) > slots:
+            limited: list[int] = []
+            count = 0
+            for k in sorted(picked, key=lambda k: values[k], reverse=True):
+                if count + len(candidates[k]) <= slots:
+                    limited.append(k)
+                    count += len(candidates[k])
+            picked = limited
+        return [candidates[k] for k in sorted(picked)]
+
+
+def _split_units(body: List[ChatMessage], kinds: List[str]) -> List[List[int]]:
+    """
+    把历史切成不可拆分的单元（消息下标列表）：
+    assistant 工具调用 + 紧随的工具结果回喂；用户提问 + 不含工具调用的回答；其余消息单独成元。
+    """
+    units: list[list[int]] = []
+    i, n = 0, len(body)
+    while i < n:
+        if body[i].role == "assistant" and i + 1 < n and kinds[i + 1] == "tool_result":
+            j = i + 1
+            while j + 1 < n and kinds[j + 1] == "tool_result":
+                j += 1
+            units.append(list(range(i, j + 1)))
+            i = j + 1
+        elif (
+            kinds[i] == "user" and i + 1 < n and body[i + 1].role == "assistant"
+            and not (i + 2 < n and kinds[i + 2] == "tool_result")
+        ):
+            units.append([i, i + 1])
+            i += 2
+        else:
+            units.append([i])
+            i += 1
+    return units
+
+
+def _truncate(text: str, tokens: int, budget: int) -> str:
+    """按 token 比例保留开头与结尾（工具结果的结论常在末尾），中间替换为省略标记。"""
+    if tokens <= budget or not text:
+        return text
+    keep = max(0, int(len(text) * (budget - 16) / tokens))
+    head = keep * 2 // 3
+    tail = keep - head
+    return f"{text[:head]}\n...[已截断约 {tokens - budget} tokens]...\n{text[len(text) - tail:] if tail else ''}"
@@ -7,6 +7,8 @@ from dataclasses import dataclass
 from enum import Enum
 import math
 
+from clude_code.llm.tokenizer import get_token_counter
+
 
 class BudgetCategory(Enum):
     """预算类别"""
@@ -259,23 +261,10 @@ class ContextCompressor:
         return base_priority
 
     def _estimate_tokens(self, content: str) -> int:
-        """估算内容的token数"""
+        """估算内容的token数（统一分词服务，按内容哈希缓存）"""
         if not content:
             return 0
-
-        # 简单估算：英文约1 token/单词，中文约1.5 token/字符
-        # 这里使用一个简化的估算方法
-        char_count = len(content)
-        word_count = len(content.split())
-
-        # 假设平均每个单词4个字符，中文字符按1.5倍计算
-        english_chars = word_count * 4
-        chinese_chars = char_count - english_chars
-
-        english_tokens = word_count
-        chinese_tokens = chinese_chars * 1.5
-
-        return int(english_tokens + chinese_tokens)
+        return get_token_counter().count(content)
 
     def _reset_stats(self):
         """重置统计信息"""
@@ -0,0 +1,297 @@
+"""
+对话历史后台压缩（History Compactor）
+
+长会话中逐步截断会不断丢失信息，并且每一步都要重新裁剪。这里改为分段摘要：
+- 分段：system 与最近 keep_recent 条消息之外的历史，按“用户请求”切成轮次段（过长的段再按条数切分）；
+- 摘要：后台线程调用本地模型生成要点摘要；模型不可用/失败时使用抽取式摘要（每条消息的首行、
+  工具名/路径/错误等关键字段）；
+- 缓存：以段内消息的内容哈希为键，同一段只摘要一次；
+- 替换：在主线程裁剪时调用 apply()，把仍原样存在的、已摘要的最旧连续段替换为一对摘要消息
+  （user 摘要 + assistant 确认，保持角色交替，规范化时不会与下一轮用户请求合并），
+  一次性构造新列表后整体赋值（原子替换，不会出现半替换状态）；
+- 生命周期：后台线程是守护线程，close()（atexit 注册）取消排队中的摘要，进程退出不等待模型请求。
+"""
+
+from __future__ import annotations
+
+import atexit
+import hashlib
+import json
+import queue
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional
+
+from clude_code.llm.llama_cpp_http import ChatMessage
+from clude_code.llm.tokenizer import TokenCounter, get_token_counter
+
+from .context_assembler import message_kind
+
+SUMMARY_PREFIX = "[历史摘要]"
+# 摘要之后的 assistant 确认消息：让摘要（user）与下一轮用户请求之间保持角色交替
+SUMMARY_ACK = f"{SUMMARY_PREFIX} 已了解以上历史要点，继续当前对话。"
+# 单段最多消息数（一轮内工具往返很多时再切分）
+_MAX_SEGMENT_MESSAGES = 12
+# 送给模型摘要的单条消息最大字符数（工具结果常很长，摘要只需要要点）
+_MAX_INPUT_CHARS_PER_MESSAGE = 1500
+_CACHE_SIZE = 512
+# 合并后的摘要消息最多保留约多少段的长度
+_MAX_SUMMARY_SEGMENTS = 4
+
+
+def is_summary(msg: ChatMessage) -> bool:
+    return (msg.content or "").startswith(SUMMARY_PREFIX)
+
+
+def segment_key(msgs: List[ChatMessage]) -> str:
+    h = hashlib.sha256()
+    for m in msgs:
+        h.update(m.role.encode())
+        h.update(b"\x00")
+        h.update((m.content or "").encode("utf-8", "surrogatepass"))
+        h.update(b"\x01")
+    return h.hexdigest()
+
+
+def _tool_result_line(line: str) -> str:
+    try:
+        obj = json.loads(line)
+    except Exception:
+        obj = {}
+    if not isinstance(obj, dict):
+        obj = {}
+    parts = [f"工具 {obj.get('tool', '?')}", "成功" if obj.get("ok") else f"失败: {str(obj.get('error'))[:120]}"]
+    for k in ("path", "file", "pattern", "command", "cmd"):
+        if obj.get(k):
+            parts.append(f"{k}={str(obj[k])[:80]}")
+    return "- " + "，".join(parts)
+
+
+def _tool_call_line(call: Any) -> str:
+    if not isinstance(call, dict):
+        return "- 助手调用 ?()"
+    args = call.get("args") or {}
+    brief = ", ".join(f"{k}={str(v)[:60]}" for k, v in list(args.items())[:3]) if isinstance(args, dict) else ""
+    return f"- 助手调用 {call.get('tool', '?')}({brief})"
+
+
+def extractive_summary(msgs: List[ChatMessage], max_chars: int = 800) -> str:
+    """离线兜底：每条消息保留首行/关键字段，不依赖模型。"""
+    lines: List[str] = []
+    for m in msgs:
+        kind = message_kind(m)
+        text = (m.content or "").strip()
+        if kind == "tool_result":
+            # 批量调用的结果是一条消息、每个调用一行 JSON
+            lines.extend(_tool_result_line(ln) for ln in text.splitlines() if ln.strip())
+            continue
+        if kind == "assistant" and text.startswith("{"):
+            try:
+                call = json.loads(text)
+            except Exception:
+                call = None
+            if isinstance(call, dict):
+                batch = call.get("tool_calls")
+                lines.extend(_tool_call_line(c) for c in (batch if isinstance(batch, list) else [call]))
+                continue
+        first = text.splitlines()[0] if text else ""
+        who = "用户" if kind == "user" else ("摘要" if is_summary(m) else "助手")
+        lines.append(f"- {who}: {first[:200]}")
+    out = "\n".join(lines)
+    return out if len(out) <= max_chars else out[: max_chars - 3] + "..."
+
+
+class HistoryCompactor:
+    """分段摘要 + 按内容哈希缓存 + 后台生成 + 主线程原子替换。"""
+
+    def __init__(
+        self,
+        *,
+        summarize: Optional[Callable[[str], str]] = None,
+        counter: Optional[TokenCounter] = None,
+        keep_recent: int = 8,
+        max_summary_chars: int = 800,
+        logger: Any = None,
+    ) -> None:
+        self.summarize = summarize
+        self.counter = counter or get_token_counter()
+        self.keep_recent = max(2, int(keep_recent))
+        self.max_summary_chars = max_summary_chars
+        self.logger = logger
+        self._summaries: OrderedDict[str, str] = OrderedDict()
+        self._pending: dict[str, Future] = {}
+        self._lock = threading.Lock()
+        # 单个守护工作线程（按需启动）：线程池的工作线程不是守护线程，解释器退出会等排队的模型请求全部跑完
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._closed = False
+        _register_close(self)
+        self.stats = {"scheduled": 0, "llm": 0, "extractive": 0, "applied_segments": 0, "saved_tokens": 0}
+
+    # ------------------------------------------------------------------
+    # 分段
+    # ------------------------------------------------------------------
+    def segments(self, messages: List[ChatMessage]) -> List[tuple[int, int]]:
+        """可压缩的段（[start, end) 下标，基于完整消息列表）：跳过 system、已有摘要与最近消息。"""
+        start = 1 if messages and messages[0].role == "system" else 0
+        # 跳过已有的摘要 + 确认消息对
+        while start < len(messages) and is_summary(messages[start]):
+            start += 1
+        end = len(messages) - self.keep_recent
+        out: List[tuple[int, int]] = []
+        seg_start = start
+        # i == end 时只用来判断最后一段是否已闭合（messages[end] 是新一轮的开始）
+        for i in range(start + 1, max(start, end) + 1):
+            new_turn = messages[i].role == "user" and message_kind(messages[i]) == "user"
+            if new_turn or i - seg_start >= _MAX_SEGMENT_MESSAGES:
+                out.append((seg_start, i))
+                seg_start = i
+        # 末尾未闭合的段（下一轮尚未在 end 之前开始）暂不压缩，等它完整后再摘要
+        return out
+
+    # ------------------------------------------------------------------
+    # 后台摘要
+    # ------------------------------------------------------------------
+    def schedule(self, messages: List[ChatMessage]) -> int:
+        """为尚未摘要的段提交后台任务，返回新提交数量（只读取消息，不修改）。"""
+        submitted = 0
+        for s, e in self.segments(messages):
+            seg = list(messages[s:e])
+            key = segment_key(seg)
+            with self._lock:
+                if self._closed or key in self._summaries or key in self._pending:
+                    continue
+                fut: Future = Future()
+                self._pending[key] = fut
+                self._ensure_worker()
+                self._queue.put((fut, key, seg))
+                self.stats["scheduled"] += 1
+            submitted += 1
+        return submitted
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="history-compactor", daemon=True)
+            self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            fut, key, seg = item
+            if not fut.set_running_or_notify_cancel():
+                continue
+            try:
+                self._summarize_segment(key, seg)
+                fut.set_result(None)
+            except BaseException as e:
+                with self._lock:
+                    self._pending.pop(key, None)
+                fut.set_exception(e)
+
+    def _summarize_segment(self, key: str, seg: List[ChatMessage]) -> None:
+        text = ""
+        if self.summarize is not None:
+            transcript = "\n\n".join(
+                f"[{message_kind(m)}] {(m.content or '')[:_MAX_INPUT_CHARS_PER_MESSAGE]}" for m in seg
+            )
+            try:
+                text = (self.summarize(transcript) or "").strip()[: self.max_summary_chars]
+            except Exception as e:
+                if self.logger is not None:
+                    self.logger.debug(f"历史摘要调用模型失败，改用抽取式摘要: {e}")
+        source = "llm" if text else "extractive"
+        if not text:
+            text = extractive_summary(seg, self.max_summary_chars)
+        with self._lock:
+            self._summaries[key] = text
+            while len(self._summaries) > _CACHE_SIZE:
+                self._summaries.popitem(last=False)
+            self._pending.pop(key, None)
+            self.stats[source] += 1
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        """等待当前所有后台摘要完成（测试/退出时使用）。"""
+        with self._lock:
+            futures = list(self._pending.values())
+        for f in futures:
+            f.result(timeout=timeout)
+
+    # ------------------------------------------------------------------
+    # 替换
+    # ------------------------------------------------------------------
+    def apply(self, messages: List[ChatMessage]) -> Optional[List[ChatMessage]]:
+        """
+        用已就绪的摘要替换最旧的连续段，返回新的消息列表；没有可替换的段时返回 None。
+
+        只替换从第一个可压缩段开始、连续已摘要的段（保持时间顺序），多段摘要合并为一条消息。
+        """
+        segs = self.segments(messages)
+        if not segs:
+            return None
+        ready: List[str] = []
+        last_end = segs[0][0]
+        with self._lock:
+            for s, e in segs:
+                summary = self._summaries.get(segment_key(messages[s:e]))
+                if summary is None:
+                    break
+                ready.append(summary)
+                last_end = e
+        if not ready:
+            return None
+        first = segs[0][0]
+        prev = [m for m in messages[:first] if is_summary(m) and m.role == "user"]
+        head = [m for m in messages[:first] if not is_summary(m)]
+        merged = "\n".join([(m.content or "")[len(SUMMARY_PREFIX):].strip() for m in prev] + ready)
+        # 摘要本身也有上限：超出时丢弃最旧的要点，保证长会话的 prompt 大小有界
+        limit = self.max_summary_chars * _MAX_SUMMARY_SEGMENTS
+        if len(merged) > limit:
+            merged = "..." + merged[len(merged) - limit:]
+        summary_pair = [
+            ChatMessage(role="user", content=f"{SUMMARY_PREFIX}\n{merged}"),
+            ChatMessage(role="assistant", content=SUMMARY_ACK),
+        ]
+        new_messages = head + summary_pair + list(messages[last_end:])
+        saved = self.counter.count_messages(messages) - self.counter.count_messages(new_messages)
+        with self._lock:
+            self.stats["applied_segments"] += len(ready)
+            self.stats["saved_tokens"] += max(0, saved)
+        return new_messages
+
+    def close(self) -> None:
+        """取消排队中的摘要并停止工作线程（正在进行的模型请求不等待，守护线程随进程退出）。"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    fut, key, _ = item
+                    fut.cancel()
+                    self._pending.pop(key, None)
+            self._queue.put(None)
+
+
+_LIVE: "weakref.WeakSet[HistoryCompactor]" = weakref.WeakSet()
+_ATEXIT_REGISTERED = False
+
+
+def _register_close(compactor: HistoryCompactor) -> None:
+    global _ATEXIT_REGISTERED
+    if not _ATEXIT_REGISTERED:
+        atexit.register(_close_all)
+        _ATEXIT_REGISTERED = True
+    _LIVE.add(compactor)
+
+
+def _close_all() -> None:
+    for c in list(_LIVE):
+        c.close()
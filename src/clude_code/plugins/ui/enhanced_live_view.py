@@ -19,6 +19,7 @@ from rich.layout import Layout
 from rich.align import Align
 
 from clude_code.core.async_manager import TaskProgress, TaskStatus
+from clude_code.observability.message_store import resolve_messages
 
 
 class TaskType(Enum):
@@ -269,6 +270,12 @@ class EnhancedLiveDisplay:
         event_data = event.get("data", {}) or {}
         self.last_event = event_type
 
+        # 流式增量：只刷新 LLM 输出预览，不进入事件轨迹（避免刷屏）
+        if event_type == "llm_token":
+            prev = str(self.last_llm_resp.get("text_preview", "")) if self.last_llm_resp.get("streaming") else ""
+            self.last_llm_resp = {"text_preview": (prev + str(event_data.get("delta", "")))[-240:], "streaming": True}
+            return
+
         # 记录事件历史（更像 Claude Code 的“事件轨迹”）
         self.last_events.append(f"{event_type}: {str(event_data)[:200]}")
 
@@ -413,7 +420,7 @@ class EnhancedLiveDisplay:
             self._push_line(f"[bold cyan]→ 请求 LLM（消息数={msg_n}，阶段={stage}）[/bold cyan]")
             self._push_line(f"[dim cyan]  model={model} api={api_mode}[/dim cyan]")
             # 显示完整的 messages 内容（系统提示词 + 用户提示词）
-            messages = event_data.get("messages") or []
+            messages = resolve_messages(event_data)
             for i, msg in enumerate(messages):
                 role = str(msg.get("role") or "unknown")
                 content = str(msg.get("content") or "")
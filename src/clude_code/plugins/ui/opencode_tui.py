@@ -25,6 +25,8 @@ from rich.table import Table
 from rich.syntax import Syntax
 from collections import deque
 
+from clude_code.observability.message_store import resolve_messages
+
 
 def run_opencode_tui(
     *,
@@ -126,6 +128,7 @@ def run_opencode_tui(
             # 对话窗格风格：log = 复刻 chat 默认“执行日志流”；block = 结构化块
             self._conversation_mode: str = "log"
             self._llm_round: int = 0
+            self._stream_buf: str = ""  # llm_token 增量中尚未换行的部分
             self._last_trace_id: str | None = None
             self._last_user_text: str | None = None
             self._plan_title: str | None = None
@@ -485,6 +488,15 @@ def run_opencode_tui(
                 except Exception:
                     pass
 
+        def _on_llm_token(self, delta: str) -> None:
+            """流式输出：缓冲到换行再写一行（RichLog 不支持原地更新行）。"""
+            if self._conversation_mode != "log":
+                return
+            self._stream_buf += delta
+            while "\n" in self._stream_buf:
+                line, self._stream_buf = self._stream_buf.split("\n", 1)
+                self._push_chat_log(f"  ┊ {line}", style="dim blue")
+
         def _push_chat_log(self, text: str, *, style: str = "white") -> None:
             """在对话窗格输出“chat 默认日志流”的一行。"""
             t = (text or "").rstrip()
@@ -1220,6 +1232,13 @@ def run_opencode_tui(
             if isinstance(trace_id, str) and trace_id:
                 self._last_trace_id = trace_id
 
+            # 流式增量：按整行写入对话窗格，不写事件窗格（避免刷屏）
+            if et == "llm_token":
+                self._on_llm_token(str(data.get("delta") or ""))
+                return
+            if et == "llm_response_data" and self._stream_buf:
+                self._on_llm_token("\n")
+
             conversation = self.query_one("#conversation", _Log)
             ops = self.query_one("#ops", _Log)
 
@@ -1300,7 +1319,7 @@ def run_opencode_tui(
                         style="dim cyan",
                     )
                     # 显示完整的 messages 内容（系统提示词 + 用户提示词）
-                    messages = data.get("messages") or []
+                    messages = resolve_messages(data)
                     for i, msg in enumerate(messages):
                         role = str(msg.get("role") or "unknown")
                         content = str(msg.get("content") or "")
@@ -6,6 +6,7 @@ from .types import ToolError, ToolResult
 from .workspace import resolve_in_workspace as _resolve_in_workspace
 from .tools.glob_search import glob_file_search as _glob_file_search_impl
 from .tools.grep import grep as _grep_impl
+from .tools.grep_index import mark_grep_index_stale as _mark_grep_index_stale
 from .tools.list_dir import list_dir as _list_dir_impl
 from .tools.patching import apply_patch as _apply_patch_impl
 from .tools.patching import undo_patch as _undo_patch_impl
@@ -41,7 +42,9 @@ class LocalTools:
         )
 
     def write_file(self, path: str, text: str, content_based: bool = False, insert_at_line: int | None = None) -> ToolResult:
-        return _write_file_impl(workspace_root=self.workspace_root, path=path, text=text, content_based=content_based, insert_at_line=insert_at_line)
+        tr = _write_file_impl(workspace_root=self.workspace_root, path=path, text=text, content_based=content_based, insert_at_line=insert_at_line)
+        _mark_grep_index_stale(self.workspace_root, path)
+        return tr
 
     def apply_patch(
         self,
@@ -52,7 +55,7 @@ class LocalTools:
         fuzzy: bool = False,
         min_similarity: float = 0.92,
     ) -> ToolResult:
-        return _apply_patch_impl(
+        tr = _apply_patch_impl(
             workspace_root=self.workspace_root,
             path=path,
             old=old,
@@ -61,9 +64,13 @@ class LocalTools:
             fuzzy=fuzzy,
             min_similarity=min_similarity,
         )
+        _mark_grep_index_stale(self.workspace_root, path)
+        return tr
 
     def undo_patch(self, undo_id: str, force: bool = False) -> ToolResult:
-        return _undo_patch_impl(workspace_root=self.workspace_root, undo_id=undo_id, force=force)
+        tr = _undo_patch_impl(workspace_root=self.workspace_root, undo_id=undo_id, force=force)
+        _mark_grep_index_stale(self.workspace_root)
+        return tr
 
     def glob_file_search(self, glob_pattern: str, target_directory: str = ".") -> ToolResult:
         return _glob_file_search_impl(workspace_root=self.workspace_root, glob_pattern=glob_pattern, target_directory=target_directory)
@@ -89,17 +96,21 @@ class LocalTools:
     def grep(self, pattern: str, path: str = ".", language: str = "all", include_glob: str | None = None, ignore_case: bool = False, max_hits: int = 200) -> ToolResult:
         return _grep_impl(workspace_root=self.workspace_root, pattern=pattern, path=path, language=language, include_glob=include_glob, ignore_case=ignore_case, max_hits=max_hits)
 
-    def generate_repo_map(self) -> str:
-        return _generate_repo_map_impl(workspace_root=self.workspace_root)
+    def generate_repo_map(self, max_tokens: int | None = None, focus_text: str | None = None, refresh: bool = True) -> str:
+        return _generate_repo_map_impl(
+            workspace_root=self.workspace_root, max_tokens=max_tokens, focus_text=focus_text, refresh=refresh
+        )
 
     def run_cmd(self, command: str, cwd: str = ".", timeout_s: int | None = None) -> ToolResult:
-        return _run_cmd_impl(
+        tr = _run_cmd_impl(
             workspace_root=self.workspace_root,
             max_output_bytes=self.max_output_bytes,
             command=command,
             cwd=cwd,
             timeout_s=timeout_s,
         )
+        _mark_grep_index_stale(self.workspace_root)
+        return tr
 
     def ask_question(self, question: str, options: list[str] | None = None, multiple: bool = False, header: str | None = None) -> ToolResult:
         return _ask_question_impl(question=question, options=options, multiple=multiple, header=header)
@@ -30,6 +30,7 @@ from ..types import ToolResult
 from ..workspace import resolve_in_workspace
 from ..logger_helper import get_tool_logger
 from ...config.tools_config import get_search_config
+from .grep_index import get_grep_index, index_available
 
 # 工具模块 logger（延迟初始化）
 _logger = get_tool_logger(__name__)
@@ -87,16 +88,26 @@ def grep(*, workspace_root: Path, pattern: str, path: str = ".", language: str =
         return ToolResult(False, error={"code": "E_TOOL_DISABLED", "message": "search tool is disabled"})
 
     _logger.debug(f"[Grep] 开始搜索: pattern={pattern}, path={path}, language={language}, include_glob={include_glob}, ignore_case={ignore_case}, max_hits={max_hits}")
-    if shutil.which("rg"):
+    kwargs = dict(workspace_root=workspace_root, pattern=pattern, path=path, language=language, include_glob=include_glob, ignore_case=ignore_case, max_hits=max_hits, cfg=config)
+    engine = str(getattr(config, "grep_engine", "auto") or "auto").lower()
+    if engine in ("auto", "rg") and shutil.which("rg"):
         _logger.debug("[Grep] 使用 ripgrep (rg)")
-        tr = _rg_grep(workspace_root=workspace_root, pattern=pattern, path=path, language=language, include_glob=include_glob, ignore_case=ignore_case, max_hits=max_hits, cfg=config)
+        tr = _rg_grep(**kwargs)
         if tr.ok:
             _logger.info(f"[Grep] ripgrep 搜索成功: 找到 {len(tr.payload.get('matches', [])) if tr.payload else 0} 个匹配")
             return tr
         _logger.warning("[Grep] ripgrep 搜索失败，回退到 Python 扫描")
+        return _python_grep(**kwargs)
+    # 三元组索引会在 .clude/grep_index 落盘并启动变更监听，只在显式配置 index 时使用
+    if engine == "index" and index_available():
+        _logger.debug("[Grep] 使用三元组索引")
+        try:
+            return _index_grep(**kwargs)
+        except Exception as e:
+            _logger.warning(f"[Grep] 三元组索引搜索失败，回退到 Python 扫描: {e}", exc_info=True)
     else:
-        _logger.debug("[Grep] ripgrep 不可用，使用 Python 扫描")
-    return _python_grep(workspace_root=workspace_root, pattern=pattern, path=path, language=language, include_glob=include_glob, ignore_case=ignore_case, max_hits=max_hits, cfg=config)
+        _logger.debug("[Grep] ripgrep/索引不可用或未启用，使用 Python 扫描")
+    return _python_grep(**kwargs)
 
 
 def old_rg_grep(*, workspace_root: Path, pattern: str, path: str, language: str, include_glob: str | None, ignore_case: bool, max_hits: int) -> ToolResult:
@@ -348,3 +359,55 @@ def _python_grep(*, workspace_root: Path, pattern: str, path: str, language: str
     return ToolResult(True, payload={"pattern": pattern, "engine": "python", "hits": hits, "truncated": False})
 
 
+def _index_grep(*, workspace_root: Path, pattern: str, path: str, language: str, include_glob: str | None, ignore_case: bool, max_hits: int, cfg: Any) -> ToolResult:
+    """
+    三元组索引引擎：先用正则中的必需字面量在索引里求候选文件，再逐行跑正则确认。
+    过滤条件与 Python 扫描一致；二进制文件与超过 grep_python_max_file_bytes 的文件不在索引中。
+    """
+    root = resolve_in_workspace(workspace_root, path)
+    if not root.exists():
+        return ToolResult(False, error={"code": "E_NOT_FOUND", "message": f"path not found: {path}"})
+    flags = re.IGNORECASE if ignore_case else 0
+    try:
+        rx = re.compile(pattern, flags)
+    except re.error as e:
+        return ToolResult(False, error={"code": "E_INVALID_REGEX", "message": str(e)})
+
+    lang_map = _get_lang_exts(cfg)
+    target_exts = set(lang_map.get(language, [])) if language != "all" else None
+    ignore_dirs = _get_ignore_dirs(cfg)
+    ws = workspace_root.resolve()
+
+    idx = get_grep_index(
+        ws,
+        ignore_dirs=ignore_dirs,
+        max_file_bytes=_get_python_max_file_bytes(cfg),
+        watch_mode=str(getattr(cfg, "grep_index_watch_mode", "auto") or "auto"),
+    )
+    idx.refresh()
+    candidates = idx.candidates(pattern, ignore_case)
+    files = candidates if candidates is not None else idx.indexed_files()
+
+    rel_root = root.resolve().relative_to(ws).as_posix()
+    prefix = "" if rel_root == "." else rel_root + "/"
+    hits: list[dict[str, Any]] = []
+    for rel in files:
+        if prefix and rel != rel_root and not rel.startswith(prefix):
+            continue
+        name = rel.rsplit("/", 1)[-1]
+        if target_exts is not None and Path(name).suffix.lower() not in target_exts:
+            continue
+        if include_glob and not fnmatch.fnmatch(name, include_glob):
+            continue
+        try:
+            content = (ws / rel).read_text(encoding="utf-8", errors="ignore")
+        except OSError:
+            continue
+        for i, line in enumerate(content.splitlines(), start=1):
+            if rx.search(line):
+                hits.append({"path": rel, "line": i, "preview": line})
+                if len(hits) >= max_hits:
+                    return ToolResult(True, payload={"pattern": pattern, "engine": "index", "hits": hits, "truncated": True})
+
+    _logger.debug(f"[Grep] 索引候选文件: {len(files)}（收窄={'是' if candidates is not None else '否'}）")
+    return ToolResult(True, payload={"pattern": pattern, "engine": "index", "hits": hits, "truncated": False})
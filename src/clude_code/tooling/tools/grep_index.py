@@ -0,0 +1,471 @@
+"""
+grep 三元组索引（Trigram Index）
+
+在 `.clude/grep_index/` 下维护大小写折叠后的字节三元组倒排索引，grep 先用正则中必须出现的字面量
+求候选文件，再只对候选文件跑正则：
+- 索引由若干不可变段（segment）组成：`seg_N.keys.npy`（有序三元组）/ `seg_N.offs.npy` / `seg_N.docs.npy`
+  + `seg_N.paths.json`，查询时以 mmap 方式加载，`searchsorted` 定位倒排表；
+- `manifest.json` 记录每个文件的 mtime 与所在段：文件变化时只为变化的文件写一个新段（旧段中的条目自然失效），
+  段过多或失效条目过半时整体重建；
+- 只索引文本文件（含 NUL 字节的二进制与超过上限的大文件跳过，与 rg 默认行为一致）；
+- 首次查询做一次全量 mtime 扫描，之后只同步变更源（inotify/轮询）报告的路径与 `mark_stale(rel)` 标记的路径；
+  `mark_stale()`（如执行命令后）或变更源溢出时才再做全量扫描。
+
+需要 numpy（可选依赖）；缺失时 `index_available()` 为 False，grep 回退到 Python 扫描。
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None  # type: ignore
+
+try:
+    import re._parser as _sre_parse  # Python 3.11+
+    from re._constants import (
+        BRANCH,
+        LITERAL,
+        MAX_REPEAT,
+        MIN_REPEAT,
+        SRE_FLAG_IGNORECASE,
+        SUBPATTERN,
+    )
+except ImportError:  # pragma: no cover - Python 3.10
+    import sre_parse as _sre_parse  # type: ignore[no-redef]
+    from sre_constants import (  # type: ignore[no-redef]
+        BRANCH,
+        LITERAL,
+        MAX_REPEAT,
+        MIN_REPEAT,
+        SRE_FLAG_IGNORECASE,
+        SUBPATTERN,
+    )
+
+from clude_code.knowledge.file_watcher import ChangeFeed, WorkspaceScanner, build_change_feed
+
+_VERSION = 1
+# 重建时每段最多包含的文件数（限制构建峰值内存）
+_SEGMENT_FILES = 4000
+# 增量段超过该数量或失效条目比例超过阈值时整体重建
+_MAX_SEGMENTS = 12
+_MAX_DEAD_RATIO = 0.5
+# 正则展开为“析取范式”时的最大分支数（超过则放弃收窄）
+_MAX_ALTERNATIVES = 16
+
+
+def index_available() -> bool:
+    return np is not None
+
+
+# ---------------------------------------------------------------------------
+# 正则 -> 必需字面量
+# ---------------------------------------------------------------------------
+def _product(a: List[List[str]], b: List[List[str]]) -> Optional[List[List[str]]]:
+    out = [x + y for x in a for y in b]
+    return out if len(out) <= _MAX_ALTERNATIVES else None
+
+
+def _seq_literals(items: Any) -> List[List[str]]:
+    """一个序列必须包含的字面量，形式为析取范式：[[lit, ...] (AND), ...] (OR)。"""
+    dnf: List[List[str]] = [[]]
+    run: List[str] = []
+
+    def flush() -> None:
+        if run:
+            lit = "".join(run)
+            for alt in dnf:
+                alt.append(lit)
+            run.clear()
+
+    for op, av in items:
+        if op is LITERAL:
+            run.append(chr(av))
+            continue
+        flush()
+        inner: Optional[List[List[str]]] = None
+        if op is SUBPATTERN:
+            # 局部 (?i:...) 分组：非 ASCII 大小写折叠无法用字节三元组表达，保守地不收窄
+            if not (av[1] & SRE_FLAG_IGNORECASE):
+                inner = _seq_literals(av[-1])
+        elif op in (MAX_REPEAT, MIN_REPEAT) and av[0] >= 1:
+            inner = _seq_literals(av[2])
+        elif op is BRANCH:
+            alts: List[List[str]] = []
+            for branch in av[1]:
+                sub = _seq_literals(branch)
+                if any(not alt for alt in sub):
+                    alts = []
+                    break
+                alts.extend(sub)
+            inner = alts or None
+        if inner and any(inner):
+            merged = _product(dnf, inner)
+            if merged is not None:
+                dnf = merged
+    flush()
+    return dnf
+
+
+def required_literals(pattern: str, ignore_case: bool = False) -> tuple[Optional[List[List[str]]], bool]:
+    """
+    正则中必须出现的字面量（析取范式）与是否忽略大小写（含内联 `(?i)`）。
+
+    返回 None 表示无法收窄（如纯字符类、`.*`、解析失败）。
+    """
+    try:
+        parsed = _sre_parse.parse(pattern, 0)
+    except Exception:
+        return None, ignore_case
+    ignore_case = ignore_case or bool(parsed.state.flags & SRE_FLAG_IGNORECASE)
+    dnf = _seq_literals(parsed.data)
+    return dnf, ignore_case
+
+
+def _literal_trigrams(lit: str, ignore_case: bool) -> List[int]:
+    data = lit.encode("utf-8").lower()
+    out = []
+    for i in range(len(data) - 2):
+        tri = data[i:i + 3]
+        # 忽略大小写时非 ASCII 字节无法与索引的 ASCII 折叠对齐，跳过这些三元组（只会放宽候选集）
+        if ignore_case and max(tri) >= 0x80:
+            continue
+        out.append((tri[0] << 16) | (tri[1] << 8) | tri[2])
+    return out
+
+
+def _file_trigrams(data: bytes) -> Any:
+    a = np.frombuffer(data.lower(), dtype=np.uint8).astype(np.uint32)
+    if a.size < 3:
+        return np.empty(0, dtype=np.uint32)
+    return np.unique((a[:-2] << 16) | (a[1:-1] << 8) | a[2:])
+
+
+# ---------------------------------------------------------------------------
+# 索引
+# ---------------------------------------------------------------------------
+class _Segment:
+    def __init__(self, base: Path, seg_id: int) -> None:
+        self.seg_id = seg_id
+        self.keys = np.load(f"{base}.keys.npy", mmap_mode="r")
+        self.offs = np.load(f"{base}.offs.npy", mmap_mode="r")
+        self.docs = np.load(f"{base}.docs.npy", mmap_mode="r")
+        self.paths: List[str] = json.loads(Path(f"{base}.paths.json").read_text(encoding="utf-8"))
+
+    def postings(self, tri: int) -> Any:
+        i = int(np.searchsorted(self.keys, tri))
+        if i >= len(self.keys) or int(self.keys[i]) != tri:
+            return None
+        return self.docs[int(self.offs[i]):int(self.offs[i + 1])]
+
+
+class TrigramIndex:
+    """工作区级三元组索引（进程内复用，线程安全）。"""
+
+    def __init__(
+        self,
+        workspace_root: Path,
+        *,
+        ignore_dirs: set[str],
+        max_file_bytes: int,
+        watch_mode: str = "auto",
+    ) -> None:
+        self.workspace_root = Path(workspace_root).resolve()
+        self.dir = self.workspace_root / ".clude" / "grep_index"
+        self.max_file_bytes = max_file_bytes
+        # auto | inotify | poll：同 rag.watch_mode；off：只依赖 mark_stale
+        self.watch_mode = (watch_mode or "auto").strip().lower()
+        self._scanner = WorkspaceScanner(self.workspace_root, exts=None, exclude_dirs=set(ignore_dirs) | {".clude"})
+        self._lock = threading.Lock()
+        self._feed: Optional[ChangeFeed] = None
+        self._stale = True
+        # mark_stale(rel) 标记的路径（写文件/打补丁后无需全量扫描）
+        self._dirty: set[str] = set()
+        self._dirty_lock = threading.Lock()
+        # files: rel -> {"m": mtime, "s": seg_id（-1=跳过的二进制/大文件）}
+        self._files: Dict[str, Dict[str, Any]] = {}
+        self._seg_docs: Dict[int, int] = {}
+        self._next_seg = 0
+        self._segments: Dict[int, _Segment] = {}
+        self._load()
+
+    # ------------------------------------------------------------------
+    # 持久化
+    # ------------------------------------------------------------------
+    def _load(self) -> None:
+        try:
+            obj = json.loads((self.dir / "manifest.json").read_text(encoding="utf-8"))
+            if obj.get("version") != _VERSION:
+                return
+            self._files = obj["files"]
+            self._seg_docs = {int(k): int(v) for k, v in obj["segments"].items()}
+            self._next_seg = int(obj["next_seg"])
+            self._segments = {sid: _Segment(self.dir / f"seg_{sid}", sid) for sid in self._seg_docs}
+        except Exception:
+            self._files, self._seg_docs, self._next_seg, self._segments = {}, {}, 0, {}
+
+    def _save_manifest(self) -> None:
+        obj = {
+            "version": _VERSION,
+            "next_seg": self._next_seg,
+            "segments": {str(k): v for k, v in self._seg_docs.items()},
+            "files": self._files,
+        }
+        tmp = self.dir / "manifest.json.tmp"
+        tmp.write_text(json.dumps(obj, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(self.dir / "manifest.json")
+
+    def _drop_segment(self, sid: int) -> None:
+        self._segments.pop(sid, None)
+        self._seg_docs.pop(sid, None)
+        for suffix in (".keys.npy", ".offs.npy", ".docs.npy", ".paths.json"):
+            try:
+                (self.dir / f"seg_{sid}{suffix}").unlink()
+            except OSError:
+                pass
+
+    # ------------------------------------------------------------------
+    # 构建
+    # ------------------------------------------------------------------
+    def _read(self, rel: str) -> Optional[bytes]:
+        try:
+            path = self.workspace_root / rel
+            if self.max_file_bytes > 0 and path.stat().st_size > self.max_file_bytes:
+                return None
+            data = path.read_bytes()
+        except OSError:
+            return None
+        return None if b"\x00" in data[:4096] else data
+
+    def _write_segment(self, items: List[tuple[str, float]]) -> None:
+        """把 items（rel, mtime）写成一个新段；跳过的文件以 s=-1 记录。"""
+        paths: List[str] = []
+        tris: List[Any] = []
+        for rel, mtime in items:
+            data = self._read(rel)
+            if data is None:
+                self._files[rel] = {"m": mtime, "s": -1}
+                continue
+            paths.append(rel)
+            tris.append(_file_trigrams(data))
+            self._files[rel] = {"m": mtime, "s": self._next_seg}
+        sid = self._next_seg
+        self._next_seg += 1
+        if not paths:
+            return
+
+        counts = np.fromiter((t.size for t in tris), dtype=np.int64, count=len(tris))
+        keys = np.concatenate(tris) if tris else np.empty(0, dtype=np.uint32)
+        docs = np.repeat(np.arange(len(paths), dtype=np.uint32), counts)
+        order = np.argsort(keys, kind="stable")
+        keys, docs = keys[order], docs[order]
+        uniq, starts = np.unique(keys, return_index=True)
+        offs = np.append(starts, keys.size).astype(np.int64)
+
+        base = self.dir / f"seg_{sid}"
+        np.save(f"{base}.keys.npy", uniq.astype(np.uint32))
+        np.save(f"{base}.offs.npy", offs)
+        np.save(f"{base}.docs.npy", docs)
+        Path(f"{base}.paths.json").write_text(json.dumps(paths, ensure_ascii=False), encoding="utf-8")
+        self._seg_docs[sid] = len(paths)
+        self._segments[sid] = _Segment(base, sid)
+
+    def _rebuild(self, current: Dict[str, float]) -> None:
+        for sid in list(self._seg_docs):
+            self._drop_segment(sid)
+        self._files = {}
+        items = sorted(current.items())
+        for i in range(0, len(items), _SEGMENT_FILES):
+            self._write_segment(items[i:i + _SEGMENT_FILES])
+
+    def _dirty_changes(self, dirty: set[str]) -> tuple[List[tuple[str, float]], List[str]]:
+        """只检查给定路径（文件或目录）：返回 (变化的 (rel, mtime), 被删除的 rel)。"""
+        changed: Dict[str, float] = {}
+        gone: set[str] = set()
+        for rel in dirty:
+            path = self.workspace_root / rel
+            if path.is_dir():
+                # 目录（移入/整体变化）：遍历其下文件，并清理不再存在的旧条目
+                seen = dict(self._scanner.iter_files(rel)) if self._scanner.is_watched_dir(rel) else {}
+                changed.update(seen)
+                gone.update(f for f in self._files if f.startswith(rel + "/") and f not in seen)
+                continue
+            try:
+                mtime = path.stat().st_mtime
+            except OSError:
+                gone.update(f for f in self._files if f == rel or f.startswith(rel + "/"))
+                continue
+            if self._scanner.is_candidate(rel):
+                changed[rel] = mtime
+            elif rel in self._files:
+                gone.add(rel)
+        return (
+            [(rel, m) for rel, m in changed.items() if (self._files.get(rel) or {}).get("m") != m],
+            sorted(gone - changed.keys()),
+        )
+
+    def refresh(self, force: bool = False) -> Dict[str, int]:
+        """
+        同步索引：首次、force、mark_stale() 之后或变更源溢出时做全量 mtime 扫描，
+        否则只处理变更源与 mark_stale(rel) 报告的路径（无变更时不触碰文件系统）。
+
+        Returns:
+            统计：files / changed / removed / rebuilt
+        """
+        with self._lock:
+            if self._feed is None and self.watch_mode != "off":
+                # 先启动变更源再做全量扫描：扫描期间的改动会出现在之后的变更里
+                self._feed = build_change_feed(self._scanner, mode=self.watch_mode)
+                self._feed.start()
+                self._stale = True
+            paths, overflow = self._feed.drain(timeout=0.0, debounce_s=0.0) if self._feed else ([], False)
+            with self._dirty_lock:
+                dirty, self._dirty = self._dirty | set(paths), set()
+
+            if force or self._stale or overflow:
+                self._stale = False
+                current = dict(self._scanner.iter_files())
+                changed = [(rel, m) for rel, m in current.items() if (self._files.get(rel) or {}).get("m") != m]
+                removed = [rel for rel in self._files if rel not in current]
+            elif dirty:
+                changed, removed = self._dirty_changes(dirty)
+                current = {rel: e["m"] for rel, e in self._files.items() if rel not in removed}
+                current.update(changed)
+            else:
+                changed, removed = [], []
+            if not changed and not removed:
+                return {"files": len(self._files), "changed": 0, "removed": 0, "rebuilt": 0}
+
+            self.dir.mkdir(parents=True, exist_ok=True)
+            for rel in removed:
+                del self._files[rel]
+            # 增量写入后：段中条目总数 vs 仍然有效的条目数
+            changed_set = {rel for rel, _ in changed}
+            total = sum(self._seg_docs.values()) + len(changed)
+            live = sum(1 for rel, e in self._files.items() if e["s"] >= 0 and rel not in changed_set) + len(changed)
+            rebuild = (
+                not self._seg_docs
+                or len(self._seg_docs) >= _MAX_SEGMENTS
+                or 1.0 - live / max(1, total) > _MAX_DEAD_RATIO
+            )
+            if rebuild:
+                self._rebuild(current)
+            else:
+                self._write_segment(changed)
+                # 不再有存活文件的段直接删除
+                alive = {e["s"] for e in self._files.values()}
+                for sid in [sid for sid in self._seg_docs if sid not in alive]:
+                    self._drop_segment(sid)
+            self._save_manifest()
+            return {"files": len(self._files), "changed": len(changed), "removed": len(removed), "rebuilt": int(rebuild)}
+
+    def mark_stale(self, rel_path: Optional[str] = None) -> None:
+        """
+        工作区被修改后调用：给出 rel_path 时下一次查询只同步该路径；
+        否则（如执行了命令，影响范围未知）下一次查询前做一次全量扫描。
+        """
+        if rel_path is None:
+            self._stale = True
+            return
+        with self._dirty_lock:
+            self._dirty.add(rel_path.replace("\\", "/").strip("/"))
+
+    def close(self) -> None:
+        """停止变更源线程（索引对象被替换时调用）。"""
+        with self._lock:
+            if self._feed is not None:
+                self._feed.stop()
+                self._feed = None
+                self._stale = True
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+    def indexed_files(self) -> List[str]:
+        with self._lock:
+            return sorted(rel for rel, e in self._files.items() if e["s"] >= 0)
+
+    def candidates(self, pattern: str, ignore_case: bool = False) -> Optional[List[str]]:
+        """可能匹配 pattern 的文件（已排序）；None 表示无法收窄（需扫描全部已索引文件）。"""
+        dnf, ignore_case = required_literals(pattern, ignore_case)
+        if not dnf:
+            return None
+        alternatives: List[List[int]] = []
+        for alt in dnf:
+            tris = sorted({t for lit in alt for t in _literal_trigrams(lit, ignore_case)})
+            if not tris:
+                return None
+            alternatives.append(tris)
+
+        out: set[str] = set()
+        with self._lock:
+            for seg in self._segments.values():
+                for tris in alternatives:
+                    lists = []
+                    for t in tris:
+                        p = seg.postings(t)
+                        if p is None:
+                            lists = []
+                            break
+                        lists.append(p)
+                    if not lists:
+                        continue
+                    lists.sort(key=len)
+                    ids = np.asarray(lists[0])
+                    for p in lists[1:]:
+                        if ids.size == 0:
+                            break
+                        ids = np.intersect1d(ids, p, assume_unique=True)
+                    for i in ids.tolist():
+                        rel = seg.paths[i]
+                        if (self._files.get(rel) or {}).get("s") == seg.seg_id:
+                            out.add(rel)
+        return sorted(out)
+
+
+_INDEXES: Dict[str, TrigramIndex] = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def get_grep_index(
+    workspace_root: Path, *, ignore_dirs: set[str], max_file_bytes: int, watch_mode: str = "auto"
+) -> TrigramIndex:
+    """进程内按工作区复用索引（配置变化时重建对象）。"""
+    key = str(Path(workspace_root).resolve())
+    with _INDEXES_LOCK:
+        idx = _INDEXES.get(key)
+        if (
+            idx is None
+            or idx.max_file_bytes != max_file_bytes
+            or idx.watch_mode != (watch_mode or "auto").strip().lower()
+            or idx._scanner.exclude_dirs != frozenset(set(ignore_dirs) | {".clude"})
+        ):
+            if idx is not None:
+                idx.close()
+            idx = TrigramIndex(Path(key), ignore_dirs=ignore_dirs, max_file_bytes=max_file_bytes, watch_mode=watch_mode)
+            _INDEXES[key] = idx
+        return idx
+
+
+def mark_grep_index_stale(workspace_root: Path, path: Optional[str] = None) -> None:
+    """
+    写文件/打补丁（传入 path）或执行命令（不传 path）后调用；索引未创建时无操作。
+
+    path 无法解析到工作区内时按“影响范围未知”处理。
+    """
+    ws = Path(workspace_root).resolve()
+    idx = _INDEXES.get(str(ws))
+    if idx is None:
+        return
+    rel: Optional[str] = None
+    if path is not None:
+        try:
+            rel = (ws / path).resolve().relative_to(ws).as_posix()
+        except (OSError, ValueError):
+            rel = None
+    idx.mark_stale(None if rel in (None, ".") else rel)
@@ -0,0 +1,388 @@
+"""
+仓库引用图（Repo Reference Graph）
+
+在 repo_symbols 的符号库之上构建“文件 → 文件”的引用图：文件 f 引用了文件 g 定义的符号即连一条边，
+边权 = Σ sqrt(引用次数) × 修正系数（长的 snake/camel 名 ×10，私有名 ×0.1，被超过 5 个文件定义的通用名 ×0.1）。
+用个性化 PageRank 排序（种子为本轮对话提到的文件/符号），再按 token 预算渲染 repo map。
+
+增量与缓存：
+- 符号库每次同步产生一个 generation；图只对变化文件及受影响的引用方重算出边；
+- 展平后的边数组与 PageRank 结果（按种子集合）都缓存到下一次图变化，
+  因此每轮对话的重排只在种子变化时做一次幂迭代（以全局排名热启动）。
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None  # type: ignore
+
+from .repo_symbols import RepoSymbolDB
+
+# 渲染时展示的符号种类（与旧版 repo map 一致）
+RENDER_KINDS: frozenset[str] = frozenset({"class", "function", "interface", "struct"})
+
+_DAMPING = 0.85
+_TOL = 1e-6
+_MAX_ITER = 100
+_RANK_CACHE_SIZE = 32
+_MENTION_RE = re.compile(r"[\w./\\-]+")
+
+
+def _ident_mult(ident: str, num_definers: int) -> float:
+    """标识符的区分度：info/error/run 这类短通用名几乎不携带依赖信息。"""
+    mult = 1.0
+    if len(ident) >= 8 and ("_" in ident.strip("_") or (ident[:1].islower() and any(c.isupper() for c in ident)) or (ident[:1].isupper() and any(c.islower() for c in ident[1:]) and any(c.isupper() for c in ident[1:]))):
+        mult *= 10.0
+    if ident.startswith("_"):
+        mult *= 0.1
+    if num_definers > 5:
+        mult *= 0.1
+    return mult
+
+
+class RepoGraph:
+    """增量维护的引用图 + 个性化 PageRank + token 预算渲染。"""
+
+    def __init__(self) -> None:
+        self.generation = -1
+        self.symbols: Dict[str, List[Dict[str, Any]]] = {}
+        self.refs: Dict[str, Dict[str, int]] = {}
+        self.defines: Dict[str, set[str]] = {}  # 符号名 -> 定义它的文件
+        self.referrers: Dict[str, set[str]] = {}  # 标识符 -> 引用它的文件
+        self.out: Dict[str, Dict[str, float]] = {}  # 文件 -> {被引用文件: 权重}
+        self._basenames: Dict[str, set[str]] = {}
+        self._arrays: Optional[tuple[List[str], Dict[str, int], Any, Any, Any]] = None
+        self._sym_weights: Dict[str, List[tuple[float, Dict[str, Any]]]] = {}
+        self._rank_cache: "OrderedDict[tuple, Dict[str, float]]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    # ------------------------------------------------------------------
+    # 构图（增量）
+    # ------------------------------------------------------------------
+    def sync(self, db: RepoSymbolDB) -> bool:
+        """与符号库对齐；有变化时返回 True。"""
+        with self._lock:
+            generation, changed, entries = db.delta(self.generation)
+            if changed is not None and not changed:
+                self.generation = generation
+                return False
+            if changed is None:
+                self._rebuild(entries)
+            else:
+                self._apply(changed, entries)
+            self.generation = generation
+            self._arrays = None
+            self._sym_weights = {}
+            self._rank_cache.clear()
+            return True
+
+    def _rebuild(self, entries: Dict[str, Dict[str, Any]]) -> None:
+        self.symbols, self.refs, self.defines, self.referrers, self.out, self._basenames = {}, {}, {}, {}, {}, {}
+        for rel, entry in entries.items():
+            self._add_file(rel, entry)
+        for rel in self.refs:
+            self.out[rel] = self._edges_from(rel)
+
+    def _apply(self, changed: set[str], entries: Dict[str, Dict[str, Any]]) -> None:
+        affected_names: set[str] = set()
+        for rel in changed:
+            affected_names |= self._remove_file(rel)
+        for rel in changed:
+            entry = entries.get(rel)
+            if entry is not None:
+                affected_names |= self._add_file(rel, entry)
+        # 定义变化会改变所有引用方的出边；变化文件自身的引用也可能变化
+        recompute = {rel for rel in changed if rel in self.refs}
+        for name in affected_names:
+            recompute |= self.referrers.get(name, set())
+        for rel in recompute:
+            self.out[rel] = self._edges_from(rel)
+
+    def _add_file(self, rel: str, entry: Dict[str, Any]) -> set[str]:
+        symbols = list(entry.get("symbols") or [])
+        refs = dict(entry.get("refs") or {})
+        self.symbols[rel] = symbols
+        self.refs[rel] = refs
+        self._basenames.setdefault(os.path.basename(rel), set()).add(rel)
+        names = {str(s.get("name")) for s in symbols if s.get("name")}
+        for name in names:
+            self.defines.setdefault(name, set()).add(rel)
+        for ident in refs:
+            self.referrers.setdefault(ident, set()).add(rel)
+        return names
+
+    def _remove_file(self, rel: str) -> set[str]:
+        names = {str(s.get("name")) for s in self.symbols.pop(rel, []) if s.get("name")}
+        for name in names:
+            files = self.defines.get(name)
+            if files is not None:
+                files.discard(rel)
+                if not files:
+                    del self.defines[name]
+        for ident in self.refs.pop(rel, {}):
+            files = self.referrers.get(ident)
+            if files is not None:
+                files.discard(rel)
+                if not files:
+                    del self.referrers[ident]
+        base = self._basenames.get(os.path.basename(rel))
+        if base is not None:
+            base.discard(rel)
+        self.out.pop(rel, None)
+        return names
+
+    def _edges_from(self, rel: str) -> Dict[str, float]:
+        edges: Dict[str, float] = {}
+        for ident, count in self.refs.get(rel, {}).items():
+            definers = self.defines.get(ident)
+            if not definers:
+                continue
+            w = _ident_mult(ident, len(definers)) * math.sqrt(count)
+            for target in definers:
+                if target != rel:
+                    edges[target] = edges.get(target, 0.0) + w
+        return edges
+
+    # ------------------------------------------------------------------
+    # 排序
+    # ------------------------------------------------------------------
+    def mentioned(self, text: str) -> Dict[str, float]:
+        """从文本中识别提到的文件（路径/文件名）与符号（→ 定义文件），作为 PageRank 种子。"""
+        seeds: Dict[str, float] = {}
+        with self._lock:
+            for token in _MENTION_RE.findall(text or ""):
+                token = token.replace("\\", "/").strip("./")
+                if not token:
+                    continue
+                if token in self.symbols:
+                    seeds[token] = 1.0
+                    continue
+                by_name = self._basenames.get(os.path.basename(token))
+                if by_name and "." in token:
+                    for rel in by_name:
+                        if rel.endswith(token):
+                            seeds[rel] = max(seeds.get(rel, 0.0), 1.0 / len(by_name))
+                    continue
+                definers = self.defines.get(token)
+                if definers and len(token) >= 4 and len(definers) <= 3:
+                    for rel in definers:
+                        seeds[rel] = max(seeds.get(rel, 0.0), 0.5)
+        return seeds
+
+    def _flatten(self) -> tuple[List[str], Dict[str, int], Any, Any, Any]:
+        if self._arrays is None:
+            files = sorted(self.symbols)
+            index = {f: i for i, f in enumerate(files)}
+            src: List[int] = []
+            dst: List[int] = []
+            w: List[float] = []
+            for f, edges in self.out.items():
+                i = index.get(f)
+                if i is None:
+                    continue
+                for g, weight in edges.items():
+                    j = index.get(g)
+                    if j is not None:
+                        src.append(i)
+                        dst.append(j)
+                        w.append(weight)
+            if np is not None:
+                self._arrays = (files, index, np.asarray(src, dtype=np.int64), np.asarray(dst, dtype=np.int64),
+                                np.asarray(w, dtype=np.float64))
+            else:
+                self._arrays = (files, index, src, dst, w)
+        return self._arrays
+
+    def pagerank(self, seeds: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+        """个性化 PageRank（seeds 为空时为全局排名）；结果按种子集合缓存到下一次图变化。"""
+        with self._lock:
+            files, index, src, dst, w = self._flatten()
+            seeds = {f: v for f, v in (seeds or {}).items() if f in index and v > 0}
+            key = tuple(sorted(seeds.items()))
+            cached = self._rank_cache.get(key)
+            if cached is not None:
+                self._rank_cache.move_to_end(key)
+                return cached
+            start = self.pagerank() if seeds else None
+            n = len(files)
+            if n == 0:
+                ranks: Dict[str, float] = {}
+            elif np is not None:
+                ranks = self._pagerank_numpy(files, index, src, dst, w, seeds, start)
+            else:
+                ranks = self._pagerank_python(files, index, src, dst, w, seeds, start)
+            self._rank_cache[key] = ranks
+            while len(self._rank_cache) > _RANK_CACHE_SIZE:
+                self._rank_cache.popitem(last=False)
+            return ranks
+
+    @staticmethod
+    def _pagerank_numpy(files, index, src, dst, w, seeds, start) -> Dict[str, float]:
+        n = len(files)
+        if seeds:
+            p = np.zeros(n)
+            for f, v in seeds.items():
+                p[index[f]] = v
+            p /= p.sum()
+        else:
+            p = np.full(n, 1.0 / n)
+        out_sum = np.bincount(src, weights=w, minlength=n) if len(w) else np.zeros(n)
+        dangling = out_sum == 0
+        wn = w / out_sum[src] if len(w) else w
+        r = np.asarray([start[f] for f in files]) if start else p.copy()
+        for _ in range(_MAX_ITER):
+            spread = np.bincount(dst, weights=r[src] * wn, minlength=n) if len(w) else np.zeros(n)
+            r_new = _DAMPING * (spread + r[dangling].sum() * p) + (1.0 - _DAMPING) * p
+            delta = float(np.abs(r_new - r).sum())
+            r = r_new
+            if delta < _TOL:
+                break
+        return dict(zip(files, r.tolist(), strict=True))
+
+    @staticmethod
+    def _pagerank_python(files, index, src, dst, w, seeds, start) -> Dict[str, float]:
+        n = len(files)
+        if seeds:
+            total = sum(seeds.values())
+            p = [0.0] * n
+            for f, v in seeds.items():
+                p[index[f]] = v / total
+        else:
+            p = [1.0 / n] * n
+        out_sum = [0.0] * n
+        for i, weight in zip(src, w, strict=True):
+            out_sum[i] += weight
+        r = [start[f] for f in files] if start else list(p)
+        for _ in range(_MAX_ITER):
+            spread = [0.0] * n
+            for i, j, weight in zip(src, dst, w, strict=True):
+                spread[j] += r[i] * weight / out_sum[i]
+            dangling = sum(r[i] for i in range(n) if out_sum[i] == 0)
+            r_new = [_DAMPING * (spread[i] + dangling * p[i]) + (1.0 - _DAMPING) * p[i] for i in range(n)]
+            delta = sum(abs(a - b) for a, b in zip(r_new, r, strict=True))
+            r = r_new
+            if delta < _TOL:
+                break
+        return dict(zip(files, r, strict=True))
+
+    # ------------------------------------------------------------------
+    # 渲染
+    # ------------------------------------------------------------------
+    def _symbol_weights(self, f: str) -> List[tuple[float, Dict[str, Any]]]:
+        """文件内可渲染符号的权重 1 + log1p(区分度 × 被其他文件引用次数)（与种子无关，按 generation 缓存）。"""
+        cached = self._sym_weights.get(f)
+        if cached is None:
+            cached = []
+            for s in self.symbols.get(f, []):
+                if s.get("kind") not in RENDER_KINDS:
+                    continue
+                name = str(s.get("name"))
+                inbound = sum(self.refs[r].get(name, 0) for r in self.referrers.get(name, ()) if r != f)
+                mult = _ident_mult(name, len(self.defines.get(name, ())))
+                cached.append((1.0 + math.log1p(mult * inbound), s))
+            self._sym_weights[f] = cached
+        return cached
+
+    def _ranked_entries(
+        self, ranks: Dict[str, float], limit: int, pinned: Optional[Dict[str, float]] = None
+    ) -> List[tuple[str, Optional[Dict[str, Any]]]]:
+        """
+        (文件, 符号|None) 按重要性降序；符号得分 = 文件排名 × 符号权重。
+
+        pinned（本轮提到的文件）排在最前；只对排名靠前、条目累计达到 limit 的文件打分（预算内放不下更多条目）。
+        """
+        pinned = pinned or {}
+        top = max(ranks.values(), default=0.0) * 100.0
+        ranks = {f: r + (top * pinned[f] if f in pinned else 0.0) for f, r in ranks.items()}
+        scored: List[tuple[float, str, Optional[Dict[str, Any]]]] = []
+        for f in sorted(ranks, key=lambda x: -ranks[x]):
+            if len(scored) >= limit:
+                break
+            rank = ranks[f]
+            weights = self._symbol_weights(f)
+            if not weights:
+                scored.append((rank, f, None))
+            for weight, s in weights:
+                scored.append((rank * weight, f, s))
+        scored.sort(key=lambda x: (-x[0], x[1], (x[2] or {}).get("line") or 0))
+        return [(f, s) for _, f, s in scored]
+
+    def render(
+        self,
+        *,
+        max_tokens: int,
+        count_tokens: Callable[[str], int],
+        seeds: Optional[Dict[str, float]] = None,
+    ) -> str:
+        """按排名取前 N 个条目渲染，二分查找满足 count_tokens(输出) ≤ max_tokens 的最大 N。"""
+        with self._lock:
+            # 每个条目至少占一行（约 5+ token），4 倍余量保证重排后仍有足够候选
+            entries = self._ranked_entries(
+                self.pagerank(seeds), limit=max(64, max_tokens // 5 * 4), pinned=seeds
+            )
+        header = ["# 核心代码架构图谱 (Core Repo Map)"]
+        if seeds:
+            header.append("提示：已按引用关系排序，并优先展示与当前对话相关的文件及符号。")
+        else:
+            header.append("提示：已按引用关系（PageRank）优先展示项目核心文件及符号。")
+        header.append("")
+
+        lo, hi = 0, len(entries)
+        best = _render_tree(header, [])
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            text = _render_tree(header, entries[:mid])
+            if count_tokens(text) <= max_tokens:
+                lo, best = mid, text
+            else:
+                hi = mid - 1
+        return best
+
+
+def _render_tree(header: List[str], entries: List[tuple[str, Optional[Dict[str, Any]]]]) -> str:
+    tree: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+    for path, sym in entries:
+        p_obj = Path(path)
+        files = tree.setdefault(str(p_obj.parent), {})
+        syms = files.setdefault(p_obj.name, [])
+        if sym is not None:
+            syms.append(sym)
+
+    lines = list(header)
+    for dir_path in sorted(tree.keys()):
+        # 简化根目录显示
+        display_dir = "Project Root" if dir_path == "." else dir_path
+        lines.append(f"📁 {display_dir}/")
+        for file_name in sorted(tree[dir_path].keys()):
+            lines.append(f"  📄 {file_name}")
+            # 排序：类 -> 函数
+            for s in sorted(tree[dir_path][file_name], key=lambda x: (x.get("kind") != "class", x.get("line") or 0)):
+                kind = str(s.get("kind") or "?")
+                lines.append(f"    └─ [{kind[0].upper()}] {s.get('name')} (L{s.get('line')})")
+        lines.append("")
+    return "\n".join(lines)
+
+
+_GRAPHS: Dict[str, RepoGraph] = {}
+_GRAPHS_LOCK = threading.Lock()
+
+
+def get_repo_graph(workspace_root: Path) -> RepoGraph:
+    """进程内按工作区复用引用图。"""
+    key = str(Path(workspace_root).resolve())
+    with _GRAPHS_LOCK:
+        graph = _GRAPHS.get(key)
+        if graph is None:
+            graph = RepoGraph()
+            _GRAPHS[key] = graph
+        return graph
@@ -1,25 +1,48 @@
 from __future__ import annotations
 
-import json
-import platform
-import shutil
-import subprocess
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import Optional
 
 from ..logger_helper import get_tool_logger
 from ...config.tools_config import get_repo_map_config
+from ...llm.tokenizer import get_token_counter
+from ...orchestrator.context_budget import BudgetCategory, get_token_budget
+from .repo_graph import get_repo_graph
+from .repo_symbols import get_symbol_db
 
 # 工具模块 logger（延迟初始化）
 _logger = get_tool_logger(__name__)
 
 
-def generate_repo_map(*, workspace_root: Path) -> str:
+def resolve_repo_map_budget(context_window: Optional[int] = None) -> int:
     """
-    生成增强版仓库图谱 (V2)：
-    1. 引入权重计算 (Ranking)：根据文件深度和符号数量识别核心模块。
-    2. 深度树形结构。
-    3. 自动排除非核心符号，防止上下文溢出。
+    repo map 的 token 预算：显式配置优先，否则取 context_budget 中代码上下文（CONTEXT）的份额，
+    并以 auto_max_tokens 为上限（大窗口下 CONTEXT 份额可达数万 token，远超旧版地图的长度）。
+    """
+    config = get_repo_map_config()
+    configured = int(getattr(config, "max_tokens", 0) or 0)
+    if configured > 0:
+        return configured
+    budget = get_token_budget(int(context_window)) if context_window else get_token_budget()
+    share = budget.get_budget_for(BudgetCategory.CONTEXT)
+    cap = int(getattr(config, "auto_max_tokens", 0) or 0)
+    return min(share, cap) if cap > 0 else share
+
+
+def generate_repo_map(
+    *,
+    workspace_root: Path,
+    max_tokens: Optional[int] = None,
+    focus_text: Optional[str] = None,
+    refresh: bool = True,
+) -> str:
+    """
+    生成增强版仓库图谱 (V3)：
+    1. 符号来自持久化增量符号库（repo_symbols），只重新标记变化的文件。
+    2. 引用图 + 个性化 PageRank 排序（repo_graph）：focus_text 中提到的文件/符号作为种子。
+    3. 按 token 预算渲染（max_tokens 缺省取 context_budget 的 CONTEXT 份额），深度树形结构。
+
+    refresh=False 时跳过工作区同步，只按当前图重排（每轮对话的个性化重排走这条路径）。
     """
     # 检查工具是否启用
     config = get_repo_map_config()
@@ -28,92 +51,27 @@ def generate_repo_map(*, workspace_root: Path) -> str:
         return "Repo Map: tool is disabled."
 
     _logger.debug("[RepoMap] 开始生成仓库图谱")
-    ctags_exe = shutil.which("ctags")
-    if not ctags_exe:
-        _logger.warning("[RepoMap] ctags 未找到，无法生成仓库图谱")
-        return "Repo Map: ctags not found."
-
-    # 1. 扫描符号 (增加更多的元数据字段)
-    args = [
-        ctags_exe,
-        "--languages=Python,JavaScript,TypeScript,Go,Rust,C,C++,C#",
-        "--output-format=json",
-        "--fields=+n+k+K+S",
-        "--extras=+q",
-        "-R",
-        "--exclude=.git", "--exclude=node_modules", "--exclude=venv", "--exclude=.venv",
-        "--exclude=__pycache__", "--exclude=build", "--exclude=dist", "--exclude=.clude",
-        "--exclude=*.json", "--exclude=*.md", "--exclude=tests", # 排除文档和常规测试目录以聚焦核心
-        ".",
-    ]
-
-    abs_root = str(workspace_root.resolve())
+    # 1. 同步持久化符号库与引用图（增量）
+    db = get_symbol_db(workspace_root)
+    graph = get_repo_graph(workspace_root)
     try:
-        _logger.debug(f"[RepoMap] 执行 ctags 命令: {' '.join(args[:5])}...")
-        cp = subprocess.run(args, cwd=abs_root, capture_output=True, text=True, encoding="utf-8", shell=(platform.system() == "Windows"))
-        _logger.debug(f"[RepoMap] ctags 执行完成: 输出行数={len(cp.stdout.splitlines())}")
+        if refresh or graph.generation < 0:
+            db.refresh()
+        graph.sync(db)
     except Exception as e:
-        _logger.error(f"[RepoMap] ctags 执行失败: {e}", exc_info=True)
+        _logger.error(f"[RepoMap] 符号库同步失败: {e}", exc_info=True)
         return f"Repo Map Error: {e}"
+    if not db.ctags_exe and not any(graph.symbols.values()):
+        _logger.warning("[RepoMap] ctags 未找到，无法生成仓库图谱")
+        return "Repo Map: ctags not found."
 
-    # 2. 解析并计算文件权重
-    # file_stats[path] = {"symbols": [], "weight": float}
-    file_stats: Dict[str, Dict[str, Any]] = {}
-    
-    for line in (cp.stdout or "").splitlines():
-        try:
-            obj = json.loads(line)
-        except: continue
-        
-        path = obj.get("path")
-        kind = obj.get("kind")
-        if not (path and kind in ("class", "function", "interface", "struct")): continue
-        
-        if path not in file_stats:
-            # 权重计算逻辑：根目录下的文件权重更高；.py 比 .txt 高
-            depth = len(Path(path).parts)
-            base_weight = 10.0 / depth
-            file_stats[path] = {"symbols": [], "weight": base_weight}
-            
-        file_stats[path]["symbols"].append({
-            "name": obj.get("name"),
-            "kind": kind[0].upper(),
-            "line": obj.get("line")
-        })
-        # 每增加一个核心符号，文件权重略微增加
-        file_stats[path]["weight"] += 0.5
-
-    # 3. 筛选核心文件（仅展示权重前 50 的文件，防止上下文挤爆）
-    top_files = sorted(file_stats.keys(), key=lambda x: file_stats[x]["weight"], reverse=True)[:50]
-    
-    # 4. 构建渲染树
-    tree: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
-    for p in top_files:
-        p_obj = Path(p)
-        d, f = str(p_obj.parent), p_obj.name
-        if d not in tree: tree[d] = {}
-        tree[d][f] = file_stats[p]["symbols"]
-
-    # 5. 渲染 Markdown
-    _logger.debug(f"[RepoMap] 开始渲染图谱: 文件数={len(file_stats)}, 总符号数={sum(len(s['symbols']) for s in file_stats.values())}")
-    lines = ["# 核心代码架构图谱 (Core Repo Map)", "提示：已优先展示项目核心逻辑文件及符号。", ""]
-    
-    for dir_path in sorted(tree.keys()):
-        # 简化根目录显示
-        display_dir = "Project Root" if dir_path == "." else dir_path
-        lines.append(f"📁 {display_dir}/")
-        
-        for file_name in sorted(tree[dir_path].keys()):
-            lines.append(f"  📄 {file_name}")
-            syms = tree[dir_path][file_name]
-            # 排序：类 -> 函数
-            sorted_syms = sorted(syms, key=lambda x: (x["kind"] != "C", x["line"]))
-            
-            # 单个文件内最多展示 8 个符号
-            for s in sorted_syms[:8]:
-                lines.append(f"    └─ [{s['kind']}] {s['name']} (L{s['line']})")
-            if len(sorted_syms) > 8:
-                lines.append(f"    └─ ... (+{len(sorted_syms)-8} more)")
-        lines.append("")
-
-    return "\n".join(lines)
+    # 2. 排序 + 按预算渲染
+    budget = int(max_tokens) if max_tokens else resolve_repo_map_budget()
+    seeds = graph.mentioned(focus_text) if focus_text else None
+    counter = get_token_counter()
+    text = graph.render(max_tokens=budget, count_tokens=counter.count, seeds=seeds)
+    _logger.debug(
+        f"[RepoMap] 渲染完成: 文件数={len(graph.symbols)}, 种子={len(seeds or {})}, "
+        f"预算={budget}, tokens≈{counter.count(text)}"
+    )
+    return text
@@ -0,0 +1,282 @@
+"""
+仓库符号库（Repo Symbol DB）
+
+repo map 的符号数据持久化在 `.clude/repo_symbols.json`，按文件 mtime（变化时再比对内容 hash）增量更新：
+- 启动时只做一次剪枝遍历 + stat，未变化的文件直接复用上次的符号；
+- 变化的文件批量交给 `ctags -L -`（只标记这些文件，而非 `ctags -R` 全量）；
+- 无 ctags 时 Python 文件用 `ast` 兜底提取定义；
+- 同时记录每个文件引用的标识符（refs），供 repo_graph 构建“引用 → 定义”图。
+"""
+
+from __future__ import annotations
+
+import ast
+import hashlib
+import json
+import platform
+import re
+import shutil
+import subprocess
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from clude_code.knowledge.file_watcher import DEFAULT_EXCLUDE_DIRS, WorkspaceScanner
+
+from ..logger_helper import get_tool_logger
+
+_logger = get_tool_logger(__name__)
+
+# 与 ctags --languages 对应的扩展名
+REPO_MAP_EXTS: frozenset[str] = frozenset({
+    ".py", ".js", ".jsx", ".mjs", ".ts", ".tsx", ".go", ".rs",
+    ".c", ".h", ".cc", ".cpp", ".cxx", ".hpp", ".cs",
+})
+# 排除常规测试目录与虚拟环境，聚焦核心代码
+REPO_MAP_EXCLUDE_DIRS: frozenset[str] = DEFAULT_EXCLUDE_DIRS | {"tests", "__pycache__"}
+# 持久化的符号种类（渲染时再按需过滤）
+SYMBOL_KINDS: frozenset[str] = frozenset({"class", "function", "interface", "struct", "method", "member"})
+
+_DB_VERSION = 2
+_CTAGS_BATCH = 2000
+# 每个文件最多记录的引用标识符数（按出现次数取前 N，控制库体积）
+_MAX_REFS_PER_FILE = 256
+# 变更日志保留的代数（更久远的增量请求退化为全量重建）
+_MAX_CHANGE_LOG = 64
+_IDENT_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]{2,}")
+
+
+def _file_hash(path: Path) -> str:
+    return hashlib.md5(path.read_bytes()).hexdigest()
+
+
+def extract_refs(text: str) -> Dict[str, int]:
+    """文件中出现的标识符及次数（语言无关的近似引用；是否为“定义的引用”由图构建时判断）。"""
+    counts = Counter(_IDENT_RE.findall(text))
+    return dict(counts.most_common(_MAX_REFS_PER_FILE))
+
+
+def python_tags(text: str) -> List[Dict[str, Any]]:
+    """ctags 不可用时的 Python 兜底：提取类、函数与方法定义。"""
+    try:
+        tree = ast.parse(text)
+    except (SyntaxError, ValueError):
+        return []
+    out: List[Dict[str, Any]] = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            out.append({"name": node.name, "kind": "function", "line": node.lineno})
+        elif isinstance(node, ast.ClassDef):
+            out.append({"name": node.name, "kind": "class", "line": node.lineno})
+            for sub in node.body:
+                if isinstance(sub, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    out.append({"name": sub.name, "kind": "member", "line": sub.lineno, "scope": node.name})
+    return out
+
+
+class RepoSymbolDB:
+    """
+    持久化的增量符号库。
+
+    files: rel_path -> {"mtime": float, "hash": str, "symbols": [{"name", "kind", "line", ...}], "refs": {ident: n}}
+
+    generation 在内容变化时递增，`changes_since(gen)` 返回此后变化的文件（供增量构图）。
+    """
+
+    def __init__(self, workspace_root: Path) -> None:
+        self.workspace_root = Path(workspace_root).resolve()
+        self.path = self.workspace_root / ".clude" / "repo_symbols.json"
+        self.files: Dict[str, Dict[str, Any]] = {}
+        # 标记器变化（如后来装了 ctags）时丢弃旧库，避免沿用兜底结果
+        self.ctags_exe = shutil.which("ctags")
+        self.tagger = "ctags" if self.ctags_exe else "ast"
+        self.generation = 0
+        self._change_log: List[tuple[int, set[str]]] = []
+        self._lock = threading.Lock()
+        self._scanner = WorkspaceScanner(self.workspace_root, exts=REPO_MAP_EXTS, exclude_dirs=REPO_MAP_EXCLUDE_DIRS)
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            obj = json.loads(self.path.read_text(encoding="utf-8"))
+        except Exception:
+            return
+        if not isinstance(obj, dict) or obj.get("version") != _DB_VERSION or obj.get("tagger") != self.tagger:
+            return
+        if isinstance(obj.get("files"), dict):
+            self.files = obj["files"]
+
+    def _save(self) -> None:
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(json.dumps({"version": _DB_VERSION, "tagger": self.tagger, "files": self.files}, ensure_ascii=False), encoding="utf-8")
+            tmp.replace(self.path)
+        except Exception as e:
+            # 持久化失败只影响下次启动速度
+            _logger.warning(f"[RepoMap] 符号库写入失败: {e}")
+
+    def refresh(self) -> Dict[str, int]:
+        """
+        与工作区同步：只重新标记 mtime 与内容 hash 都变化的文件，删除已消失的文件。
+
+        Returns:
+            统计：files / retagged / removed
+        """
+        with self._lock:
+            seen: set[str] = set()
+            changed: List[tuple[str, float, str]] = []
+            touched = False
+            for rel, mtime in self._scanner.iter_files():
+                seen.add(rel)
+                entry = self.files.get(rel)
+                if entry is not None and entry.get("mtime") == mtime:
+                    continue
+                try:
+                    h = _file_hash(self.workspace_root / rel)
+                except OSError:
+                    continue
+                if entry is not None and entry.get("hash") == h:
+                    entry["mtime"] = mtime
+                    touched = True
+                    continue
+                changed.append((rel, mtime, h))
+
+            removed = [rel for rel in self.files if rel not in seen]
+            for rel in removed:
+                del self.files[rel]
+
+            tags = self._tag_files([rel for rel, _, _ in changed]) if changed else {}
+            if tags is None:
+                # 标记失败：不记录这些文件，下次同步重试
+                changed = []
+            else:
+                for rel, mtime, h in changed:
+                    self.files[rel] = {
+                        "mtime": mtime,
+                        "hash": h,
+                        "symbols": tags.get(rel, []),
+                        "refs": self._read_refs(rel),
+                    }
+
+            if changed or removed:
+                self.generation += 1
+                self._change_log.append((self.generation, {rel for rel, _, _ in changed} | set(removed)))
+                del self._change_log[:-_MAX_CHANGE_LOG]
+            if changed or removed or touched:
+                self._save()
+            _logger.debug(f"[RepoMap] 符号库同步: files={len(self.files)} retagged={len(changed)} removed={len(removed)}")
+            return {"files": len(self.files), "retagged": len(changed), "removed": len(removed)}
+
+    def snapshot(self) -> Dict[str, List[Dict[str, Any]]]:
+        """rel_path -> symbols（浅拷贝，供渲染）。"""
+        with self._lock:
+            return {rel: list(e.get("symbols") or []) for rel, e in self.files.items()}
+
+    def delta(self, generation: int) -> tuple[int, Optional[set[str]], Dict[str, Dict[str, Any]]]:
+        """
+        增量视图（原子）：返回 (当前 generation, 变化的文件集合, 条目)。
+
+        变化集合为 None 表示变更日志已不覆盖 generation（需全量重建），此时条目为全部文件；
+        否则条目只包含仍存在的变化文件（集合中缺席的即已删除）。条目只读，勿修改。
+        """
+        with self._lock:
+            changed: Optional[set[str]]
+            if generation == self.generation:
+                changed = set()
+            elif generation > self.generation or not self._change_log or self._change_log[0][0] > generation + 1:
+                changed = None
+            else:
+                changed = set()
+                for gen, rels in self._change_log:
+                    if gen > generation:
+                        changed |= rels
+            if changed is None:
+                return self.generation, None, dict(self.files)
+            return self.generation, changed, {rel: self.files[rel] for rel in changed if rel in self.files}
+
+    def _read_refs(self, rel: str) -> Dict[str, int]:
+        try:
+            return extract_refs((self.workspace_root / rel).read_text(encoding="utf-8", errors="replace"))
+        except OSError:
+            return {}
+
+    # ------------------------------------------------------------------
+    # 标记（tagging）
+    # ------------------------------------------------------------------
+    def _tag_files(self, rels: List[str]) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+        if self.ctags_exe:
+            out: Dict[str, List[Dict[str, Any]]] = {}
+            for i in range(0, len(rels), _CTAGS_BATCH):
+                part = self._ctags(self.ctags_exe, rels[i:i + _CTAGS_BATCH])
+                if part is None:
+                    return None
+                out.update(part)
+            return out
+        out = {}
+        for rel in rels:
+            if rel.endswith(".py"):
+                try:
+                    text = (self.workspace_root / rel).read_text(encoding="utf-8", errors="replace")
+                except OSError:
+                    continue
+                out[rel] = python_tags(text)
+        return out
+
+    def _ctags(self, ctags_exe: str, rels: List[str]) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+        args = [
+            ctags_exe,
+            "--languages=Python,JavaScript,TypeScript,Go,Rust,C,C++,C#",
+            "--output-format=json",
+            "--fields=+n+k+K+S",
+            "--extras=+q",
+            "-f", "-",
+            "-L", "-",
+        ]
+        try:
+            cp = subprocess.run(
+                args,
+                cwd=str(self.workspace_root),
+                input="\n".join(rels),
+                capture_output=True,
+                text=True,
+                encoding="utf-8",
+                shell=(platform.system() == "Windows"),
+            )
+        except Exception as e:
+            _logger.error(f"[RepoMap] ctags 执行失败: {e}", exc_info=True)
+            return None
+
+        out: Dict[str, List[Dict[str, Any]]] = {}
+        for line in (cp.stdout or "").splitlines():
+            try:
+                obj = json.loads(line)
+            except ValueError:
+                continue
+            path = str(obj.get("path") or "").replace("\\", "/")
+            if path.startswith("./"):
+                path = path[2:]
+            kind = obj.get("kind")
+            if not path or kind not in SYMBOL_KINDS:
+                continue
+            sym: Dict[str, Any] = {"name": obj.get("name"), "kind": kind, "line": obj.get("line")}
+            if obj.get("scope"):
+                sym["scope"] = obj.get("scope")
+            out.setdefault(path, []).append(sym)
+        return out
+
+
+_DBS: Dict[str, RepoSymbolDB] = {}
+_DBS_LOCK = threading.Lock()
+
+
+def get_symbol_db(workspace_root: Path) -> RepoSymbolDB:
+    """进程内按工作区复用符号库（避免重复加载 JSON）。"""
+    key = str(Path(workspace_root).resolve())
+    with _DBS_LOCK:
+        db: Optional[RepoSymbolDB] = _DBS.get(key)
+        if db is None:
+            db = RepoSymbolDB(Path(key))
+            _DBS[key] = db
+        return db
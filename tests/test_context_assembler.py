@@ -0,0 +1,103 @@
+"""
+上下文组装回归用例 (Regression Tests for Token-Budget Context Assembly)
+
+验证场景：
+1. 组装结果不超过窗口预算，system 与最新消息始终保留；system 很大时历史只用剩余容量
+2. 容量不足时优先保留对话，丢弃较旧的工具结果
+3. 工具调用与其结果、提问与回答作为整体保留或丢弃；结果中 user/assistant 严格交替
+4. 从 llama.cpp /props 读取实际 n_ctx
+
+运行方式：
+    python -m pytest tests/test_context_assembler.py -v
+"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from clude_code.llm.llama_cpp_http import ChatMessage, LlamaCppHttpClient
+from clude_code.llm.tokenizer import TokenCounter
+from clude_code.orchestrator.context_assembler import ContextAssembler, message_kind
+
+
+def _history(rounds: int) -> list[ChatMessage]:
+    msgs = [ChatMessage(role="system", content="system prompt " * 50)]
+    for i in range(rounds):
+        msgs.append(ChatMessage(role="user", content=f"question {i} " * 20))
+        msgs.append(ChatMessage(role="assistant", content=f"answer {i} " * 20))
+        msgs.append(ChatMessage(role="user", content=json.dumps({"tool": "read_file", "ok": True, "text": "x" * 800})))
+    msgs.append(ChatMessage(role="user", content="latest request"))
+    return msgs
+
+
+def test_assemble_respects_budget_and_keeps_recent():
+    counter = TokenCounter(source="heuristic")
+    asm = ContextAssembler(context_window=2048, max_output_tokens=512, counter=counter)
+    msgs = _history(30)
+    assert not asm.fits(msgs)
+
+    out, stats = asm.assemble(msgs)
+    assert out[0] is msgs[0] and out[-1] is msgs[-1]
+    assert counter.count_messages(out) <= asm.available_tokens
+    assert stats.dropped > 0 and stats.kept == len(out) - 1
+    # 同等条件下对话比旧工具结果更有价值
+    assert stats.by_kind.get("user", 0) > stats.by_kind.get("tool_result", 0)
+    assert message_kind(out[1]) == "user"
+
+    small, _ = asm.assemble(msgs, max_messages=6)
+    assert len(small) - 1 <= 6
+
+    big_system = counter.count(msgs[0].content or "")
+    crowded = [ChatMessage(role="system", content=msgs[0].content * (asm.available_tokens // big_system - 1))] + msgs[1:]
+    out, stats = asm.assemble(crowded)
+    assert counter.count_messages(out) <= asm.available_tokens
+    assert out[-1].role == "user"
+
+
+def test_units_keep_pairs_and_alternation():
+    counter = TokenCounter(source="heuristic")
+    asm = ContextAssembler(context_window=2048, max_output_tokens=512, counter=counter)
+    msgs = [ChatMessage(role="system", content="system prompt")]
+    for i in range(40):
+        msgs.append(ChatMessage(role="user", content=f"question {i} " * (5 + i % 7 * 10)))
+        msgs.append(ChatMessage(role="assistant", content=json.dumps({"tool": "grep", "args": {"q": str(i)}})))
+        msgs.append(ChatMessage(role="user", content=json.dumps({"tool": "grep", "ok": True, "text": "y" * (40 * (i % 5))})))
+        msgs.append(ChatMessage(role="assistant", content=f"answer {i} " * (3 + i % 3 * 20)))
+    msgs.append(ChatMessage(role="user", content="latest request"))
+
+    out, stats = asm.assemble(msgs)
+    body = out[1:]
+    assert stats.dropped > 0 and body[0].role == "user" and body[-1] is msgs[-1]
+    assert all(a.role != b.role for a, b in zip(body, body[1:], strict=False))
+    for k, m in enumerate(body):
+        if message_kind(m) == "tool_result":
+            assert body[k - 1].role == "assistant" and body[k - 1].content.startswith('{"tool":')
+        if m.role == "assistant" and m.content.startswith('{"tool":'):
+            assert message_kind(body[k + 1]) == "tool_result"
+
+
+class _Props(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):  # noqa: D401 - 静默
+        pass
+
+    def do_GET(self):
+        body = json.dumps({"default_generation_settings": {"n_ctx": 8192}}).encode("utf-8")
+        self.send_response(200 if self.path == "/props" else 404)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def test_context_window_from_props():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _Props)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    try:
+        client = LlamaCppHttpClient(base_url=f"http://127.0.0.1:{srv.server_port}", model="m")
+        assert client.get_context_window() == 8192
+        client.close()
+    finally:
+        srv.shutdown()
+        srv.server_close()
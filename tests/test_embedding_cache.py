@@ -0,0 +1,46 @@
+"""
+Embedding 缓存回归用例 (Regression Tests for Content-Addressed Embedding Cache)
+
+验证场景：
+1. 读写往返：float32 存储后数值一致
+2. 按字节上限的 LRU 淘汰：最近命中的条目被保留
+3. 持久化：重新打开后仍可命中
+
+运行方式：
+    python -m pytest tests/test_embedding_cache.py -v
+"""
+
+from pathlib import Path
+
+from clude_code.knowledge.embedding_cache import EmbeddingCache, chunk_hash
+
+
+def test_chunk_hash_depends_on_model():
+    assert chunk_hash("x = 1", "m1") == chunk_hash("x = 1", "m1")
+    assert chunk_hash("x = 1", "m1") != chunk_hash("x = 1", "m2")
+
+
+def test_roundtrip_and_persistence(tmp_path: Path):
+    path = tmp_path / "cache.sqlite"
+    cache = EmbeddingCache(path)
+    cache.put_many([("a", [0.5, 1.0, -2.0])])
+    assert cache.get_many(["a", "b"]) == {"a": [0.5, 1.0, -2.0]}
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.close()
+
+    reopened = EmbeddingCache(path)
+    assert reopened.get_many(["a"]) == {"a": [0.5, 1.0, -2.0]}
+    assert reopened.total_bytes == 12
+
+
+def test_lru_eviction_by_bytes(tmp_path: Path):
+    # 每条 4 个 float32 = 16 字节；上限 48 字节 → 最多 3 条
+    cache = EmbeddingCache(tmp_path / "cache.sqlite", max_bytes=48)
+    cache.put_many([("k1", [1.0] * 4), ("k2", [2.0] * 4), ("k3", [3.0] * 4)])
+    cache.get_many(["k1"])  # 刷新 k1 的 LRU 时间戳
+    cache.put_many([("k4", [4.0] * 4)])
+
+    got = cache.get_many(["k1", "k2", "k3", "k4"])
+    assert "k1" in got and "k4" in got
+    assert "k2" not in got
+    assert cache.total_bytes <= 48
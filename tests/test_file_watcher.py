@@ -0,0 +1,112 @@
+"""
+工作区变更源回归用例 (Regression Tests for Workspace Change Feed)
+
+验证场景：
+1. .gitignore 语义：目录规则、取反、锚定、`**`
+2. 剪枝扫描：排除目录与被忽略目录不会被遍历
+3. 变更队列：同一路径去重、溢出置位
+4. 轮询回退：start() 时同步建立基准快照；.gitignore 变化清缓存并置位溢出
+
+运行方式：
+    python -m pytest tests/test_file_watcher.py -v
+"""
+
+import time
+from pathlib import Path
+
+from clude_code.knowledge.file_watcher import (
+    ChangeFeed,
+    GitIgnoreMatcher,
+    PollingChangeFeed,
+    WorkspaceScanner,
+)
+
+
+def _touch(root: Path, rel: str, text: str = "") -> None:
+    p = root / rel
+    p.parent.mkdir(parents=True, exist_ok=True)
+    p.write_text(text, encoding="utf-8")
+
+
+class TestGitIgnoreMatcher:
+    def test_patterns(self, tmp_path: Path):
+        _touch(tmp_path, ".gitignore", "out/\n*.gen.py\n!keep.gen.py\n/top.py\ndocs/**/tmp\n")
+        m = GitIgnoreMatcher(tmp_path)
+
+        assert m.is_ignored("out", is_dir=True)
+        assert m.is_ignored("src/out/a.py")
+        assert m.is_ignored("src/a.gen.py")
+        assert not m.is_ignored("src/keep.gen.py")
+        assert m.is_ignored("top.py")
+        assert not m.is_ignored("src/top.py")
+        assert m.is_ignored("docs/a/b/tmp", is_dir=True)
+        assert not m.is_ignored("src/a.py")
+
+    def test_nested_gitignore_overrides(self, tmp_path: Path):
+        _touch(tmp_path, ".gitignore", "*.py\n")
+        _touch(tmp_path, "pkg/.gitignore", "!main.py\n")
+        m = GitIgnoreMatcher(tmp_path)
+
+        assert m.is_ignored("a.py")
+        assert not m.is_ignored("pkg/main.py")
+        assert m.is_ignored("pkg/other.py")
+
+
+class TestWorkspaceScanner:
+    def test_prunes_excluded_and_ignored_dirs(self, tmp_path: Path):
+        _touch(tmp_path, ".gitignore", "generated/\n")
+        _touch(tmp_path, "src/a.py")
+        _touch(tmp_path, "src/readme.md")
+        _touch(tmp_path, "node_modules/lib/x.js")
+        _touch(tmp_path, "generated/b.py")
+
+        scanner = WorkspaceScanner(tmp_path)
+        files = sorted(rel for rel, _mtime in scanner.iter_files())
+
+        assert files == ["src/a.py"]
+        assert scanner.is_candidate("src/new.py")
+        assert not scanner.is_candidate("generated/new.py")
+        assert not scanner.is_candidate("node_modules/new.js")
+
+
+class TestChangeFeedQueue:
+    def test_dedup_and_overflow(self, tmp_path: Path):
+        feed = ChangeFeed(WorkspaceScanner(tmp_path), queue_size=2)
+        feed.push("a.py")
+        feed.push("a.py")
+        feed.push("b.py")
+        feed.push("c.py")
+
+        paths, overflow = feed.drain(timeout=0, debounce_s=0)
+        assert paths == ["a.py", "b.py"]
+        assert overflow is True
+
+        feed.push("a.py")
+        paths, overflow = feed.drain(timeout=0, debounce_s=0)
+        assert paths == ["a.py"]
+        assert overflow is False
+
+
+class TestPollingChangeFeed:
+    def test_snapshot_before_scan_and_gitignore_changes(self, tmp_path: Path):
+        _touch(tmp_path, ".gitignore", "gen/\n")
+        _touch(tmp_path, "src/a.py")
+        _touch(tmp_path, "gen/b.py")
+        scanner = WorkspaceScanner(tmp_path)
+        feed = PollingChangeFeed(scanner, interval_s=0.1)
+        feed.start()
+        try:
+            # 基准快照在 start() 返回前就已建立：之后（初始扫描期间）的改动不会丢
+            assert feed._snapshot == {"src/a.py": (tmp_path / "src/a.py").stat().st_mtime}
+            _touch(tmp_path, "src/new.py")
+            paths, overflow = feed.drain(timeout=5, debounce_s=0)
+            assert paths == ["src/new.py"] and overflow is False
+
+            _touch(tmp_path, ".gitignore", "")
+            deadline = time.monotonic() + 5
+            while not feed.overflowed.is_set() and time.monotonic() < deadline:
+                time.sleep(0.05)
+            assert feed.overflowed.is_set()
+            assert scanner.is_candidate("gen/b.py")
+        finally:
+            feed.stop()
@@ -0,0 +1,145 @@
+"""
+grep 三元组索引回归用例 (Regression Tests for Trigram Grep Index)
+
+验证场景：
+1. 正则必需字面量提取（分支 / 重复 / 字符类 / 内联 (?i)）
+2. 候选文件收窄：跳过忽略目录与二进制文件，大小写不敏感查询
+3. 增量同步：新增/修改/删除文件后结果正确，新实例复用磁盘索引
+4. index 引擎与 python 引擎命中一致
+5. 同步只由 mark_stale / 变更源驱动：mark_stale(rel) 只检查该路径，未标记时不扫描
+6. grep_engine=auto 在缺少 rg 时使用 Python 扫描，不创建 .clude/grep_index
+
+运行方式：
+    python -m pytest tests/test_grep_index.py -v
+"""
+
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from clude_code.config.tools_config import SearchToolConfig
+from clude_code.tooling.tools import grep as grep_mod
+from clude_code.tooling.tools.grep import _index_grep, _python_grep
+from clude_code.tooling.tools.grep_index import TrigramIndex, required_literals
+
+
+def _write(root: Path, rel: str, data: str | bytes) -> Path:
+    p = root / rel
+    p.parent.mkdir(parents=True, exist_ok=True)
+    if isinstance(data, bytes):
+        p.write_bytes(data)
+    else:
+        p.write_text(data, encoding="utf-8")
+    return p
+
+
+def _hit_key(h: dict) -> tuple[str, int]:
+    return h["path"].replace(os.sep, "/"), h["line"]
+
+
+def _index(root: Path, watch_mode: str = "off") -> TrigramIndex:
+    return TrigramIndex(root, ignore_dirs={"node_modules"}, max_file_bytes=10_000, watch_mode=watch_mode)
+
+
+def test_required_literals():
+    assert required_literals("RenderEngine") == ([["RenderEngine"]], False)
+    assert required_literals("foo_bar|hello")[0] == [["foo_bar"], ["hello"]]
+    assert required_literals(r"def \w+Engine")[0] == [["def ", "Engine"]]
+    assert required_literals("(?i)FooBar") == ([["FooBar"]], True)
+    # 可选分支让整体无法收窄
+    assert required_literals("abc|")[0] == [[]]
+
+
+def test_candidates_and_incremental(tmp_path: Path):
+    _write(tmp_path, "src/a.py", "class RenderEngine:\n    pass\n")
+    _write(tmp_path, "src/b.txt", "hello ConnectionPool\n")
+    _write(tmp_path, "node_modules/x.js", "RenderEngine()\n")
+    _write(tmp_path, "src/c.bin", b"\x00\x01RenderEngine")
+
+    idx = _index(tmp_path)
+    assert idx.refresh()["changed"] == 3  # node_modules 被忽略
+    assert idx.candidates("RenderEngine") == ["src/a.py"]
+    assert idx.candidates("connectionpool", ignore_case=True) == ["src/b.txt"]
+    assert idx.candidates("connectionpool") == ["src/b.txt"]  # 候选集是超集，最终由正则确认
+    assert idx.candidates("nothing_here") == []
+    assert idx.candidates(r"\w+") is None
+
+    _write(tmp_path, "src/d.py", "RenderEngine()\n")
+    (tmp_path / "src/a.py").unlink()
+    idx.mark_stale()
+    stats = idx.refresh()
+    assert (stats["changed"], stats["removed"]) == (1, 1)
+    assert idx.candidates("RenderEngine") == ["src/d.py"]
+
+    again = _index(tmp_path)
+    assert again.refresh()["changed"] == 0
+    assert again.candidates("RenderEngine") == ["src/d.py"]
+
+
+def test_index_engine_matches_python(tmp_path: Path):
+    for i in range(30):
+        _write(tmp_path, f"pkg/m{i}.py", f"def handler_{i}():\n    return 'value_{i % 3}'\n")
+    cfg = SearchToolConfig(grep_index_watch_mode="off")
+    kw = dict(workspace_root=tmp_path, language="all", include_glob=None, max_hits=1000, cfg=cfg)
+    for pattern, ignore_case in [("value_1", False), ("HANDLER_2", True), (r"handler_\d+\(", False)]:
+        ix = _index_grep(pattern=pattern, path="pkg", ignore_case=ignore_case, **kw)
+        py = _python_grep(pattern=pattern, path="pkg", ignore_case=ignore_case, **kw)
+        assert ix.payload["engine"] == "index"
+        assert sorted(map(_hit_key, ix.payload["hits"])) == sorted(map(_hit_key, py.payload["hits"]))
+
+
+def test_refresh_is_driven_by_marks(tmp_path: Path, monkeypatch):
+    _write(tmp_path, "a.py", "alpha\n")
+    _write(tmp_path, "b.py", "beta\n")
+    idx = _index(tmp_path)
+    assert idx.refresh()["changed"] == 2
+
+    # 未标记：不遍历工作区
+    monkeypatch.setattr(idx._scanner, "iter_files", lambda *a, **k: pytest.fail("unexpected full scan"))
+    _write(tmp_path, "a.py", "alpha gamma\n")
+    _write(tmp_path, "b.py", "beta gamma\n")
+    assert idx.refresh()["changed"] == 0
+
+    idx.mark_stale("a.py")
+    stats = idx.refresh()
+    assert (stats["changed"], stats["removed"]) == (1, 0)
+    assert idx.candidates("gamma") == ["a.py"]
+
+    (tmp_path / "a.py").unlink()
+    idx.mark_stale("a.py")
+    assert idx.refresh()["removed"] == 1
+    monkeypatch.undo()
+
+    idx.mark_stale()
+    assert idx.refresh()["changed"] == 1
+    assert idx.candidates("gamma") == ["b.py"]
+
+
+def test_change_feed_picks_up_external_edits(tmp_path: Path):
+    _write(tmp_path, "a.py", "alpha\n")
+    idx = _index(tmp_path, watch_mode="inotify")
+    idx.refresh()
+    try:
+        if idx._feed is None or idx._feed.kind != "inotify":
+            pytest.skip("inotify 不可用")
+        deadline = time.monotonic() + 5.0
+        while idx.candidates("delta") != ["sub/new.py"] and time.monotonic() < deadline:
+            # 新目录的监听是异步加上的：重复写入直到事件被捕获
+            _write(tmp_path, "sub/new.py", "delta\n")
+            time.sleep(0.05)
+            idx.refresh()
+        assert idx.candidates("delta") == ["sub/new.py"]
+    finally:
+        idx.close()
+
+
+def test_auto_engine_without_rg_uses_python(tmp_path: Path, monkeypatch):
+    _write(tmp_path, "a.py", "needle\n")
+    monkeypatch.setattr(grep_mod.shutil, "which", lambda name: None)
+    tr = grep_mod.grep(workspace_root=tmp_path, pattern="needle")
+    assert tr.ok and tr.payload["engine"] == "python"
+    assert not (tmp_path / ".clude" / "grep_index").exists()
@@ -0,0 +1,120 @@
+"""
+历史压缩回归用例 (Regression Tests for Background History Compaction)
+
+验证场景：
+1. 按用户轮次分段，最近消息与未闭合的段不参与摘要
+2. 模型摘要按段内容哈希缓存，同一段只摘要一次
+3. 模型失败时回退为抽取式摘要；替换后消息变少、保留最近消息，重复替换时摘要合并
+4. 摘要以 user + assistant 确认成对插入，保持角色交替（不会与下一轮用户请求合并）
+5. 抽取式摘要逐行解析批量工具调用/结果；close 取消排队任务，工作线程不阻塞进程退出
+6. 摘要槽位：主对话固定槽位时错开，未固定时不固定也不改动主客户端，单槽位时跳过模型摘要
+
+运行方式：
+    python -m pytest tests/test_history_compactor.py -v
+"""
+
+import json
+from types import SimpleNamespace
+
+from clude_code.llm.llama_cpp_http import ChatMessage
+from clude_code.llm.tokenizer import TokenCounter
+from clude_code.orchestrator.history_compactor import (
+    SUMMARY_PREFIX,
+    HistoryCompactor,
+    extractive_summary,
+    is_summary,
+)
+
+
+def _session(turns: int) -> list[ChatMessage]:
+    msgs = [ChatMessage(role="system", content="sys")]
+    for i in range(turns):
+        msgs.append(ChatMessage(role="user", content=f"请检查模块 {i}"))
+        msgs.append(ChatMessage(role="assistant", content=json.dumps({"tool": "read_file", "args": {"path": f"m{i}.py"}})))
+        msgs.append(ChatMessage(role="user", content=json.dumps({"tool": "read_file", "ok": True, "path": f"m{i}.py", "text": "x" * 500})))
+        msgs.append(ChatMessage(role="assistant", content=f"模块 {i} 没有问题"))
+    return msgs
+
+
+def test_llm_summaries_are_cached_and_swapped():
+    calls = []
+
+    def _summarize(transcript: str) -> str:
+        calls.append(transcript)
+        return f"- 摘要{len(calls)}"
+
+    comp = HistoryCompactor(summarize=_summarize, counter=TokenCounter(source="heuristic"), keep_recent=4)
+    msgs = _session(5)
+    assert comp.segments(msgs) == [(1, 5), (5, 9), (9, 13), (13, 17)]
+
+    comp.schedule(msgs)
+    comp.wait()
+    comp.schedule(msgs)
+    comp.wait()
+    assert len(calls) == 4
+
+    new = comp.apply(msgs)
+    assert new is not None and new[0] is msgs[0] and new[-4:] == msgs[-4:]
+    assert is_summary(new[1]) and "摘要1" in new[1].content and "摘要4" in new[1].content
+    assert len(new) == 1 + 2 + 4
+    roles = [m.role for m in new]
+    assert all(a != b for a, b in zip(roles[1:], roles[2:], strict=False))
+    assert comp.stats["saved_tokens"] > 0
+
+
+def test_extractive_fallback_and_merge():
+    def _fail(transcript: str) -> str:
+        raise ConnectionError("offline")
+
+    comp = HistoryCompactor(summarize=_fail, counter=TokenCounter(source="heuristic"), keep_recent=4)
+    msgs = _session(3)
+    comp.schedule(msgs)
+    comp.wait()
+    first = comp.apply(msgs)
+    assert first is not None and comp.stats["extractive"] == 2
+    assert "m0.py" in first[1].content and first[1].content.startswith(SUMMARY_PREFIX)
+
+    more = first + _session(3)[1:]
+    comp.schedule(more)
+    comp.wait()
+    second = comp.apply(more)
+    assert second is not None
+    assert sum(1 for m in second if is_summary(m) and m.role == "user") == 1
+    assert second[2].role == "assistant" and is_summary(second[2])
+    assert "m0.py" in second[1].content and "请检查模块 2" in second[1].content
+
+
+def test_extractive_parses_batches_and_close_cancels():
+    batch_call = ChatMessage(role="assistant", content=json.dumps({"tool_calls": [
+        {"tool": "read_file", "args": {"path": "a.py"}}, {"tool": "grep", "args": {"pattern": "foo"}},
+    ]}))
+    batch_result = ChatMessage(role="user", content="\n".join([
+        json.dumps({"tool": "read_file", "ok": True, "path": "a.py"}),
+        json.dumps({"tool": "grep", "ok": False, "error": "bad pattern"}),
+    ]))
+    text = extractive_summary([batch_call, batch_result])
+    assert "助手调用 read_file(path=a.py)" in text and "助手调用 grep(pattern=foo)" in text
+    assert "path=a.py" in text and "工具 grep，失败: bad pattern" in text
+
+    import threading
+
+    gate = threading.Event()
+    comp = HistoryCompactor(summarize=lambda _t: gate.wait(5) and "", counter=TokenCounter(source="heuristic"), keep_recent=4)
+    comp.schedule(_session(6))
+    comp.close()
+    assert comp.stats["scheduled"] >= 3 and len(comp._pending) <= 1
+    assert comp._worker is not None and comp._worker.daemon
+    gate.set()
+
+
+def test_summary_slot_leaves_main_client_alone():
+    from clude_code.orchestrator.agent_loop.agent_loop import AgentLoop
+
+    def slot(main: int, total: int):
+        loop = SimpleNamespace(llm=SimpleNamespace(id_slot=main, get_total_slots=lambda: total))
+        return AgentLoop._summary_slot(loop), loop.llm.id_slot
+
+    assert slot(-1, 4) == (-1, -1)
+    assert slot(0, 4) == (3, 0)
+    assert slot(3, 4) == (0, 3)
+    assert slot(2, 1) == (None, 2)
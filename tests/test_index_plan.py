@@ -0,0 +1,106 @@
+"""
+单文件索引计划回归用例 (Regression Tests for the Per-file Index Plan)
+
+验证场景：
+1. 超大/二进制文件标记 skipped，读取失败返回 empty
+2. 首次索引全量写入；内容哈希不变时返回 unchanged
+3. 只改动一个函数时 chunk 级 diff 只重写包含改动的 chunk
+4. 文件开头插入一行：chunk_id 不含行号，其余 chunk 只平移行号，不重新嵌入
+5. 写库后、保存 state 前崩溃：按旧 state 重放同一计划不会留下重复行
+
+运行方式：
+    python -m pytest tests/test_index_plan.py -v
+"""
+
+import pytest
+
+from clude_code.config.config import CludeConfig
+from clude_code.knowledge.chunking import build_chunker
+from clude_code.knowledge.index_plan import plan_file_update
+
+
+def _source(bodies: list[str]) -> str:
+    out = []
+    for i, body in enumerate(bodies):
+        out.append(f"def func_{i}(x):")
+        out.extend(f"    x = x + {j}  # {body}" for j in range(14))
+        out.append("    return x")
+        out.append("")
+    return "\n".join(out) + "\n"
+
+
+def test_guards(tmp_path):
+    cfg = CludeConfig(workspace_root=str(tmp_path))
+    chunker = build_chunker(cfg)
+    (tmp_path / "blob.bin").write_bytes(b"\x00\x01\x02" * 10)
+    assert plan_file_update(cfg, chunker, tmp_path / "blob.bin", "blob.bin", None).kind == "skipped"
+
+    cfg.rag.max_file_bytes = 16
+    (tmp_path / "big.py").write_text(_source(["a"]), encoding="utf-8")
+    assert plan_file_update(cfg, chunker, tmp_path / "big.py", "big.py", None).kind == "skipped"
+    assert plan_file_update(cfg, chunker, tmp_path / "missing.py", "missing.py", None).kind == "empty"
+
+
+def test_full_then_unchanged_then_incremental(tmp_path):
+    cfg = CludeConfig(workspace_root=str(tmp_path))
+    chunker = build_chunker(cfg)
+    path = tmp_path / "mod.py"
+    path.write_text(_source(["a", "b", "c", "d"]), encoding="utf-8")
+
+    first = plan_file_update(cfg, chunker, path, "mod.py", None)
+    assert first.kind == "update" and not first.incremental
+    assert len(first.to_add) == len(first.new_sig) > 1
+    assert set(first.columns()) >= {"text", "path", "start_line", "end_line", "chunk_id"}
+    prev = {"hash": first.file_hash, "chunks": first.new_sig}
+
+    assert plan_file_update(cfg, chunker, path, "mod.py", prev).kind == "unchanged"
+
+    path.write_text(_source(["a", "b", "CHANGED", "d"]), encoding="utf-8")
+    second = plan_file_update(cfg, chunker, path, "mod.py", prev)
+    assert second.kind == "update" and second.incremental
+    # 只有包含改动的 chunk（相邻块有少量 overlap）被重写
+    assert all("CHANGED" in r["text"] for r in second.to_add)
+    assert 0 < len(second.to_add) == len(second.stale_ids) < len(first.to_add)
+
+
+def test_inserted_line_only_shifts_later_chunks(tmp_path):
+    cfg = CludeConfig(workspace_root=str(tmp_path))
+    chunker = build_chunker(cfg)
+    path = tmp_path / "mod.py"
+    path.write_text(_source(["a", "b", "c", "d"]), encoding="utf-8")
+    first = plan_file_update(cfg, chunker, path, "mod.py", None)
+    prev = {"hash": first.file_hash, "chunks": first.new_sig}
+
+    path.write_text("import os\n" + _source(["a", "b", "c", "d"]), encoding="utf-8")
+    second = plan_file_update(cfg, chunker, path, "mod.py", prev)
+    assert second.incremental
+    assert all("import os" in r["text"] for r in second.to_add)
+    assert len(second.stale_ids) == len(second.to_add) < len(first.to_add)
+    shifted = second.moved[1]
+    assert len(shifted) + len(second.to_add) == len(second.new_sig)
+    assert all(second.new_sig[c] == [s + 1, e + 1] for c in shifted for s, e in [first.new_sig[c]])
+
+
+def test_replayed_update_is_idempotent(tmp_path):
+    np = pytest.importorskip("numpy")
+    pytest.importorskip("lancedb")
+    from clude_code.knowledge.indexer_service import IndexerService
+
+    cfg = CludeConfig(workspace_root=str(tmp_path))
+    cfg.rag.write_buffer_rows = 0
+    svc = IndexerService(cfg)
+    path = tmp_path / "mod.py"
+    path.write_text(_source(["a", "b", "c", "d"]), encoding="utf-8")
+    first = plan_file_update(cfg, svc.chunker, path, "mod.py", None)
+    svc._apply_update(first, np.zeros((len(first.to_add), 8), dtype=np.float32))
+    prev = {"hash": first.file_hash, "chunks": first.new_sig}
+
+    path.write_text(_source(["a", "b", "CHANGED", "d"]), encoding="utf-8")
+    second = plan_file_update(cfg, svc.chunker, path, "mod.py", prev)
+    vectors = np.ones((len(second.to_add), 8), dtype=np.float32)
+    svc._apply_update(second, vectors)
+    # 模拟崩溃：state 未保存，下次仍按旧签名得到同一计划
+    svc._apply_update(plan_file_update(cfg, svc.chunker, path, "mod.py", prev), vectors)
+
+    ids = svc.store._table.to_arrow().column("chunk_id").to_pylist()
+    assert sorted(ids) == sorted(second.new_sig)
@@ -0,0 +1,55 @@
+"""
+进程池索引冒烟用例 (Smoke Tests for Process-Pool Indexing)
+
+验证场景：
+1. spawn 子进程能加载配置与分块器，并把索引计划（skipped / unchanged）回传父进程
+2. load_vectors 对内联字节与 shared_memory 两种回传方式都能还原向量，并释放 shm
+
+运行方式：
+    python -m pytest tests/test_index_workers.py -v
+"""
+
+import hashlib
+
+import pytest
+
+from clude_code.config.config import CludeConfig
+from clude_code.knowledge.index_plan import FileUpdate
+from clude_code.knowledge.index_workers import ProcessIndexPool, WorkerResult, load_vectors
+
+
+def test_process_pool_smoke(tmp_path):
+    cfg = CludeConfig(workspace_root=str(tmp_path))
+    text = "def f():\n    return 1\n"
+    (tmp_path / "a.py").write_text(text, encoding="utf-8")
+    (tmp_path / "b.bin").write_bytes(b"\x00" * 32)
+    prev = {"hash": hashlib.md5(text.encode()).hexdigest()}
+
+    pool = ProcessIndexPool(cfg, workers=1)
+    try:
+        unchanged = pool.submit(tmp_path / "a.py", "a.py", prev).result(timeout=120)
+        skipped = pool.submit(tmp_path / "b.bin", "b.bin", {}).result(timeout=120)
+    finally:
+        pool.shutdown()
+    assert unchanged.update.kind == "unchanged" and unchanged.update.file_hash == prev["hash"]
+    assert skipped.update.kind == "skipped"
+    assert unchanged.shm_name is None and unchanged.inline is None
+
+
+def test_load_vectors_inline_and_shm():
+    np = pytest.importorskip("numpy")
+    from multiprocessing import shared_memory
+
+    vectors = np.arange(12, dtype=np.float32).reshape(3, 4)
+    got = []
+    load_vectors(WorkerResult(FileUpdate("a.py", "update"), shape=(3, 4), inline=vectors.tobytes()), lambda v: got.append(v.copy()))
+
+    shm = shared_memory.SharedMemory(create=True, size=vectors.nbytes)
+    np.ndarray((3, 4), dtype=np.float32, buffer=shm.buf)[:] = vectors
+    name = shm.name
+    shm.close()
+    load_vectors(WorkerResult(FileUpdate("a.py", "update"), shape=(3, 4), shm_name=name), lambda v: got.append(v.copy()))
+
+    assert all((v == vectors).all() for v in got) and len(got) == 2
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name)
@@ -0,0 +1,62 @@
+"""
+LLM HTTP 连接池回归用例 (Regression Tests for Pooled LlamaCppHttpClient)
+
+验证场景：
+1. 多次 chat 复用同一条 keep-alive 连接
+2. model 为空时自动解析的模型 ID 按 TTL 缓存（只请求一次 /v1/models）
+3. last_timing 提供 connect/ttfb/total 耗时拆分
+
+运行方式：
+    python -m pytest tests/test_llm_http_pool.py -v
+"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from clude_code.llm.llama_cpp_http import ChatMessage, LlamaCppHttpClient
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    peers: set = set()
+    model_calls = 0
+
+    def log_message(self, *args):  # noqa: D401 - 静默
+        pass
+
+    def _send(self, obj):
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        _Handler.peers.add(self.client_address)
+        _Handler.model_calls += 1
+        self._send({"data": [{"id": "local-model"}]})
+
+    def do_POST(self):
+        _Handler.peers.add(self.client_address)
+        req = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self._send({"choices": [{"message": {"content": f"ok:{req['model']}"}}]})
+
+
+def test_pooled_client_reuses_connection_and_caches_model():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    try:
+        client = LlamaCppHttpClient(base_url=f"http://127.0.0.1:{srv.server_port}", model="", api_key="x")
+        for _ in range(4):
+            assert client.chat([ChatMessage(role="user", content="hi")]) == "ok:local-model"
+        assert _Handler.model_calls == 1
+        assert len(_Handler.peers) == 1
+        t = client.last_timing
+        assert t["reused"] is True and t["connect_ms"] == 0.0
+        assert 0.0 <= t["ttfb_ms"] <= t["total_ms"]
+        client.close()
+    finally:
+        srv.shutdown()
+        srv.server_close()
@@ -0,0 +1,84 @@
+"""
+LLM 流式输出回归用例 (Regression Tests for Token Streaming)
+
+验证场景：
+1. ToolCallDetector 增量识别顶层工具调用（字符串内括号/转义、嵌套 "tool" 不误触发）
+2. chat_stream 解析 SSE 增量，检测到工具调用后提前断开（服务端不再继续发送）
+
+运行方式：
+    python -m pytest tests/test_llm_streaming.py -v
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from clude_code.llm.llama_cpp_http import ChatMessage, LlamaCppHttpClient
+from clude_code.orchestrator.agent_loop.parsing import ToolCallDetector
+
+_TOOL_TEXT = 'Let me search. {"tool": "grep", "args": {"pattern": "a}\\"{b"}}'
+_TAIL = " and then I keep rambling for a very long time" * 20
+
+
+def test_tool_call_detector_incremental():
+    det = ToolCallDetector()
+    found = None
+    for i in range(0, len(_TOOL_TEXT), 2):
+        found = det.feed(_TOOL_TEXT[i : i + 2]) or found
+    assert found == {"tool": "grep", "args": {"pattern": 'a}"{b'}}
+
+    plan = ToolCallDetector()
+    assert plan.feed('{"title": "p", "steps": [{"tool": "read_file"}]}') is None
+    assert ToolCallDetector().feed("use {braces} in prose") is None
+
+
+class _SSEHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    sent = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        pieces = [_TOOL_TEXT[i : i + 4] for i in range(0, len(_TOOL_TEXT), 4)] + list(_TAIL)
+        try:
+            for p in pieces:
+                chunk = {"choices": [{"delta": {"content": p}}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                _SSEHandler.sent += 1
+                time.sleep(0.002)
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def test_chat_stream_early_stop():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _SSEHandler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    try:
+        client = LlamaCppHttpClient(base_url=f"http://127.0.0.1:{srv.server_port}", model="m")
+        det = ToolCallDetector()
+        deltas = []
+
+        def on_delta(d):
+            deltas.append(d)
+            return det.feed(d) is not None
+
+        text = client.chat_stream([ChatMessage(role="user", content="hi")], on_delta)
+        assert text == _TOOL_TEXT
+        assert client.last_timing["early_stop"] is True
+        assert client.last_timing["first_token_ms"] <= client.last_timing["total_ms"]
+        time.sleep(0.2)
+        total_pieces = len(_TOOL_TEXT) // 4 + 1 + len(_TAIL)
+        assert _SSEHandler.sent < total_pieces
+        client.close()
+    finally:
+        srv.shutdown()
+        srv.server_close()
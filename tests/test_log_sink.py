@@ -0,0 +1,90 @@
+"""
+异步日志写入器回归用例 (Regression Tests for the Async Log Sink)
+
+验证场景：
+1. 多个文件的行按提交顺序批量写入；flush 后读取方能读到，sync 才 fsync
+2. 队列满时生产者阻塞等待（不丢行），背压次数计入 stats
+3. close 写完剩余行；关闭后的 submit 退化为同步写入
+4. TraceLogger 写入后 read_traces 立即可见
+5. 孤立代理字符被转义写入；某个文件写入出错不会丢同批其他行，写线程继续运行
+
+运行方式：
+    python -m pytest tests/test_log_sink.py -v
+"""
+
+import threading
+import time
+
+from clude_code.observability.log_sink import LogSink, LogWriter
+
+
+def test_batches_in_order_and_sync(tmp_path):
+    sink = LogSink(batch_size=64, flush_interval=0.05)
+    a, b = tmp_path / "logs" / "a.jsonl", tmp_path / "logs" / "b.jsonl"
+    for i in range(200):
+        sink.submit(a if i % 2 else b, str(i))
+    assert sink.flush()
+    assert a.read_text().split() == [str(i) for i in range(1, 200, 2)]
+    assert b.read_text().split() == [str(i) for i in range(0, 200, 2)]
+    stats = sink.stats()
+    assert stats["written"] == 200 and stats["batches"] < 200 and stats["fsyncs"] == 0
+    assert sink.sync() and sink.stats()["fsyncs"] == 2
+    sink.close()
+
+
+def test_backpressure_blocks_without_dropping(tmp_path):
+    sink = LogSink(max_queue=4, batch_size=2, flush_interval=0)
+    gate = threading.Event()
+    original = sink._write_batch
+
+    def slow_write(batch):
+        gate.wait(5)
+        original(batch)
+
+    sink._write_batch = slow_write
+    path = tmp_path / "audit.jsonl"
+    producer = threading.Thread(target=lambda: [sink.submit(path, str(i)) for i in range(20)])
+    producer.start()
+    time.sleep(0.2)
+    assert producer.is_alive()  # 写线程卡住、队列已满：生产者被阻塞
+    gate.set()
+    producer.join(5)
+    sink.close()
+    assert path.read_text().split() == [str(i) for i in range(20)]
+    stats = sink.stats()
+    assert stats["backpressure_waits"] >= 1 and stats["backpressure_wait_seconds"] > 0
+    assert stats["max_queue_depth"] <= 4
+
+    sink.submit(path, "late")
+    assert path.read_text().split()[-1] == "late" and sink.stats()["sync_writes"] == 1
+
+
+def test_trace_logger_reads_own_writes(tmp_path):
+    from clude_code.observability.trace import TraceLogger
+
+    tl = TraceLogger(str(tmp_path), "s1")
+    for i in range(3):
+        tl.write(trace_id="t", step=i, event="e", data={"i": i})
+    assert len(tl.read_traces(limit=10, session_id="s1")) == 3
+    assert TraceLogger.list_sessions(str(tmp_path)) == ["s1"]
+
+
+def test_bad_batch_does_not_kill_writer(tmp_path):
+    class Broken(LogWriter):
+        def write_lines(self, lines):
+            raise RuntimeError("boom")
+
+    sink = LogSink(flush_interval=0.05)
+    ok, broken = tmp_path / "ok.jsonl", tmp_path / "broken.jsonl"
+    sink.attach(broken, Broken(broken))
+    sink.submit(ok, "ok1")
+    sink.submit(ok, "bad \ud800")
+    sink.submit(broken, "lost")
+    assert sink.flush()
+    assert sink._alive()
+    sink.submit(ok, "ok2")
+    assert sink.flush()
+    assert ok.read_text(encoding="utf-8").splitlines() == ["ok1", "bad \\ud800", "ok2"]
+    stats = sink.stats()
+    assert stats["write_errors"] == 1 and stats["sync_writes"] == 0
+    sink.close()
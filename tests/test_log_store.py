@@ -0,0 +1,119 @@
+"""
+轮转索引日志存储回归用例 (Regression Tests for the Rotating Indexed JSONL Log)
+
+验证场景：
+1. 超过 max_bytes 时封存为编号段并写出偏移索引与清单；默认不删段，显式 max_segments 时旧段整段删除
+2. tail 按会话/trace_id 跨段返回最新的 N 条（新 -> 旧），会话列表只读清单
+3. 另一个只读实例（模拟 CLI 进程）增量追上活动文件；清单丢失时读取方只在内存中重建，由写入端落盘
+4. TraceLogger.read_traces(limit) 返回最新而不是最旧的 N 条
+5. 两个写进程并发追加并各自触发轮转：偏移索引不指向行中间，按会话读取不丢事件，清单不互相覆盖
+
+运行方式：
+    python -m pytest tests/test_log_store.py -v
+"""
+
+import json
+import multiprocessing
+import sys
+
+import pytest
+
+from clude_code.observability.log_store import RotatingJsonlLog
+
+
+def _line(i: int, session: str, trace: str) -> str:
+    return json.dumps({"timestamp": 1_700_000_000 + i, "trace_id": trace, "session_id": session, "event": "e", "i": i, "pad": "x" * 200})
+
+
+def _fill(log: RotatingJsonlLog, n: int) -> None:
+    for i in range(0, n, 5):
+        log.write_lines([_line(j, f"s{j % 2}", f"t{j // 10}") for j in range(i, min(i + 5, n))])
+
+
+def test_rotation_and_indexed_tail(tmp_path):
+    path = tmp_path / "logs" / "trace.jsonl"
+    log = RotatingJsonlLog(path, max_bytes=4096, max_segments=100)
+    _fill(log, 200)
+    segments = log.segment_files()
+    assert len(segments) > 5 and segments[-1] == path
+    assert (tmp_path / "logs" / "trace.index.json").exists()
+    assert all(p.with_name(p.name.replace(".jsonl", ".idx.json")).exists() for p in segments[:-1])
+
+    latest = log.tail(7, session_id="s1")
+    assert [r["i"] for r in latest] == [199, 197, 195, 193, 191, 189, 187]
+    assert [r["i"] for r in log.tail(3)] == [199, 198, 197]
+    assert [r["i"] for r in log.trace_events("t3")] == list(range(30, 40))
+    assert [r["i"] for r in log.tail(100, since=1_700_000_000 + 195)] == [199, 198, 197, 196, 195]
+    assert log.sessions() == {"s0": [1_700_000_000, 1_700_000_198, 100], "s1": [1_700_000_001, 1_700_000_199, 100]}
+    log.close()
+
+    # 默认保留全部封存段
+    unlimited = RotatingJsonlLog(tmp_path / "audit.jsonl", max_bytes=4096)
+    _fill(unlimited, 200)
+    assert len(unlimited.segment_files()) == len(segments)
+    unlimited.close()
+
+
+def test_retention_and_reader_instance(tmp_path):
+    path = tmp_path / "audit.jsonl"
+    writer = RotatingJsonlLog(path, max_bytes=4096, max_segments=2)
+    reader = RotatingJsonlLog(path, max_bytes=4096, max_segments=2)
+    _fill(writer, 60)
+    assert [r["i"] for r in reader.tail(2)] == [59, 58]
+    _fill(writer, 200)
+    assert len(writer.segment_files()) == 3
+    # 读取实例检测到轮转后重新加载清单
+    assert [r["i"] for r in reader.tail(1, session_id="s0")] == [198]
+    assert len(list(tmp_path.glob("audit.0*.jsonl"))) == 2
+
+    writer.close()
+    (tmp_path / "audit.index.json").unlink()
+    for p in tmp_path.glob("audit.*.idx.json"):
+        p.unlink()
+    fresh = RotatingJsonlLog(path)
+    assert [r["i"] for r in fresh.tail(2, trace_id="t19")] == [199, 198]
+    # 只读实例不写共享文件；写入端下次写入时把重建结果落盘
+    assert not (tmp_path / "audit.index.json").exists()
+    assert not list(tmp_path.glob("audit.*.idx.json"))
+    fresh.write_lines([_line(200, "s0", "t20")])
+    assert (tmp_path / "audit.index.json").exists()
+    assert all(p.with_name(p.name.replace(".jsonl", ".idx.json")).exists() for p in fresh.segment_files()[:-1])
+    fresh.close()
+
+
+def _write_session(path: str, session: str) -> None:
+    log = RotatingJsonlLog(path, max_bytes=8192)
+    for i in range(0, 300, 3):
+        log.write_lines([_line(j, session, f"{session}-{j // 10}") for j in range(i, i + 3)])
+    log.close()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="跨进程写锁依赖 fcntl")
+def test_concurrent_writer_processes(tmp_path):
+    path = tmp_path / "audit.jsonl"
+    ctx = multiprocessing.get_context("fork")
+    procs = [ctx.Process(target=_write_session, args=(str(path), s)) for s in ("a", "b")]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(60)
+        assert p.exitcode == 0
+
+    reader = RotatingJsonlLog(path, max_bytes=8192)
+    for session in ("a", "b"):
+        assert sorted(r["i"] for r in reader.tail(1000, session_id=session)) == list(range(300))
+        assert [r["i"] for r in reader.trace_events(f"{session}-7")] == list(range(70, 80))
+    manifest = json.loads((tmp_path / "audit.index.json").read_text(encoding="utf-8"))
+    assert [seg["seq"] for seg in manifest["segments"]] == list(range(1, len(reader.segment_files())))
+    assert sum(seg["count"] for seg in manifest["segments"]) + reader._active.count == 600
+
+
+def test_trace_logger_returns_newest(tmp_path):
+    from clude_code.observability.trace import TraceLogger
+
+    tl = TraceLogger(str(tmp_path), "sess")
+    for i in range(50):
+        tl.write(trace_id=f"t{i // 10}", step=i, event="e", data={})
+    assert [e.step for e in tl.read_traces(limit=3)] == [49, 48, 47]
+    assert [e.step for e in tl.read_trace("t2")] == list(range(20, 30))
+    assert TraceLogger.list_sessions(str(tmp_path)) == ["sess"]
@@ -0,0 +1,43 @@
+"""
+消息存储回归用例 (Regression Tests for Content-Addressed Message Store)
+
+验证场景：
+1. 同一会话中已发送过的消息只发引用，新消息随 delta 发送正文
+2. resolve_messages 从存储还原完整 messages；存储淘汰后回退到事件中的 delta
+3. 兼容旧格式（messages 元素自带 content）
+
+运行方式：
+    python -m pytest tests/test_message_store.py -v
+"""
+
+from clude_code.llm.llama_cpp_http import ChatMessage
+from clude_code.observability.message_store import MessageRefEncoder, MessageStore, resolve_messages
+
+
+def test_refs_delta_and_resolve():
+    store = MessageStore()
+    enc = MessageRefEncoder(store)
+    msgs = [ChatMessage(role="system", content="S" * 5000), ChatMessage(role="user", content="hi")]
+
+    refs, delta = enc.encode(msgs)
+    assert [d["content"] for d in delta] == ["S" * 5000, "hi"]
+    assert refs[0]["length"] == 5000 and "content" not in refs[0]
+
+    msgs.append(ChatMessage(role="assistant", content="ok"))
+    refs, delta = enc.encode(msgs)
+    assert [d["content"] for d in delta] == ["ok"]
+    event = {"messages": refs, "messages_delta": delta}
+    assert [m["content"] for m in resolve_messages(event, store)] == ["S" * 5000, "hi", "ok"]
+
+    # 存储为空（例如离线回放 trace）时，delta 中的正文仍可还原
+    assert resolve_messages(event, MessageStore())[2] == {"role": "assistant", "content": "ok"}
+
+    legacy = {"messages": [{"role": "user", "content": "old"}]}
+    assert resolve_messages(legacy, store) == [{"role": "user", "content": "old"}]
+
+
+def test_store_evicts_by_bytes():
+    store = MessageStore(max_bytes=10)
+    a = store.put("user", "aaaaaa")
+    b = store.put("user", "bbbbbb")
+    assert store.get(a) is None and store.get(b)["content"] == "bbbbbb"
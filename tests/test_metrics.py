@@ -0,0 +1,97 @@
+"""
+常量内存 Histogram / Summary 回归用例 (Regression Tests for Constant-Memory Metrics)
+
+验证场景：
+1. Histogram 累计桶计数、count/sum 正确，且不保存原始观察值
+2. DDSketch 分位数相对误差在 relative_accuracy 内，两个草图合并等价于合并数据
+3. Summary 只统计滑动窗口内的时间片
+
+运行方式：
+    python -m pytest tests/test_metrics.py -v
+"""
+
+import random
+
+from clude_code.observability.metrics import DDSketch, Histogram, Summary
+
+
+def test_histogram_cumulative_buckets():
+    h = Histogram("latency", buckets=[1.0, 0.1, 5.0])
+    for v in [0.05, 0.1, 0.3, 2.0, 7.0, 9.0]:
+        h.observe(v)
+    assert [(b.le, b.count) for b in h.get_bucket_counts()] == [(0.1, 2), (1.0, 3), (5.0, 4), (float("inf"), 6)]
+    points = {(p.name, p.labels.get("le")): p.value for p in h.collect()}
+    assert points[("latency_count", None)] == 6
+    assert abs(points[("latency_sum", None)] - 18.45) < 1e-9
+    assert not hasattr(h, "_observations")
+
+
+def test_ddsketch_accuracy_and_merge():
+    rng = random.Random(1)
+    a_vals = [rng.lognormvariate(0, 2) for _ in range(20000)]
+    b_vals = [-rng.expovariate(1.0) for _ in range(5000)] + [0.0] * 100
+    a, b = DDSketch(0.01), DDSketch(0.01)
+    for v in a_vals:
+        a.add(v)
+    for v in b_vals:
+        b.add(v)
+    a.merge(b)
+    data = sorted(a_vals + b_vals)
+    assert a.count == len(data)
+    for q in (0.01, 0.1, 0.5, 0.9, 0.99):
+        exact = data[int(q * (len(data) - 1))]
+        est = a.quantile(q)
+        assert abs(est - exact) <= 0.0101 * abs(exact) + 1e-9, (q, est, exact)
+    assert DDSketch().quantile(0.5) is None
+
+
+def test_summary_window(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("clude_code.observability.metrics.time.time", lambda: now[0])
+    s = Summary("dur", quantiles=[0.5], max_age=100, age_buckets=4)
+    for v in range(1, 101):
+        s.observe(float(v))
+    now[0] += 60
+    s.observe(500.0)
+    stats = s.get_stats()
+    assert stats.count == 101 and stats.max == 500.0 and stats.min == 1.0
+    assert abs(stats.quantiles[0.5] - 51) <= 1
+    # 第一个时间片过期后只剩最新的观察值
+    now[0] += 50
+    stats = s.get_stats()
+    assert stats.count == 1 and stats.quantiles[0.5] == 500.0
+
+
+def test_metric_family_interns_children_and_caps_cardinality(tmp_path):
+    from clude_code.observability.metrics import MetricFamily, MetricsCollector
+
+    collector = MetricsCollector(str(tmp_path))
+    calls = collector.counter_family("tool_calls_total", ["tool"], "calls", max_series=3)
+    assert collector.counter_family("tool_calls_total", ["tool"]) is calls
+    calls.with_labels(tool="grep").inc()
+    calls.child("grep").inc()
+    calls.child(tool="read_file").inc(3)
+    assert calls.child(tool="grep") is calls.child("grep")
+
+    durations = collector.histogram_family("tool_call_duration_seconds", ["tool"], buckets=[0.1, 1.0])
+    durations.child(tool="grep").observe(0.05)
+
+    points = collector.collect_all()
+    by_tool = {p.labels["tool"]: p.value for p in points if p.name == "tool_calls_total"}
+    assert by_tool == {"grep": 2, "read_file": 3}
+    assert any(p.name == "tool_call_duration_seconds_bucket" and p.labels == {"tool": "grep", "le": "0.1"} and p.value == 1
+               for p in points)
+
+    # 超过上限的标签组合统一计入溢出序列
+    for i in range(10):
+        calls.child(tool=f"path_{i}").inc()
+    # 3 个真实序列 + 1 个溢出序列
+    assert len(calls.children()) == 4
+    assert calls.child(tool="another").labels["tool"] == MetricFamily.OVERFLOW_LABEL
+    assert calls.dropped_series >= 10
+
+    import pytest
+    with pytest.raises(ValueError):
+        collector.gauge_family("tool_calls_total", ["tool"])
+    with pytest.raises(ValueError):
+        calls.child(name="x")
@@ -0,0 +1,107 @@
+"""
+分段指标存储回归用例 (Regression Tests for Segmented Metrics Storage)
+
+验证场景：
+1. 数据点按小时写入不同段；按名称/标签/类型/时间范围/limit 查询结果正确
+2. 旁路索引丢失或段文件尾部写坏时，从段文件重建索引；加载只忽略不完整块，写入端追加前才截断
+3. 过期清理整段删除；旧 data.jsonl 一次性迁移
+4. 两个实例（模拟同一工作区的两个会话）交替写同一段：序列号不串号、互不截断对方的块
+
+运行方式：
+    python -m pytest tests/test_metrics_storage.py -v
+"""
+
+import json
+
+from clude_code.observability.metrics import MetricPoint, MetricType
+from clude_code.observability.metrics_storage import MetricsQuery, SegmentedMetricsStorage
+
+_T0 = 1_700_000_000.0  # 2023-11-14 22:13:20 UTC
+
+
+def _points(t0: float, hours: int = 3) -> list[MetricPoint]:
+    out = []
+    for h in range(hours):
+        for i in range(10):
+            ts = t0 + h * 3600 + i
+            out.append(MetricPoint("tool_calls_total", MetricType.COUNTER, i, ts, {"tool": "grep" if i % 2 else "read"}))
+            out.append(MetricPoint("cpu", MetricType.GAUGE, 0.5, ts))
+    return out
+
+
+def test_store_and_query(tmp_path):
+    s = SegmentedMetricsStorage(str(tmp_path))
+    s.store(_points(_T0))
+    assert len(list((tmp_path / ".clude" / "metrics" / "segments").glob("*.seg"))) == 3
+    assert sorted(s.get_metric_names()) == ["cpu", "tool_calls_total"]
+
+    res = s.query(MetricsQuery(name="tool_calls_total", labels={"tool": "grep"}))
+    assert len(res) == 15 and all(p.labels == {"tool": "grep"} for p in res)
+    assert res[0].timestamp > res[-1].timestamp
+
+    res = s.query(MetricsQuery(start_time=_T0 + 3600, end_time=_T0 + 3604))
+    assert len(res) == 10
+    assert {p.metric_type for p in s.query(MetricsQuery(metric_type=MetricType.GAUGE))} == {MetricType.GAUGE}
+
+    latest = s.query(MetricsQuery(name="cpu", limit=3))
+    assert [p.timestamp for p in latest] == [_T0 + 2 * 3600 + i for i in (9, 8, 7)]
+
+
+def test_rebuild_index_and_truncate_tail(tmp_path):
+    s = SegmentedMetricsStorage(str(tmp_path))
+    s.store(_points(_T0, hours=1))
+    s.store(_points(_T0 + 20, hours=1))
+    seg_dir = tmp_path / ".clude" / "metrics" / "segments"
+    seg = next(seg_dir.glob("*.seg"))
+    good_size = seg.stat().st_size
+    next(seg_dir.glob("*.idx")).unlink()
+    with open(seg, "ab") as f:
+        f.write(b"CMS1\x05\x00")  # 写入中途崩溃留下的半个块头
+
+    s2 = SegmentedMetricsStorage(str(tmp_path))
+    assert seg.stat().st_size == good_size + 6  # 只读加载不改段文件
+    assert len(s2.query(MetricsQuery(name="tool_calls_total"))) == 20
+    s2.store([MetricPoint("tool_calls_total", MetricType.COUNTER, 1, _T0 + 30, {"tool": "grep"})])
+    assert len(s2.query(MetricsQuery(name="tool_calls_total", labels={"tool": "grep"}))) == 11
+    assert len(SegmentedMetricsStorage(str(tmp_path)).query(MetricsQuery(name="tool_calls_total"))) == 21
+
+
+def test_two_writers_share_segment(tmp_path):
+    a = SegmentedMetricsStorage(str(tmp_path))
+    b = SegmentedMetricsStorage(str(tmp_path))
+    a.store([MetricPoint("x", MetricType.GAUGE, 1.0, _T0)])
+    b.store([MetricPoint("y", MetricType.GAUGE, 2.0, _T0 + 1)])
+    a.store([MetricPoint("x", MetricType.GAUGE, 3.0, _T0 + 2)])
+    b.store([MetricPoint("y", MetricType.GAUGE, 4.0, _T0 + 3)])
+    a.flush()
+    b.flush()
+
+    def values(store: SegmentedMetricsStorage, name: str) -> list[float]:
+        return sorted(p.value for p in store.query(MetricsQuery(name=name)))
+
+    for reader in (a, SegmentedMetricsStorage(str(tmp_path))):
+        assert values(reader, "x") == [1.0, 3.0]
+        assert values(reader, "y") == [2.0, 4.0]
+    for idx in (tmp_path / ".clude" / "metrics" / "segments").glob("*.idx"):
+        idx.unlink()
+    fresh = SegmentedMetricsStorage(str(tmp_path))
+    assert values(fresh, "x") == [1.0, 3.0] and values(fresh, "y") == [2.0, 4.0]
+
+
+def test_cleanup_drops_segments_and_migrates_legacy(tmp_path):
+    metrics_dir = tmp_path / ".clude" / "metrics"
+    metrics_dir.mkdir(parents=True)
+    legacy = metrics_dir / "data.jsonl"
+    legacy.write_text(
+        json.dumps({"name": "old", "metric_type": "counter", "value": 1, "timestamp": _T0, "labels": {}}) + "\n"
+        + "not json\n"
+    )
+    s = SegmentedMetricsStorage(str(tmp_path))
+    assert not legacy.exists() and (metrics_dir / "data.jsonl.migrated").exists()
+    assert [p.name for p in s.query(MetricsQuery())] == ["old"]
+
+    import time
+    s.store([MetricPoint("fresh", MetricType.GAUGE, 1, time.time())])
+    assert s.cleanup(retention_hours=1) == 1
+    assert s.get_metric_names() == ["fresh"]
+    assert len(list((metrics_dir / "segments").glob("*.seg"))) == 1
@@ -0,0 +1,87 @@
+"""
+提示词前缀缓存回归用例 (Regression Tests for Prompt-Prefix KV-Cache Reuse)
+
+验证场景：
+1. 请求体携带 cache_prompt / id_slot，并解析服务端返回的 timings.cache_n
+2. 服务端未报告时，按与上一次请求的公共前缀估算节省的 prefill token
+3. SessionUsage 汇总会话级与本轮的 prefill 节省
+
+运行方式：
+    python -m pytest tests/test_prefix_cache.py -v
+"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+from clude_code.llm.llama_cpp_http import ChatMessage, LlamaCppHttpClient
+from clude_code.observability.usage import SessionUsage
+from clude_code.orchestrator.agent_loop.llm_io import _prompt_signature, prefill_stats
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    requests: list = []
+
+    def log_message(self, *args):  # noqa: D401 - 静默
+        pass
+
+    def do_POST(self):
+        req = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        _Handler.requests.append(req)
+        body = json.dumps({
+            "choices": [{"message": {"content": "ok"}}],
+            "timings": {"cache_n": 90, "prompt_n": 10},
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def test_cache_fields_and_server_usage():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    try:
+        client = LlamaCppHttpClient(
+            base_url=f"http://127.0.0.1:{srv.server_port}", model="m", cache_prompt=True, id_slot=2
+        )
+        assert client.chat([ChatMessage(role="user", content="hi")]) == "ok"
+        assert _Handler.requests[-1]["cache_prompt"] is True
+        assert _Handler.requests[-1]["id_slot"] == 2
+        assert client.last_server_usage == {"prompt_tokens": 100, "cached_tokens": 90}
+        client.close()
+    finally:
+        srv.shutdown()
+        srv.server_close()
+
+    usage = {"usage": {"prompt_tokens": 50, "prompt_tokens_details": {"cached_tokens": 32}}}
+    assert LlamaCppHttpClient._server_usage(usage) == {"prompt_tokens": 50, "cached_tokens": 32}
+
+
+def test_prefill_estimate_and_usage():
+    loop = SimpleNamespace(llm=SimpleNamespace(last_server_usage={}))
+    system = ChatMessage(role="system", content="你是代码助手。" * 200)
+    msgs = [system, ChatMessage(role="user", content="读一下 a.py")]
+
+    first = prefill_stats(loop, _prompt_signature(msgs), 1000)
+    assert first == {"prompt_tokens": 1000, "saved_tokens": 0, "source": "estimate"}
+
+    msgs += [ChatMessage(role="assistant", content="好的"), ChatMessage(role="user", content="继续")]
+    second = prefill_stats(loop, _prompt_signature(msgs), 1000)
+    assert 0 < second["saved_tokens"] <= 1000
+
+    loop.llm.last_server_usage = {"prompt_tokens": 1200, "cached_tokens": 1100}
+    third = prefill_stats(loop, _prompt_signature(msgs), 1000)
+    assert third == {"prompt_tokens": 1200, "saved_tokens": 1100, "source": "server"}
+
+    su = SessionUsage()
+    su.record_prefill(prompt_tokens=1200, saved_tokens=1100)
+    su.begin_turn()
+    su.record_prefill(prompt_tokens=100, saved_tokens=500)
+    summary = su.summary()
+    assert summary["prefill_tokens_total"] == 1300
+    assert summary["prefill_tokens_saved"] == 1200
+    assert summary["turn_prefill_tokens_saved"] == 100
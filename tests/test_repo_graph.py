@@ -0,0 +1,83 @@
+"""
+仓库引用图回归用例 (Regression Tests for Graph-Ranked Repo Map)
+
+验证场景：
+1. 被多处引用的定义文件排名最高
+2. 本轮提到的文件作为种子后优先渲染
+3. 增量同步与全量重建得到相同的出边
+4. 渲染结果不超过 token 预算；自动预算不超过 auto_max_tokens
+
+运行方式：
+    python -m pytest tests/test_repo_graph.py -v
+"""
+
+import os
+from pathlib import Path
+
+from clude_code.observability.usage import estimate_tokens
+from clude_code.tooling.tools.repo_graph import RepoGraph
+from clude_code.tooling.tools.repo_symbols import RepoSymbolDB
+
+
+def _write(root: Path, rel: str, text: str) -> None:
+    p = root / rel
+    p.parent.mkdir(parents=True, exist_ok=True)
+    p.write_text(text, encoding="utf-8")
+
+
+def _repo(root: Path) -> RepoSymbolDB:
+    _write(root, "core/engine.py", "class RenderEngine:\n    pass\n\ndef build_pipeline():\n    pass\n")
+    for i in range(4):
+        _write(root, f"app/view_{i}.py", f"from core.engine import RenderEngine\n\ndef view_{i}_handler():\n    RenderEngine()\n")
+    _write(root, "misc/orphan.py", "def lonely_function():\n    pass\n")
+    db = RepoSymbolDB(root)
+    db.refresh()
+    return db
+
+
+def test_pagerank_and_personalization(tmp_path: Path):
+    graph = RepoGraph()
+    graph.sync(_repo(tmp_path))
+
+    ranks = graph.pagerank()
+    assert max(ranks, key=ranks.get) == "core/engine.py"
+
+    seeds = graph.mentioned("please look at misc/orphan.py")
+    assert seeds == {"misc/orphan.py": 1.0}
+    assert graph.pagerank(seeds)["misc/orphan.py"] > ranks["misc/orphan.py"]
+    text = graph.render(max_tokens=60, count_tokens=estimate_tokens, seeds=seeds)
+    assert "lonely_function" in text
+
+
+def test_incremental_matches_rebuild(tmp_path: Path):
+    db = _repo(tmp_path)
+    graph = RepoGraph()
+    graph.sync(db)
+
+    _write(tmp_path, "core/engine.py", "class RenderEngine2:\n    pass\n")
+    os.utime(tmp_path / "core/engine.py", (1, 1))
+    (tmp_path / "app/view_0.py").unlink()
+    db.refresh()
+    assert graph.sync(db)
+
+    fresh = RepoGraph()
+    fresh.sync(RepoSymbolDB(tmp_path))
+    assert graph.out == fresh.out
+    assert graph.defines == fresh.defines
+
+
+def test_render_respects_budget(tmp_path: Path):
+    graph = RepoGraph()
+    graph.sync(_repo(tmp_path))
+    for budget in (30, 60, 200):
+        text = graph.render(max_tokens=budget, count_tokens=estimate_tokens)
+        assert estimate_tokens(text) <= budget
+    full = graph.render(max_tokens=10_000, count_tokens=estimate_tokens)
+    assert "RenderEngine" in full and "lonely_function" in full
+
+
+def test_auto_budget_is_capped():
+    from clude_code.tooling.tools.repo_map import resolve_repo_map_budget
+
+    assert resolve_repo_map_budget(8192) < 4096
+    assert resolve_repo_map_budget(131072) == 4096
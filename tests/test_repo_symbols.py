@@ -0,0 +1,53 @@
+"""
+仓库符号库回归用例 (Regression Tests for Incremental Repo Symbol DB)
+
+验证场景：
+1. 首次同步标记全部文件，再次同步不重新标记
+2. 修改/删除文件后只处理变化的文件
+3. 持久化：新实例复用磁盘上的符号库
+
+运行方式：
+    python -m pytest tests/test_repo_symbols.py -v
+"""
+
+import os
+from pathlib import Path
+
+from clude_code.tooling.tools.repo_symbols import RepoSymbolDB, python_tags
+
+
+def _write(root: Path, rel: str, text: str) -> Path:
+    p = root / rel
+    p.parent.mkdir(parents=True, exist_ok=True)
+    p.write_text(text, encoding="utf-8")
+    return p
+
+
+def test_python_tags_extracts_definitions():
+    tags = python_tags("class A:\n    def m(self):\n        pass\n\ndef f():\n    pass\n")
+    assert [(t["name"], t["kind"]) for t in tags] == [("A", "class"), ("m", "member"), ("f", "function")]
+
+
+def test_incremental_refresh(tmp_path: Path):
+    _write(tmp_path, "pkg/a.py", "def a():\n    pass\n")
+    b = _write(tmp_path, "pkg/b.py", "class B:\n    pass\n")
+    _write(tmp_path, "tests/test_x.py", "def test_x():\n    pass\n")
+
+    db = RepoSymbolDB(tmp_path)
+    assert db.refresh() == {"files": 2, "retagged": 2, "removed": 0}
+    assert db.refresh()["retagged"] == 0
+    assert [s["name"] for s in db.snapshot()["pkg/b.py"]] == ["B"]
+
+    # 只改 mtime 不改内容：不重新标记
+    st = b.stat()
+    os.utime(b, (st.st_atime, st.st_mtime + 10))
+    assert db.refresh()["retagged"] == 0
+
+    b.write_text("class B2:\n    pass\n", encoding="utf-8")
+    os.utime(b, (st.st_atime, st.st_mtime + 20))
+    (tmp_path / "pkg/a.py").unlink()
+    assert db.refresh() == {"files": 1, "retagged": 1, "removed": 1}
+
+    again = RepoSymbolDB(tmp_path)
+    assert again.refresh()["retagged"] == 0
+    assert [s["name"] for s in again.snapshot()["pkg/b.py"]] == ["B2"]
@@ -0,0 +1,140 @@
+"""
+计划步骤 DAG 并发调度回归用例 (Regression Tests for Parallel Plan-Step Scheduling)
+
+验证场景：
+1. 只挑选依赖已满足的只读步骤；涉及相同文件的步骤不进入同一批
+2. 一批步骤真正并发执行，合并后的消息按计划顺序排列（与完成先后无关）
+3. 并发步骤内调用写工具被拒绝
+
+运行方式：
+    python -m pytest tests/test_step_scheduler.py -v
+"""
+
+import logging
+import threading
+import time
+from types import SimpleNamespace
+
+from clude_code.llm.llama_cpp_http import ChatMessage
+from clude_code.llm.tokenizer import TokenCounter
+from clude_code.orchestrator.agent_loop.step_scheduler import (
+    StepBranch,
+    run_parallel_batch,
+    select_parallel_batch,
+)
+from clude_code.orchestrator.planner import Plan, PlanStep
+from clude_code.tooling.local_tools import ToolResult
+
+
+def _plan() -> Plan:
+    return Plan(
+        title="调查",
+        steps=[
+            PlanStep(id="s1", description="阅读 src/a.py 的入口", tools_expected=["read_file"]),
+            PlanStep(id="s2", description="在 src/b.py 中搜索调用点", tools_expected=["grep", "read_file"]),
+            PlanStep(id="s3", description="再看一遍 src/a.py 的异常处理", tools_expected=["read_file"]),
+            PlanStep(id="s4", description="修改 src/c.py", tools_expected=["apply_patch"]),
+            PlanStep(id="s5", description="汇总", dependencies=["s1"], tools_expected=["display"]),
+        ],
+    )
+
+
+def test_select_parallel_batch():
+    plan = _plan()
+    assert [s.id for s in select_parallel_batch(plan, 4)] == ["s1", "s2"]
+    assert select_parallel_batch(plan, 1) == []
+    plan.steps[0].status = "done"
+    plan.steps[1].status = "done"
+    # s3 就绪；s4 会写文件，是屏障：其后的 s5 不得提前，批次不足 2 个交给串行路径
+    assert select_parallel_batch(plan, 4) == []
+
+
+def test_pending_write_step_is_a_barrier():
+    plan = Plan(
+        title="先改后读",
+        steps=[
+            PlanStep(id="s1", description="修改 src/a.py", tools_expected=["apply_patch"]),
+            PlanStep(id="s2", description="阅读 src/a.py", tools_expected=["read_file"]),
+            PlanStep(id="s3", description="在 src/b.py 中搜索", tools_expected=["grep"]),
+        ],
+    )
+    assert select_parallel_batch(plan, 4) == []
+    plan.steps[0].status = "done"
+    assert [s.id for s in select_parallel_batch(plan, 4)] == ["s2", "s3"]
+
+
+class _FakeLLM:
+    base_url = "http://fake"
+    api_mode = "openai_compat"
+    model = "m"
+    temperature = 0.0
+    max_tokens = 64
+
+    def __init__(self, shared: dict) -> None:
+        self.shared = shared
+        self.last_timing: dict = {}
+        self.last_server_usage: dict = {}
+
+    def fork(self, **_kw) -> "_FakeLLM":
+        return _FakeLLM(self.shared)
+
+    def chat(self, messages):
+        lock = self.shared["lock"]
+        with lock:
+            self.shared["active"] += 1
+            self.shared["peak"] = max(self.shared["peak"], self.shared["active"])
+        step_prompt = messages[-1].content
+        # s1 慢、s2 快：完成顺序与计划顺序相反
+        time.sleep(0.3 if "s1" in step_prompt else 0.05)
+        with lock:
+            self.shared["active"] -= 1
+        return '{"control": "step_done"}'
+
+
+def _fake_loop() -> SimpleNamespace:
+    counter = TokenCounter(source="heuristic")
+    loop = SimpleNamespace(
+        messages=[ChatMessage(role="system", content="sys"), ChatMessage(role="user", content="调查一下")],
+        llm=_FakeLLM({"lock": threading.Lock(), "active": 0, "peak": 0}),
+        cfg=SimpleNamespace(
+            llm=SimpleNamespace(stream=False),
+            orchestrator=SimpleNamespace(max_step_tool_calls=3),
+        ),
+        logger=logging.getLogger("test"),
+        file_only_logger=logging.getLogger("test"),
+        audit=SimpleNamespace(write=lambda **_kw: None),
+        token_counter=counter,
+        context_assembler=SimpleNamespace(available_tokens=100_000),
+    )
+    loop._trim_history = lambda **_kw: None
+    return loop
+
+
+def test_run_parallel_batch_merges_in_plan_order():
+    plan = _plan()
+    loop = _fake_loop()
+    events: list = []
+    batch = select_parallel_batch(plan, 4)
+    run_parallel_batch(
+        loop, plan, batch, "t1", set(), lambda _m: True,
+        lambda e, d: events.append(e), lambda _t: None, lambda *_a, **_k: "",
+    )
+    assert [s.status for s in batch] == ["done", "done"]
+    assert loop.llm.shared["peak"] == 2
+    # 历史 + 每个步骤的（步骤提示, 完成信号），按计划顺序 s1 在前
+    assert len(loop.messages) == 2 + 4
+    assert "s1" in loop.messages[2].content and "调查一下" not in loop.messages[2].content
+    assert "s2" in loop.messages[4].content
+    assert "plan_steps_parallel" in events and "plan_steps_parallel_done" in events
+
+
+def test_branch_rejects_write_tools():
+    loop = _fake_loop()
+    loop._run_tool_lifecycle = lambda *a: ToolResult(ok=True)
+    branch = StepBranch(loop, loop.llm.fork())
+    assert branch._run_tool_lifecycle("read_file", {"path": "a"}, "t", lambda _m: True, lambda e, d: None).ok
+    res = branch._run_tool_lifecycle("apply_patch", {"path": "a"}, "t", lambda _m: True, lambda e, d: None)
+    assert not res.ok and res.error["code"] == "E_READ_ONLY_STEP"
+    # 分支写入不影响主循环
+    branch.messages.append(ChatMessage(role="assistant", content="x"))
+    assert len(loop.messages) == 2
@@ -0,0 +1,111 @@
+"""
+统一分词计数服务回归用例 (Regression Tests for TokenCounter)
+
+验证场景：
+1. 服务端 /tokenize 计数按内容哈希缓存，重复消息不再请求
+2. 服务端失败后降级，并在冷却期内不再重试
+3. heuristic 来源与 usage.estimate_tokens 一致
+4. 本地分词器注册表：离线时立即失败并给出提示，加载结果进程内缓存，可注册自定义加载器
+5. 命中本地 tiktoken 文件时只在构造编码期间改写 TIKTOKEN_CACHE_DIR，随后恢复
+
+运行方式：
+    python -m pytest tests/test_tokenizer.py -v
+"""
+
+import hashlib
+import os
+import sys
+import time
+import types
+
+from clude_code.llm.llama_cpp_http import ChatMessage
+from clude_code.llm.tokenizer import (
+    _TIKTOKEN_URLS,
+    LocalTokenizer,
+    TokenCounter,
+    load_tokenizer,
+    register_tokenizer_loader,
+    tokenizer_kind,
+)
+from clude_code.observability.usage import estimate_tokens
+
+
+class _FakeLLM:
+    def __init__(self, fail: bool = False) -> None:
+        self.calls = 0
+        self.fail = fail
+
+    def tokenize(self, content: str) -> list[int]:
+        self.calls += 1
+        if self.fail:
+            raise ConnectionError("no /tokenize")
+        return list(range(len(content.split())))
+
+
+def test_server_counts_are_memoized():
+    llm = _FakeLLM()
+    counter = TokenCounter(source="server", llm=llm)
+    history = [ChatMessage(role="user", content=f"message number {i}") for i in range(10)]
+
+    assert counter.count_messages(history) == 30
+    assert llm.calls == 10
+    history.append(ChatMessage(role="assistant", content="one more"))
+    assert counter.count_messages(history) == 32
+    assert llm.calls == 11  # 只有新消息需要分词
+    assert counter.stats()["hits"] == 10
+
+
+def test_fallback_and_cooldown():
+    llm = _FakeLLM(fail=True)
+    counter = TokenCounter(source="auto", llm=llm, server_retry_s=3600)
+    assert counter.count("alpha beta gamma") > 0
+    assert counter.count("delta epsilon") > 0
+    assert llm.calls == 1
+    assert counter.active_source in ("local", "heuristic")
+
+    text = "x" * 400
+    assert TokenCounter(source="heuristic").count(text) == estimate_tokens(text)
+
+
+def test_registry_offline_and_custom_loader(tmp_path, monkeypatch):
+    monkeypatch.setenv("TIKTOKEN_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+    t0 = time.perf_counter()
+    tok, info = load_tokenizer("cl100k_base", path=str(tmp_path / "vendored"))
+    assert tok is None and not info.ok
+    assert time.perf_counter() - t0 < 1.0  # 不联网下载
+    assert info.hints and str(tmp_path / "vendored") in info.hints[0]
+
+    (tmp_path / "tokenizer.json").write_text("{}", encoding="utf-8")
+    assert tokenizer_kind("x", str(tmp_path)) == "hf"
+
+    calls = []
+
+    def _chars(name, path, allow_download):
+        calls.append(name)
+        return LocalTokenizer(name, lambda t: list(t.encode("utf-8")), lambda ids: bytes(ids).decode("utf-8")), "memory"
+
+    register_tokenizer_loader("chars", _chars)
+    counter = TokenCounter(source="local", encoding_name="chars:utf8")
+    assert counter.count("abc") == 3
+    assert counter.count("abcd") == 4
+    assert load_tokenizer("chars:utf8")[1].source == "memory"
+    assert calls == ["utf8"]
+
+
+def test_vendored_tiktoken_does_not_leak_env(tmp_path, monkeypatch):
+    vendored = tmp_path / "vendored"
+    vendored.mkdir()
+    (vendored / hashlib.sha1(_TIKTOKEN_URLS["r50k_base"].encode()).hexdigest()).write_bytes(b"")
+    monkeypatch.setenv("TIKTOKEN_CACHE_DIR", str(tmp_path / "elsewhere"))
+    seen = []
+
+    def _get_encoding(name):
+        seen.append(os.environ.get("TIKTOKEN_CACHE_DIR"))
+        return types.SimpleNamespace(encode=lambda t, **kw: list(t), decode=lambda ids: "".join(ids))
+
+    monkeypatch.setitem(sys.modules, "tiktoken", types.SimpleNamespace(get_encoding=_get_encoding))
+    tok, info = load_tokenizer("r50k_base", path=str(vendored))
+    assert info.ok and tok is not None
+    assert seen == [str(vendored)]
+    assert os.environ["TIKTOKEN_CACHE_DIR"] == str(tmp_path / "elsewhere")
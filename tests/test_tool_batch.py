@@ -0,0 +1,99 @@
+"""
+批量工具调用回归用例 (Regression Tests for Batched Tool Calls)
+
+验证场景：
+1. 解析 {"tool_calls": [...]} 批量信封（流式检测器同样识别），单个调用退化为普通调用
+2. 连续的只读调用并发执行，有副作用的调用作为屏障按顺序执行，结果保持调用顺序
+3. 批量结果合并为一条消息回喂
+
+运行方式：
+    python -m pytest tests/test_tool_batch.py -v
+"""
+
+import json
+import logging
+import threading
+import time
+from types import SimpleNamespace
+
+from clude_code.llm.llama_cpp_http import ChatMessage
+from clude_code.orchestrator.agent_loop.agent_loop import _try_parse_tool_call
+from clude_code.orchestrator.agent_loop.execution import handle_tool_batch
+from clude_code.orchestrator.agent_loop.parsing import ToolCallDetector
+from clude_code.orchestrator.agent_loop.tool_lifecycle import run_tool_batch
+from clude_code.tooling.local_tools import ToolResult
+
+
+def test_parse_batch_envelope():
+    text = '先读两个文件\n{"tool_calls": [{"tool": "read_file", "args": {"path": "a.py"}}, {"tool": "grep", "args": {"pattern": "x"}}]}'
+    obj = _try_parse_tool_call(text)
+    assert [c["tool"] for c in obj["tool_calls"]] == ["read_file", "grep"]
+    assert _try_parse_tool_call('{"tool_calls": [{"tool": "read_file", "args": {"path": "a.py"}}]}') == {
+        "tool": "read_file",
+        "args": {"path": "a.py"},
+    }
+    assert _try_parse_tool_call('{"tool_calls": []}') is None
+    assert _try_parse_tool_call('{"tool_calls": [{"args": {}}]}') is None
+
+    det = ToolCallDetector()
+    assert det.feed('思路\n{"tool_calls": [{"tool": "read_file", "args": {"path": "a"}},') is None
+    assert det.feed(' {"tool": "grep", "args": {}}]} 多余') is not None
+    assert len(det.tool_call["tool_calls"]) == 2
+
+
+class _Loop:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+        self.order: list[str] = []
+        self.messages = [ChatMessage(role="system", content="sys")]
+        self.cfg = SimpleNamespace(orchestrator=SimpleNamespace(parallel_tool_calls=4))
+        self.logger = logging.getLogger("test")
+        self.file_only_logger = self.logger
+
+    def _trim_history(self, **_kw) -> None:
+        pass
+
+    def _run_tool_lifecycle(self, name, args, trace_id, confirm, _ev) -> ToolResult:
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            self.order.append(f"start:{args['path']}")
+        time.sleep(0.1)
+        with self.lock:
+            self.active -= 1
+            self.order.append(f"end:{args['path']}")
+        return ToolResult(ok=True, payload={"path": args["path"]})
+
+
+def test_read_only_calls_run_concurrently_and_writes_are_barriers():
+    loop = _Loop()
+    calls = [
+        {"tool": "read_file", "args": {"path": "a"}},
+        {"tool": "grep", "args": {"path": "b"}},
+        {"tool": "write_file", "args": {"path": "c"}},
+        {"tool": "read_file", "args": {"path": "d"}},
+    ]
+    results = run_tool_batch(loop, calls, "t", lambda _m: True, lambda e, d: None, max_workers=4)
+    assert [r.payload["path"] for r in results] == ["a", "b", "c", "d"]
+    assert loop.peak == 2
+    # 写调用在前两个只读调用都结束后才开始，之后的读取在写调用结束后才开始
+    assert loop.order.index("start:c") > max(loop.order.index("end:a"), loop.order.index("end:b"))
+    assert loop.order.index("start:d") > loop.order.index("end:c")
+
+
+def test_batch_results_fed_back_as_one_message():
+    loop = _Loop()
+    events: list = []
+    calls = [{"tool": "read_file", "args": {"path": "a"}}, {"tool": "read_file", "args": {"path": "b"}}]
+    results, modified = handle_tool_batch(
+        loop, calls, "t", set(), lambda _m: True, lambda e, d: events.append(e),
+        lambda name, tr, keywords=None: json.dumps({"tool": name, "ok": tr.ok, "path": tr.payload["path"]}),
+    )
+    assert len(results) == 2 and not modified
+    assert [m.role for m in loop.messages] == ["system", "assistant", "user"]
+    assert json.loads(loop.messages[1].content) == {"tool_calls": calls}
+    lines = loop.messages[2].content.splitlines()
+    assert [json.loads(x)["path"] for x in lines] == ["a", "b"]
+    assert events.count("tool_result") == 2 and events.count("tool_result_fed_back") == 1
@@ -0,0 +1,83 @@
+"""
+只读工具结果缓存回归用例 (Regression Tests for Tool Result Cache)
+
+验证场景：
+1. dispatch_tool 对相同参数的 read_file 命中缓存，命中/未命中计入 SessionUsage
+2. 文件 (mtime, size) 变化、write_file 与 run_cmd 使缓存失效
+3. grep 等目录树条目与 list_dir 条目只在本轮有效
+4. 按字节数 LRU 淘汰
+
+运行方式：
+    python -m pytest tests/test_tool_cache.py -v
+"""
+
+from pathlib import Path
+from types import SimpleNamespace
+
+from clude_code.observability.usage import SessionUsage
+from clude_code.orchestrator.agent_loop.tool_cache import ToolResultCache
+from clude_code.orchestrator.agent_loop.tool_dispatch import dispatch_tool
+from clude_code.tooling.local_tools import LocalTools, ToolResult
+
+
+def _loop(root: Path) -> SimpleNamespace:
+    return SimpleNamespace(
+        tools=LocalTools(str(root), max_file_read_bytes=1_000_000, max_output_bytes=1_000_000),
+        tool_cache=ToolResultCache(root, max_bytes=1_000_000),
+        usage=SessionUsage(),
+    )
+
+
+def test_read_file_hits_and_invalidation(tmp_path: Path):
+    f = tmp_path / "a.txt"
+    f.write_text("one\n", encoding="utf-8")
+    loop = _loop(tmp_path)
+
+    r1 = dispatch_tool(loop, "read_file", {"path": "a.txt"})
+    r2 = dispatch_tool(loop, "read_file", {"path": "a.txt"})
+    assert r1.ok and r2.payload == r1.payload
+    assert (loop.usage.tool_cache_hits, loop.usage.tool_cache_misses) == (1, 1)
+
+    # 外部修改：指纹变化
+    f.write_text("one\ntwo\n", encoding="utf-8")
+    assert "two" in str(dispatch_tool(loop, "read_file", {"path": "a.txt"}).payload)
+
+    # 写工具按路径失效
+    dispatch_tool(loop, "read_file", {"path": "a.txt"})
+    assert len(loop.tool_cache) == 1
+    assert dispatch_tool(loop, "write_file", {"path": "a.txt", "text": "three\n"}).ok
+    assert len(loop.tool_cache) == 0
+    assert "three" in str(dispatch_tool(loop, "read_file", {"path": "a.txt"}).payload)
+    assert loop.usage.summary()["by_tool"]["read_file"]["cache_hits"] == 2
+
+
+def test_tree_entries_expire_per_turn_and_on_exec(tmp_path: Path):
+    cache = ToolResultCache(tmp_path, max_bytes=1_000_000)
+    res = ToolResult(True, payload={"hits": []})
+    cache.put("grep", {"pattern": "x", "path": "."}, res)
+    cache.put("read_file", {"path": "a.txt"}, res)
+    cache.put("list_dir", {"path": "."}, res)
+    assert cache.get("grep", {"pattern": "x", "path": "."}) is not None
+    assert cache.get("list_dir", {"path": "."}) is not None
+
+    cache.begin_turn()
+    assert cache.get("grep", {"pattern": "x", "path": "."}) is None
+    assert cache.get("list_dir", {"path": "."}) is None
+    assert cache.get("read_file", {"path": "a.txt"}) is not None
+
+    cache.invalidate()
+    assert cache.get("read_file", {"path": "a.txt"}) is None
+
+
+def test_byte_bounded_lru(tmp_path: Path):
+    for i in range(3):
+        (tmp_path / f"f{i}.txt").write_text("x", encoding="utf-8")
+    big = ToolResult(True, payload={"text": "y" * 400})
+    cache = ToolResultCache(tmp_path, max_bytes=1000)
+    cache.put("read_file", {"path": "f0.txt"}, big)
+    cache.put("read_file", {"path": "f1.txt"}, big)
+    assert cache.get("read_file", {"path": "f0.txt"}) is not None  # f0 变为最近使用
+    cache.put("read_file", {"path": "f2.txt"}, big)
+    assert cache.get("read_file", {"path": "f1.txt"}) is None
+    assert cache.get("read_file", {"path": "f0.txt"}) is not None
+    assert cache.size_bytes <= 1000
@@ -0,0 +1,62 @@
+"""
+ANN 索引维护与召回评估回归用例 (Regression Tests for ANN Index Maintenance)
+
+验证场景：
+1. maintain_index：空表 empty、行数不足 below_threshold、达到阈值 built、之后 ok、关闭时 disabled
+2. index_stats：无索引时 ANN 即暴力检索（recall@k = 1.0）；建索引后报告索引信息与召回
+
+运行方式：
+    python -m pytest tests/test_vector_index.py -v
+"""
+
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("lancedb")
+
+from clude_code.config.config import CludeConfig  # noqa: E402
+from clude_code.knowledge.vector_store import VectorStore  # noqa: E402
+
+
+def _store(tmp_path: Path) -> VectorStore:
+    cfg = CludeConfig(workspace_root=str(tmp_path))
+    cfg.rag.write_buffer_rows = 0
+    cfg.rag.ann_min_rows = 256
+    cfg.rag.ann_num_partitions = 4
+    return VectorStore(cfg)
+
+
+def _add(store: VectorStore, start: int, n: int) -> None:
+    vecs = np.random.default_rng(start).standard_normal((n, 16), dtype=np.float32)
+    ids = [str(i) for i in range(start, start + n)]
+    store.add_batch(vecs, {
+        "text": ids,
+        "path": [f"f{i % 7}.py" for i in range(start, start + n)],
+        "start_line": [1] * n,
+        "end_line": [1] * n,
+        "chunk_id": ids,
+    })
+
+
+def test_maintain_index_lifecycle(tmp_path: Path):
+    store = _store(tmp_path)
+    assert store.maintain_index() == "empty"
+    assert store.index_stats()["rows"] == 0
+
+    _add(store, 0, 200)
+    assert store.maintain_index() == "below_threshold"
+    info = store.index_stats(sample=5, k=3, seed=1)
+    assert info["rows"] == 200 and info["index"] is None
+    assert info["recall"]["recall@3"] == 1.0 and info["recall"]["samples"] == 5
+
+    _add(store, 200, 100)
+    assert store.maintain_index() == "built"
+    assert store.maintain_index() == "ok"
+    info = store.index_stats(sample=5, k=3, seed=1)
+    assert info["index"] is not None and info["index"]["trained_rows"] == 300
+    assert 0.0 <= info["recall"]["recall@3"] <= 1.0
+
+    store.cfg.rag.ann_index_type = "none"
+    assert store.maintain_index() == "disabled"
@@ -0,0 +1,97 @@
+"""
+向量库写后缓冲回归用例 (Regression Tests for VectorStore Write-Behind Buffer)
+
+验证场景：
+1. 合并落盘：多次 add/delete 在 flush 前不写表，flush 后结果与逐次写入一致
+2. 先加后删：缓冲区内命中的待写入行被丢弃，不会留下陈旧行
+3. 读路径自动 flush；compact 可在小表上执行
+4. shift_lines 只平移行号列：缓冲区中的行直接改，已落盘的行在 flush 时改
+
+运行方式：
+    python -m pytest tests/test_vector_store_buffer.py -v
+"""
+
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("lancedb")
+
+from clude_code.config.config import CludeConfig  # noqa: E402
+from clude_code.knowledge.vector_store import VectorStore  # noqa: E402
+
+
+def _store(tmp_path: Path, buffer_rows: int = 1000) -> VectorStore:
+    cfg = CludeConfig(workspace_root=str(tmp_path))
+    cfg.rag.write_buffer_rows = buffer_rows
+    return VectorStore(cfg)
+
+
+def _add(store: VectorStore, path: str, ids: list[str], seed: int = 0) -> None:
+    vecs = np.random.default_rng(seed).standard_normal((len(ids), 8), dtype=np.float32)
+    store.add_batch(vecs, {
+        "text": ids,
+        "path": [path] * len(ids),
+        "start_line": [1] * len(ids),
+        "end_line": [1] * len(ids),
+        "chunk_id": [f"{path}:{c}" for c in ids],
+    })
+
+
+def _rows(store: VectorStore) -> list[str]:
+    store.flush()
+    return sorted(store._table.to_arrow().column("chunk_id").to_pylist())
+
+
+def test_buffered_writes_are_coalesced(tmp_path: Path):
+    store = _store(tmp_path)
+    _add(store, "a.py", ["1", "2"])
+    _add(store, "b.py", ["1"])
+    assert store._table is None  # 尚未落盘
+    assert store.pending_writes == 3
+    assert _rows(store) == ["a.py:1", "a.py:2", "b.py:1"]
+    assert len(store._table.list_versions()) == 2  # 建表 + 一次追加
+
+    store.delete_by_path("b.py")
+    store.delete_chunks("a.py", ["a.py:2"])
+    _add(store, "a.py", ["3"], seed=1)
+    assert _rows(store) == ["a.py:1", "a.py:3"]
+
+
+def test_delete_drops_pending_adds(tmp_path: Path):
+    store = _store(tmp_path)
+    _add(store, "a.py", ["1"])
+    store.flush()
+    _add(store, "a.py", ["2", "3"])
+    store.delete_chunks("a.py", ["a.py:2"])
+    _add(store, "c.py", ["1"])
+    store.delete_by_path("c.py")
+    assert _rows(store) == ["a.py:1", "a.py:3"]
+
+
+def test_search_flushes_and_compact(tmp_path: Path):
+    store = _store(tmp_path, buffer_rows=2)
+    _add(store, "a.py", ["1"])
+    hits = store.search([0.0] * 8, limit=5)
+    assert [h["chunk_id"] for h in hits] == ["a.py:1"]
+    _add(store, "a.py", ["2", "3"])  # 达到阈值自动落盘
+    assert store.pending_writes == 0
+    assert store.compact(force=True)["action"] == "compacted"
+    assert _rows(store) == ["a.py:1", "a.py:2", "a.py:3"]
+
+
+def test_shift_lines(tmp_path: Path):
+    def lines(store: VectorStore) -> dict[str, int]:
+        store.flush()
+        t = store._table.to_arrow()
+        return dict(zip(t.column("chunk_id").to_pylist(), t.column("start_line").to_pylist(), strict=True))
+
+    for buffer_rows in (0, 1000):
+        store = _store(tmp_path / str(buffer_rows), buffer_rows=buffer_rows)
+        _add(store, "a.py", ["1", "2"])
+        store.flush()
+        _add(store, "a.py", ["3"])
+        store.shift_lines("a.py", ["a.py:2", "a.py:3"], 5)
+        store.shift_lines("a.py", ["a.py:2"], -2)
+        assert lines(store) == {"a.py:1": 1, "a.py:2": 4, "a.py:3": 6}
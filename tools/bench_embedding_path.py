@@ -0,0 +1,137 @@
+"""
+Embedding 写入路径基准（Embedding Write-Path Benchmark）
+
+对比两条路径写入 LanceDB 的吞吐与峰值内存：
+- list : 旧路径。fastembed 逐行 ndarray -> `tolist()` -> 每 chunk 一个 dict -> `VectorStore.add_chunks`
+- numpy: 新路径。`CodeEmbedder.embed_batch` 风格的连续 float32 矩阵 -> `VectorStore.add_batch`（FixedSizeList）
+
+模型推理用随机向量替代（只测数据搬运，不测 ONNX），每种模式在独立子进程中运行，
+峰值 RSS 取自 `resource.getrusage(RUSAGE_SELF).ru_maxrss`，与导入完成后的基线相减。
+
+运行方式：
+    python tools/bench_embedding_path.py --chunks 200000 --dim 384
+    python tools/bench_embedding_path.py --no-db   # 仅构造 Arrow 数据，不写 LanceDB
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+def _rss_mb() -> float:
+    # Linux: KB；macOS: bytes
+    r = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return r / 1024.0 if sys.platform != "darwin" else r / (1024.0 * 1024.0)
+
+
+def _fake_embed(rng, n: int, dim: int, batch: int):
+    """模拟 fastembed：按 batch 生成矩阵后逐行产出 ndarray。"""
+    import numpy as np
+
+    for i in range(0, n, batch):
+        m = rng.standard_normal((min(batch, n - i), dim), dtype=np.float32)
+        yield from m
+
+
+def _columns(i0: int, n: int) -> dict[str, list]:
+    return {
+        "text": [f"def f{i}():\n    return {i}\n" for i in range(i0, i0 + n)],
+        "path": [f"pkg/mod_{i // 20}.py" for i in range(i0, i0 + n)],
+        "start_line": [1] * n,
+        "end_line": [3] * n,
+        "chunk_id": [f"pkg/mod_{i // 20}.py:{i}" for i in range(i0, i0 + n)],
+    }
+
+
+def run_child(mode: str, chunks: int, dim: int, batch: int, write_batch: int, use_db: bool) -> dict:
+    import numpy as np
+    import pyarrow as pa
+
+    from clude_code.config.config import CludeConfig
+    from clude_code.knowledge.vector_store import VectorStore
+
+    rng = np.random.default_rng(0)
+    tmp = tempfile.TemporaryDirectory()
+    store = None
+    if use_db:
+        cfg = CludeConfig(workspace_root=tmp.name)
+        cfg.rag.table_name = f"bench_{mode}"
+        store = VectorStore(cfg)
+    base_rss = _rss_mb()
+
+    t0 = time.perf_counter()
+    done = 0
+    gen = _fake_embed(rng, chunks, dim, batch)
+    while done < chunks:
+        n = min(write_batch, chunks - done)
+        cols = _columns(done, n)
+        if mode == "list":
+            vecs = [next(gen).tolist() for _ in range(n)]
+            rows = [dict({k: v[j] for k, v in cols.items()}, vector=vecs[j]) for j in range(n)]
+            if store is not None:
+                store.add_chunks(rows)
+            else:
+                pa.Table.from_pylist(rows)
+        else:
+            mat = np.empty((n, dim), dtype=np.float32)
+            for j in range(n):
+                mat[j] = next(gen)
+            if store is not None:
+                store.add_batch(mat, cols)
+            else:
+                pa.FixedSizeListArray.from_arrays(pa.array(mat.reshape(-1)), dim)
+        done += n
+    elapsed = time.perf_counter() - t0
+    tmp.cleanup()
+    return {
+        "mode": mode,
+        "chunks": chunks,
+        "dim": dim,
+        "seconds": round(elapsed, 3),
+        "chunks_per_s": round(chunks / elapsed, 1) if elapsed > 0 else None,
+        "peak_rss_mb": round(_rss_mb(), 1),
+        "peak_rss_delta_mb": round(_rss_mb() - base_rss, 1),
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--chunks", type=int, default=100_000)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--embed-batch", type=int, default=64)
+    ap.add_argument("--write-batch", type=int, default=10_000, help="每次写入的 chunk 数")
+    ap.add_argument("--no-db", action="store_true", help="只构造 Arrow 数据，不写 LanceDB")
+    ap.add_argument("--child", choices=["list", "numpy"], help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        res = run_child(args.child, args.chunks, args.dim, args.embed_batch, args.write_batch, not args.no_db)
+        print(json.dumps(res))
+        return
+
+    results = []
+    for mode in ("list", "numpy"):
+        cmd = [
+            sys.executable, str(Path(__file__).resolve()), "--child", mode,
+            "--chunks", str(args.chunks), "--dim", str(args.dim),
+            "--embed-batch", str(args.embed_batch), "--write-batch", str(args.write_batch),
+        ]
+        if args.no_db:
+            cmd.append("--no-db")
+        out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+
+    print(f"{'mode':<8}{'chunks/s':>12}{'seconds':>10}{'peak RSS MB':>14}{'Δ RSS MB':>11}")
+    for r in results:
+        print(f"{r['mode']:<8}{r['chunks_per_s']:>12}{r['seconds']:>10}{r['peak_rss_mb']:>14}{r['peak_rss_delta_mb']:>11}")
+
+
+if __name__ == "__main__":
+    main()
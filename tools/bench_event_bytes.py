@@ -0,0 +1,73 @@
+"""
+llm_request_params 事件体积基准（Event Bytes per Turn）
+
+模拟一轮多步 ReAct：系统提示词 + Repo Map 固定，每步追加一次工具调用与工具结果，
+对比每次 LLM 请求发出的 llm_request_params 事件序列化后的字节数：
+- before : 事件携带完整 messages（旧格式）
+- after  : 消息引用 + 本会话首次出现的正文（message_store.MessageRefEncoder）
+
+运行方式：
+    python tools/bench_event_bytes.py --steps 30
+    python tools/bench_event_bytes.py --steps 30 --system-kb 24 --result-kb 4 --turns 3
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+
+from clude_code.llm.llama_cpp_http import ChatMessage
+from clude_code.observability.message_store import MessageRefEncoder, MessageStore
+
+
+def _text(rng: random.Random, n_bytes: int) -> str:
+    words = ["def", "return", "value", "config", "handler", "import", "class", "self", "token", "路径", "结果"]
+    out: list[str] = []
+    size = 0
+    while size < n_bytes:
+        w = rng.choice(words)
+        out.append(w)
+        size += len(w.encode("utf-8")) + 1
+    return " ".join(out)
+
+
+def _event(messages: list[ChatMessage], *, encoder: MessageRefEncoder | None) -> bytes:
+    obj = {"stage": "react", "step_id": None, "model": "auto", "messages_count": len(messages)}
+    if encoder is None:
+        obj["messages"] = [{"role": m.role, "content": m.content} for m in messages]
+    else:
+        obj["messages"], obj["messages_delta"] = encoder.encode(messages)
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--steps", type=int, default=30, help="每轮的 LLM 请求次数")
+    ap.add_argument("--turns", type=int, default=1)
+    ap.add_argument("--system-kb", type=float, default=16.0, help="系统提示词 + Repo Map 大小（KB）")
+    ap.add_argument("--result-kb", type=float, default=2.0, help="每次工具结果大小（KB）")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    messages = [ChatMessage(role="system", content=_text(rng, int(args.system_kb * 1024)))]
+    encoder = MessageRefEncoder(MessageStore())
+
+    print(f"{'turn':>4}{'requests':>10}{'before KB':>12}{'after KB':>11}{'ratio':>8}")
+    for turn in range(args.turns):
+        messages.append(ChatMessage(role="user", content=f"第 {turn + 1} 个问题：" + _text(rng, 200)))
+        before = after = 0
+        for step in range(args.steps):
+            before += len(_event(messages, encoder=None))
+            after += len(_event(messages, encoder=encoder))
+            call = {"tool": "read_file", "args": {"path": f"src/mod_{turn}_{step}.py"}}
+            messages.append(ChatMessage(role="assistant", content=json.dumps(call, ensure_ascii=False)))
+            messages.append(ChatMessage(role="user", content=json.dumps(
+                {"tool": "read_file", "ok": True, "text": _text(rng, int(args.result_kb * 1024))}, ensure_ascii=False
+            )))
+        print(f"{turn + 1:>4}{args.steps:>10}{before / 1024:>12.0f}{after / 1024:>11.0f}{before / max(after, 1):>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
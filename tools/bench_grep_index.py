@@ -0,0 +1,116 @@
+"""
+grep 三元组索引基准（Grep Trigram Index Benchmark）
+
+在临时目录生成大型合成代码树，对比：
+- python : 现有 Python 全量扫描（逐文件读取 + 逐行正则）
+- index  : `.clude/grep_index` 三元组索引（首次构建 / 冷查询 / 热查询 / 修改少量文件后的增量同步）
+
+查询集合包含稀有标识符、常见词与带字符类的正则，分别给出候选文件数与耗时。
+
+运行方式：
+    python tools/bench_grep_index.py --files 20000
+    python tools/bench_grep_index.py --files 50000 --lines 80 --keep /tmp/grep_tree
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+QUERIES = [
+    "RareSymbol_4242",
+    r"def handler_17_\d+\(",
+    "TODO|FIXME",
+    r"(?i)connectionpool",
+    r"import \w+",
+]
+
+_WORDS = [
+    "value", "result", "config", "request", "buffer", "client", "session", "index", "token",
+    "cache", "handler", "stream", "parser", "queue", "worker", "record", "payload", "status",
+]
+
+
+def _make_tree(root: Path, files: int, lines: int, seed: int) -> None:
+    rng = random.Random(seed)
+    for i in range(files):
+        d = root / f"pkg_{i % 97}" / f"sub_{i % 13}"
+        d.mkdir(parents=True, exist_ok=True)
+        out = [f"import {rng.choice(_WORDS)}", ""]
+        for j in range(lines // 4):
+            a, b = rng.choice(_WORDS), rng.choice(_WORDS)
+            out.append(f"def handler_{i % 50}_{j}({a}, {b}):")
+            out.append(f"    {a}_{j} = {b}.get('{rng.choice(_WORDS)}_{rng.randrange(100000)}')")
+            out.append(f"    return {a}_{j}")
+            out.append("")
+        if i % 400 == 0:
+            out.append("# TODO: refactor ConnectionPool usage")
+        if i == files // 2:
+            out.append("RareSymbol_4242 = True")
+        (d / f"mod_{i}.py").write_text("\n".join(out) + "\n", encoding="utf-8")
+
+
+def _timed(fn):
+    t0 = time.perf_counter()
+    res = fn()
+    return res, (time.perf_counter() - t0) * 1000.0
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--files", type=int, default=20_000)
+    ap.add_argument("--lines", type=int, default=60, help="每个文件的大致行数")
+    ap.add_argument("--touch", type=int, default=20, help="增量测试中修改的文件数")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--keep", default="", help="保留生成的目录（默认使用临时目录并在结束后删除）")
+    args = ap.parse_args()
+
+    from clude_code.config.tools_config import SearchToolConfig
+    from clude_code.tooling.tools.grep import _index_grep, _python_grep
+    from clude_code.tooling.tools.grep_index import get_grep_index
+
+    root = Path(args.keep) if args.keep else Path(tempfile.mkdtemp(prefix="clude_grep_bench_"))
+    root.mkdir(parents=True, exist_ok=True)
+    try:
+        _, gen_ms = _timed(lambda: _make_tree(root, args.files, args.lines, args.seed))
+        print(f"生成 {args.files} 个文件: {gen_ms / 1000:.1f}s")
+
+        cfg = SearchToolConfig(grep_index_watch_mode="off")
+        kw = dict(workspace_root=root, path=".", language="all", include_glob=None, ignore_case=False, max_hits=10**9, cfg=cfg)
+        idx = get_grep_index(root, ignore_dirs=set(cfg.grep_ignore_dirs), max_file_bytes=cfg.grep_python_max_file_bytes, watch_mode="off")
+
+        stats, build_ms = _timed(lambda: idx.refresh(force=True))
+        print(f"索引构建: {build_ms:.0f}ms  {stats}")
+
+        print(f"{'query':<28}{'hits':>8}{'cands':>8}{'python ms':>12}{'index ms':>11}{'speedup':>9}")
+        for q in QUERIES:
+            py, py_ms = _timed(lambda q=q: _python_grep(pattern=q, **kw))
+            ix, ix_ms = _timed(lambda q=q: _index_grep(pattern=q, **kw))
+            assert len(py.payload["hits"]) == len(ix.payload["hits"]), q
+            cands = idx.candidates(q)
+            ncand = len(cands) if cands is not None else len(idx.indexed_files())
+            print(f"{q:<28}{len(ix.payload['hits']):>8}{ncand:>8}{py_ms:>12.0f}{ix_ms:>11.1f}{py_ms / max(ix_ms, 1e-3):>8.0f}x")
+
+        rng = random.Random(args.seed + 1)
+        all_files = sorted(root.rglob("mod_*.py"))
+        for fp in rng.sample(all_files, min(args.touch, len(all_files))):
+            fp.write_text(fp.read_text(encoding="utf-8") + "FreshlyAdded_999 = 1\n", encoding="utf-8")
+        idx.mark_stale()
+        stats, inc_ms = _timed(lambda: idx.refresh())
+        hits = _index_grep(pattern="FreshlyAdded_999", **kw).payload["hits"]
+        print(f"增量同步（修改 {args.touch} 个文件）: {inc_ms:.0f}ms  {stats}  新增命中={len(hits)}")
+
+        idx.mark_stale()
+        _, noop_ms = _timed(lambda: idx.refresh())
+        print(f"无变化同步（mtime 扫描）: {noop_ms:.0f}ms")
+    finally:
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
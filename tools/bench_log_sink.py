@@ -0,0 +1,62 @@
+"""
+审计/追踪日志写入微基准（Log Sink Microbenchmark）
+
+对比每个事件的调用方耗时：
+- open    : 旧实现（每个事件 open → 写一行 → close）
+- sink    : 共享异步写入器（只入队；后台按批写入），末尾 sync() 的 fsync 耗时单独列出
+可用 --dir 指向慢盘/网络盘目录观察差异。
+
+运行方式：
+    python tools/bench_log_sink.py
+    python tools/bench_log_sink.py --events 50000 --dir /mnt/nfs/tmp
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from clude_code.observability.log_sink import LogSink
+
+
+def _line(i: int) -> str:
+    return json.dumps({"timestamp": int(time.time()), "trace_id": "t", "event": "tool_result", "data": {"i": i, "ok": True}})
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--events", type=int, default=20_000)
+    ap.add_argument("--dir", default=None)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as root:
+        path = Path(root) / "open.jsonl"
+        t0 = time.perf_counter()
+        for i in range(args.events):
+            with path.open("a", encoding="utf-8") as f:
+                f.write(_line(i) + "\n")
+        open_us = (time.perf_counter() - t0) / args.events * 1e6
+
+        sink = LogSink()
+        path = Path(root) / "sink.jsonl"
+        t0 = time.perf_counter()
+        for i in range(args.events):
+            sink.submit(path, _line(i))
+        sink_us = (time.perf_counter() - t0) / args.events * 1e6
+        t0 = time.perf_counter()
+        sink.sync()
+        sync_ms = (time.perf_counter() - t0) * 1000
+        sink.close()
+        stats = sink.stats()
+
+    print(f"{'impl':<8}{'per event us':>14}")
+    print(f"{'open':<8}{open_us:>14.1f}")
+    print(f"{'sink':<8}{sink_us:>14.1f}   (sync {sync_ms:.1f} ms, {int(stats['batches'])} batches, "
+          f"{int(stats['backpressure_waits'])} backpressure waits)")
+
+
+if __name__ == "__main__":
+    main()
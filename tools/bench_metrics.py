@@ -0,0 +1,98 @@
+"""
+Histogram / Summary 微基准（Metrics Microbenchmark）
+
+对比观察值数量增长时：
+- legacy : 旧实现（保存全部观察值；收集时排序 + 每个桶线性计数 / 排序取分位数）
+- sketch : 现实现（固定桶计数器；DDSketch 时间片合并）
+的 observe 吞吐、单次收集耗时与常驻内存（tracemalloc）。
+
+运行方式：
+    python tools/bench_metrics.py
+    python tools/bench_metrics.py --sizes 10000 100000 1000000 --collects 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import threading
+import time
+import tracemalloc
+
+from clude_code.observability.metrics import Histogram, Summary
+
+_BUCKETS = [0.1, 0.5, 1.0, 2.5, 5.0, 10.0]
+_QUANTILES = [0.5, 0.9, 0.95, 0.99]
+
+
+class _LegacyHistogram:
+    def __init__(self) -> None:
+        self.obs: list[float] = []
+        self.lock = threading.Lock()
+
+    def observe(self, v: float) -> None:
+        with self.lock:
+            self.obs.append(v)
+
+    def collect(self) -> list[int]:
+        s = sorted(self.obs)
+        return [sum(1 for v in s if v <= le) for le in _BUCKETS] + [len(s)]
+
+
+class _LegacySummary:
+    def __init__(self) -> None:
+        self.obs: list[float] = []
+        self.lock = threading.Lock()
+
+    def observe(self, v: float) -> None:
+        with self.lock:
+            self.obs.append(v)
+
+    def collect(self) -> dict[float, float]:
+        s = sorted(self.obs)
+        return {q: s[min(int(q * len(s)), len(s) - 1)] for q in _QUANTILES}
+
+
+def _bench(factory, values: list[float], collects: int) -> tuple[float, float, float]:
+    m = factory()
+    t0 = time.perf_counter()
+    for v in values:
+        m.observe(v)
+    observe_ns = (time.perf_counter() - t0) / len(values) * 1e9
+    t0 = time.perf_counter()
+    for _ in range(collects):
+        m.collect()
+    collect_ms = (time.perf_counter() - t0) / collects * 1000
+    # 内存单独测一遍（tracemalloc 会显著拖慢 observe 计时）
+    tracemalloc.start()
+    m = factory()
+    for v in values:
+        m.observe(v)
+    mem_kb = tracemalloc.get_traced_memory()[0] / 1024
+    tracemalloc.stop()
+    return observe_ns, collect_ms, mem_kb
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 500_000])
+    ap.add_argument("--collects", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    cases = [
+        ("histogram", _LegacyHistogram, lambda: Histogram("bench", _BUCKETS)),
+        ("summary", _LegacySummary, lambda: Summary("bench", _QUANTILES, max_age=1e9)),
+    ]
+    print(f"{'metric':<10}{'n':>9}{'impl':>8}{'observe ns':>12}{'collect ms':>12}{'mem KB':>10}")
+    for n in args.sizes:
+        values = [rng.lognormvariate(0, 1) for _ in range(n)]
+        for label, legacy, current in cases:
+            for impl, factory in (("legacy", legacy), ("sketch", current)):
+                observe_ns, collect_ms, mem_kb = _bench(factory, values, args.collects)
+                print(f"{label:<10}{n:>9}{impl:>8}{observe_ns:>12.0f}{collect_ms:>12.2f}{mem_kb:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
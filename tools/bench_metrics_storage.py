@@ -0,0 +1,73 @@
+"""
+指标存储微基准（Metrics Storage Microbenchmark）
+
+模拟 N 小时的指标采集（每 10 秒一批），对比：
+- file    : FileMetricsStorage（data.jsonl 追加 + 每批重写 index.json；查询全量扫描）
+- segment : SegmentedMetricsStorage（按小时分段的列式块 + 段内指标名索引）
+的写入耗时、"最近 1 小时某指标" 查询耗时与过期清理耗时。
+
+运行方式：
+    python tools/bench_metrics_storage.py
+    python tools/bench_metrics_storage.py --hours 24 72 --series 40
+"""
+
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+
+from clude_code.observability.metrics import MetricPoint, MetricType
+from clude_code.observability.metrics_storage import (
+    FileMetricsStorage,
+    MetricsQuery,
+    SegmentedMetricsStorage,
+)
+
+
+def _batches(hours: int, series: int, now: float):
+    start = now - hours * 3600
+    for step in range(hours * 360):
+        ts = start + step * 10
+        yield [
+            MetricPoint(f"metric_{i % 10}", MetricType.GAUGE, float(step), ts, {"series": str(i)})
+            for i in range(series)
+        ]
+
+
+def _bench(factory, hours: int, series: int) -> tuple[float, float, float]:
+    now = time.time()
+    with tempfile.TemporaryDirectory() as root:
+        storage = factory(root)
+        t0 = time.perf_counter()
+        for batch in _batches(hours, series, now):
+            storage.store(batch)
+        store_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        res = storage.query(MetricsQuery(name="metric_3", start_time=now - 3600, end_time=now))
+        query_ms = (time.perf_counter() - t0) * 1000
+        assert res, "query returned nothing"
+
+        t0 = time.perf_counter()
+        storage.cleanup(retention_hours=max(1, hours // 2))
+        cleanup_ms = (time.perf_counter() - t0) * 1000
+    return store_s, query_ms, cleanup_ms
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--hours", type=int, nargs="+", default=[6, 24])
+    ap.add_argument("--series", type=int, default=20)
+    args = ap.parse_args()
+
+    impls = [("file", FileMetricsStorage), ("segment", SegmentedMetricsStorage)]
+    print(f"{'hours':>6}{'impl':>9}{'store s':>10}{'query ms':>11}{'cleanup ms':>12}")
+    for hours in args.hours:
+        for impl, factory in impls:
+            store_s, query_ms, cleanup_ms = _bench(factory, hours, args.series)
+            print(f"{hours:>6}{impl:>9}{store_s:>10.2f}{query_ms:>11.1f}{cleanup_ms:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+追踪日志读取微基准（Trace Store Microbenchmark）
+
+写入 N 个事件（多个会话交替）后对比：
+- legacy : 旧实现（从头扫描整个 trace.jsonl：列会话 / 取某会话最近 N 条）
+- indexed: RotatingJsonlLog（清单会话摘要 / 偏移索引 + 按段倒序读取）
+冷启动（新实例，含加载清单与补齐活动段索引）与热查询分别计时。
+
+运行方式：
+    python tools/bench_trace_store.py
+    python tools/bench_trace_store.py --events 500000 --sessions 200
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from clude_code.observability.log_store import RotatingJsonlLog
+
+
+def _legacy_sessions(path: Path) -> list[str]:
+    sessions = set()
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            sessions.add(json.loads(line)["session_id"])
+    return sorted(sessions)
+
+
+def _legacy_tail(path: Path, session_id: str, n: int) -> list[dict]:
+    out = []
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            d = json.loads(line)
+            if d["session_id"] == session_id:
+                out.append(d)
+    return out[-n:][::-1]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--events", type=int, default=200_000)
+    ap.add_argument("--sessions", type=int, default=50)
+    ap.add_argument("--tail", type=int, default=50)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        legacy = Path(root) / "legacy" / "trace.jsonl"
+        legacy.parent.mkdir()
+        log = RotatingJsonlLog(Path(root) / "indexed" / "trace.jsonl")
+        now = int(time.time())
+        batch: list[str] = []
+        with legacy.open("w", encoding="utf-8") as f:
+            for i in range(args.events):
+                line = json.dumps({
+                    "timestamp": now + i // 100, "trace_id": f"trace_{i // 200}", "session_id": f"s{(i // 500) % args.sessions}",
+                    "step": i, "event": "tool_result", "data": {"ok": True, "payload": "x" * 300},
+                })
+                f.write(line + "\n")
+                batch.append(line)
+                if len(batch) >= 256:
+                    log.write_lines(batch)
+                    batch = []
+        if batch:
+            log.write_lines(batch)
+        log.close()
+        size_mb = legacy.stat().st_size / 1e6
+        target = f"s{args.sessions // 2}"
+
+        rows = []
+        t0 = time.perf_counter()
+        _legacy_sessions(legacy)
+        rows.append(("legacy", "list_sessions", time.perf_counter() - t0))
+        t0 = time.perf_counter()
+        _legacy_tail(legacy, target, args.tail)
+        rows.append(("legacy", f"tail({args.tail}, session)", time.perf_counter() - t0))
+
+        t0 = time.perf_counter()
+        cold = RotatingJsonlLog(log.path)
+        cold.sessions()
+        rows.append(("indexed", "list_sessions (cold)", time.perf_counter() - t0))
+        t0 = time.perf_counter()
+        cold.tail(args.tail, session_id=target)
+        rows.append(("indexed", f"tail({args.tail}, session)", time.perf_counter() - t0))
+        t0 = time.perf_counter()
+        cold.tail(args.tail)
+        rows.append(("indexed", f"tail({args.tail})", time.perf_counter() - t0))
+
+        print(f"{args.events} events, {size_mb:.0f} MB, {len(log.segment_files())} segment files")
+        for impl, op, secs in rows:
+            print(f"{impl:<9}{op:<26}{secs * 1000:>10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()